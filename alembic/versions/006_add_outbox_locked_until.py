@@ -0,0 +1,28 @@
+"""הוספת עמודת locked_until ל-outbox_messages (lease לתפיסת batch)
+
+Revision ID: 006_outbox_locked_until
+Revises: 005_external_user_id
+Create Date: 2026-10-16
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "006_outbox_locked_until"
+down_revision: Union[str, None] = "005_external_user_id"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """הוספת locked_until — lease של worker על הודעה בסטטוס PROCESSING."""
+    op.add_column(
+        "outbox_messages",
+        sa.Column("locked_until", sa.DateTime(), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("outbox_messages", "locked_until")
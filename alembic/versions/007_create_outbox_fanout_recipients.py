@@ -0,0 +1,54 @@
+"""יצירת טבלת outbox_fanout_recipients (fan-out של BROADCAST_COURIERS)
+
+Revision ID: 007_outbox_fanout
+Revises: 006_outbox_locked_until
+Create Date: 2026-10-16
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "007_outbox_fanout"
+down_revision: Union[str, None] = "006_outbox_locked_until"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# SQLEnum ללא values_callable שומר member names (uppercase)
+fanout_status = sa.Enum("PENDING", "SENT", "FAILED", name="fanoutstatus")
+
+
+def upgrade() -> None:
+    """שורת מסירה לכל נמען של broadcast — retry רק לנמענים שנכשלו."""
+    op.create_table(
+        "outbox_fanout_recipients",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column(
+            "outbox_message_id",
+            sa.Integer(),
+            sa.ForeignKey("outbox_messages.id", ondelete="CASCADE"),
+            nullable=False,
+        ),
+        sa.Column("user_id", sa.BigInteger(), nullable=True),
+        sa.Column("recipient_id", sa.String(100), nullable=False),
+        sa.Column("status", fanout_status, nullable=False, server_default="PENDING"),
+        sa.Column("retry_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("last_error", sa.String(1000), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("sent_at", sa.DateTime(), nullable=True),
+        sa.UniqueConstraint(
+            "outbox_message_id", "recipient_id", name="uq_fanout_message_recipient"
+        ),
+    )
+    op.create_index(
+        "ix_fanout_message_status",
+        "outbox_fanout_recipients",
+        ["outbox_message_id", "status"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_fanout_message_status", table_name="outbox_fanout_recipients")
+    op.drop_table("outbox_fanout_recipients")
+    fanout_status.drop(op.get_bind(), checkfirst=True)
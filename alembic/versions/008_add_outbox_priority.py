@@ -0,0 +1,63 @@
+"""הוספת עמודת priority ל-outbox_messages (נתיבי עדיפות)
+
+Revision ID: 008_outbox_priority
+Revises: 007_outbox_fanout
+Create Date: 2026-10-16
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "008_outbox_priority"
+down_revision: Union[str, None] = "007_outbox_fanout"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# חייב להתאים ל-MESSAGE_TYPE_PRIORITIES ב-app/db/models/outbox_message.py
+_INTERACTIVE_TYPES = (
+    "capture_notification_sender",
+    "delivery_request_notification",
+    "delivery_decision_notification",
+    "panel_otp",
+)
+_BULK_TYPES = ("delivery_broadcast", "ride_posting_broadcast", "expiry_warning")
+
+
+def upgrade() -> None:
+    """priority נגזר מ-message_type — 0=interactive, 1=normal, 2=bulk."""
+    op.add_column(
+        "outbox_messages",
+        sa.Column("priority", sa.SmallInteger(), nullable=False, server_default="1"),
+    )
+
+    outbox = sa.table(
+        "outbox_messages",
+        sa.column("priority", sa.SmallInteger()),
+        sa.column("message_type", sa.String()),
+        sa.column("status", sa.String()),
+    )
+    unsent = sa.cast(outbox.c.status, sa.String()).in_(["PENDING", "PROCESSING"])
+    op.execute(
+        outbox.update()
+        .where(unsent, outbox.c.message_type.in_(_INTERACTIVE_TYPES))
+        .values(priority=0)
+    )
+    op.execute(
+        outbox.update()
+        .where(unsent, outbox.c.message_type.in_(_BULK_TYPES))
+        .values(priority=2)
+    )
+
+    op.create_index(
+        "idx_outbox_pending_lane",
+        "outbox_messages",
+        ["priority", "created_at"],
+        postgresql_where=sa.text("status = 'PENDING'"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("idx_outbox_pending_lane", table_name="outbox_messages")
+    op.drop_column("outbox_messages", "priority")
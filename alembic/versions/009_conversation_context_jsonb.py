@@ -0,0 +1,38 @@
+"""המרת conversation_sessions.context_data ל-JSONB (עדכון context חלקי)
+
+Revision ID: 009_context_jsonb
+Revises: 008_outbox_priority
+Create Date: 2026-10-16
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import JSONB
+
+
+revision: str = "009_context_jsonb"
+down_revision: Union[str, None] = "008_outbox_priority"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """StateManager כותב patch (context_data - ARRAY[...] || patch) — אופרטורים של JSONB."""
+    op.alter_column(
+        "conversation_sessions",
+        "context_data",
+        type_=JSONB(),
+        existing_type=sa.JSON(),
+        postgresql_using="context_data::jsonb",
+    )
+
+
+def downgrade() -> None:
+    op.alter_column(
+        "conversation_sessions",
+        "context_data",
+        type_=sa.JSON(),
+        existing_type=JSONB(),
+        postgresql_using="context_data::json",
+    )
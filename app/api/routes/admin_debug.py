@@ -3,13 +3,15 @@ Admin Debug Endpoints — endpoints דיאגנוסטיים לניטור ותחז
 
 שלושה כלים עיקריים:
 1. סטטוס circuit breakers (Telegram/WhatsApp)
-2. שאילתת הודעות כושלות עם אפשרות retry ידני
+2. שאילתת הודעות כושלות עם אפשרות retry ידני, וטלמטריית outbox (גם בפורמט Prometheus)
+   ומצב התור הנכנס של טלגרם (backpressure, dead letters ו-replay)
 3. בדיקת מצב state machine של משתמש (דיבוג משתמשים תקועים)
 """
 from datetime import datetime
 from typing import Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel, Field, field_validator
 from sqlalchemy import select, func
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -21,11 +23,20 @@ from app.core.circuit_breaker import (
     get_whatsapp_circuit_breaker,
     get_whatsapp_admin_circuit_breaker,
 )
+from app.core.config import settings
 from app.core.logging import get_logger
 from app.db.database import get_db
 from app.db.models.conversation_session import ConversationSession
 from app.db.models.outbox_message import MessageStatus, OutboxMessage
 from app.db.models.user import User, UserRole, ApprovalStatus
+from app.domain.services.outbox_metrics import read_outbox_metrics, render_prometheus
+from app.domain.services.outbox_service import OutboxService
+from app.domain.services.telegram_inbound_queue import (
+    list_dead_letters,
+    read_inbound_stats,
+    render_prometheus as render_inbound_prometheus,
+    replay_dead_letters,
+)
 
 logger = get_logger(__name__)
 
@@ -34,6 +45,20 @@ router = APIRouter()
 
 # ─── Pydantic models ────────────────────────────────────────────────────────
 
+class CircuitBreakerWindowResponse(BaseModel):
+    """סטטיסטיקת sliding window של circuit breaker"""
+    window_seconds: float
+    calls: int
+    failure_rate: float
+    slow_call_rate: float
+    p95_latency_seconds: Optional[float] = Field(
+        description="p95 של latency בחלון (מוערך מהיסטוגרמה), None אם אין קריאות"
+    )
+    failure_rate_threshold: float
+    slow_call_seconds: Optional[float]
+    slow_call_rate_threshold: float
+
+
 class CircuitBreakerStatusResponse(BaseModel):
     """סטטוס של circuit breaker בודד"""
     service: str
@@ -44,6 +69,10 @@ class CircuitBreakerStatusResponse(BaseModel):
     retry_after_seconds: float = Field(
         description="שניות עד שניסיון חוזר אפשרי (0 אם לא פתוח)"
     )
+    window: Optional[CircuitBreakerWindowResponse] = Field(
+        default=None,
+        description="סטטיסטיקת החלון — רק ל-breakers במצב sliding window",
+    )
 
 
 class OutboxMessageResponse(BaseModel):
@@ -81,6 +110,48 @@ class OutboxSummaryResponse(BaseModel):
     total: int = 0
 
 
+class OutboxQueueDepthResponse(BaseModel):
+    """עומק התור לסוג הודעה / פלטפורמה / סטטוס"""
+    message_type: str
+    platform: str
+    status: str
+    depth: int
+    oldest_age_seconds: float = Field(
+        description="גיל ההודעה הוותיקה שניתנת לתפיסה (0 אם כולן ב-backoff)"
+    )
+
+
+class OutboxHistogramResponse(BaseModel):
+    """היסטוגרמה מצטברת לסוג הודעה / פלטפורמה"""
+    metric: str
+    message_type: str
+    platform: str
+    buckets: dict[str, int] = Field(description="le → ספירה מצטברת (כולל +Inf)")
+    count: int
+    sum: float
+
+
+class OutboxCounterResponse(BaseModel):
+    """מונה תוצאות שליחה"""
+    metric: str
+    message_type: str
+    platform: str
+    outcome: str = Field(description="sent | retry | dead")
+    value: int
+
+
+class OutboxMetricsResponse(BaseModel):
+    """טלמטריית outbox — latency, retries ועומק תור"""
+    oldest_pending_age_seconds: float
+    oldest_pending_alert_threshold_seconds: int
+    oldest_pending_alert: bool = Field(
+        description="האם ההודעה הוותיקה שממתינה עברה את סף ההתראה"
+    )
+    queue: list[OutboxQueueDepthResponse]
+    histograms: list[OutboxHistogramResponse]
+    counters: list[OutboxCounterResponse]
+
+
 class UserStateResponse(BaseModel):
     """מצב state machine של משתמש"""
     user_id: int
@@ -111,6 +182,23 @@ class ForceStateRequest(BaseModel):
 
 def _cb_to_response(cb: CircuitBreaker) -> CircuitBreakerStatusResponse:
     """המרת circuit breaker למודל תשובה"""
+    window = None
+    stats = cb.get_window_stats()
+    if stats is not None:
+        window = CircuitBreakerWindowResponse(
+            window_seconds=cb.config.window_seconds,
+            calls=stats.calls,
+            failure_rate=round(stats.failure_rate, 3),
+            slow_call_rate=round(stats.slow_call_rate, 3),
+            p95_latency_seconds=(
+                round(stats.p95_latency_seconds, 3)
+                if stats.p95_latency_seconds is not None
+                else None
+            ),
+            failure_rate_threshold=cb.config.failure_rate_threshold,
+            slow_call_seconds=cb.config.slow_call_seconds,
+            slow_call_rate_threshold=cb.config.slow_call_rate_threshold,
+        )
     return CircuitBreakerStatusResponse(
         service=cb.service_name,
         state=cb.state.value,
@@ -118,6 +206,7 @@ def _cb_to_response(cb: CircuitBreaker) -> CircuitBreakerStatusResponse:
         success_count=cb._state.success_count,
         half_open_calls=cb._state.half_open_calls,
         retry_after_seconds=round(cb.get_retry_after(), 1),
+        window=window,
     )
 
 
@@ -127,6 +216,8 @@ def _cb_to_response(cb: CircuitBreaker) -> CircuitBreakerStatusResponse:
     summary="סטטוס circuit breakers",
     description=(
         "מחזיר את המצב הנוכחי של כל circuit breaker רשום (Telegram, WhatsApp, WhatsApp Admin). "
+        "ל-breakers במצב sliding window (גטוויי WhatsApp) — גם שיעור כשלונות, "
+        "שיעור קריאות איטיות ו-p95 של latency בחלון. "
         "שימושי לניטור זמינות שירותים חיצוניים."
     ),
     responses={
@@ -184,6 +275,67 @@ async def get_outbox_summary(
     )
 
 
+@router.get(
+    "/outbox/metrics",
+    response_model=OutboxMetricsResponse,
+    summary="טלמטריית outbox",
+    description=(
+        "היסטוגרמות latency (enqueue→claim, claim→sent, משך שליחה), retries ומוני תוצאות "
+        "לפי message_type ו-platform, עומק התור והגיל של ההודעה הוותיקה שממתינה."
+    ),
+    responses={
+        200: {"description": "טלמטריית outbox"},
+        401: {"description": "חסר מפתח API"},
+        403: {"description": "מפתח API שגוי"},
+    },
+)
+async def get_outbox_metrics(
+    _: None = Depends(require_admin_api_key),
+    db: AsyncSession = Depends(get_db),
+) -> OutboxMetricsResponse:
+    """טלמטריית outbox — מצטברת מכל ה-workers (Redis) + מצב התור (DB)"""
+    queue = await OutboxService(db).get_queue_stats()
+    histograms, counters = await read_outbox_metrics()
+
+    oldest = max(
+        (row["oldest_age_seconds"] for row in queue if row["status"] == "pending"),
+        default=0.0,
+    )
+    threshold = settings.OUTBOX_OLDEST_PENDING_ALERT_SECONDS
+    return OutboxMetricsResponse(
+        oldest_pending_age_seconds=round(oldest, 1),
+        oldest_pending_alert_threshold_seconds=threshold,
+        oldest_pending_alert=oldest > threshold,
+        queue=[OutboxQueueDepthResponse(**row) for row in queue],
+        histograms=[OutboxHistogramResponse(**vars(h)) for h in histograms],
+        counters=[OutboxCounterResponse(**vars(c)) for c in counters],
+    )
+
+
+@router.get(
+    "/outbox/metrics/prometheus",
+    response_class=PlainTextResponse,
+    summary="טלמטריית outbox בפורמט Prometheus",
+    description="אותה טלמטריה כמו /outbox/metrics, בפורמט Prometheus text exposition.",
+    responses={
+        200: {"description": "Prometheus text exposition (version 0.0.4)"},
+        401: {"description": "חסר מפתח API"},
+        403: {"description": "מפתח API שגוי"},
+    },
+)
+async def get_outbox_metrics_prometheus(
+    _: None = Depends(require_admin_api_key),
+    db: AsyncSession = Depends(get_db),
+) -> PlainTextResponse:
+    """ייצוא ל-scrape של Prometheus"""
+    queue = await OutboxService(db).get_queue_stats()
+    histograms, counters = await read_outbox_metrics()
+    return PlainTextResponse(
+        render_prometheus(histograms, counters, queue),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
 @router.get(
     "/outbox/messages",
     response_model=list[OutboxMessageResponse],
@@ -520,6 +672,164 @@ async def retry_dead_letter_message(
     )
 
 
+# ─── 2c. תור נכנס של טלגרם ─────────────────────────────────────────────────
+
+
+class TelegramInboundShardResponse(BaseModel):
+    """מצב shard בתור הנכנס"""
+    shard: int
+    backlog: int = Field(description="updates שעוד לא עובדו (כולל pending)")
+    pending: int = Field(description="נקראו ע\"י consumer ועוד לא אושרו")
+    oldest_age_seconds: float
+    consumer: Optional[str] = Field(description="מחזיק ה-lease על ה-shard")
+
+
+class TelegramInboundMetricsResponse(BaseModel):
+    """backpressure ו-latency של התור הנכנס של טלגרם"""
+    enabled: bool
+    backlog: int
+    oldest_age_seconds: float
+    backlog_alert_threshold_seconds: int
+    backlog_alert: bool = Field(
+        description="האם ה-update הוותיק שממתין עבר את סף ההתראה"
+    )
+    dead_letters: int
+    shards: list[TelegramInboundShardResponse]
+    counters: dict[str, int] = Field(
+        description="enqueued | processed | dead | rejected | inline_fallback | reclaimed | replayed"
+    )
+    latency_buckets: dict[str, int] = Field(description="le → ספירה מצטברת (כולל +Inf)")
+    latency_count: int
+    latency_sum: float
+
+
+class TelegramInboundDeadLetterResponse(BaseModel):
+    """update שהעיבוד שלו נכשל"""
+    entry_id: str
+    chat: str
+    source_id: str
+    error: str
+    update_id: Optional[int] = None
+
+
+class TelegramInboundReplayRequest(BaseModel):
+    """בחירת dead letters להחזרה — ריק = הוותיקים ביותר עד limit"""
+    entry_ids: Optional[list[str]] = None
+    limit: int = Field(default=100, ge=1, le=1000)
+
+
+class TelegramInboundReplayResponse(BaseModel):
+    """ה-dead letters שהוחזרו לתור"""
+    replayed: list[str]
+
+
+@router.get(
+    "/telegram/inbound/metrics",
+    response_model=TelegramInboundMetricsResponse,
+    summary="מצב התור הנכנס של טלגרם",
+    description=(
+        "backlog, pending והגיל של ה-update הוותיק לכל shard, מחזיק ה-lease, "
+        "מוני תוצאות והיסטוגרמת latency מקבלת ה-webhook ועד סיום העיבוד."
+    ),
+    responses={
+        200: {"description": "מצב התור הנכנס"},
+        401: {"description": "חסר מפתח API"},
+        403: {"description": "מפתח API שגוי"},
+    },
+)
+async def get_telegram_inbound_metrics(
+    _: None = Depends(require_admin_api_key),
+) -> TelegramInboundMetricsResponse:
+    """מצב התור הנכנס — מה-streams ב-Redis ומהמונים המצטברים"""
+    stats = await read_inbound_stats()
+    threshold = settings.TELEGRAM_INBOUND_BACKLOG_ALERT_SECONDS
+    return TelegramInboundMetricsResponse(
+        enabled=settings.TELEGRAM_INBOUND_QUEUE_ENABLED,
+        backlog=stats.backlog,
+        oldest_age_seconds=round(stats.oldest_age_seconds, 1),
+        backlog_alert_threshold_seconds=threshold,
+        backlog_alert=stats.oldest_age_seconds > threshold,
+        dead_letters=stats.dead_letters,
+        shards=[TelegramInboundShardResponse(**vars(s)) for s in stats.shards],
+        counters=stats.counters,
+        latency_buckets=stats.latency_buckets,
+        latency_count=stats.latency_count,
+        latency_sum=stats.latency_sum,
+    )
+
+
+@router.get(
+    "/telegram/inbound/metrics/prometheus",
+    response_class=PlainTextResponse,
+    summary="מצב התור הנכנס של טלגרם בפורמט Prometheus",
+    description="אותם נתונים כמו /telegram/inbound/metrics, בפורמט Prometheus text exposition.",
+    responses={
+        200: {"description": "Prometheus text exposition (version 0.0.4)"},
+        401: {"description": "חסר מפתח API"},
+        403: {"description": "מפתח API שגוי"},
+    },
+)
+async def get_telegram_inbound_metrics_prometheus(
+    _: None = Depends(require_admin_api_key),
+) -> PlainTextResponse:
+    """ייצוא ל-scrape של Prometheus"""
+    return PlainTextResponse(
+        render_inbound_prometheus(await read_inbound_stats()),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+@router.get(
+    "/telegram/inbound/dead-letters",
+    response_model=list[TelegramInboundDeadLetterResponse],
+    summary="updates של טלגרם שהעיבוד שלהם נכשל",
+    description="ה-dead letters הוותיקים ביותר מהתור הנכנס, לפי הסדר.",
+    responses={
+        200: {"description": "רשימת dead letters"},
+        401: {"description": "חסר מפתח API"},
+        403: {"description": "מפתח API שגוי"},
+    },
+)
+async def get_telegram_inbound_dead_letters(
+    limit: int = Query(default=50, ge=1, le=500),
+    _: None = Depends(require_admin_api_key),
+) -> list[TelegramInboundDeadLetterResponse]:
+    """רשימת dead letters של התור הנכנס"""
+    return [
+        TelegramInboundDeadLetterResponse(
+            entry_id=letter.entry_id,
+            chat=letter.chat,
+            source_id=letter.source_id,
+            error=letter.error,
+            update_id=letter.update.get("update_id"),
+        )
+        for letter in await list_dead_letters(limit)
+    ]
+
+
+@router.post(
+    "/telegram/inbound/replay",
+    response_model=TelegramInboundReplayResponse,
+    summary="החזרת dead letters של טלגרם לתור הנכנס",
+    description=(
+        "מחזיר updates מה-dead letter stream לתור ומוחק אותם משם. "
+        "ה-updates נכנסים לסוף התור של הצ'אט."
+    ),
+    responses={
+        200: {"description": "ה-ids שהוחזרו"},
+        401: {"description": "חסר מפתח API"},
+        403: {"description": "מפתח API שגוי"},
+    },
+)
+async def replay_telegram_inbound_dead_letters(
+    request: TelegramInboundReplayRequest,
+    _: None = Depends(require_admin_api_key),
+) -> TelegramInboundReplayResponse:
+    """replay ידני של dead letters"""
+    replayed = await replay_dead_letters(request.entry_ids, count=request.limit)
+    return TelegramInboundReplayResponse(replayed=replayed)
+
+
 # ─── 3. State Machine של משתמש ──────────────────────────────────────────────
 
 @router.get(
@@ -4,19 +4,18 @@ Telegram Webhook Handler - Bot Gateway Layer
 
 import re
 import hashlib
-import secrets
 from dataclasses import dataclass
 from collections.abc import Awaitable, Callable
 from fastapi import APIRouter, Depends, BackgroundTasks
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field, ConfigDict
 from typing import Optional, List, TypeAlias
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
 
-from app.db.database import get_db
+from app.db.database import get_db, get_task_session
 from app.db.models.user import User, UserRole, ApprovalStatus
-from app.db.models.station import Station
 from app.state_machine.handlers import (
     SenderStateHandler,
     CourierStateHandler,
@@ -32,10 +31,14 @@ from app.state_machine.states import (
 )
 from app.state_machine.dispatcher_handler import DispatcherStateHandler
 from app.state_machine.station_owner_handler import StationOwnerStateHandler
-from app.state_machine.manager import StateManager
+from app.state_machine.manager import StateManager, conversation_unit_of_work
 from app.domain.services.courier_approval_service import CourierApprovalService
+from app.domain.services.role_capabilities import get_role_capabilities
+from app.domain.services.telegram_inbound_queue import InboundBacklogFull, enqueue_update
+from app.domain.services.user_identity_cache import load_cached_user, remember_user
 from app.core.logging import get_logger
 from app.core.circuit_breaker import get_telegram_circuit_breaker
+from app.core.rate_limiter import call_with_rate_limit, telegram_rate_limits
 from app.core.config import settings
 from app.core.exceptions import TelegramError
 from app.api.dependencies.webhook_auth import verify_telegram_webhook_token
@@ -129,32 +132,64 @@ def _compact_callback_data_fallback(button_text: str) -> str | None:
     return None
 
 
-async def _store_inline_button_mapping(
+def _inline_button_callback_data(chat_id: str, button_text: str) -> str:
+    """callback_data דטרמיניסטי לכפתור ארוך — hash של chat + טקסט.
+
+    אותו תפריט לאותו צ'אט מקבל תמיד אותם tokens, כך שמיפוי קיים ממוחזר
+    בלי כתיבה ל-Redis. 128 bits — התנגשות לא מעשית (וגם אז לא דורסים).
+    """
+    digest = hashlib.sha256(f"{chat_id}\0{button_text}".encode("utf-8")).hexdigest()
+    return f"{_INLINE_BUTTON_CALLBACK_PREFIX}{digest[:32]}"
+
+
+async def _store_inline_button_mappings(
     chat_id: str,
-    callback_data: str,
-    button_text: str,
-) -> bool:
-    """שומר מיפוי callback_data→טקסט ב-Redis.
+    buttons: dict[str, str],
+) -> set[str]:
+    """שמירת כל מיפויי ה-callback_data→טקסט של מקלדת ב-pipeline.
+
+    round trip אחד קורא את כל המיפויים (GET + TTL). מיפוי קיים עם אותו
+    טקסט ממוחזר; נכתבים רק מיפויים חסרים (SET NX) או רענון TTL למיפוי
+    שעבר חצי מחייו — ב-round trip שני, ורק אם יש מה לכתוב.
 
-    משתמש ב-NX כדי למנוע דריסת ערך במקרה נדיר של התנגשות token.
+    Returns:
+        ה-callback_data שממופים ב-Redis (ריק אם Redis לא זמין).
     """
     try:
         from app.core.redis_client import get_redis
 
         r = await get_redis()
-        was_set = await r.set(
-            _inline_button_key(chat_id, callback_data),
-            button_text,
-            ex=_INLINE_BUTTON_TTL_SECONDS,
-            nx=True,
-        )
-        return bool(was_set)
+        keys = {cb: _inline_button_key(chat_id, cb) for cb in buttons}
+        pipe = r.pipeline(transaction=False)
+        for key in keys.values():
+            pipe.get(key)
+            pipe.ttl(key)
+        replies = await pipe.execute()
+
+        mapped: set[str] = set()
+        writes = 0
+        pipe = r.pipeline(transaction=False)
+        for (cb, key), value, ttl in zip(keys.items(), replies[0::2], replies[1::2]):
+            if value is None:
+                # NX — אם process אחר כתב במקביל, זה אותו hash ולכן אותו טקסט
+                pipe.set(key, buttons[cb], ex=_INLINE_BUTTON_TTL_SECONDS, nx=True)
+                writes += 1
+            elif value != buttons[cb]:
+                # התנגשות hash — לא דורסים מיפוי של כפתור אחר
+                continue
+            elif 0 <= ttl < _INLINE_BUTTON_TTL_SECONDS // 2:
+                pipe.expire(key, _INLINE_BUTTON_TTL_SECONDS)
+                writes += 1
+            mapped.add(cb)
+        if writes:
+            await pipe.execute()
+        return mapped
     except Exception as e:
         logger.warning(
-            "כשלון בשמירת מיפוי כפתור inline ב-Redis",
-            extra_data={"chat_id": chat_id, "error": str(e)},
+            "כשלון בשמירת מיפויי כפתורי inline ב-Redis",
+            extra_data={"chat_id": chat_id, "buttons": len(buttons), "error": str(e)},
         )
-        return False
+        return set()
 
 
 async def _resolve_inline_button_mapping(
@@ -585,17 +620,14 @@ def _is_in_multi_step_flow(
     return False
 
 
-async def _get_station_for_owner_or_downgrade(
+async def _get_owner_station_id_or_downgrade(
     user: User,
     db: AsyncSession,
-) -> Station | None:
-    """שליפת תחנה לבעל תחנה; אם אין תחנה פעילה מוריד תפקיד לשולח."""
-    from app.domain.services.station_service import StationService
-
-    station_service = StationService(db)
-    station = await station_service.get_station_by_owner(user.id)
-    if station:
-        return station
+) -> int | None:
+    """תחנת בעל התחנה (מרשומת היכולות); אם אין תחנה פעילה מוריד תפקיד לשולח."""
+    capabilities = await get_role_capabilities(db, user.id)
+    if capabilities.owner_station_id is not None:
+        return capabilities.owner_station_id
 
     # בעל תחנה ללא תחנה פעילה - הורדת תפקיד לשולח כדי למנוע לולאה אינסופית
     logger.warning(
@@ -607,15 +639,13 @@ async def _get_station_for_owner_or_downgrade(
     return None
 
 
-async def _get_dispatcher_station(
+async def _get_dispatcher_station_id(
     user: User,
     db: AsyncSession,
-) -> Station | None:
-    """שליפת תחנה לסדרן (נהג)."""
-    from app.domain.services.station_service import StationService
-
-    station_service = StationService(db)
-    return await station_service.get_dispatcher_station(user.id)
+) -> int | None:
+    """תחנת הסדרן (נהג) מרשומת היכולות."""
+    capabilities = await get_role_capabilities(db, user.id)
+    return capabilities.dispatcher_station_id
 
 
 async def _handle_sender_join_as_courier(
@@ -857,7 +887,38 @@ async def get_or_create_user(
        בוחרים את הפעילה/עדכנית ביותר ומשביתים את השאר.
     2. race condition — אם שתי בקשות מקבילות מנסות ליצור משתמש חדש
        באותו telegram_chat_id, IntegrityError נתפס ונעשית שאילתה מחדש.
+
+    משתמש מוכר נטען ממטמון הזיהוי (user_identity_cache) לפי primary key.
     """
+    user = await load_cached_user(
+        db,
+        "telegram",
+        telegram_chat_id,
+        lambda cached: cached.is_active and cached.telegram_chat_id == telegram_chat_id,
+    )
+    if user is not None:
+        await _sync_telegram_username(db, user, username)
+        return user, False
+
+    user, is_new = await _resolve_telegram_user(db, telegram_chat_id, name, username)
+    if user.is_active:
+        await remember_user("telegram", telegram_chat_id, user)
+    return user, is_new
+
+
+async def _sync_telegram_username(db: AsyncSession, user: User, username: Optional[str]) -> None:
+    """עדכון username בכל כניסה — המשתמש יכול לשנות או להסיר username בטלגרם"""
+    if user.telegram_username != username:
+        user.telegram_username = username
+        await db.commit()
+        await db.refresh(user)
+
+
+async def _resolve_telegram_user(
+    db: AsyncSession, telegram_chat_id: str, name: Optional[str],
+    username: Optional[str],
+) -> tuple[User, bool]:
+    """חיפוש (או יצירה) של המשתמש מול ה-DB"""
     result = await db.execute(
         select(User)
         .where(User.telegram_chat_id == telegram_chat_id)
@@ -929,12 +990,7 @@ async def get_or_create_user(
         await db.refresh(user)
         return user, True  # New user
 
-    # עדכון username בכל כניסה — המשתמש יכול לשנות או להסיר username בטלגרם
-    if user.telegram_username != username:
-        user.telegram_username = username
-        await db.commit()
-        await db.refresh(user)
-
+    await _sync_telegram_username(db, user, username)
     return user, False  # Existing user
 
 
@@ -944,8 +1000,8 @@ async def send_telegram_message(
     keyboard: Optional[list] = None,
 ) -> None:
     """שליחת הודעה דרך Telegram Bot API — כפתורים תמיד inline, reply keyboard מנוקה אוטומטית"""
-    import httpx
     from app.core.config import settings
+    from app.core.http_clients import get_telegram_client, telegram_api_url
 
     if not settings.TELEGRAM_BOT_TOKEN:
         logger.warning("Telegram bot token not configured")
@@ -953,10 +1009,23 @@ async def send_telegram_message(
 
     circuit_breaker = get_telegram_circuit_breaker()
 
-    url = f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/sendMessage"
+    url = telegram_api_url("sendMessage")
 
     async def _build_inline_keyboard(button_rows: list) -> list[list[dict]]:
         """בניית inline keyboard עם callback_data קצר כשצריך (מגבלת 64 bytes)."""
+        # מגבלת Telegram: callback_data עד 64 bytes. לכפתור ארוך יותר — token
+        # דטרמיניסטי, וכל המיפויים של המקלדת נשמרים ב-Redis בפעולה אחת
+        long_buttons = {
+            _inline_button_callback_data(chat_id, text_str): text_str
+            for text_str in (str(b) for row in button_rows for b in row)
+            if len(text_str.encode("utf-8")) > 64
+        }
+        mapped = (
+            await _store_inline_button_mappings(chat_id, long_buttons)
+            if long_buttons
+            else set()
+        )
+
         inline_keyboard: list[list[dict]] = []
         for row in button_rows:
             inline_row: list[dict] = []
@@ -964,21 +1033,8 @@ async def send_telegram_message(
                 text_str = str(button_text)
                 callback_data = text_str
                 if len(callback_data.encode("utf-8")) > 64:
-                    # מגבלת Telegram: callback_data עד 64 bytes.
-                    # מייצרים token קצר ושומרים ב-Redis עם NX למניעת התנגשות נדירה.
-                    ok = False
-                    for _attempt in range(3):
-                        token = secrets.token_urlsafe(16)
-                        candidate = f"{_INLINE_BUTTON_CALLBACK_PREFIX}{token}"
-                        ok = await _store_inline_button_mapping(
-                            chat_id=chat_id,
-                            callback_data=candidate,
-                            button_text=text_str,
-                        )
-                        if ok:
-                            callback_data = candidate
-                            break
-                    if not ok:
+                    callback_data = _inline_button_callback_data(chat_id, text_str)
+                    if callback_data not in mapped:
                         # אם Redis לא זמין / התנגשות token: נעדיף fallback "חכם"
                         # שממשיך לעבוד (keyword קצר), ואם אין — נשתמש ב-btn:unavailable
                         # כדי שה-webhook יחזיר הודעת שגיאה ברורה.
@@ -992,42 +1048,46 @@ async def send_telegram_message(
             inline_keyboard.append(inline_row)
         return inline_keyboard
 
+    rate_limits = telegram_rate_limits(chat_id)
+
     async def _send(payload: dict) -> dict:
+        # מכסה משותפת לכל ה-workers; 429 עם retry_after ממתין במקום להיכשל
+        return await call_with_rate_limit(rate_limits, lambda: _post(payload))
+
+    async def _post(payload: dict) -> dict:
         import json
 
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, json=payload, timeout=30.0)
-            if response.status_code != 200:
-                raise TelegramError.from_response(
-                    "sendMessage",
-                    response,
-                    message=f"sendMessage returned status {response.status_code}",
-                )
-            try:
-                data = response.json()
-            except json.JSONDecodeError as e:
-                raise TelegramError(
-                    "Telegram returned invalid JSON",
-                    details={"status_code": response.status_code, "error": str(e)},
-                ) from e
-            if not data.get("ok"):
-                raise TelegramError(
-                    "sendMessage returned ok=false",
-                    details={"response": data},
-                )
-            return data
+        client = get_telegram_client()
+        response = await client.post(url, json=payload, timeout=30.0)
+        if response.status_code != 200:
+            raise TelegramError.from_response(
+                "sendMessage",
+                response,
+                message=f"sendMessage returned status {response.status_code}",
+            )
+        try:
+            data = response.json()
+        except json.JSONDecodeError as e:
+            raise TelegramError(
+                "Telegram returned invalid JSON",
+                details={"status_code": response.status_code, "error": str(e)},
+            ) from e
+        if not data.get("ok"):
+            raise TelegramError(
+                "sendMessage returned ok=false",
+                details={"response": data},
+            )
+        return data
 
     async def _delete_message(message_id: int) -> bool:
         """מחיקת הודעה — best-effort, לא זורק exception."""
-        delete_url = (
-            f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/deleteMessage"
-        )
+        delete_url = telegram_api_url("deleteMessage")
         delete_payload = {"chat_id": chat_id, "message_id": message_id}
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    delete_url, json=delete_payload, timeout=30.0
-                )
+            client = get_telegram_client()
+            response = await client.post(
+                delete_url, json=delete_payload, timeout=30.0
+            )
         except Exception as e:
             logger.debug(
                 "כשלון בבקשת deleteMessage (best-effort)",
@@ -1111,65 +1171,66 @@ async def send_telegram_message_raising(
     text: str,
 ) -> None:
     """שליחת הודעה דרך Telegram — מעלה exception בכשלון (לא fire-and-forget)."""
-    import httpx
     from app.core.config import settings
+    from app.core.http_clients import get_telegram_client, telegram_api_url
 
     if not settings.TELEGRAM_BOT_TOKEN:
         raise ValueError("Telegram bot token not configured")
 
     circuit_breaker = get_telegram_circuit_breaker()
-    url = f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/sendMessage"
+    url = telegram_api_url("sendMessage")
 
     async def _send_inner() -> dict:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                url,
-                json={"chat_id": chat_id, "text": text, "parse_mode": "HTML"},
-                timeout=30.0,
+        return await call_with_rate_limit(telegram_rate_limits(chat_id), _post)
+
+    async def _post() -> dict:
+        client = get_telegram_client()
+        response = await client.post(
+            url,
+            json={"chat_id": chat_id, "text": text, "parse_mode": "HTML"},
+            timeout=30.0,
+        )
+        if response.status_code != 200:
+            raise TelegramError.from_response(
+                "sendMessage",
+                response,
+                message=f"sendMessage returned status {response.status_code}",
             )
-            if response.status_code != 200:
-                raise TelegramError.from_response(
-                    "sendMessage",
-                    response,
-                    message=f"sendMessage returned status {response.status_code}",
-                )
-            data = response.json()
-            if not data.get("ok"):
-                raise TelegramError(
-                    "sendMessage returned ok=false",
-                    details={"response": data},
-                )
-            return data
+        data = response.json()
+        if not data.get("ok"):
+            raise TelegramError(
+                "sendMessage returned ok=false",
+                details={"response": data},
+            )
+        return data
 
     await circuit_breaker.execute(_send_inner)
 
 
 async def answer_callback_query(callback_query_id: str, text: str = None) -> None:
     """Answer callback query to remove loading state with circuit breaker protection"""
-    import httpx
     from app.core.config import settings
+    from app.core.http_clients import get_telegram_client, telegram_api_url
 
     if not settings.TELEGRAM_BOT_TOKEN:
         return
 
     circuit_breaker = get_telegram_circuit_breaker()
 
-    url = (
-        f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/answerCallbackQuery"
-    )
+    url = telegram_api_url("answerCallbackQuery")
     payload = {"callback_query_id": callback_query_id}
     if text:
         payload["text"] = text
 
     async def _send():
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, json=payload, timeout=30.0)
-            if response.status_code != 200:
-                raise TelegramError.from_response(
-                    "answerCallbackQuery",
-                    response,
-                    message=f"answerCallbackQuery returned status {response.status_code}",
-                )
+        client = get_telegram_client()
+        response = await client.post(url, json=payload, timeout=30.0)
+        if response.status_code != 200:
+            raise TelegramError.from_response(
+                "answerCallbackQuery",
+                response,
+                message=f"answerCallbackQuery returned status {response.status_code}",
+            )
 
     try:
         await circuit_breaker.execute(_send)
@@ -1229,6 +1290,9 @@ async def _resolve_role_state(
     אם מוסיפים תפקיד חדש — חובה להוסיף ענף כאן, אחרת ייפול ל-SENDER עם אזהרה בלוג.
 
     Returns: (new_state, station_id) — station_id מוחזר כשרלוונטי (בעל תחנה / סדרן)
+
+    תחנת הסדרן ותחנת הבעלים נקראות מרשומת היכולות (get_role_capabilities) —
+    בלי שאילתות תחנה כשהרשומה ב-Redis עדכנית.
     """
     platform = "telegram"
 
@@ -1238,11 +1302,11 @@ async def _resolve_role_state(
         return target, None
 
     if user.role == UserRole.STATION_OWNER:
-        station = await _get_station_for_owner_or_downgrade(user, db)
-        if station is not None:
+        station_id = await _get_owner_station_id_or_downgrade(user, db)
+        if station_id is not None:
             target = StationOwnerState.MENU.value
             await state_manager.force_state(user.id, platform, target, context={})
-            return target, station.id
+            return target, station_id
         target = SenderState.MENU.value
         await state_manager.force_state(user.id, platform, target, context={})
         return target, None
@@ -1252,15 +1316,15 @@ async def _resolve_role_state(
 
         # סשן 6: עדכון פעילות אחרונה — גם לנהג-סדרן
         session_service = DriverSessionService(db)
-        await session_service.touch_session(user.id)
+        await session_service.touch_session_throttled(user.id)
 
         # סשן 9: בדיקה אם הנהג הוא גם סדרן פעיל בתחנה
         if not skip_dispatcher_check:
-            dispatcher_station = await _get_dispatcher_station(user, db)
-            if dispatcher_station is not None:
+            dispatcher_station_id = await _get_dispatcher_station_id(user, db)
+            if dispatcher_station_id is not None:
                 target = DispatcherState.MENU.value
                 await state_manager.force_state(user.id, platform, target, context={})
-                return target, dispatcher_station.id
+                return target, dispatcher_station_id
 
         target = DriverState.INITIAL.value
         await state_manager.force_state(user.id, platform, target, context={})
@@ -1277,11 +1341,11 @@ async def _resolve_role_state(
 
     if user.role == UserRole.SENDER:
         if not skip_dispatcher_check:
-            dispatcher_station = await _get_dispatcher_station(user, db)
-            if dispatcher_station is not None:
+            dispatcher_station_id = await _get_dispatcher_station_id(user, db)
+            if dispatcher_station_id is not None:
                 target = DispatcherState.MENU.value
                 await state_manager.force_state(user.id, platform, target, context={})
-                return target, dispatcher_station.id
+                return target, dispatcher_station_id
 
         target = SenderState.MENU.value
         await state_manager.force_state(user.id, platform, target, context={})
@@ -1445,7 +1509,10 @@ def _is_telegram_admin_id(telegram_user_id: str | None) -> bool:
         "תומכת גם בהודעות טקסט/תמונות וגם ב-callback queries (כפתורים). "
         "מאומת באמצעות X-Telegram-Bot-Api-Secret-Token."
     ),
-    responses={403: {"description": "טוקן אימות webhook חסר או שגוי"}},
+    responses={
+        403: {"description": "טוקן אימות webhook חסר או שגוי"},
+        503: {"description": "התור הנכנס מלא (TELEGRAM_INBOUND_QUEUE_ENABLED) — Telegram ישלח שוב"},
+    },
 )
 async def telegram_webhook(
     update: TelegramUpdate,
@@ -1456,8 +1523,69 @@ async def telegram_webhook(
     """
     Handle incoming Telegram messages.
     This is the Bot Gateway layer entry point for Telegram.
-    Routes to sender or courier handlers based on user role.
+
+    כשהתור הנכנס פעיל — ה-update נשמר ב-Redis Stream וה-webhook חוזר מיד;
+    אחרת (או כש-Redis לא זמין) העיבוד רץ כאן.
     """
+    if settings.TELEGRAM_INBOUND_QUEUE_ENABLED:
+        try:
+            entry_id = await enqueue_update(
+                update.model_dump(mode="json", by_alias=True, exclude_none=True),
+                _inbound_chat_key(update),
+            )
+        except InboundBacklogFull as e:
+            logger.warning(
+                "התור הנכנס של טלגרם מלא — Telegram ישלח את ה-update שוב",
+                extra_data={"shard": e.shard, "backlog": e.backlog, "update_id": update.update_id},
+            )
+            return JSONResponse(
+                status_code=503,
+                content={"ok": False, "error": "inbound_backlog_full"},
+                headers={"Retry-After": "5"},
+            )
+        if entry_id is not None:
+            return {"ok": True, "queued": True}
+
+    # state ו-context של השיחה נכתבים פעם אחת בסוף העיבוד
+    async with conversation_unit_of_work(db):
+        return await _handle_telegram_update(update, background_tasks, db)
+
+
+def _inbound_chat_key(update: TelegramUpdate) -> str:
+    """מפתח הסדר בתור הנכנס — updates של אותו צ'אט מעובדים לפי סדר ההגעה"""
+    chat_id = _resolve_telegram_chat_id(update)
+    return chat_id if chat_id is not None else f"update:{update.update_id}"
+
+
+async def process_queued_telegram_update(payload: dict) -> None:
+    """עיבוד update מהתור הנכנס — אותו נתיב כמו ה-webhook, בסשן של worker.
+
+    ה-background tasks (תשובות, answerCallbackQuery) רצים כאן לפי הסדר לפני
+    ה-ack, כך שה-update הבא באותו צ'אט לא עוקף את התשובה לקודם. כשלון בשליחה
+    נרשם ללוג בלבד — ה-state כבר נשמר, ועיבוד חוזר היה משכפל אותו.
+    """
+    update = TelegramUpdate.model_validate(payload)
+    background_tasks = BackgroundTasks()
+    async with get_task_session() as db, conversation_unit_of_work(db):
+        await _handle_telegram_update(update, background_tasks, db)
+
+    for task in background_tasks.tasks:
+        try:
+            await task()
+        except Exception as e:
+            logger.error(
+                "שליחת תשובה ל-update מהתור הנכנס נכשלה",
+                extra_data={"update_id": update.update_id, "error": str(e)},
+                exc_info=True,
+            )
+
+
+async def _handle_telegram_update(
+    update: TelegramUpdate,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession,
+):
+    """ניתוב update לפי תפקיד המשתמש (שולח/שליח/סדרן/בעל תחנה/נהג/מנהל)."""
     event = _parse_inbound_event(update, background_tasks)
     if event is None:
         return {"ok": True}
@@ -2307,8 +2435,8 @@ async def telegram_webhook(
 
         if current_state.startswith("DISPATCHER.") and user.role != UserRole.COURIER:
             # סדרנים שאינם שליחים — בודקים בטבלת station_dispatchers לפני איפוס
-            dispatcher_station = await _get_dispatcher_station(user, db)
-            if dispatcher_station is None:
+            dispatcher_station_id = await _get_dispatcher_station_id(user, db)
+            if dispatcher_station_id is None:
                 logger.warning(
                     "Stale dispatcher state for non-dispatcher user; resetting to role menu",
                     extra_data={
@@ -2453,9 +2581,9 @@ async def telegram_webhook(
     # ==================== ניתוב לפי תפקיד (handler לכל role) ====================
 
     if user.role == UserRole.STATION_OWNER:
-        station = await _get_station_for_owner_or_downgrade(user, db)
-        if station is not None:
-            handler = StationOwnerStateHandler(db, station.id)
+        station_id = await _get_owner_station_id_or_downgrade(user, db)
+        if station_id is not None:
+            handler = StationOwnerStateHandler(db, station_id)
             response, new_state = await handler.handle_message(
                 user, text, photo_file_id
             )
@@ -2476,9 +2604,9 @@ async def telegram_webhook(
     )
 
     if is_dispatcher_menu_click or is_dispatcher_flow:
-        station = await _get_dispatcher_station(user, db)
+        station_id = await _get_dispatcher_station_id(user, db)
 
-        if station is not None:
+        if station_id is not None:
             if is_dispatcher_menu_click:
                 _dm_admin_keys = await _save_admin_context(
                     user.id, state_manager, "telegram"
@@ -2486,7 +2614,7 @@ async def telegram_webhook(
                 await state_manager.force_state(
                     user.id, "telegram", DispatcherState.MENU.value, context={}
                 )
-                handler = DispatcherStateHandler(db, station.id)
+                handler = DispatcherStateHandler(db, station_id)
                 response, new_state = await handler.handle_message(user, "תפריט", None)
                 # שחזור admin context אחרי ה-handler — כדי שלא יימחק ע"י force_state פנימי
                 if _dm_admin_keys:
@@ -2543,7 +2671,7 @@ async def telegram_webhook(
                 _queue_response_send(background_tasks, send_chat_id, response)
                 return {"ok": True, "new_state": new_state}
 
-            handler = DispatcherStateHandler(db, station.id)
+            handler = DispatcherStateHandler(db, station_id)
             response, new_state = await handler.handle_message(
                 user, text, photo_file_id
             )
@@ -3,27 +3,39 @@ WhatsApp Webhook Handler - Bot Gateway Layer
 """
 
 import asyncio
+import hashlib
 import re
-from datetime import datetime, timedelta, timezone
+from collections.abc import Awaitable, Callable, Sequence
 
 from fastapi import APIRouter, Depends, BackgroundTasks, Request
 from pydantic import BaseModel, model_validator
-from typing import Optional
+from typing import Optional, TypeVar
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy import select, update
+from sqlalchemy import select
 
 from app.api.dependencies.webhook_signature import require_wppconnect_signature
-from app.db.database import get_db
+from app.db.database import AsyncSessionLocal, get_db
 from app.db.models.user import User, UserRole, ApprovalStatus
-from app.db.models.webhook_event import WebhookEvent
 from app.state_machine.handlers import SenderStateHandler, CourierStateHandler
 from app.state_machine.states import CourierState, DispatcherState, SenderState, StationOwnerState, DriverState
 from app.state_machine.dispatcher_handler import DispatcherStateHandler
 from app.state_machine.station_owner_handler import StationOwnerStateHandler
-from app.state_machine.manager import StateManager
+from app.state_machine.manager import (
+    StateManager,
+    commit_conversation_state,
+    conversation_unit_of_work,
+    discard_conversation_state,
+)
 from app.domain.services import AdminNotificationService
 from app.domain.services.courier_approval_service import CourierApprovalService
+from app.domain.services.role_capabilities import get_role_capabilities
+from app.domain.services.user_identity_cache import load_cached_user, remember_user
+from app.domain.services.webhook_idempotency import (
+    STALE_PROCESSING_SECONDS,
+    mark_message_completed,
+    try_acquire_message,
+)
 from app.core.logging import get_logger
 from app.core.validation import PhoneNumberValidator
 from app.core.config import settings
@@ -31,94 +43,29 @@ from app.domain.services.whatsapp import get_whatsapp_provider, get_whatsapp_gro
 
 logger = get_logger(__name__)
 
+_T = TypeVar("_T")
+
 # ──────────────────────────────────────────────
-#  מנגנון idempotency – מבוסס DB, לא memory cache.
-#  מסמן הודעה כ-processing רק אחרי INSERT מוצלח.
-#  אם העיבוד נכשל — הרשומה נשארת processing ומאפשרת retry אחרי timeout.
-#  רק אחרי עיבוד מלא הסטטוס הופך ל-completed — שחוסם כפילויות.
+#  מנגנון idempotency – רכישה וסימון completed ב-Redis (SET NX עם TTL),
+#  טבלת webhook_events כ-fallback כש-Redis לא זמין וכ-audit שנכתב ב-batch.
+#  הודעה שהעיבוד שלה נכשל נשארת processing ומאפשרת retry אחרי timeout.
+#  ראה app/domain/services/webhook_idempotency.py
 # ──────────────────────────────────────────────
-_STALE_PROCESSING_SECONDS = 120  # הודעה ב-processing יותר מ-2 דקות = תקועה, מאפשרים retry
+_STALE_PROCESSING_SECONDS = STALE_PROCESSING_SECONDS
 
 
 async def _try_acquire_message(db: AsyncSession, message_id: str, platform: str) -> bool:
     """
     ניסיון לרכוש הודעה לעיבוד (idempotency check).
     מחזיר True אם ההודעה חדשה ואפשר לעבד, False אם כפולה.
-    גישה אופטימיסטית: INSERT קודם, טיפול בקיים אחר כך.
     """
-    if not message_id:
-        return True  # הודעה ללא ID — מאפשרים עיבוד (אין מה לדדפ)
-
-    # ניסיון אופטימיסטי — הוספת הודעה חדשה ב-savepoint
-    try:
-        async with db.begin_nested():
-            db.add(WebhookEvent(
-                message_id=message_id,
-                platform=platform,
-                status="processing",
-                created_at=datetime.now(timezone.utc),
-            ))
-        # commit מיידי כדי שהרשומה תישמר גם אם העיבוד נכשל —
-        # מונע retry מיידי ומכריח המתנה של _STALE_PROCESSING_SECONDS
-        await db.commit()
-        return True
-    except IntegrityError:
-        pass  # הודעה כבר קיימת — בדיקה אם completed או stale
-
-    # הודעה קיימת — בדיקה אם כבר הושלמה
-    result = await db.execute(
-        select(WebhookEvent.status, WebhookEvent.created_at)
-        .where(WebhookEvent.message_id == message_id)
-    )
-    row = result.one_or_none()
-    if not row:
-        return False
-
-    if row.status == "completed":
-        logger.info(
-            "Skipping completed duplicate message",
-            extra_data={"message_id": message_id},
-        )
-        return False
-
-    # ניסיון retry אטומי — UPDATE רק אם ההודעה תקועה מעבר ל-threshold
-    threshold = datetime.now(timezone.utc) - timedelta(seconds=_STALE_PROCESSING_SECONDS)
-    update_result = await db.execute(
-        update(WebhookEvent)
-        .where(
-            WebhookEvent.message_id == message_id,
-            WebhookEvent.status == "processing",
-            WebhookEvent.created_at < threshold,
-        )
-        .values(created_at=datetime.now(timezone.utc))
-    )
-
-    if update_result.rowcount > 0:
-        # commit מיידי — אותה סיבה כמו ב-INSERT
-        await db.commit()
-        logger.warning(
-            "Retrying stale processing message",
-            extra_data={"message_id": message_id},
-        )
-        return True
-
-    logger.info(
-        "Skipping in-progress message",
-        extra_data={"message_id": message_id},
-    )
-    return False
+    return await try_acquire_message(db, message_id, platform)
 
 
 async def _mark_message_completed(db: AsyncSession, message_id: str) -> None:
-    """סימון הודעה כ-completed אחרי עיבוד מוצלח + commit."""
-    if not message_id:
-        return
-    await db.execute(
-        update(WebhookEvent)
-        .where(WebhookEvent.message_id == message_id)
-        .values(status="completed")
-    )
-    await db.commit()
+    """סימון הודעה כ-completed אחרי עיבוד מוצלח — state ו-context של השיחה נכתבים קודם."""
+    await commit_conversation_state(db)
+    await mark_message_completed(db, message_id)
 
 router = APIRouter()
 
@@ -237,6 +184,21 @@ def _resolve_contact_phone(
     return "לא ידוע"
 
 
+def _whatsapp_sender_placeholder(raw: str) -> str:
+    """
+    יצירת placeholder קצר ויציב ל-phone_number עבור מזהים ארוכים.
+
+    הערה: עמודת phone_number מוגדרת VARCHAR(20). אם המזהה ארוך — PostgreSQL יזרוק שגיאה.
+    """
+    raw = (raw or "").strip()
+    if not raw:
+        return "wa:unknown"
+    if len(raw) <= 20:
+        return raw
+    digest = hashlib.sha1(raw.encode("utf-8")).hexdigest()[:17]
+    return f"wa:{digest}"
+
+
 async def get_or_create_user(
     db: AsyncSession,
     sender_identifier: str,
@@ -255,23 +217,10 @@ async def get_or_create_user(
     external_user_id (BSUID מ-Meta Cloud API): אם סופק, משמש כמזהה ראשוני (עדיפות
     עליונה) כי הוא יציב ברמת portfolio גם כאשר המשתמש מאמץ username ומספר הטלפון
     לא מגיע ב-webhook. אם BSUID לא סופק או לא נמצא — חוזרים ללוגיקה הקיימת.
-    """
-    import hashlib
-
-    def _whatsapp_sender_placeholder(raw: str) -> str:
-        """
-        יצירת placeholder קצר ויציב ל-phone_number עבור מזהים ארוכים.
-
-        הערה: עמודת phone_number מוגדרת VARCHAR(20). אם המזהה ארוך — PostgreSQL יזרוק שגיאה.
-        """
-        raw = (raw or "").strip()
-        if not raw:
-            return "wa:unknown"
-        if len(raw) <= 20:
-            return raw
-        digest = hashlib.sha1(raw.encode("utf-8")).hexdigest()[:17]
-        return f"wa:{digest}"
 
+    משתמש מוכר נטען ממטמון הזיהוי (user_identity_cache) לפי primary key —
+    לפי BSUID אם סופק, אחרת לפי צירוף sender + טלפון (הבחירה ביניהם תלויה בשניהם).
+    """
     # ניסיון לחלץ מספר אמיתי (אם הגטוויי הצליח) כדי למנוע "משתמש כפול"
     # בין יצירת תחנה (מבוסס +972...) לבין שיחות WhatsApp (מבוסס sender_id/@lid).
     normalized_phone = (
@@ -279,11 +228,58 @@ async def get_or_create_user(
         or _extract_real_phone(from_number)
         or _extract_real_phone(reply_to)
     )
+    bsuid_clean = (external_user_id or "").strip() or None
+    sender_key_raw = (sender_identifier or "").strip()
+    sender_key = _whatsapp_sender_placeholder(sender_key_raw)
+
+    if bsuid_clean:
+        cache_kind, cache_identifier = "bsuid", bsuid_clean
+    else:
+        cache_kind, cache_identifier = "whatsapp", f"{sender_key}|{normalized_phone or ''}"
+
+    def _matches(user: User) -> bool:
+        if not user.is_active:
+            return False
+        if normalized_phone and (user.phone_number or "").startswith("wa:"):
+            return False  # placeholder שצריך ריפוי — רק בנתיב המלא
+        if bsuid_clean:
+            return user.external_user_id == bsuid_clean
+        return user.phone_number in {sender_key, sender_key_raw, normalized_phone}
+
+    user = await load_cached_user(db, cache_kind, cache_identifier, _matches)
+    if user is not None:
+        return user, False, normalized_phone
+
+    user, is_new = await _resolve_whatsapp_user(
+        db,
+        normalized_phone=normalized_phone,
+        bsuid_clean=bsuid_clean,
+        sender_key_raw=sender_key_raw,
+        sender_key=sender_key,
+        sender_identifier=sender_identifier,
+        reply_to=reply_to,
+        from_number=from_number,
+    )
+    if _matches(user):
+        await remember_user(cache_kind, cache_identifier, user)
+    return user, is_new, normalized_phone
+
 
+async def _resolve_whatsapp_user(
+    db: AsyncSession,
+    *,
+    normalized_phone: str | None,
+    bsuid_clean: str | None,
+    sender_key_raw: str,
+    sender_key: str,
+    sender_identifier: str,
+    reply_to: str | None,
+    from_number: str | None,
+) -> tuple[User, bool]:
+    """חיפוש (או יצירה) של המשתמש מול ה-DB. Returns (user, is_new)"""
     # עדיפות 1 — חיפוש לפי BSUID. מזהה יציב ברמת portfolio של Meta; גם אם משתמש
     # מחליף טלפון או מסתיר אותו (username), ה-BSUID נשאר עוגן הזיהוי. מצליחים
     # כאן — חוזרים מיד, כולל healing של phone_number אם נמצא placeholder.
-    bsuid_clean = (external_user_id or "").strip() or None
     if bsuid_clean:
         result = await db.execute(
             select(User).where(User.external_user_id == bsuid_clean).limit(1)
@@ -315,13 +311,10 @@ async def get_or_create_user(
                         "לא ניתן לעדכן phone_number אחרי זיהוי BSUID — כבר קיים אצל אחר",
                         extra_data={"user_id": user_by_bsuid.id},
                     )
-            return user_by_bsuid, False, normalized_phone
+            return user_by_bsuid, False
 
     # חיפוש לפי מזהה שיחה יציב: משתמשים באותו placeholder גם ב-lookup וגם ביצירה
     # כדי למנוע מצב שבו sender_id ארוך נשמר כ-wa:<hash> אבל lookup מחפש את הערך הגולמי.
-    sender_key_raw = (sender_identifier or "").strip()
-    sender_key = _whatsapp_sender_placeholder(sender_key_raw)
-
     user_by_sender = None
     if sender_key:
         keys = [sender_key]
@@ -386,7 +379,7 @@ async def get_or_create_user(
     # - אחרת נעדיף את המשתמש לפי sender_id כדי לשמר session יציב גם כש-reply_to משתנה (@lid/@c.us).
     if user_by_phone and user_by_phone.id != getattr(user_by_sender, "id", None):
         if user_by_phone.role in {UserRole.STATION_OWNER, UserRole.COURIER, UserRole.ADMIN}:
-            return user_by_phone, False, normalized_phone
+            return user_by_phone, False
 
     if user_by_sender:
         # ריפוי: אם למשתמש יש placeholder (wa:...) ועכשיו יש לנו מספר אמיתי —
@@ -422,10 +415,10 @@ async def get_or_create_user(
                         "phone": PhoneNumberValidator.mask(normalized_phone),
                     },
                 )
-        return user_by_sender, False, normalized_phone
+        return user_by_sender, False
 
     if user_by_phone:
-        return user_by_phone, False, normalized_phone
+        return user_by_phone, False
 
     # יצירת משתמש חדש — מעדיפים מספר אמיתי (אם קיים) על פני placeholder
     # כדי שחיפוש עתידי לפי normalized_phone ימצא את המשתמש ולא ייצור כפילות.
@@ -441,7 +434,7 @@ async def get_or_create_user(
             db.add(user)
         await db.commit()
         await db.refresh(user)
-        return user, True, normalized_phone
+        return user, True
     except IntegrityError:
         # race condition — משתמש אחר נוצר במקביל עם אותו phone_number.
         # אין צורך ב-db.rollback() — ה-savepoint כבר בוטל אוטומטית.
@@ -455,7 +448,7 @@ async def get_or_create_user(
         )
         existing = result.scalar_one_or_none()
         if existing:
-            return existing, False, normalized_phone
+            return existing, False
         # לא אמור לקרות — IntegrityError בלי רשומה תואמת.
         # זורקים שגיאה ברורה כדי שה-webhook ידלג על ההודעה עם לוג מתאים.
         raise ValueError(
@@ -945,6 +938,9 @@ async def _resolve_role_state_wa(
     אם מוסיפים תפקיד חדש — חובה להוסיף ענף כאן, אחרת ייפול ל-SENDER עם אזהרה בלוג.
 
     Returns: (new_state, station_id) — station_id מוחזר כשרלוונטי (בעל תחנה / סדרן)
+
+    תחנת הסדרן ותחנת הבעלים נקראות מרשומת היכולות (get_role_capabilities) —
+    בלי שאילתות תחנה כשהרשומה ב-Redis עדכנית.
     """
     platform = "whatsapp"
 
@@ -954,15 +950,11 @@ async def _resolve_role_state_wa(
         return target, None
 
     if user.role == UserRole.STATION_OWNER:
-        from app.domain.services.station_service import StationService
-
-        station_service = StationService(db)
-        station = await station_service.get_station_by_owner(user.id)
-
-        if station:
+        capabilities = await get_role_capabilities(db, user.id)
+        if capabilities.owner_station_id is not None:
             target = StationOwnerState.MENU.value
             await state_manager.force_state(user.id, platform, target, context={})
-            return target, station.id
+            return target, capabilities.owner_station_id
         # בעל תחנה ללא תחנה פעילה - הורדת תפקיד לשולח
         logger.warning(
             "Station owner without active station, downgrading to sender",
@@ -979,18 +971,15 @@ async def _resolve_role_state_wa(
 
         # סשן 6: עדכון פעילות אחרונה — גם לנהג-סדרן
         session_service = DriverSessionService(db)
-        await session_service.touch_session(user.id)
+        await session_service.touch_session_throttled(user.id)
 
         # סשן 9: בדיקה אם הנהג הוא גם סדרן פעיל בתחנה
         if not skip_dispatcher_check:
-            from app.domain.services.station_service import StationService
-
-            station_service = StationService(db)
-            dispatcher_station = await station_service.get_dispatcher_station(user.id)
-            if dispatcher_station:
+            capabilities = await get_role_capabilities(db, user.id)
+            if capabilities.dispatcher_station_id is not None:
                 target = DispatcherState.MENU.value
                 await state_manager.force_state(user.id, platform, target, context={})
-                return target, dispatcher_station.id
+                return target, capabilities.dispatcher_station_id
 
         target = DriverState.INITIAL.value
         await state_manager.force_state(user.id, platform, target, context={})
@@ -1011,14 +1000,11 @@ async def _resolve_role_state_wa(
 
     if user.role == UserRole.SENDER:
         if not skip_dispatcher_check:
-            from app.domain.services.station_service import StationService
-
-            station_service = StationService(db)
-            dispatcher_station = await station_service.get_dispatcher_station(user.id)
-            if dispatcher_station:
+            capabilities = await get_role_capabilities(db, user.id)
+            if capabilities.dispatcher_station_id is not None:
                 target = DispatcherState.MENU.value
                 await state_manager.force_state(user.id, platform, target, context={})
-                return target, dispatcher_station.id
+                return target, capabilities.dispatcher_station_id
 
         target = SenderState.MENU.value
         await state_manager.force_state(user.id, platform, target, context={})
@@ -1234,1015 +1220,1086 @@ async def send_welcome_message(phone_number: str):
     await send_whatsapp_message(phone_number, welcome_text, keyboard, button_text="🚗 תפריט ראשי")
 
 
-@router.post(
-    "/webhook",
-    summary="Webhook - WhatsApp (קבלת הודעות נכנסות)",
-    description=(
-        "נקודת כניסה לקבלת הודעות מ-WhatsApp Gateway. "
-        "מבצעת ניתוב לזרימת שולח/שליח לפי role ומנהלת state machine."
-    ),
-    responses={
-        200: {"description": "הודעה התקבלה ועובדה"},
-        403: {"description": "חתימה לא תקינה"},
-        429: {"description": "IP חסום עקב ניסיונות אימות כושלים"},
-    },
-)
-async def whatsapp_webhook(
-    request: Request,
-    background_tasks: BackgroundTasks,
-    db: AsyncSession = Depends(get_db),
-    payload: WhatsAppWebhookPayload = Depends(_get_verified_payload),
-):
+# ──────────────────────────────────────────────
+#  עיבוד batch של הודעות — כשה-Gateway/Meta מוסרים תור שהצטבר (למשל אחרי
+#  reconnect), הודעות של שולחים שונים רצות במקביל, כל שולח עם סשן משלו
+#  מה-pool, והסדר בתוך אותו שולח נשמר. משותף ל-WPPConnect ול-Cloud API.
+# ──────────────────────────────────────────────
+
+
+def _wppconnect_sender_key(message: WhatsAppMessage) -> str:
+    return (message.sender_id or message.from_number or "").strip()
+
+
+def _use_per_sender_mode(items: Sequence[_T], sender_key: Callable[[_T], str]) -> bool:
+    """מצב מקבילי רק כשהוא מופעל ויש בבקשה יותר משולח אחד"""
+    if not settings.WHATSAPP_WEBHOOK_CONCURRENT_SENDERS or len(items) < 2:
+        return False
+    first = sender_key(items[0])
+    return any(sender_key(item) != first for item in items[1:])
+
+
+async def _process_per_sender(
+    items: Sequence[_T],
+    sender_key: Callable[[_T], str],
+    handle: Callable[[AsyncSession, _T, list[dict]], Awaitable[None]],
+) -> list[dict]:
     """
-    Handle incoming WhatsApp messages.
-    Routes to sender or courier handlers based on user role.
+    עיבוד הודעות מקובצות לפי שולח.
+
+    הודעות של אותו שולח רצות ברצף על סשן אחד; שולחים שונים רצים במקביל עד
+    WHATSAPP_WEBHOOK_SENDER_CONCURRENCY. התגובות מוחזרות לפי סדר ההופעה
+    הראשונה של כל שולח ב-batch.
     """
+    groups: dict[str, list[_T]] = {}
+    for item in items:
+        groups.setdefault(sender_key(item), []).append(item)
 
-    responses = []
+    slots = asyncio.Semaphore(settings.WHATSAPP_WEBHOOK_SENDER_CONCURRENCY)
 
-    for message in payload.messages:
-        # מניעת עיבוד כפול — בדיקה מול טבלת idempotency ב-DB
-        # עטוף ב-try כדי שכשל ב-idempotency (למשל DataError) לא יעצור הודעות הבאות
-        try:
-            if not await _try_acquire_message(db, message.message_id, "whatsapp"):
-                continue
-        except Exception:
-            logger.error(
-                "Idempotency check failed, skipping message",
-                extra_data={"message_id": message.message_id},
-                exc_info=True,
-            )
-            continue
+    async def _run_sender(sender: str, batch: list[_T]) -> list[dict]:
+        results: list[dict] = []
+        async with slots:
+            try:
+                async with AsyncSessionLocal() as session:
+                    for item in batch:
+                        await handle(session, item, results)
+            except Exception:
+                # כשל ברמת הסשן (למשל pool מלא) — שאר השולחים ממשיכים
+                logger.error(
+                    "Per-sender webhook processing failed",
+                    extra_data={
+                        "sender": PhoneNumberValidator.mask(sender),
+                        "messages": len(batch),
+                    },
+                    exc_info=True,
+                )
+        return results
 
-        _msg_failed = False
-        try:
-            text = message.text or ""
-            sender_id = (message.sender_id or message.from_number or "").strip()
-            reply_to = (message.reply_to or message.from_number or "").strip()
-            from_number = (message.from_number or "").strip()
-            resolved_phone = (message.resolved_phone or "").strip()
-            # תמונות רגילות (media_type מכיל 'image')
-            # או מסמך שהוא בעצם תמונה (media_type=document + mime_type מתחיל ב-image/)
-            if message.media_url and message.media_type:
-                mt = message.media_type.lower()
-                if "image" in mt:
-                    photo_file_id = message.media_url
-                elif 'document' in mt and message.mime_type and message.mime_type.lower().startswith('image/'):
-                    photo_file_id = message.media_url
-                else:
-                    photo_file_id = None
+    per_sender = await asyncio.gather(
+        *(_run_sender(sender, batch) for sender, batch in groups.items())
+    )
+    return [result for results in per_sender for result in results]
+
+
+async def _process_whatsapp_message(
+    db: AsyncSession,
+    message: WhatsAppMessage,
+    background_tasks: BackgroundTasks,
+    responses: list[dict],
+) -> None:
+    """עיבוד הודעה בודדת מה-Gateway — תגובה (אם יש) נוספת ל-responses"""
+    # מניעת עיבוד כפול — בדיקה מול טבלת idempotency ב-DB
+    # עטוף ב-try כדי שכשל ב-idempotency (למשל DataError) לא יעצור הודעות הבאות
+    try:
+        if not await _try_acquire_message(db, message.message_id, "whatsapp"):
+            return
+    except Exception:
+        logger.error(
+            "Idempotency check failed, skipping message",
+            extra_data={"message_id": message.message_id},
+            exc_info=True,
+        )
+        return
+
+    _msg_failed = False
+    try:
+        text = message.text or ""
+        sender_id = (message.sender_id or message.from_number or "").strip()
+        reply_to = (message.reply_to or message.from_number or "").strip()
+        from_number = (message.from_number or "").strip()
+        resolved_phone = (message.resolved_phone or "").strip()
+        # תמונות רגילות (media_type מכיל 'image')
+        # או מסמך שהוא בעצם תמונה (media_type=document + mime_type מתחיל ב-image/)
+        if message.media_url and message.media_type:
+            mt = message.media_type.lower()
+            if "image" in mt:
+                photo_file_id = message.media_url
+            elif 'document' in mt and message.mime_type and message.mime_type.lower().startswith('image/'):
+                photo_file_id = message.media_url
             else:
                 photo_file_id = None
+        else:
+            photo_file_id = None
 
-            # מיקום GPS (iDriver סשן 5 — חיפוש לפי מיקום)
-            location_lat: float | None = message.location_latitude
-            location_lng: float | None = message.location_longitude
+        # מיקום GPS (iDriver סשן 5 — חיפוש לפי מיקום)
+        location_lat: float | None = message.location_latitude
+        location_lng: float | None = message.location_longitude
 
-            logger.debug(
-                "WhatsApp message received",
-                extra_data={
-                    "from": PhoneNumberValidator.mask(sender_id),
-                    "reply_to": PhoneNumberValidator.mask(reply_to),
-                    "text_preview": text[:50] if text else "",
-                    "media_type": message.media_type,
-                    "has_media_url": bool(message.media_url),
-                },
-            )
-    
-            # Skip empty messages (מיקום GPS גם נחשב תוכן — לחיפוש נסיעות)
-            if not text and not photo_file_id and location_lat is None:
-                continue
-    
-            # בדיקה אם ההודעה מגיעה מקבוצה (group ID מסתיים ב-@g.us)
-            is_group_message = sender_id.endswith("@g.us")
-    
-            if is_group_message:
-                # בדיקה אם זו קבוצת המנהלים
-                if (
-                    settings.WHATSAPP_ADMIN_GROUP_ID
-                    and sender_id == settings.WHATSAPP_ADMIN_GROUP_ID
-                ):
-                    logger.info(
-                        "Admin group message received",
-                        extra_data={"group_id": sender_id, "text": text[:50]},
+        logger.debug(
+            "WhatsApp message received",
+            extra_data={
+                "from": PhoneNumberValidator.mask(sender_id),
+                "reply_to": PhoneNumberValidator.mask(reply_to),
+                "text_preview": text[:50] if text else "",
+                "media_type": message.media_type,
+                "has_media_url": bool(message.media_url),
+            },
+        )
+
+        # Skip empty messages (מיקום GPS גם נחשב תוכן — לחיפוש נסיעות)
+        if not text and not photo_file_id and location_lat is None:
+            return
+
+        # בדיקה אם ההודעה מגיעה מקבוצה (group ID מסתיים ב-@g.us)
+        is_group_message = sender_id.endswith("@g.us")
+
+        if is_group_message:
+            # בדיקה אם זו קבוצת המנהלים
+            if (
+                settings.WHATSAPP_ADMIN_GROUP_ID
+                and sender_id == settings.WHATSAPP_ADMIN_GROUP_ID
+            ):
+                logger.info(
+                    "Admin group message received",
+                    extra_data={"group_id": sender_id, "text": text[:50]},
+                )
+
+                # ניסיון לזהות פקודת מנהל
+                response_text = await handle_admin_group_command(
+                    db, text, background_tasks=background_tasks
+                )
+
+                if response_text:
+                    # שליחת תגובה לקבוצה
+                    background_tasks.add_task(
+                        send_whatsapp_message, sender_id, response_text  # שליחה לקבוצה
                     )
-    
-                    # ניסיון לזהות פקודת מנהל
-                    response_text = await handle_admin_group_command(
-                        db, text, background_tasks=background_tasks
+                    responses.append(
+                        {
+                            "from": sender_id,
+                            "response": response_text,
+                            "admin_command": True,
+                        }
                     )
-    
-                    if response_text:
-                        # שליחת תגובה לקבוצה
-                        background_tasks.add_task(
-                            send_whatsapp_message, sender_id, response_text  # שליחה לקבוצה
-                        )
-                        responses.append(
-                            {
-                                "from": sender_id,
-                                "response": response_text,
-                                "admin_command": True,
-                            }
-                        )
-                    else:
-                        # הודעה רגילה בקבוצה (לא פקודה) - מתעלמים
-                        logger.debug("Non-command message in admin group, ignoring")
-    
                 else:
-                    # הודעה מקבוצה אחרת - מתעלמים
-                    logger.debug(
-                        "Message from non-admin group, ignoring",
-                        extra_data={"group_id": sender_id},
-                    )
-    
-                continue  # לא ממשיכים לטיפול רגיל בהודעות מקבוצות
-    
-            # Get or create user
-            user, is_new_user, _normalized_phone = await get_or_create_user(
-                db,
-                sender_id,
-                from_number=from_number,
-                reply_to=reply_to,
-                resolved_phone=resolved_phone,
-            )
+                    # הודעה רגילה בקבוצה (לא פקודה) - מתעלמים
+                    logger.debug("Non-command message in admin group, ignoring")
 
-            # לוג זיהוי משתמש — observability למעקב אחר חיפוש/יצירה
-            logger.info(
-                "User resolved",
-                extra_data={
-                    "resolved_user_id": user.id,
-                    "lookup_by": "whatsapp",
-                    "sender_id": PhoneNumberValidator.mask(sender_id) if sender_id else None,
-                    "normalized_phone": PhoneNumberValidator.mask(_normalized_phone) if _normalized_phone else None,
-                    "is_new": is_new_user,
-                    "role": user.role.value if user.role else None,
-                },
-            )
+            else:
+                # הודעה מקבוצה אחרת - מתעלמים
+                logger.debug(
+                    "Message from non-admin group, ignoring",
+                    extra_data={"group_id": sender_id},
+                )
+
+            return  # לא ממשיכים לטיפול רגיל בהודעות מקבוצות
+
+        # Get or create user
+        user, is_new_user, _normalized_phone = await get_or_create_user(
+            db,
+            sender_id,
+            from_number=from_number,
+            reply_to=reply_to,
+            resolved_phone=resolved_phone,
+        )
+
+        # לוג זיהוי משתמש — observability למעקב אחר חיפוש/יצירה
+        logger.info(
+            "User resolved",
+            extra_data={
+                "resolved_user_id": user.id,
+                "lookup_by": "whatsapp",
+                "sender_id": PhoneNumberValidator.mask(sender_id) if sender_id else None,
+                "normalized_phone": PhoneNumberValidator.mask(_normalized_phone) if _normalized_phone else None,
+                "is_new": is_new_user,
+                "role": user.role.value if user.role else None,
+            },
+        )
 
-            # טיפול בפקודות אישור/דחייה מהודעות פרטיות של מנהלים
-            # חייב להיות לפני בדיקת is_new_user כדי שמנהל חדש שעוד לא ב-DB
-            # יוכל לאשר/לדחות שליחים כבר מההודעה הראשונה שלו.
-            # בודקים גם resolved_phone (טלפון שהגטוויי חילץ מ-LID) וגם phone_number מה-DB
-            # (במקרה שהמשתמש נוצר לפני שהגטוויי עבר ל-LID).
-            is_admin_sender = _is_whatsapp_admin_any(
-                sender_id, reply_to, from_number, resolved_phone, user.phone_number
+        # טיפול בפקודות אישור/דחייה מהודעות פרטיות של מנהלים
+        # חייב להיות לפני בדיקת is_new_user כדי שמנהל חדש שעוד לא ב-DB
+        # יוכל לאשר/לדחות שליחים כבר מההודעה הראשונה שלו.
+        # בודקים גם resolved_phone (טלפון שהגטוויי חילץ מ-LID) וגם phone_number מה-DB
+        # (במקרה שהמשתמש נוצר לפני שהגטוויי עבר ל-LID).
+        is_admin_sender = _is_whatsapp_admin_any(
+            sender_id, reply_to, from_number, resolved_phone, user.phone_number
+        )
+        if is_admin_sender and text:
+            admin_response = await handle_admin_private_command(
+                db,
+                text,
+                admin_name=user.name or PhoneNumberValidator.mask(sender_id),
+                background_tasks=background_tasks,
             )
-            if is_admin_sender and text:
-                admin_response = await handle_admin_private_command(
-                    db,
-                    text,
-                    admin_name=user.name or PhoneNumberValidator.mask(sender_id),
-                    background_tasks=background_tasks,
+            if admin_response:
+                # שליחת התגובה למספר המנהל מההגדרות (שאנחנו יודעים שעובד)
+                # במקום ל-reply_to (שעלול להיות @lid שהגטוויי לא יודע לשלוח אליו)
+                admin_send_to = _resolve_admin_send_target(
+                    sender_id, reply_to, from_number, resolved_phone
+                )
+                background_tasks.add_task(send_whatsapp_message, admin_send_to, admin_response)
+                responses.append({
+                    "from": sender_id,
+                    "response": admin_response,
+                    "admin_command": True
+                })
+                return
+
+        # שלב 4: טיפול בפקודות אישור/דחיית משלוח (סדרנים)
+        if text and not is_new_user:
+            delivery_approval = _match_delivery_approval_command(text)
+            if delivery_approval:
+                action, delivery_id = delivery_approval
+
+                # שליפת המשלוח לבדיקת תחנה
+                from app.domain.services.station_service import StationService
+                from app.db.models.delivery import Delivery
+                station_service = StationService(db)
+
+                delivery_result = await db.execute(
+                    select(Delivery).where(Delivery.id == delivery_id)
                 )
-                if admin_response:
-                    # שליחת התגובה למספר המנהל מההגדרות (שאנחנו יודעים שעובד)
-                    # במקום ל-reply_to (שעלול להיות @lid שהגטוויי לא יודע לשלוח אליו)
-                    admin_send_to = _resolve_admin_send_target(
-                        sender_id, reply_to, from_number, resolved_phone
+                target_delivery = delivery_result.scalar_one_or_none()
+
+                # בדיקה שהמשלוח קיים ושייך לתחנה
+                if not target_delivery or not target_delivery.station_id:
+                    background_tasks.add_task(
+                        send_whatsapp_message, reply_to,
+                        "❌ המשלוח לא נמצא."
                     )
-                    background_tasks.add_task(send_whatsapp_message, admin_send_to, admin_response)
                     responses.append({
                         "from": sender_id,
-                        "response": admin_response,
-                        "admin_command": True
+                        "response": "❌ המשלוח לא נמצא.",
+                        "delivery_approval": True,
                     })
-                    continue
-
-            # שלב 4: טיפול בפקודות אישור/דחיית משלוח (סדרנים)
-            if text and not is_new_user:
-                delivery_approval = _match_delivery_approval_command(text)
-                if delivery_approval:
-                    action, delivery_id = delivery_approval
-
-                    # שליפת המשלוח לבדיקת תחנה
-                    from app.domain.services.station_service import StationService
-                    from app.db.models.delivery import Delivery
-                    station_service = StationService(db)
-
-                    delivery_result = await db.execute(
-                        select(Delivery).where(Delivery.id == delivery_id)
-                    )
-                    target_delivery = delivery_result.scalar_one_or_none()
+                    return
 
-                    # בדיקה שהמשלוח קיים ושייך לתחנה
-                    if not target_delivery or not target_delivery.station_id:
-                        background_tasks.add_task(
-                            send_whatsapp_message, reply_to,
-                            "❌ המשלוח לא נמצא."
-                        )
-                        responses.append({
-                            "from": sender_id,
-                            "response": "❌ המשלוח לא נמצא.",
-                            "delivery_approval": True,
-                        })
-                        continue
-
-                    # בדיקה שהסדרן שייך לתחנה של המשלוח הספציפי
-                    is_disp = await station_service.is_dispatcher_of_station(
-                        user.id, target_delivery.station_id
-                    )
-                    if not is_disp:
-                        background_tasks.add_task(
-                            send_whatsapp_message, reply_to,
-                            "❌ אין לך הרשאה לאשר/לדחות משלוחים בתחנה זו."
-                        )
-                        responses.append({
-                            "from": sender_id,
-                            "response": "❌ אין לך הרשאה לאשר/לדחות משלוחים בתחנה זו.",
-                            "delivery_approval": True,
-                        })
-                        continue
-
-                    approval_msg = await _handle_whatsapp_delivery_approval(
-                        db, action, delivery_id,
-                        dispatcher_id=user.id,
-                    )
+                # בדיקה שהסדרן שייך לתחנה של המשלוח הספציפי
+                is_disp = await station_service.is_dispatcher_of_station(
+                    user.id, target_delivery.station_id
+                )
+                if not is_disp:
                     background_tasks.add_task(
-                        send_whatsapp_message, reply_to, approval_msg
+                        send_whatsapp_message, reply_to,
+                        "❌ אין לך הרשאה לאשר/לדחות משלוחים בתחנה זו."
                     )
                     responses.append({
                         "from": sender_id,
-                        "response": approval_msg,
+                        "response": "❌ אין לך הרשאה לאשר/לדחות משלוחים בתחנה זו.",
                         "delivery_approval": True,
                     })
-                    continue
+                    return
 
-            # Initialize state manager
-            state_manager = StateManager(db)
-    
-            # New user - show welcome message with role selection [1.1]
-            if is_new_user:
-                background_tasks.add_task(send_welcome_message, reply_to)
-                responses.append(
-                    {"from": sender_id, "response": "welcome", "new_user": True}
-                )
-                continue
-    
-            # Handle "#" to return to main menu
-            if text.strip() in {"#", "תפריט ראשי"}:
-                # רענון מהDB לפני בדיקת סטטוס - למניעת stale data אם האדמין אישר בינתיים
-                await db.refresh(user)
-                # לוג לדיבאג - מראה את מצב המשתמש בלחיצה על #
-                logger.info(
-                    "User pressed # to return to menu",
-                    extra_data={
-                        "user_id": user.id,
-                        "phone": PhoneNumberValidator.mask(sender_id),
-                        "role": user.role.value if user.role else None,
-                        "approval_status": (
-                            user.approval_status.value if user.approval_status else None
-                        ),
-                    },
+                approval_msg = await _handle_whatsapp_delivery_approval(
+                    db, action, delivery_id,
+                    dispatcher_id=user.id,
                 )
-    
-                # אדמין (לפי WHATSAPP_ADMIN_NUMBERS): מאפשרים יציאה "קשיחה" מכל זרימה וחזרה לתפריט הראשי
-                # של כל אפשרויות הרישום.
-                if is_admin_sender:
-                    # שחזור תפקיד לשולח כדי שהודעות הבאות לא יגיעו ל-CourierStateHandler
-                    if user.role == UserRole.COURIER:
-                        user.role = UserRole.SENDER
-                        await db.commit()
-    
-                    # איפוס state כדי לאפשר עבודה עם תפריט ראשי גם אם האדמין היה באמצע זרימה רב-שלבית כשליח
-                    await state_manager.force_state(
-                        user.id,
-                        "whatsapp",
-                        SenderState.MENU.value,
-                        context={"admin_root_menu": True},
-                    )
-    
-                    # שליחה למספר המנהל מההגדרות (reply_to עלול להיות @lid)
-                    admin_send_to = _resolve_admin_send_target(
-                        sender_id, reply_to, from_number, resolved_phone
-                    )
-                    background_tasks.add_task(send_welcome_message, admin_send_to)
-                    responses.append(
-                        {
-                            "from": sender_id,
-                            "response": "welcome (admin main menu)",
-                            "new_state": SenderState.MENU.value,
-                            "admin_main_menu": True,
-                        }
-                    )
-                    continue
-    
-                # Reset state to menu
-                if user.role == UserRole.COURIER:
-                    # בדיקה אם המשתמש נכנס לזרימת שליח מתפריט אדמין
-                    # (fallback למקרה שזיהוי אדמין לפי מספר טלפון נכשל, למשל בגלל LID)
-                    _hash_ctx = await state_manager.get_context(user.id, "whatsapp")
-                    _entered_as_admin = _hash_ctx.get("entered_as_admin", False)
-    
-                    if user.approval_status != ApprovalStatus.APPROVED or _entered_as_admin:
-                        # שליח לא מאושר / אדמין שנכנס לזרימת שליח - מחזירים לתפריט ראשי
-                        logger.info(
-                            "Courier pressed #, switching to sender",
-                            extra_data={
-                                "user_id": user.id,
-                                "phone": PhoneNumberValidator.mask(sender_id),
-                                "reply_to": PhoneNumberValidator.mask(reply_to),
-                                "entered_as_admin": _entered_as_admin,
-                                "approval_status": (
-                                    user.approval_status.value if user.approval_status else None
-                                ),
-                            },
-                        )
-                        user.role = UserRole.SENDER
-                        await db.commit()
-                        await state_manager.force_state(
-                            user.id, "whatsapp", SenderState.MENU.value, context={}
-                        )
-                        # אם נכנס כאדמין, שליחה ליעד מנהל (reply_to עלול להיות LID)
-                        _send_to = (
-                            _resolve_admin_send_target(
-                                sender_id, reply_to, from_number, resolved_phone
-                            )
-                            if _entered_as_admin
-                            else reply_to
-                        )
-                        background_tasks.add_task(send_welcome_message, _send_to)
-                        responses.append(
-                            {
-                                "from": sender_id,
-                                "response": "welcome (switched from courier to sender)",
-                                "new_state": SenderState.MENU.value,
-                            }
-                        )
-                        continue
-    
-                response, new_state = await _route_to_role_menu_wa(user, db, state_manager)
-    
                 background_tasks.add_task(
-                    send_whatsapp_message, reply_to, response.text, response.keyboard, response.button_text
-                )
-                responses.append(
-                    {"from": sender_id, "response": response.text, "new_state": new_state}
+                    send_whatsapp_message, reply_to, approval_msg
                 )
-                continue
-    
-            # טיפול בכפתורי תפריט ראשי [שלב 1]
-            # הכפתורים פעילים רק למשתמשים שאינם באמצע זרימה רב-שלבית
-            # (רישום שליח, זרימת סדרן, זרימת בעל תחנה)
-            _current_state_value = await state_manager.get_current_state(
-                user.id, "whatsapp"
-            )
-            _is_courier_in_registration = (
-                user.role == UserRole.COURIER
-                and _current_state_value
-                in {
-                    CourierState.REGISTER_COLLECT_NAME.value,
-                    CourierState.REGISTER_COLLECT_DOCUMENT.value,
-                    CourierState.REGISTER_COLLECT_SELFIE.value,
-                    CourierState.REGISTER_COLLECT_VEHICLE_CATEGORY.value,
-                    CourierState.REGISTER_COLLECT_VEHICLE_PHOTO.value,
-                    CourierState.REGISTER_TERMS.value,
-                }
+                responses.append({
+                    "from": sender_id,
+                    "response": approval_msg,
+                    "delivery_approval": True,
+                })
+                return
+
+        # Initialize state manager
+        state_manager = StateManager(db)
+
+        # New user - show welcome message with role selection [1.1]
+        if is_new_user:
+            background_tasks.add_task(send_welcome_message, reply_to)
+            responses.append(
+                {"from": sender_id, "response": "welcome", "new_user": True}
             )
-            _is_in_multi_step_flow = _is_courier_in_registration or (
-                isinstance(_current_state_value, str)
-                and (
-                    _current_state_value.startswith(("DISPATCHER.", "STATION.", "DRIVER.", "ADMIN."))
-                    # הגנה על זרימות שולח: מונע "תחנה" וכו' מלתפוס כתובות כמו "תחנה מרכזית"
-                    or (
-                        _current_state_value.startswith("SENDER.")
-                        and _current_state_value != SenderState.MENU.value
-                    )
-                )
+            return
+
+        # Handle "#" to return to main menu
+        if text.strip() in {"#", "תפריט ראשי"}:
+            # רענון מהDB לפני בדיקת סטטוס - למניעת stale data אם האדמין אישר בינתיים
+            await db.refresh(user)
+            # לוג לדיבאג - מראה את מצב המשתמש בלחיצה על #
+            logger.info(
+                "User pressed # to return to menu",
+                extra_data={
+                    "user_id": user.id,
+                    "phone": PhoneNumberValidator.mask(sender_id),
+                    "role": user.role.value if user.role else None,
+                    "approval_status": (
+                        user.approval_status.value if user.approval_status else None
+                    ),
+                },
             )
-            _context = await state_manager.get_context(user.id, "whatsapp")
-            _admin_root_menu = bool(_context.get("admin_root_menu")) and is_admin_sender
-
-            # חזרה לאדמין — אדמין שהחליף תפקיד רוצה לחזור
-            if "חזרה לאדמין" in text and _context.get("original_role") == "admin":
-                original_approval = _context.get("original_approval_status")
-                user.role = UserRole.ADMIN
-                if original_approval is not None:
-                    user.approval_status = ApprovalStatus(original_approval) if original_approval else None
-                else:
-                    user.approval_status = None
-                await db.commit()
 
-                from app.state_machine.admin_handler import AdminStateHandler
-                from app.state_machine.states import AdminState
+            # אדמין (לפי WHATSAPP_ADMIN_NUMBERS): מאפשרים יציאה "קשיחה" מכל זרימה וחזרה לתפריט הראשי
+            # של כל אפשרויות הרישום.
+            if is_admin_sender:
+                # שחזור תפקיד לשולח כדי שהודעות הבאות לא יגיעו ל-CourierStateHandler
+                if user.role == UserRole.COURIER:
+                    user.role = UserRole.SENDER
+                    await db.commit()
 
+                # איפוס state כדי לאפשר עבודה עם תפריט ראשי גם אם האדמין היה באמצע זרימה רב-שלבית כשליח
                 await state_manager.force_state(
-                    user.id, "whatsapp", AdminState.MENU.value,
-                    context={
-                        "original_role": None,
-                        "original_approval_status": None,
-                        "admin_station_id": None,
-                        "admin_target_role": None,
-                    },
+                    user.id,
+                    "whatsapp",
+                    SenderState.MENU.value,
+                    context={"admin_root_menu": True},
                 )
-                admin_handler = AdminStateHandler(db, platform="whatsapp")
-                response, new_state = await admin_handler.handle_message(user, "תפריט", None)
-                background_tasks.add_task(
-                    send_whatsapp_message, reply_to, response.text, response.keyboard, response.button_text
+
+                # שליחה למספר המנהל מההגדרות (reply_to עלול להיות @lid)
+                admin_send_to = _resolve_admin_send_target(
+                    sender_id, reply_to, from_number, resolved_phone
+                )
+                background_tasks.add_task(send_welcome_message, admin_send_to)
+                responses.append(
+                    {
+                        "from": sender_id,
+                        "response": "welcome (admin main menu)",
+                        "new_state": SenderState.MENU.value,
+                        "admin_main_menu": True,
+                    }
                 )
-                continue
-
-            if not _is_in_multi_step_flow:
-                if (
-                    user.role in (UserRole.SENDER, UserRole.ADMIN) or _admin_root_menu
-                ) and ("הצטרפות למנוי" in text or "שליח" in text):
-                    # ניתוב לתהליך הרישום כנהג/שליח
-                    user.role = UserRole.COURIER
+                return
+
+            # Reset state to menu
+            if user.role == UserRole.COURIER:
+                # בדיקה אם המשתמש נכנס לזרימת שליח מתפריט אדמין
+                # (fallback למקרה שזיהוי אדמין לפי מספר טלפון נכשל, למשל בגלל LID)
+                _hash_ctx = await state_manager.get_context(user.id, "whatsapp")
+                _entered_as_admin = _hash_ctx.get("entered_as_admin", False)
+
+                if user.approval_status != ApprovalStatus.APPROVED or _entered_as_admin:
+                    # שליח לא מאושר / אדמין שנכנס לזרימת שליח - מחזירים לתפריט ראשי
+                    logger.info(
+                        "Courier pressed #, switching to sender",
+                        extra_data={
+                            "user_id": user.id,
+                            "phone": PhoneNumberValidator.mask(sender_id),
+                            "reply_to": PhoneNumberValidator.mask(reply_to),
+                            "entered_as_admin": _entered_as_admin,
+                            "approval_status": (
+                                user.approval_status.value if user.approval_status else None
+                            ),
+                        },
+                    )
+                    user.role = UserRole.SENDER
                     await db.commit()
-    
-                    # שמירת דגל אדמין בקונטקסט כדי לאפשר חזרה לתפריט ראשי גם אם זיהוי אדמין נכשל
-                    courier_context = {}
-                    if _admin_root_menu or is_admin_sender:
-                        courier_context["entered_as_admin"] = True
-    
                     await state_manager.force_state(
-                        user.id, "whatsapp", CourierState.INITIAL.value, context=courier_context
-                    )
-    
-                    handler = CourierStateHandler(db, platform="whatsapp")
-                    response, new_state = await handler.handle_message(
-                        user, text, photo_file_id
+                        user.id, "whatsapp", SenderState.MENU.value, context={}
                     )
-    
-                    background_tasks.add_task(
-                        send_whatsapp_message, reply_to, response.text, response.keyboard, response.button_text
+                    # אם נכנס כאדמין, שליחה ליעד מנהל (reply_to עלול להיות LID)
+                    _send_to = (
+                        _resolve_admin_send_target(
+                            sender_id, reply_to, from_number, resolved_phone
+                        )
+                        if _entered_as_admin
+                        else reply_to
                     )
+                    background_tasks.add_task(send_welcome_message, _send_to)
                     responses.append(
                         {
                             "from": sender_id,
-                            "response": response.text,
-                            "new_state": new_state,
+                            "response": "welcome (switched from courier to sender)",
+                            "new_state": SenderState.MENU.value,
                         }
                     )
-                    continue
-    
-                if (
-                    user.role in (UserRole.SENDER, UserRole.ADMIN) or _admin_root_menu
-                ) and ("הצטרפות כנהג" in text or "נהג" in text):
-                    # ניתוב לתהליך רישום כנהג (iDriver)
-                    from app.state_machine.driver_handler import DriverStateHandler
-
-                    user.role = UserRole.DRIVER
-                    await db.commit()
+                    return
 
-                    # שמירת דגל אדמין בקונטקסט כדי לאפשר חזרה לתפריט ראשי גם אם זיהוי אדמין נכשל
-                    driver_context: dict = {}
-                    if _admin_root_menu or is_admin_sender:
-                        driver_context["entered_as_admin"] = True
+            response, new_state = await _route_to_role_menu_wa(user, db, state_manager)
 
-                    await state_manager.force_state(
-                        user.id, "whatsapp", DriverState.INITIAL.value, context=driver_context
-                    )
+            background_tasks.add_task(
+                send_whatsapp_message, reply_to, response.text, response.keyboard, response.button_text
+            )
+            responses.append(
+                {"from": sender_id, "response": response.text, "new_state": new_state}
+            )
+            return
 
-                    handler = DriverStateHandler(db, platform="whatsapp")
-                    response, new_state = await handler.handle_message(
-                        user, text, photo_file_id
-                    )
-
-                    background_tasks.add_task(
-                        send_whatsapp_message, reply_to, response.text, response.keyboard, response.button_text
-                    )
-                    responses.append(
-                        {
-                            "from": sender_id,
-                            "response": response.text,
-                            "new_state": new_state,
-                        }
-                    )
-                    continue
-
-                if ("העלאת משלוח מהיר" in text or "משלוח מהיר" in text) and (
-                    user.role in (UserRole.SENDER, UserRole.ADMIN) or _admin_root_menu
-                ):
-                    # קישור חיצוני לקבוצת WhatsApp
-                    if settings.WHATSAPP_GROUP_LINK:
-                        msg_text = (
-                            "📦 העלאת משלוח מהיר\n\n"
-                            "להעלאת משלוח מהיר, הצטרפו לקבוצת WhatsApp שלנו:\n"
-                            f"{settings.WHATSAPP_GROUP_LINK}"
-                        )
-                    else:
-                        msg_text = (
-                            "📦 העלאת משלוח מהיר\n\n"
-                            "להעלאת משלוח מהיר, פנו להנהלה לקבלת קישור לקבוצת WhatsApp."
-                        )
-                    background_tasks.add_task(send_whatsapp_message, reply_to, msg_text)
-                    responses.append(
-                        {"from": sender_id, "response": msg_text, "new_state": None}
-                    )
-                    continue
-    
-                if ("הצטרפות כתחנה" in text or "תחנה" in text) and (
-                    user.role in (UserRole.SENDER, UserRole.ADMIN) or _admin_root_menu
-                ):
-                    # הודעה שיווקית עבור תחנות
-                    station_text = (
-                        "🏪 הצטרפות כתחנה\n\n"
-                        "המערכת של ShipShare מסדרת לך את התחנה!\n\n"
-                        "✅ ניהול נהגים אוטומטי\n"
-                        "✅ גבייה מסודרת\n"
-                        "✅ תיעוד משלוחים מלא\n"
-                        "✅ סדר בבלגן\n\n"
-                        "לפרטים נוספים, פנו להנהלה."
-                    )
-                    background_tasks.add_task(
-                        send_whatsapp_message, reply_to, station_text, [["📞 פנייה לניהול"]]
-                    )
-                    responses.append(
-                        {"from": sender_id, "response": station_text, "new_state": None}
-                    )
-                    continue
-    
-    
-                # כל תפקיד שנמצא בזרימת סדרן מוחרג — מנוהל דרך בלוק DISPATCHER למטה
-                _in_dispatcher_flow = (
-                    isinstance(_current_state_value, str)
-                    and _current_state_value.startswith("DISPATCHER.")
+        # טיפול בכפתורי תפריט ראשי [שלב 1]
+        # הכפתורים פעילים רק למשתמשים שאינם באמצע זרימה רב-שלבית
+        # (רישום שליח, זרימת סדרן, זרימת בעל תחנה)
+        _current_state_value = await state_manager.get_current_state(
+            user.id, "whatsapp"
+        )
+        _is_courier_in_registration = (
+            user.role == UserRole.COURIER
+            and _current_state_value
+            in {
+                CourierState.REGISTER_COLLECT_NAME.value,
+                CourierState.REGISTER_COLLECT_DOCUMENT.value,
+                CourierState.REGISTER_COLLECT_SELFIE.value,
+                CourierState.REGISTER_COLLECT_VEHICLE_CATEGORY.value,
+                CourierState.REGISTER_COLLECT_VEHICLE_PHOTO.value,
+                CourierState.REGISTER_TERMS.value,
+            }
+        )
+        _is_in_multi_step_flow = _is_courier_in_registration or (
+            isinstance(_current_state_value, str)
+            and (
+                _current_state_value.startswith(("DISPATCHER.", "STATION.", "DRIVER.", "ADMIN."))
+                # הגנה על זרימות שולח: מונע "תחנה" וכו' מלתפוס כתובות כמו "תחנה מרכזית"
+                or (
+                    _current_state_value.startswith("SENDER.")
+                    and _current_state_value != SenderState.MENU.value
                 )
-                if "חזרה לתפריט" in text and (
-                    (
-                        user.role not in (UserRole.COURIER, UserRole.STATION_OWNER)
-                        and not _in_dispatcher_flow
-                    )
-                    or _admin_root_menu
-                ):
-                    # כפתור "חזרה לתפריט" - שולחים רגילים חוזרים לתפריט הראשי
-                    background_tasks.add_task(send_welcome_message, reply_to)
-                    responses.append(
-                        {"from": sender_id, "response": "welcome", "new_state": None}
-                    )
-                    continue
-    
-            # פנייה לניהול — פתוח לכל התפקידים, ללא תלות ב-guard של זרימה רב-שלבית
-            if "פנייה לניהול" in text:
-                # שמירת flag בקונטקסט — ההודעה הבאה תועבר להנהלה
-                await state_manager.update_context(
-                    user.id, "whatsapp", "contact_admin_pending", True
+            )
+        )
+        _context = await state_manager.get_context(user.id, "whatsapp")
+        _admin_root_menu = bool(_context.get("admin_root_menu")) and is_admin_sender
+
+        # חזרה לאדמין — אדמין שהחליף תפקיד רוצה לחזור
+        if "חזרה לאדמין" in text and _context.get("original_role") == "admin":
+            original_approval = _context.get("original_approval_status")
+            user.role = UserRole.ADMIN
+            if original_approval is not None:
+                user.approval_status = ApprovalStatus(original_approval) if original_approval else None
+            else:
+                user.approval_status = None
+            await db.commit()
+
+            from app.state_machine.admin_handler import AdminStateHandler
+            from app.state_machine.states import AdminState
+
+            await state_manager.force_state(
+                user.id, "whatsapp", AdminState.MENU.value,
+                context={
+                    "original_role": None,
+                    "original_approval_status": None,
+                    "admin_station_id": None,
+                    "admin_target_role": None,
+                },
+            )
+            admin_handler = AdminStateHandler(db, platform="whatsapp")
+            response, new_state = await admin_handler.handle_message(user, "תפריט", None)
+            background_tasks.add_task(
+                send_whatsapp_message, reply_to, response.text, response.keyboard, response.button_text
+            )
+            return
+
+        if not _is_in_multi_step_flow:
+            if (
+                user.role in (UserRole.SENDER, UserRole.ADMIN) or _admin_root_menu
+            ) and ("הצטרפות למנוי" in text or "שליח" in text):
+                # ניתוב לתהליך הרישום כנהג/שליח
+                user.role = UserRole.COURIER
+                await db.commit()
+
+                # שמירת דגל אדמין בקונטקסט כדי לאפשר חזרה לתפריט ראשי גם אם זיהוי אדמין נכשל
+                courier_context = {}
+                if _admin_root_menu or is_admin_sender:
+                    courier_context["entered_as_admin"] = True
+
+                await state_manager.force_state(
+                    user.id, "whatsapp", CourierState.INITIAL.value, context=courier_context
                 )
-                admin_text = (
-                    "📞 פנייה לניהול\n\n"
-                    "כתבו את ההודעה שלכם והיא תועבר להנהלה."
+
+                handler = CourierStateHandler(db, platform="whatsapp")
+                response, new_state = await handler.handle_message(
+                    user, text, photo_file_id
                 )
+
                 background_tasks.add_task(
-                    send_whatsapp_message, reply_to, admin_text, [["🔙 חזרה לתפריט"]]
+                    send_whatsapp_message, reply_to, response.text, response.keyboard, response.button_text
                 )
                 responses.append(
-                    {"from": sender_id, "response": admin_text, "new_state": None}
+                    {
+                        "from": sender_id,
+                        "response": response.text,
+                        "new_state": new_state,
+                    }
                 )
-                continue
+                return
 
-            # העברת הודעה להנהלה — אם המשתמש לחץ "פנייה לניהול" בהודעה הקודמת
-            if _context.get("contact_admin_pending"):
-                # ניקוי הדגל מהקונטקסט
-                await state_manager.update_context(
-                    user.id, "whatsapp", "contact_admin_pending", False
-                )
+            if (
+                user.role in (UserRole.SENDER, UserRole.ADMIN) or _admin_root_menu
+            ) and ("הצטרפות כנהג" in text or "נהג" in text):
+                # ניתוב לתהליך רישום כנהג (iDriver)
+                from app.state_machine.driver_handler import DriverStateHandler
 
-                # כפתור חזרה → לא להעביר, פשוט לחזור לתפריט
-                if "חזרה" in text or "תפריט" in text:
-                    response, new_state = await _route_to_role_menu_wa(
-                        user, db, state_manager
-                    )
-                    background_tasks.add_task(
-                        send_whatsapp_message, reply_to, response.text, response.keyboard, response.button_text
-                    )
-                    responses.append(
-                        {"from": sender_id, "response": response.text, "new_state": new_state}
-                    )
-                    continue
-
-                # העברת ההודעה למנהלים
-                # plain text — ה-escape לטלגרם מתבצע ב-forward_support_message
-                # מספר טלפון מלא — כדי שהאדמין יוכל ליצור קשר חזרה
-                # reply_to יכול להיות @lid או phone@c.us — לא מספר חייגני
-                user_name = user.full_name or user.name or "לא צוין"
-                display_phone = user.phone_number or reply_to
-                forward_text = (
-                    f"📨 פנייה מ-{user_name}\n"
-                    f"({display_phone})\n\n"
-                    f"{text}"
-                )
+                user.role = UserRole.DRIVER
+                await db.commit()
 
-                from app.domain.services.admin_notification_service import (
-                    AdminNotificationService,
-                )
+                # שמירת דגל אדמין בקונטקסט כדי לאפשר חזרה לתפריט ראשי גם אם זיהוי אדמין נכשל
+                driver_context: dict = {}
+                if _admin_root_menu or is_admin_sender:
+                    driver_context["entered_as_admin"] = True
 
-                sent = await AdminNotificationService.forward_support_message(
-                    forward_text, user.id, prefer_telegram=False
+                await state_manager.force_state(
+                    user.id, "whatsapp", DriverState.INITIAL.value, context=driver_context
                 )
 
-                if sent:
-                    confirm_text = "✅ ההודעה נשלחה להנהלה. נחזור אליכם בהקדם!"
-                else:
-                    confirm_text = (
-                        "⚠️ לא הצלחנו להעביר את ההודעה כרגע.\n"
-                        "אנא נסו שוב מאוחר יותר."
-                    )
-
-                background_tasks.add_task(
-                    send_whatsapp_message, reply_to, confirm_text,
-                    [["🔙 חזרה לתפריט"]],
-                )
-                # חזרה לתפריט המתאים לתפקיד המשתמש — רק איפוס state
-                _menu_state = await _reset_role_state_wa(
-                    user, db, state_manager
-                )
-                responses.append(
-                    {"from": sender_id, "response": confirm_text, "new_state": _menu_state}
+                handler = DriverStateHandler(db, platform="whatsapp")
+                response, new_state = await handler.handle_message(
+                    user, text, photo_file_id
                 )
-                continue
-
-            # ==================== ניתוב לפי תפקיד [שלב 3] ====================
-    
-            current_state = _current_state_value
-    
-            # ניתוב לבעל תחנה [שלב 3.3]
-            if user.role == UserRole.STATION_OWNER:
-                from app.domain.services.station_service import StationService
-    
-                station_service = StationService(db)
-                station = await station_service.get_station_by_owner(user.id)
-    
-                if station:
-                    handler = StationOwnerStateHandler(db, station.id, platform="whatsapp")
-                    response, new_state = await handler.handle_message(
-                        user, text, photo_file_id
-                    )
-                else:
-                    # בעל תחנה ללא תחנה פעילה - fallback
-                    response, new_state = await _route_to_role_menu_wa(
-                        user, db, state_manager
-                    )
-    
+
                 background_tasks.add_task(
                     send_whatsapp_message, reply_to, response.text, response.keyboard, response.button_text
                 )
                 responses.append(
-                    {"from": sender_id, "response": response.text, "new_state": new_state}
+                    {
+                        "from": sender_id,
+                        "response": response.text,
+                        "new_state": new_state,
+                    }
                 )
-                continue
-    
-            # ניתוב לתפריט סדרן (כפתור "תפריט סדרן" — פתוח לכל תפקיד שהוא סדרן פעיל) [שלב 3.2]
-            # בדיקת keyword רק כשהמשתמש לא באמצע זרימת סדרן — מונע תפיסת טקסט חופשי כלחיצת כפתור
-            _in_dispatcher_flow = isinstance(current_state, str) and current_state.startswith("DISPATCHER.")
-            if not _in_dispatcher_flow and ("תפריט סדרן" in text or "🏪 תפריט סדרן" in text):
-                from app.domain.services.station_service import StationService
-    
-                station_service = StationService(db)
-                station = await station_service.get_dispatcher_station(user.id)
-    
-                if station:
-                    _dm_admin_keys_wa = await _save_admin_context_wa(
-                        user.id, state_manager, "whatsapp"
-                    )
-                    await state_manager.force_state(
-                        user.id, "whatsapp", DispatcherState.MENU.value, context={}
+                return
+
+            if ("העלאת משלוח מהיר" in text or "משלוח מהיר" in text) and (
+                user.role in (UserRole.SENDER, UserRole.ADMIN) or _admin_root_menu
+            ):
+                # קישור חיצוני לקבוצת WhatsApp
+                if settings.WHATSAPP_GROUP_LINK:
+                    msg_text = (
+                        "📦 העלאת משלוח מהיר\n\n"
+                        "להעלאת משלוח מהיר, הצטרפו לקבוצת WhatsApp שלנו:\n"
+                        f"{settings.WHATSAPP_GROUP_LINK}"
                     )
-                    handler = DispatcherStateHandler(db, station.id, platform="whatsapp")
-                    response, new_state = await handler.handle_message(user, "תפריט", None)
-                    # שחזור admin context אחרי ה-handler
-                    if _dm_admin_keys_wa:
-                        await _restore_admin_context_wa(
-                            user.id, state_manager, new_state,
-                            _dm_admin_keys_wa, "whatsapp",
-                        )
-                    if _dm_admin_keys_wa and _dm_admin_keys_wa.get("original_role") == "admin":
-                        _inject_admin_return_button_wa(response)
                 else:
-                    # סדרן הוסר או תחנה בוטלה
-                    logger.warning(
-                        "Dispatcher clicked station menu but station not found",
-                        extra_data={"user_id": user.id},
+                    msg_text = (
+                        "📦 העלאת משלוח מהיר\n\n"
+                        "להעלאת משלוח מהיר, פנו להנהלה לקבלת קישור לקבוצת WhatsApp."
                     )
-                    response, new_state = await _route_to_role_menu_wa(
-                        user, db, state_manager
-                    )
-    
-                background_tasks.add_task(
-                    send_whatsapp_message, reply_to, response.text, response.keyboard, response.button_text
-                )
+                background_tasks.add_task(send_whatsapp_message, reply_to, msg_text)
                 responses.append(
-                    {"from": sender_id, "response": response.text, "new_state": new_state}
+                    {"from": sender_id, "response": msg_text, "new_state": None}
+                )
+                return
+
+            if ("הצטרפות כתחנה" in text or "תחנה" in text) and (
+                user.role in (UserRole.SENDER, UserRole.ADMIN) or _admin_root_menu
+            ):
+                # הודעה שיווקית עבור תחנות
+                station_text = (
+                    "🏪 הצטרפות כתחנה\n\n"
+                    "המערכת של ShipShare מסדרת לך את התחנה!\n\n"
+                    "✅ ניהול נהגים אוטומטי\n"
+                    "✅ גבייה מסודרת\n"
+                    "✅ תיעוד משלוחים מלא\n"
+                    "✅ סדר בבלגן\n\n"
+                    "לפרטים נוספים, פנו להנהלה."
                 )
-                continue
-    
-            # אם המשתמש באמצע זרימת סדרן - ממשיכים עם DispatcherStateHandler
-            if current_state and current_state.startswith("DISPATCHER."):
-                from app.domain.services.station_service import StationService
-    
-                station_service = StationService(db)
-                station = await station_service.get_dispatcher_station(user.id)
-    
-                if station:
-                    # כפתור "חזרה לתפריט ראשי"/"חזרה לתפריט נהג" — חזרה לתפריט לפי תפקיד
-                    # חשוב: קוראים ישירות ל-fallback ולא ל-_route_to_role_menu_wa כדי למנוע
-                    # לולאה (כי _route_to_role_menu_wa יזהה שהמשתמש סדרן ויחזיר לתפריט סדרן)
-                    if "חזרה לתפריט נהג" in text or "חזרה לתפריט ראשי" in text:
-                        # אדמין שהחליף תפקיד — שחזור ישיר לתפריט אדמין
-                        # (לא _route_to_role_menu_wa — כי הוא יזהה סדרן ויחזור ללולאה)
-                        _back_ctx_wa = await state_manager.get_context(
-                            user.id, "whatsapp"
-                        )
-                        if _back_ctx_wa.get("original_role") == "admin":
-                            response, new_state = await _restore_admin_role_and_route_wa(
-                                user, db, state_manager, "whatsapp"
-                            )
-                        elif user.role == UserRole.COURIER:
-                            await state_manager.force_state(
-                                user.id, "whatsapp", CourierState.MENU.value, context={}
-                            )
-                            handler = CourierStateHandler(db, platform="whatsapp")
-                            response, new_state = await handler.handle_message(
-                                user, "תפריט", None
-                            )
-                        elif user.role == UserRole.DRIVER:
-                            # סשן 9: נהג-סדרן חוזר לתפריט נהג (לא סדרן)
-                            from app.state_machine.driver_handler import DriverStateHandler
-                            from app.domain.services.driver_session_service import DriverSessionService
-
-                            session_service = DriverSessionService(db)
-                            await session_service.touch_session(user.id)
-
-                            await state_manager.force_state(
-                                user.id, "whatsapp", DriverState.INITIAL.value, context={}
-                            )
-                            handler = DriverStateHandler(db, platform="whatsapp")
-                            response, new_state = await handler.handle_message(
-                                user, "תפריט", None
-                            )
-                        else:
-                            response, new_state = await _sender_fallback_wa(
-                                user, db, state_manager
-                            )
-                    else:
-                        handler = DispatcherStateHandler(
-                            db, station.id, platform="whatsapp"
-                        )
-                        response, new_state = await handler.handle_message(
-                            user, text, photo_file_id
-                        )
-                        # הוספת כפתור "חזרה לאדמין" אם נדרש
-                        _disp_ctx_wa = await state_manager.get_context(
-                            user.id, "whatsapp"
-                        )
-                        if _disp_ctx_wa.get("original_role") == "admin":
-                            _inject_admin_return_button_wa(response)
-                else:
-                    # תחנה לא נמצאה - איפוס לתפריט נהג
-                    logger.warning(
-                        "Dispatcher station not found, resetting to courier menu",
-                        extra_data={"user_id": user.id, "state": current_state},
-                    )
-                    response, new_state = await _route_to_role_menu_wa(
-                        user, db, state_manager
-                    )
-    
                 background_tasks.add_task(
-                    send_whatsapp_message, reply_to, response.text, response.keyboard, response.button_text
+                    send_whatsapp_message, reply_to, station_text, [["📞 פנייה לניהול"]]
                 )
                 responses.append(
-                    {"from": sender_id, "response": response.text, "new_state": new_state}
+                    {"from": sender_id, "response": station_text, "new_state": None}
                 )
-                continue
-    
-            # אם המשתמש באמצע זרימת בעל תחנה - ממשיכים
-            if current_state and current_state.startswith("STATION."):
-                from app.domain.services.station_service import StationService
-    
-                station_service = StationService(db)
-                station = await station_service.get_station_by_owner(user.id)
-    
-                if station:
-                    handler = StationOwnerStateHandler(db, station.id, platform="whatsapp")
-                    response, new_state = await handler.handle_message(
-                        user, text, photo_file_id
-                    )
-                    # הוספת כפתור "חזרה לאדמין" אם נדרש
-                    _station_ctx_wa = await state_manager.get_context(user.id, "whatsapp")
-                    if _station_ctx_wa.get("original_role") == "admin":
-                        _inject_admin_return_button_wa(response)
-                else:
-                    # תחנה לא נמצאה - fallback
-                    response, new_state = await _route_to_role_menu_wa(
-                        user, db, state_manager
-                    )
+                return
 
-                background_tasks.add_task(
-                    send_whatsapp_message, reply_to, response.text, response.keyboard, response.button_text
+
+            # כל תפקיד שנמצא בזרימת סדרן מוחרג — מנוהל דרך בלוק DISPATCHER למטה
+            _in_dispatcher_flow = (
+                isinstance(_current_state_value, str)
+                and _current_state_value.startswith("DISPATCHER.")
+            )
+            if "חזרה לתפריט" in text and (
+                (
+                    user.role not in (UserRole.COURIER, UserRole.STATION_OWNER)
+                    and not _in_dispatcher_flow
                 )
+                or _admin_root_menu
+            ):
+                # כפתור "חזרה לתפריט" - שולחים רגילים חוזרים לתפריט הראשי
+                background_tasks.add_task(send_welcome_message, reply_to)
                 responses.append(
-                    {"from": sender_id, "response": response.text, "new_state": new_state}
+                    {"from": sender_id, "response": "welcome", "new_state": None}
                 )
-                continue
-    
-            # ניתוב אדמין — תפריט אדמין או המשך זרימת בחירת תפקיד
-            if user.role == UserRole.ADMIN:
-                from app.core.config import settings as _wa_settings
-
-                if _wa_settings.ADMIN_ROLE_SWITCH_ENABLED:
-                    from app.state_machine.admin_handler import AdminStateHandler
-                    from app.state_machine.states import AdminState
-
-                    is_admin_flow = isinstance(current_state, str) and current_state.startswith("ADMIN.")
-                    if not is_admin_flow:
-                        await state_manager.force_state(
-                            user.id, "whatsapp", AdminState.MENU.value, context={}
-                        )
-                    _admin_handler = AdminStateHandler(db, platform="whatsapp")
-                    response, new_state = await _admin_handler.handle_message(user, text, photo_file_id)
+                return
 
-                    # מצב מיוחד: admin_handler מחזיר _ADMIN_SWITCH_* כשצריך לנתב לתפקיד חדש
-                    if isinstance(new_state, str) and new_state.startswith("_ADMIN_SWITCH_"):
-                        background_tasks.add_task(
-                            send_whatsapp_message, reply_to, response.text, response.keyboard, response.button_text
-                        )
-                        # _route_to_role_menu_wa שומר ומשחזר admin context אוטומטית,
-                        # ומוסיף כפתור "חזרה לאדמין" לתגובה
-                        response2, new_state2 = await _route_to_role_menu_wa(user, db, state_manager)
-                        background_tasks.add_task(
-                            send_whatsapp_message, reply_to, response2.text, response2.keyboard, response2.button_text
-                        )
-                        responses.append(
-                            {"from": sender_id, "response": response2.text, "new_state": new_state2}
-                        )
-                        continue
+        # פנייה לניהול — פתוח לכל התפקידים, ללא תלות ב-guard של זרימה רב-שלבית
+        if "פנייה לניהול" in text:
+            # שמירת flag בקונטקסט — ההודעה הבאה תועבר להנהלה
+            await state_manager.update_context(
+                user.id, "whatsapp", "contact_admin_pending", True
+            )
+            admin_text = (
+                "📞 פנייה לניהול\n\n"
+                "כתבו את ההודעה שלכם והיא תועבר להנהלה."
+            )
+            background_tasks.add_task(
+                send_whatsapp_message, reply_to, admin_text, [["🔙 חזרה לתפריט"]]
+            )
+            responses.append(
+                {"from": sender_id, "response": admin_text, "new_state": None}
+            )
+            return
 
-                    background_tasks.add_task(
-                        send_whatsapp_message, reply_to, response.text, response.keyboard, response.button_text
-                    )
-                    responses.append(
-                        {"from": sender_id, "response": response.text, "new_state": new_state}
-                    )
-                    continue
+        # העברת הודעה להנהלה — אם המשתמש לחץ "פנייה לניהול" בהודעה הקודמת
+        if _context.get("contact_admin_pending"):
+            # ניקוי הדגל מהקונטקסט
+            await state_manager.update_context(
+                user.id, "whatsapp", "contact_admin_pending", False
+            )
 
-                # פיצ'ר כבוי — ניתוב לשולח
-                if isinstance(current_state, str) and current_state.startswith("SENDER."):
-                    # אדמין כבר במצב שולח — המשך טיפול רגיל
-                    handler = SenderStateHandler(db)
-                    response, new_state = await handler.handle_message(
-                        user_id=user.id, platform="whatsapp", message=text
-                    )
-                else:
-                    response, new_state = await _sender_fallback_wa(user, db, state_manager)
+            # כפתור חזרה → לא להעביר, פשוט לחזור לתפריט
+            if "חזרה" in text or "תפריט" in text:
+                response, new_state = await _route_to_role_menu_wa(
+                    user, db, state_manager
+                )
                 background_tasks.add_task(
                     send_whatsapp_message, reply_to, response.text, response.keyboard, response.button_text
                 )
                 responses.append(
                     {"from": sender_id, "response": response.text, "new_state": new_state}
                 )
-                continue
+                return
+
+            # העברת ההודעה למנהלים
+            # plain text — ה-escape לטלגרם מתבצע ב-forward_support_message
+            # מספר טלפון מלא — כדי שהאדמין יוכל ליצור קשר חזרה
+            # reply_to יכול להיות @lid או phone@c.us — לא מספר חייגני
+            user_name = user.full_name or user.name or "לא צוין"
+            display_phone = user.phone_number or reply_to
+            forward_text = (
+                f"📨 פנייה מ-{user_name}\n"
+                f"({display_phone})\n\n"
+                f"{text}"
+            )
 
-            # Route based on user role
-            if user.role == UserRole.COURIER:
-                # שמירת המצב הקודם לפני הטיפול בהודעה
-                previous_state = current_state
+            from app.domain.services.admin_notification_service import (
+                AdminNotificationService,
+            )
 
-                handler = CourierStateHandler(db, platform="whatsapp")
-                response, new_state = await handler.handle_message(
-                    user, text, photo_file_id
+            sent = await AdminNotificationService.forward_support_message(
+                forward_text, user.id, prefer_telegram=False
+            )
+
+            if sent:
+                confirm_text = "✅ ההודעה נשלחה להנהלה. נחזור אליכם בהקדם!"
+            else:
+                confirm_text = (
+                    "⚠️ לא הצלחנו להעביר את ההודעה כרגע.\n"
+                    "אנא נסו שוב מאוחר יותר."
                 )
 
-                # לוגיקה משותפת: כרטיס נהג + הפקדה
-                contact_phone = _resolve_contact_phone(
-                    resolved_phone=resolved_phone,
-                    from_number=from_number,
-                    reply_to=reply_to,
-                    sender_id=sender_id,
-                    stored_phone=user.phone_number,
+            background_tasks.add_task(
+                send_whatsapp_message, reply_to, confirm_text,
+                [["🔙 חזרה לתפריט"]],
+            )
+            # חזרה לתפריט המתאים לתפקיד המשתמש — רק איפוס state
+            _menu_state = await _reset_role_state_wa(
+                user, db, state_manager
+            )
+            responses.append(
+                {"from": sender_id, "response": confirm_text, "new_state": _menu_state}
+            )
+            return
+
+        # ==================== ניתוב לפי תפקיד [שלב 3] ====================
+
+        current_state = _current_state_value
+
+        # ניתוב לבעל תחנה [שלב 3.3]
+        if user.role == UserRole.STATION_OWNER:
+            station_id = (await get_role_capabilities(db, user.id)).owner_station_id
+
+            if station_id is not None:
+                handler = StationOwnerStateHandler(db, station_id, platform="whatsapp")
+                response, new_state = await handler.handle_message(
+                    user, text, photo_file_id
                 )
-                await _handle_courier_post_processing(
-                    db=db,
-                    user=user,
-                    previous_state=previous_state,
-                    new_state=new_state,
-                    contact_phone=contact_phone,
-                    photo_file_id=photo_file_id,
-                    platform="whatsapp",
-                    background_tasks=background_tasks,
+            else:
+                # בעל תחנה ללא תחנה פעילה - fallback
+                response, new_state = await _route_to_role_menu_wa(
+                    user, db, state_manager
                 )
 
-                # הוספת כפתור "חזרה לאדמין" אם נדרש
-                _courier_ctx_wa = await state_manager.get_context(user.id, "whatsapp")
-                if _courier_ctx_wa.get("original_role") == "admin":
-                    _inject_admin_return_button_wa(response)
-                background_tasks.add_task(
-                    send_whatsapp_message, reply_to, response.text, response.keyboard, response.button_text
-                )
-                responses.append(
-                    {"from": sender_id, "response": response.text, "new_state": new_state}
+            background_tasks.add_task(
+                send_whatsapp_message, reply_to, response.text, response.keyboard, response.button_text
+            )
+            responses.append(
+                {"from": sender_id, "response": response.text, "new_state": new_state}
+            )
+            return
+
+        # ניתוב לתפריט סדרן (כפתור "תפריט סדרן" — פתוח לכל תפקיד שהוא סדרן פעיל) [שלב 3.2]
+        # בדיקת keyword רק כשהמשתמש לא באמצע זרימת סדרן — מונע תפיסת טקסט חופשי כלחיצת כפתור
+        _in_dispatcher_flow = isinstance(current_state, str) and current_state.startswith("DISPATCHER.")
+        if not _in_dispatcher_flow and ("תפריט סדרן" in text or "🏪 תפריט סדרן" in text):
+            station_id = (await get_role_capabilities(db, user.id)).dispatcher_station_id
+
+            if station_id is not None:
+                _dm_admin_keys_wa = await _save_admin_context_wa(
+                    user.id, state_manager, "whatsapp"
                 )
-                continue
-
-            if user.role == UserRole.DRIVER:
-                # iDriver — ניתוב נהג ל-handler (סשנים 2-6)
-                from app.state_machine.driver_handler import DriverStateHandler as _DH
-                from app.domain.services.driver_session_service import DriverSessionService as _DSS
-
-                # סשן 6: עדכון פעילות אחרונה בכל הודעה מנהג
-                _session_svc = _DSS(db)
-                await _session_svc.touch_session(user.id)
-
-                is_driver_flow = isinstance(current_state, str) and current_state.startswith("DRIVER.")
-                _drv_admin_keys_wa = None
-                if not is_driver_flow:
-                    _drv_admin_keys_wa = await _save_admin_context_wa(
-                        user.id, state_manager, "whatsapp"
-                    )
-                    await state_manager.force_state(
-                        user.id, "whatsapp", DriverState.INITIAL.value, context={}
-                    )
-                _driver_handler = _DH(db, platform="whatsapp")
-                response, new_state = await _driver_handler.handle_message(
-                    user, text, photo_file_id,
-                    location_lat=location_lat, location_lng=location_lng,
+                await state_manager.force_state(
+                    user.id, "whatsapp", DispatcherState.MENU.value, context={}
                 )
+                handler = DispatcherStateHandler(db, station_id, platform="whatsapp")
+                response, new_state = await handler.handle_message(user, "תפריט", None)
                 # שחזור admin context אחרי ה-handler
-                if _drv_admin_keys_wa:
+                if _dm_admin_keys_wa:
                     await _restore_admin_context_wa(
                         user.id, state_manager, new_state,
-                        _drv_admin_keys_wa, "whatsapp",
+                        _dm_admin_keys_wa, "whatsapp",
                     )
-                # הוספת כפתור "חזרה לאדמין" אם נדרש
-                if _drv_admin_keys_wa and _drv_admin_keys_wa.get("original_role") == "admin":
+                if _dm_admin_keys_wa and _dm_admin_keys_wa.get("original_role") == "admin":
                     _inject_admin_return_button_wa(response)
+            else:
+                # סדרן הוסר או תחנה בוטלה
+                logger.warning(
+                    "Dispatcher clicked station menu but station not found",
+                    extra_data={"user_id": user.id},
+                )
+                response, new_state = await _route_to_role_menu_wa(
+                    user, db, state_manager
+                )
+
+            background_tasks.add_task(
+                send_whatsapp_message, reply_to, response.text, response.keyboard, response.button_text
+            )
+            responses.append(
+                {"from": sender_id, "response": response.text, "new_state": new_state}
+            )
+            return
+
+        # אם המשתמש באמצע זרימת סדרן - ממשיכים עם DispatcherStateHandler
+        if current_state and current_state.startswith("DISPATCHER."):
+            station_id = (await get_role_capabilities(db, user.id)).dispatcher_station_id
+
+            if station_id is not None:
+                # כפתור "חזרה לתפריט ראשי"/"חזרה לתפריט נהג" — חזרה לתפריט לפי תפקיד
+                # חשוב: קוראים ישירות ל-fallback ולא ל-_route_to_role_menu_wa כדי למנוע
+                # לולאה (כי _route_to_role_menu_wa יזהה שהמשתמש סדרן ויחזיר לתפריט סדרן)
+                if "חזרה לתפריט נהג" in text or "חזרה לתפריט ראשי" in text:
+                    # אדמין שהחליף תפקיד — שחזור ישיר לתפריט אדמין
+                    # (לא _route_to_role_menu_wa — כי הוא יזהה סדרן ויחזור ללולאה)
+                    _back_ctx_wa = await state_manager.get_context(
+                        user.id, "whatsapp"
+                    )
+                    if _back_ctx_wa.get("original_role") == "admin":
+                        response, new_state = await _restore_admin_role_and_route_wa(
+                            user, db, state_manager, "whatsapp"
+                        )
+                    elif user.role == UserRole.COURIER:
+                        await state_manager.force_state(
+                            user.id, "whatsapp", CourierState.MENU.value, context={}
+                        )
+                        handler = CourierStateHandler(db, platform="whatsapp")
+                        response, new_state = await handler.handle_message(
+                            user, "תפריט", None
+                        )
+                    elif user.role == UserRole.DRIVER:
+                        # סשן 9: נהג-סדרן חוזר לתפריט נהג (לא סדרן)
+                        from app.state_machine.driver_handler import DriverStateHandler
+                        from app.domain.services.driver_session_service import DriverSessionService
+
+                        session_service = DriverSessionService(db)
+                        await session_service.touch_session(user.id)
+
+                        await state_manager.force_state(
+                            user.id, "whatsapp", DriverState.INITIAL.value, context={}
+                        )
+                        handler = DriverStateHandler(db, platform="whatsapp")
+                        response, new_state = await handler.handle_message(
+                            user, "תפריט", None
+                        )
+                    else:
+                        response, new_state = await _sender_fallback_wa(
+                            user, db, state_manager
+                        )
                 else:
-                    _driver_ctx_wa = await state_manager.get_context(user.id, "whatsapp")
-                    if _driver_ctx_wa.get("original_role") == "admin":
+                    handler = DispatcherStateHandler(
+                        db, station_id, platform="whatsapp"
+                    )
+                    response, new_state = await handler.handle_message(
+                        user, text, photo_file_id
+                    )
+                    # הוספת כפתור "חזרה לאדמין" אם נדרש
+                    _disp_ctx_wa = await state_manager.get_context(
+                        user.id, "whatsapp"
+                    )
+                    if _disp_ctx_wa.get("original_role") == "admin":
                         _inject_admin_return_button_wa(response)
-                background_tasks.add_task(
-                    send_whatsapp_message, reply_to, response.text, response.keyboard, response.button_text
+            else:
+                # תחנה לא נמצאה - איפוס לתפריט נהג
+                logger.warning(
+                    "Dispatcher station not found, resetting to courier menu",
+                    extra_data={"user_id": user.id, "state": current_state},
                 )
-                responses.append(
-                    {"from": sender_id, "response": response.text, "new_state": new_state}
+                response, new_state = await _route_to_role_menu_wa(
+                    user, db, state_manager
                 )
-                continue
 
-            # Sender flow
-            if "שלוח" in text or "חבילה" in text:
-                handler = SenderStateHandler(db)
+            background_tasks.add_task(
+                send_whatsapp_message, reply_to, response.text, response.keyboard, response.button_text
+            )
+            responses.append(
+                {"from": sender_id, "response": response.text, "new_state": new_state}
+            )
+            return
+
+        # אם המשתמש באמצע זרימת בעל תחנה - ממשיכים
+        if current_state and current_state.startswith("STATION."):
+            station_id = (await get_role_capabilities(db, user.id)).owner_station_id
+
+            if station_id is not None:
+                handler = StationOwnerStateHandler(db, station_id, platform="whatsapp")
                 response, new_state = await handler.handle_message(
-                    user_id=user.id, platform="whatsapp", message=text
+                    user, text, photo_file_id
                 )
                 # הוספת כפתור "חזרה לאדמין" אם נדרש
-                _sender_ctx_wa = await state_manager.get_context(user.id, "whatsapp")
-                if _sender_ctx_wa.get("original_role") == "admin":
+                _station_ctx_wa = await state_manager.get_context(user.id, "whatsapp")
+                if _station_ctx_wa.get("original_role") == "admin":
                     _inject_admin_return_button_wa(response)
+            else:
+                # תחנה לא נמצאה - fallback
+                response, new_state = await _route_to_role_menu_wa(
+                    user, db, state_manager
+                )
+
+            background_tasks.add_task(
+                send_whatsapp_message, reply_to, response.text, response.keyboard, response.button_text
+            )
+            responses.append(
+                {"from": sender_id, "response": response.text, "new_state": new_state}
+            )
+            return
+
+        # ניתוב אדמין — תפריט אדמין או המשך זרימת בחירת תפקיד
+        if user.role == UserRole.ADMIN:
+            from app.core.config import settings as _wa_settings
+
+            if _wa_settings.ADMIN_ROLE_SWITCH_ENABLED:
+                from app.state_machine.admin_handler import AdminStateHandler
+                from app.state_machine.states import AdminState
+
+                is_admin_flow = isinstance(current_state, str) and current_state.startswith("ADMIN.")
+                if not is_admin_flow:
+                    await state_manager.force_state(
+                        user.id, "whatsapp", AdminState.MENU.value, context={}
+                    )
+                _admin_handler = AdminStateHandler(db, platform="whatsapp")
+                response, new_state = await _admin_handler.handle_message(user, text, photo_file_id)
+
+                # מצב מיוחד: admin_handler מחזיר _ADMIN_SWITCH_* כשצריך לנתב לתפקיד חדש
+                if isinstance(new_state, str) and new_state.startswith("_ADMIN_SWITCH_"):
+                    background_tasks.add_task(
+                        send_whatsapp_message, reply_to, response.text, response.keyboard, response.button_text
+                    )
+                    # _route_to_role_menu_wa שומר ומשחזר admin context אוטומטית,
+                    # ומוסיף כפתור "חזרה לאדמין" לתגובה
+                    response2, new_state2 = await _route_to_role_menu_wa(user, db, state_manager)
+                    background_tasks.add_task(
+                        send_whatsapp_message, reply_to, response2.text, response2.keyboard, response2.button_text
+                    )
+                    responses.append(
+                        {"from": sender_id, "response": response2.text, "new_state": new_state2}
+                    )
+                    return
+
                 background_tasks.add_task(
                     send_whatsapp_message, reply_to, response.text, response.keyboard, response.button_text
                 )
                 responses.append(
                     {"from": sender_id, "response": response.text, "new_state": new_state}
                 )
-                continue
+                return
 
-            # If user is in the middle of a sender flow, continue it
-            if (
-                current_state
-                and not current_state.startswith("COURIER.")
-                and not current_state.startswith("DISPATCHER.")
-                and not current_state.startswith("STATION.")
-                and not current_state.startswith("DRIVER.")
-                and not current_state.startswith("ADMIN.")
-                and current_state not in ["INITIAL", "SENDER.INITIAL"]
-            ):
+            # פיצ'ר כבוי — ניתוב לשולח
+            if isinstance(current_state, str) and current_state.startswith("SENDER."):
+                # אדמין כבר במצב שולח — המשך טיפול רגיל
                 handler = SenderStateHandler(db)
                 response, new_state = await handler.handle_message(
                     user_id=user.id, platform="whatsapp", message=text
                 )
-                # הוספת כפתור "חזרה לאדמין" אם נדרש
-                _sender_ctx2_wa = await state_manager.get_context(user.id, "whatsapp")
-                if _sender_ctx2_wa.get("original_role") == "admin":
-                    _inject_admin_return_button_wa(response)
-                background_tasks.add_task(
-                    send_whatsapp_message, reply_to, response.text, response.keyboard, response.button_text
+            else:
+                response, new_state = await _sender_fallback_wa(user, db, state_manager)
+            background_tasks.add_task(
+                send_whatsapp_message, reply_to, response.text, response.keyboard, response.button_text
+            )
+            responses.append(
+                {"from": sender_id, "response": response.text, "new_state": new_state}
+            )
+            return
+
+        # Route based on user role
+        if user.role == UserRole.COURIER:
+            # שמירת המצב הקודם לפני הטיפול בהודעה
+            previous_state = current_state
+
+            handler = CourierStateHandler(db, platform="whatsapp")
+            response, new_state = await handler.handle_message(
+                user, text, photo_file_id
+            )
+
+            # לוגיקה משותפת: כרטיס נהג + הפקדה
+            contact_phone = _resolve_contact_phone(
+                resolved_phone=resolved_phone,
+                from_number=from_number,
+                reply_to=reply_to,
+                sender_id=sender_id,
+                stored_phone=user.phone_number,
+            )
+            await _handle_courier_post_processing(
+                db=db,
+                user=user,
+                previous_state=previous_state,
+                new_state=new_state,
+                contact_phone=contact_phone,
+                photo_file_id=photo_file_id,
+                platform="whatsapp",
+                background_tasks=background_tasks,
+            )
+
+            # הוספת כפתור "חזרה לאדמין" אם נדרש
+            _courier_ctx_wa = await state_manager.get_context(user.id, "whatsapp")
+            if _courier_ctx_wa.get("original_role") == "admin":
+                _inject_admin_return_button_wa(response)
+            background_tasks.add_task(
+                send_whatsapp_message, reply_to, response.text, response.keyboard, response.button_text
+            )
+            responses.append(
+                {"from": sender_id, "response": response.text, "new_state": new_state}
+            )
+            return
+
+        if user.role == UserRole.DRIVER:
+            # iDriver — ניתוב נהג ל-handler (סשנים 2-6)
+            from app.state_machine.driver_handler import DriverStateHandler as _DH
+            from app.domain.services.driver_session_service import DriverSessionService as _DSS
+
+            # סשן 6: עדכון פעילות אחרונה בכל הודעה מנהג
+            _session_svc = _DSS(db)
+            await _session_svc.touch_session(user.id)
+
+            is_driver_flow = isinstance(current_state, str) and current_state.startswith("DRIVER.")
+            _drv_admin_keys_wa = None
+            if not is_driver_flow:
+                _drv_admin_keys_wa = await _save_admin_context_wa(
+                    user.id, state_manager, "whatsapp"
                 )
-                responses.append(
-                    {"from": sender_id, "response": response.text, "new_state": new_state}
+                await state_manager.force_state(
+                    user.id, "whatsapp", DriverState.INITIAL.value, context={}
                 )
-                continue
-    
-            # Default: show welcome message with role selection
-            background_tasks.add_task(send_welcome_message, reply_to)
-            responses.append({"from": sender_id, "response": "welcome", "new_state": None})
+            _driver_handler = _DH(db, platform="whatsapp")
+            response, new_state = await _driver_handler.handle_message(
+                user, text, photo_file_id,
+                location_lat=location_lat, location_lng=location_lng,
+            )
+            # שחזור admin context אחרי ה-handler
+            if _drv_admin_keys_wa:
+                await _restore_admin_context_wa(
+                    user.id, state_manager, new_state,
+                    _drv_admin_keys_wa, "whatsapp",
+                )
+            # הוספת כפתור "חזרה לאדמין" אם נדרש
+            if _drv_admin_keys_wa and _drv_admin_keys_wa.get("original_role") == "admin":
+                _inject_admin_return_button_wa(response)
+            else:
+                _driver_ctx_wa = await state_manager.get_context(user.id, "whatsapp")
+                if _driver_ctx_wa.get("original_role") == "admin":
+                    _inject_admin_return_button_wa(response)
+            background_tasks.add_task(
+                send_whatsapp_message, reply_to, response.text, response.keyboard, response.button_text
+            )
+            responses.append(
+                {"from": sender_id, "response": response.text, "new_state": new_state}
+            )
+            return
 
-        except Exception as e:
-            _msg_failed = True
-            logger.error(
-                "Error processing WhatsApp message",
-                extra_data={"message_id": message.message_id, "error": str(e)},
-                exc_info=True,
+        # Sender flow
+        if "שלוח" in text or "חבילה" in text:
+            handler = SenderStateHandler(db)
+            response, new_state = await handler.handle_message(
+                user_id=user.id, platform="whatsapp", message=text
             )
-        finally:
-            # סימון הודעה כ-completed רק אם העיבוד הצליח —
-            # הודעה שנכשלה נשארת ב-processing ומאפשרת retry אחרי timeout
-            if not _msg_failed and message.message_id:
-                try:
-                    await _mark_message_completed(db, message.message_id)
-                except Exception:
-                    logger.error(
-                        "Failed to mark message as completed",
-                        extra_data={"message_id": message.message_id},
-                        exc_info=True,
-                    )
+            # הוספת כפתור "חזרה לאדמין" אם נדרש
+            _sender_ctx_wa = await state_manager.get_context(user.id, "whatsapp")
+            if _sender_ctx_wa.get("original_role") == "admin":
+                _inject_admin_return_button_wa(response)
+            background_tasks.add_task(
+                send_whatsapp_message, reply_to, response.text, response.keyboard, response.button_text
+            )
+            responses.append(
+                {"from": sender_id, "response": response.text, "new_state": new_state}
+            )
+            return
+
+        # If user is in the middle of a sender flow, continue it
+        if (
+            current_state
+            and not current_state.startswith("COURIER.")
+            and not current_state.startswith("DISPATCHER.")
+            and not current_state.startswith("STATION.")
+            and not current_state.startswith("DRIVER.")
+            and not current_state.startswith("ADMIN.")
+            and current_state not in ["INITIAL", "SENDER.INITIAL"]
+        ):
+            handler = SenderStateHandler(db)
+            response, new_state = await handler.handle_message(
+                user_id=user.id, platform="whatsapp", message=text
+            )
+            # הוספת כפתור "חזרה לאדמין" אם נדרש
+            _sender_ctx2_wa = await state_manager.get_context(user.id, "whatsapp")
+            if _sender_ctx2_wa.get("original_role") == "admin":
+                _inject_admin_return_button_wa(response)
+            background_tasks.add_task(
+                send_whatsapp_message, reply_to, response.text, response.keyboard, response.button_text
+            )
+            responses.append(
+                {"from": sender_id, "response": response.text, "new_state": new_state}
+            )
+            return
+
+        # Default: show welcome message with role selection
+        background_tasks.add_task(send_welcome_message, reply_to)
+        responses.append({"from": sender_id, "response": "welcome", "new_state": None})
+
+    except Exception as e:
+        _msg_failed = True
+        discard_conversation_state(db)
+        logger.error(
+            "Error processing WhatsApp message",
+            extra_data={"message_id": message.message_id, "error": str(e)},
+            exc_info=True,
+        )
+    finally:
+        # סימון הודעה כ-completed רק אם העיבוד הצליח —
+        # הודעה שנכשלה נשארת ב-processing ומאפשרת retry אחרי timeout
+        if not _msg_failed and message.message_id:
+            try:
+                await _mark_message_completed(db, message.message_id)
+            except Exception:
+                logger.error(
+                    "Failed to mark message as completed",
+                    extra_data={"message_id": message.message_id},
+                    exc_info=True,
+                )
+
+
+@router.post(
+    "/webhook",
+    summary="Webhook - WhatsApp (קבלת הודעות נכנסות)",
+    description=(
+        "נקודת כניסה לקבלת הודעות מ-WhatsApp Gateway. "
+        "מבצעת ניתוב לזרימת שולח/שליח לפי role ומנהלת state machine."
+    ),
+    responses={
+        200: {"description": "הודעה התקבלה ועובדה"},
+        403: {"description": "חתימה לא תקינה"},
+        429: {"description": "IP חסום עקב ניסיונות אימות כושלים"},
+    },
+)
+async def whatsapp_webhook(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db),
+    payload: WhatsAppWebhookPayload = Depends(_get_verified_payload),
+):
+    """
+    Handle incoming WhatsApp messages.
+    Routes to sender or courier handlers based on user role.
+    """
+
+    responses: list[dict] = []
+
+    async def _handle(session: AsyncSession, message: WhatsAppMessage, out: list[dict]) -> None:
+        # state ו-context של השיחה נכתבים פעם אחת להודעה
+        async with conversation_unit_of_work(session):
+            await _process_whatsapp_message(session, message, background_tasks, out)
+
+    if _use_per_sender_mode(payload.messages, _wppconnect_sender_key):
+        responses = await _process_per_sender(
+            payload.messages, _wppconnect_sender_key, _handle
+        )
+    else:
+        for message in payload.messages:
+            await _handle(db, message, responses)
 
     return {"processed": len(responses), "responses": responses}
 
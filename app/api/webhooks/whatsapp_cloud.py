@@ -35,13 +35,19 @@ from app.api.webhooks.whatsapp import (
     _handle_whatsapp_delivery_approval,
     _resolve_contact_phone,
     _handle_courier_post_processing,
+    _process_per_sender,
+    _use_per_sender_mode,
 )
 from app.domain.services.capture_service import CaptureService
 from app.domain.services.station_service import StationService
 from app.state_machine.handlers import SenderStateHandler, CourierStateHandler
 from app.state_machine.dispatcher_handler import DispatcherStateHandler
 from app.state_machine.station_owner_handler import StationOwnerStateHandler
-from app.state_machine.manager import StateManager
+from app.state_machine.manager import (
+    StateManager,
+    conversation_unit_of_work,
+    discard_conversation_state,
+)
 from app.state_machine.states import CourierState, DispatcherState, DriverState
 from app.db.models.user import User, UserRole, ApprovalStatus
 
@@ -296,6 +302,8 @@ async def cloud_api_webhook(
     responses: list[dict] = []
 
     # Cloud API payload: entry[] → changes[] → value.messages[]
+    # כל הודעה נשמרת עם ה-value שלה (contacts / metadata)
+    messages: list[tuple[dict, dict]] = []
     for entry in payload.get("entry", []):
         for change in entry.get("changes", []):
             value = change.get("value", {})
@@ -303,15 +311,29 @@ async def cloud_api_webhook(
                 continue
 
             for msg in value.get("messages", []):
-                result = await _process_cloud_message(
-                    db, msg, value, background_tasks
-                )
-                if result:
-                    responses.append(result)
+                messages.append((msg, value))
+
+    async def _handle(session: AsyncSession, item: tuple[dict, dict], out: list[dict]) -> None:
+        msg, value = item
+        # state ו-context של השיחה נכתבים פעם אחת להודעה
+        async with conversation_unit_of_work(session):
+            result = await _process_cloud_message(session, msg, value, background_tasks)
+        if result:
+            out.append(result)
+
+    if _use_per_sender_mode(messages, _cloud_sender_key):
+        responses = await _process_per_sender(messages, _cloud_sender_key, _handle)
+    else:
+        for item in messages:
+            await _handle(db, item, responses)
 
     return {"status": "ok", "responses": responses}
 
 
+def _cloud_sender_key(item: tuple[dict, dict]) -> str:
+    return item[0].get("from", "")
+
+
 async def _process_cloud_message(
     db: AsyncSession,
     msg: dict,
@@ -483,6 +505,7 @@ async def _process_cloud_message(
 
     except Exception as exc:
         _msg_failed = True
+        discard_conversation_state(db)
         logger.error(
             "Cloud API message processing failed",
             extra_data={
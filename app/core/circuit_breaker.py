@@ -2,17 +2,33 @@
 Circuit Breaker Pattern Implementation
 
 Provides protection for external service calls to prevent cascade failures.
+
+שני backends (CIRCUIT_BREAKER_BACKEND):
+- memory: המצב בתהליך בלבד — כל worker מגלה תקלה ומתאושש בנפרד
+- redis (ברירת מחדל): המצב, מוני הכשלונות וה-probes של half-open נשמרים
+  ב-hash ב-Redis ומעודכנים בסקריפטי Lua אטומיים — תקלה שזוהתה ב-worker אחד
+  חוסמת את כולם. כל תהליך מחזיק עותק מקומי של המצב: breaker סגור עם עותק
+  טרי (CIRCUIT_BREAKER_SYNC_INTERVAL_SECONDS) לא פונה ל-Redis בכלל.
+  כש-Redis לא זמין — fallback ללוגיקה המקומית.
+
+מעבר לכשלונות רצופים, breaker עם window_seconds עוקב אחרי חלון זמן נע
+(buckets): שיעור כשלונות, שיעור קריאות איטיות ו-p95 של latency. שירות שעונה
+אחרי 25 שניות (בתוך ה-timeout) פותח את ה-circuit לפי שיעור האיטיות, במקום
+לתפוס את כל ה-coroutines של ה-worker.
 """
 import asyncio
+import contextvars
+import math
 import threading
 import time
 from enum import Enum
-from typing import Callable, TypeVar, ParamSpec
+from typing import Any, Callable, TypeVar, ParamSpec
 from dataclasses import dataclass, field
 from functools import wraps
 
+from app.core.config import settings
 from app.core.logging import get_logger
-from app.core.exceptions import CircuitBreakerOpenError
+from app.core.exceptions import CircuitBreakerOpenError, OutboundRateLimitError
 
 logger = get_logger(__name__)
 
@@ -34,6 +50,136 @@ class CircuitBreakerConfig:
     success_threshold: int = 2          # Successes in half-open to close
     timeout_seconds: float = 30.0       # Time before trying half-open
     half_open_max_calls: int = 3        # Max calls in half-open state
+    # Sliding window — None = כשלונות רצופים בלבד
+    window_seconds: float | None = None
+    window_buckets: int = 12
+    minimum_calls: int = 10             # מתחת לזה אין החלטה לפי שיעורים
+    failure_rate_threshold: float = 0.5
+    slow_call_seconds: float | None = None  # None = בלי מעקב איטיות
+    slow_call_rate_threshold: float = 0.5
+
+
+# גבולות ההיסטוגרמה של latency בחלון (שניות) — p95 מוערך מתוכה
+_LATENCY_BUCKETS: tuple[float, ...] = (
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0,
+)
+
+
+@dataclass(frozen=True)
+class WindowStats:
+    """סטטיסטיקה של החלון הנוכחי"""
+    calls: int
+    failures: int
+    slow_calls: int
+    p95_latency_seconds: float | None
+
+    @property
+    def failure_rate(self) -> float:
+        return self.failures / self.calls if self.calls else 0.0
+
+    @property
+    def slow_call_rate(self) -> float:
+        return self.slow_calls / self.calls if self.calls else 0.0
+
+
+class _WindowBucket:
+    __slots__ = ("epoch", "calls", "failures", "slow_calls", "histogram", "max_latency")
+
+    def __init__(self) -> None:
+        self.clear(-1)
+
+    def clear(self, epoch: int) -> None:
+        self.epoch = epoch
+        self.calls = 0
+        self.failures = 0
+        self.slow_calls = 0
+        self.histogram = [0] * (len(_LATENCY_BUCKETS) + 1)
+        self.max_latency = 0.0
+
+
+class SlidingWindow:
+    """
+    חלון זמן נע מחולק ל-buckets של window_seconds / bucket_count שניות.
+
+    כל bucket מחזיק מונים והיסטוגרמת latency — הזיכרון קבוע ולא תלוי בכמות
+    הקריאות. bucket שיצא מהחלון מתאפס כשהזמן מגיע אליו שוב.
+    """
+
+    def __init__(
+        self,
+        window_seconds: float,
+        bucket_count: int,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._width = window_seconds / bucket_count
+        self._buckets = [_WindowBucket() for _ in range(bucket_count)]
+        self._clock = clock
+
+    def _epoch(self) -> int:
+        return int(self._clock() // self._width)
+
+    def record(self, duration: float | None, *, failed: bool, slow: bool) -> None:
+        epoch = self._epoch()
+        bucket = self._buckets[epoch % len(self._buckets)]
+        if bucket.epoch != epoch:
+            bucket.clear(epoch)
+        bucket.calls += 1
+        bucket.failures += failed
+        bucket.slow_calls += slow
+        if duration is not None:
+            index = next(
+                (i for i, bound in enumerate(_LATENCY_BUCKETS) if duration <= bound),
+                len(_LATENCY_BUCKETS),
+            )
+            bucket.histogram[index] += 1
+            bucket.max_latency = max(bucket.max_latency, duration)
+
+    def stats(self) -> WindowStats:
+        epoch = self._epoch()
+        live = [b for b in self._buckets if 0 <= epoch - b.epoch < len(self._buckets)]
+        histogram = [sum(counts) for counts in zip(*(b.histogram for b in live))]
+        return WindowStats(
+            calls=sum(b.calls for b in live),
+            failures=sum(b.failures for b in live),
+            slow_calls=sum(b.slow_calls for b in live),
+            p95_latency_seconds=self._quantile(
+                histogram, 0.95, max((b.max_latency for b in live), default=0.0)
+            ),
+        )
+
+    @staticmethod
+    def _quantile(histogram: list[int], q: float, max_latency: float) -> float | None:
+        """הערכת quantile מההיסטוגרמה — אינטרפולציה לינארית בתוך ה-bucket"""
+        total = sum(histogram)
+        if not total:
+            return None
+        rank = math.ceil(q * total)
+        seen = 0
+        for i, count in enumerate(histogram):
+            if seen + count >= rank:
+                lower = _LATENCY_BUCKETS[i - 1] if i > 0 else 0.0
+                upper = _LATENCY_BUCKETS[i] if i < len(_LATENCY_BUCKETS) else max_latency
+                upper = min(upper, max_latency)
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return max_latency
+
+    def reset(self) -> None:
+        for bucket in self._buckets:
+            bucket.clear(-1)
+
+
+# זמני המתנה מקומיים בתוך קריאה מוגנת (מכסת rate limit) — לא נספרים כ-latency
+_excluded_latency: contextvars.ContextVar[list[float] | None] = contextvars.ContextVar(
+    "circuit_breaker_excluded_latency", default=None
+)
+
+
+def exclude_from_latency(seconds: float) -> None:
+    """דיווח על המתנה מקומית בתוך קריאה מוגנת — לא נזקפת לחובת השירות"""
+    waits = _excluded_latency.get()
+    if waits is not None and seconds > 0:
+        waits.append(seconds)
 
 
 @dataclass
@@ -71,6 +217,11 @@ class CircuitBreaker:
         self._state = CircuitBreakerState()
         # שימוש ב-threading.Lock במקום asyncio.Lock כדי לתמוך ב-event loops שונים ב-Celery
         self._lock = threading.Lock()
+        self._window = (
+            SlidingWindow(self.config.window_seconds, self.config.window_buckets)
+            if self.config.window_seconds
+            else None
+        )
 
     @classmethod
     def get_instance(
@@ -85,7 +236,12 @@ class CircuitBreaker:
         """
         with cls._instances_lock:
             if service_name not in cls._instances:
-                cls._instances[service_name] = cls(service_name, config)
+                breaker_cls = (
+                    RedisCircuitBreaker
+                    if settings.CIRCUIT_BREAKER_BACKEND == "redis"
+                    else CircuitBreaker
+                )
+                cls._instances[service_name] = breaker_cls(service_name, config)
             return cls._instances[service_name]
 
     @classmethod
@@ -138,6 +294,8 @@ class CircuitBreaker:
         if new_state == CircuitState.CLOSED:
             self._state.failure_count = 0
             self._state.success_count = 0
+            if self._window is not None:
+                self._window.reset()
 
         logger.info(
             f"Circuit breaker '{self.service_name}' transitioned",
@@ -165,17 +323,68 @@ class CircuitBreaker:
                 return False
             return False
 
-    def _record_success_sync(self) -> None:
+    def get_window_stats(self) -> WindowStats | None:
+        """סטטיסטיקת ה-sliding window (None אם ה-breaker לא במצב חלון)"""
+        if self._window is None:
+            return None
+        with self._lock:
+            return self._window.stats()
+
+    def _is_slow(self, duration: float | None) -> bool:
+        return (
+            duration is not None
+            and self.config.slow_call_seconds is not None
+            and duration >= self.config.slow_call_seconds
+        )
+
+    def _window_tripped_sync(self, duration: float | None, failed: bool) -> bool:
+        """רישום הקריאה בחלון (במצב סגור) — True אם שיעור הכשלונות או האיטיות עבר את הסף"""
+        if self._window is None or self._state.state != CircuitState.CLOSED:
+            return False
+        self._window.record(duration, failed=failed, slow=self._is_slow(duration))
+        stats = self._window.stats()
+        if stats.calls < self.config.minimum_calls:
+            return False
+        tripped = stats.failure_rate >= self.config.failure_rate_threshold or (
+            self.config.slow_call_seconds is not None
+            and stats.slow_call_rate >= self.config.slow_call_rate_threshold
+        )
+        if tripped:
+            logger.warning(
+                f"Circuit breaker '{self.service_name}' window threshold exceeded",
+                extra_data={
+                    "service": self.service_name,
+                    "calls": stats.calls,
+                    "failure_rate": round(stats.failure_rate, 3),
+                    "slow_call_rate": round(stats.slow_call_rate, 3),
+                    "p95_latency_seconds": stats.p95_latency_seconds,
+                }
+            )
+        return tripped
+
+    def _open_sync(self) -> None:
+        self._state.last_failure_time = time.time()
+        self._transition_to_sync(CircuitState.OPEN)
+
+    def _record_success_sync(self, duration: float | None = None) -> None:
         """רישום הצלחה — מימוש יחיד לשימוש sync ו-async"""
         with self._lock:
             if self._state.state == CircuitState.HALF_OPEN:
+                # probe איטי לא מוכיח שהשירות התאושש
+                if self._is_slow(duration):
+                    self._open_sync()
+                    return
                 self._state.success_count += 1
                 if self._state.success_count >= self.config.success_threshold:
                     self._transition_to_sync(CircuitState.CLOSED)
             elif self._state.state == CircuitState.CLOSED:
                 self._state.failure_count = 0
+                if self._window_tripped_sync(duration, failed=False):
+                    self._open_sync()
 
-    def _record_failure_sync(self, error: Exception | None = None) -> None:
+    def _record_failure_sync(
+        self, error: Exception | None = None, duration: float | None = None
+    ) -> None:
         """רישום כשלון — מימוש יחיד לשימוש sync ו-async"""
         with self._lock:
             self._state.failure_count += 1
@@ -193,14 +402,18 @@ class CircuitBreaker:
                 self._transition_to_sync(CircuitState.OPEN)
             elif self._state.failure_count >= self.config.failure_threshold:
                 self._transition_to_sync(CircuitState.OPEN)
+            elif self._window_tripped_sync(duration, failed=True):
+                self._transition_to_sync(CircuitState.OPEN)
 
-    async def record_success(self) -> None:
+    async def record_success(self, duration: float | None = None) -> None:
         """Record a successful call (האצלה למימוש sync — אין await בלוגיקה)"""
-        self._record_success_sync()
+        self._record_success_sync(duration)
 
-    async def record_failure(self, error: Exception | None = None) -> None:
+    async def record_failure(
+        self, error: Exception | None = None, duration: float | None = None
+    ) -> None:
         """Record a failed call (האצלה למימוש sync — אין await בלוגיקה)"""
-        self._record_failure_sync(error)
+        self._record_failure_sync(error, duration)
 
     async def can_execute(self) -> bool:
         """Check if a request can be executed (האצלה למימוש sync — אין await בלוגיקה)"""
@@ -239,6 +452,13 @@ class CircuitBreaker:
             retry_after = self.get_retry_after()
             raise CircuitBreakerOpenError(self.service_name, retry_after)
 
+        # במצב חלון — מדידת latency בלי המתנות מקומיות (exclude_from_latency)
+        waits: list[float] | None = None
+        token = None
+        if self._window is not None:
+            waits = []
+            token = _excluded_latency.set(waits)
+        started = time.monotonic()
         try:
             # Handle both sync and async functions
             if asyncio.iscoroutinefunction(func):
@@ -246,11 +466,240 @@ class CircuitBreaker:
             else:
                 result = func(*args, **kwargs)
 
-            await self.record_success()
+            await self.record_success(self._elapsed(started, waits))
             return result
+        except OutboundRateLimitError:
+            # המתנה מקומית למכסה — השירות עצמו לא נכשל
+            raise
         except Exception as e:
-            await self.record_failure(e)
+            await self.record_failure(e, self._elapsed(started, waits))
             raise
+        finally:
+            if token is not None:
+                _excluded_latency.reset(token)
+
+    @staticmethod
+    def _elapsed(started: float, waits: list[float] | None) -> float | None:
+        if waits is None:
+            return None
+        return max(0.0, time.monotonic() - started - sum(waits))
+
+
+_KEY_PREFIX = "circuit:"
+_KEY_TTL_MS = 24 * 60 * 60 * 1000
+
+# קריאה וכתיבה של ה-hash המשותף. opened_at הוא זמן הכשלון האחרון (ms, לפי
+# השעון של Redis) — כמו last_failure_time במימוש המקומי.
+# כל הסקריפטים מחזירים {allowed, state, failures, successes, half_open_calls,
+# ms מאז הכשלון האחרון}.
+_SCRIPT_PRELUDE = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local h = redis.call('HMGET', KEYS[1], 'state', 'failures', 'successes', 'half_open_calls', 'opened_at')
+local state = h[1] or 'closed'
+local failures = tonumber(h[2] or 0)
+local successes = tonumber(h[3] or 0)
+local calls = tonumber(h[4] or 0)
+local opened_at = tonumber(h[5] or 0)
+local allowed = 1
+local function save()
+    redis.call('HSET', KEYS[1], 'state', state, 'failures', failures, 'successes', successes,
+        'half_open_calls', calls, 'opened_at', opened_at)
+    redis.call('PEXPIRE', KEYS[1], ARGV[#ARGV])
+end
+"""
+
+_SCRIPT_RESULT = """
+return {allowed, state, failures, successes, calls, now - opened_at}
+"""
+
+# ARGV = [timeout_ms, half_open_max_calls, ttl_ms]
+_ACQUIRE_SCRIPT = _SCRIPT_PRELUDE + """
+if state == 'open' then
+    if now - opened_at >= tonumber(ARGV[1]) then
+        state = 'half_open'
+        successes = 0
+        calls = 0
+        save()
+    else
+        allowed = 0
+    end
+elseif state == 'half_open' then
+    if calls < tonumber(ARGV[2]) then
+        calls = calls + 1
+        save()
+    else
+        allowed = 0
+    end
+end
+""" + _SCRIPT_RESULT
+
+# ARGV = [success_threshold, ttl_ms]
+_SUCCESS_SCRIPT = _SCRIPT_PRELUDE + """
+if state == 'half_open' then
+    successes = successes + 1
+    if successes >= tonumber(ARGV[1]) then
+        state = 'closed'
+        failures = 0
+        successes = 0
+    end
+    save()
+elseif state == 'closed' and failures > 0 then
+    failures = 0
+    save()
+end
+""" + _SCRIPT_RESULT
+
+# ARGV = [failure_threshold, ttl_ms]
+_FAILURE_SCRIPT = _SCRIPT_PRELUDE + """
+failures = failures + 1
+opened_at = now
+if state == 'half_open' or failures >= tonumber(ARGV[1]) then
+    state = 'open'
+end
+save()
+""" + _SCRIPT_RESULT
+
+
+# פתיחה מפורשת — החלון המקומי של תהליך עבר את הסף. ARGV = [ttl_ms]
+_OPEN_SCRIPT = _SCRIPT_PRELUDE + """
+state = 'open'
+opened_at = now
+save()
+""" + _SCRIPT_RESULT
+
+
+class RedisCircuitBreaker(CircuitBreaker):
+    """
+    Circuit breaker שהמצב שלו משותף לכל התהליכים דרך Redis.
+
+    self._state הוא העותק המקומי של המצב המשותף (מתעדכן מכל תשובה של
+    סקריפט), כך ש-get_retry_after ודשבורד ה-debug עובדים כמו במימוש המקומי.
+    נתיב ה-sync של הדקורטור (מתוך loop פעיל) משתמש בעותק המקומי בלבד.
+    """
+
+    def __init__(
+        self,
+        service_name: str,
+        config: CircuitBreakerConfig | None = None
+    ):
+        super().__init__(service_name, config)
+        self._key = _KEY_PREFIX + service_name
+        # monotonic — מתי העותק המקומי סונכרן לאחרונה מ-Redis
+        self._synced_at: float | None = None
+        # אחרי כשלון Redis — לא מנסים שוב עד הרענון הבא (לא מוסיפים timeout לכל קריאה)
+        self._redis_retry_at = 0.0
+
+    def _snapshot_is_fresh(self) -> bool:
+        return (
+            self._synced_at is not None
+            and time.monotonic() - self._synced_at < settings.CIRCUIT_BREAKER_SYNC_INTERVAL_SECONDS
+        )
+
+    async def can_execute(self) -> bool:
+        """breaker סגור עם עותק טרי — בלי קריאת רשת; אחרת סנכרון (ו-probe) ב-Redis"""
+        if self._state.state == CircuitState.CLOSED and self._snapshot_is_fresh():
+            return True
+        result = await self._run_script(
+            _ACQUIRE_SCRIPT,
+            int(self.config.timeout_seconds * 1000),
+            self.config.half_open_max_calls,
+        )
+        if result is None:
+            return self._check_can_execute_sync()
+        return bool(int(result[0]))
+
+    async def record_success(self, duration: float | None = None) -> None:
+        """הצלחה במצב סגור בלי כשלונות קודמים לא משנה כלום — בלי קריאת רשת.
+
+        החלון נספר מקומית בכל תהליך; כשהוא עובר את הסף ה-circuit נפתח לכולם.
+        """
+        if self._state.state == CircuitState.CLOSED:
+            with self._lock:
+                tripped = self._window_tripped_sync(duration, failed=False)
+            if tripped:
+                await self._open_shared()
+                return
+            if self._state.failure_count == 0:
+                return
+        elif self._state.state == CircuitState.HALF_OPEN and self._is_slow(duration):
+            await self._open_shared()
+            return
+        result = await self._run_script(_SUCCESS_SCRIPT, self.config.success_threshold)
+        if result is None:
+            self._record_success_sync(duration)
+
+    async def record_failure(
+        self, error: Exception | None = None, duration: float | None = None
+    ) -> None:
+        result = await self._run_script(_FAILURE_SCRIPT, self.config.failure_threshold)
+        if result is None:
+            self._record_failure_sync(error, duration)
+            return
+        if self._state.state == CircuitState.CLOSED:
+            with self._lock:
+                tripped = self._window_tripped_sync(duration, failed=True)
+            if tripped:
+                await self._open_shared()
+        logger.warning(
+            f"Circuit breaker '{self.service_name}' recorded failure",
+            extra_data={
+                "service": self.service_name,
+                "failure_count": self._state.failure_count,
+                "threshold": self.config.failure_threshold,
+                "error": str(error) if error else None,
+                "shared": True,
+            }
+        )
+
+    async def _open_shared(self) -> None:
+        if await self._run_script(_OPEN_SCRIPT) is None:
+            with self._lock:
+                self._open_sync()
+
+    async def _run_script(self, script: str, *args: int) -> list[Any] | None:
+        """הרצת סקריפט על ה-hash המשותף ועדכון העותק המקומי. None אם Redis לא זמין."""
+        if time.monotonic() < self._redis_retry_at:
+            return None
+        try:
+            from app.core.redis_client import get_redis
+
+            redis = await get_redis()
+            result = await redis.eval(script, 1, self._key, *args, _KEY_TTL_MS)
+        except Exception as e:
+            logger.debug(
+                "Redis circuit breaker לא זמין — מצב מקומי",
+                extra_data={"service": self.service_name, "error": str(e)},
+            )
+            self._synced_at = None
+            self._redis_retry_at = time.monotonic() + settings.CIRCUIT_BREAKER_SYNC_INTERVAL_SECONDS
+            return None
+        self._apply_snapshot(result)
+        return result
+
+    def _apply_snapshot(self, result: list[Any]) -> None:
+        _, state, failures, successes, calls, since_failure_ms = result
+        if isinstance(state, bytes):
+            state = state.decode()
+        new_state = CircuitState(state)
+        with self._lock:
+            old_state = self._state.state
+            self._state.state = new_state
+            self._state.failure_count = int(failures)
+            self._state.success_count = int(successes)
+            self._state.half_open_calls = int(calls)
+            self._state.last_failure_time = time.time() - int(since_failure_ms) / 1000.0
+            self._synced_at = time.monotonic()
+        if old_state != new_state:
+            logger.info(
+                f"Circuit breaker '{self.service_name}' transitioned",
+                extra_data={
+                    "service": self.service_name,
+                    "old_state": old_state.value,
+                    "new_state": new_state.value,
+                    "shared": True,
+                }
+            )
 
 
 def circuit_breaker(
@@ -325,16 +774,26 @@ def get_telegram_circuit_breaker() -> CircuitBreaker:
     )
 
 
+def _whatsapp_gateway_config() -> CircuitBreakerConfig:
+    """
+    גטוויי WPPConnect נוטה להאט לפני שהוא נופל — sliding window שנפתח גם
+    לפי שיעור קריאות איטיות, בנוסף לכשלונות רצופים.
+    """
+    return CircuitBreakerConfig(
+        failure_threshold=5,
+        success_threshold=2,
+        timeout_seconds=30.0,
+        window_seconds=settings.CIRCUIT_BREAKER_WINDOW_SECONDS,
+        minimum_calls=settings.CIRCUIT_BREAKER_WINDOW_MIN_CALLS,
+        failure_rate_threshold=settings.CIRCUIT_BREAKER_FAILURE_RATE_THRESHOLD,
+        slow_call_seconds=settings.CIRCUIT_BREAKER_SLOW_CALL_SECONDS,
+        slow_call_rate_threshold=settings.CIRCUIT_BREAKER_SLOW_CALL_RATE_THRESHOLD,
+    )
+
+
 def get_whatsapp_circuit_breaker() -> CircuitBreaker:
     """Get circuit breaker for WhatsApp API — שליחת הודעות למשתמשים"""
-    return CircuitBreaker.get_instance(
-        "whatsapp",
-        CircuitBreakerConfig(
-            failure_threshold=5,
-            success_threshold=2,
-            timeout_seconds=30.0
-        )
-    )
+    return CircuitBreaker.get_instance("whatsapp", _whatsapp_gateway_config())
 
 
 def get_whatsapp_admin_circuit_breaker() -> CircuitBreaker:
@@ -342,14 +801,7 @@ def get_whatsapp_admin_circuit_breaker() -> CircuitBreaker:
     Circuit breaker נפרד להודעות admin — מונע מצב שכשלונות
     admin notifications (כמו send-media שבור) חוסמים תגובות למשתמשים.
     """
-    return CircuitBreaker.get_instance(
-        "whatsapp_admin",
-        CircuitBreakerConfig(
-            failure_threshold=5,
-            success_threshold=2,
-            timeout_seconds=30.0
-        )
-    )
+    return CircuitBreaker.get_instance("whatsapp_admin", _whatsapp_gateway_config())
 
 
 def get_whatsapp_cloud_circuit_breaker() -> CircuitBreaker:
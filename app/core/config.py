@@ -8,6 +8,10 @@ from typing import Optional
 # ספקי WhatsApp נתמכים
 VALID_WHATSAPP_PROVIDERS = {"wppconnect", "pywa"}
 
+# backends נתמכים ל-circuit breaker
+VALID_CIRCUIT_BREAKER_BACKENDS = {"redis", "memory"}
+VALID_WEBHOOK_IDEMPOTENCY_BACKENDS = {"redis", "db"}
+
 
 class Settings(BaseSettings):
     """Application settings loaded from environment variables"""
@@ -65,10 +69,31 @@ class Settings(BaseSettings):
     WHATSAPP_CLOUD_API_PHONE_NUMBER: str = ""     # מספר הטלפון הרשמי ליצירת wa.me/ links (ללא +)
     WHATSAPP_CLOUD_API_APP_SECRET: str = ""       # App secret לאימות webhook signatures
     WHATSAPP_CLOUD_API_VERIFY_TOKEN: str = ""     # Verify token לאימות webhook registration
+    # client משותף ל-Graph API (app/core/http_clients.py) — pool חיבורים עם keep-alive
+    WHATSAPP_CLOUD_API_HTTP_TIMEOUT_SECONDS: float = 30.0
+    WHATSAPP_CLOUD_API_HTTP_MAX_CONNECTIONS: int = 20
+    WHATSAPP_CLOUD_API_HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 10
+    WHATSAPP_CLOUD_API_HTTP_KEEPALIVE_EXPIRY_SECONDS: float = 30.0
+    # קריאות Cloud API במקביל לכל תהליך (כולל send_text_bulk). ההמתנה בין
+    # ניסיונות (backoff) לא תופסת מקום
+    WHATSAPP_CLOUD_API_MAX_CONCURRENCY: int = 10
 
     # מצב היברידי: Cloud API לפרטי, WPPConnect לקבוצות
     WHATSAPP_HYBRID_MODE: bool = False
 
+    # batch של הודעות ב-webhook (WPPConnect / Cloud API) — שולחים שונים במקביל,
+    # כל שולח עם סשן DB משלו; הסדר בתוך אותו שולח נשמר.
+    # כל שולח תופס חיבור מה-pool (pool_size + max_overflow = 40)
+    WHATSAPP_WEBHOOK_CONCURRENT_SENDERS: bool = False
+    WHATSAPP_WEBHOOK_SENDER_CONCURRENCY: int = 8
+
+    @field_validator("WHATSAPP_WEBHOOK_SENDER_CONCURRENCY", mode="after")
+    @classmethod
+    def validate_webhook_sender_concurrency(cls, v: int) -> int:
+        if v < 1:
+            raise ValueError("WHATSAPP_WEBHOOK_SENDER_CONCURRENCY must be at least 1")
+        return v
+
     @field_validator("WHATSAPP_PROVIDER", mode="before")
     @classmethod
     def validate_whatsapp_provider(cls, v: str) -> str:
@@ -110,12 +135,52 @@ class Settings(BaseSettings):
     # ב-Render מוגדר אוטומטית דרך RENDER_EXTERNAL_URL.
     # דוגמה: https://my-app.onrender.com
     TELEGRAM_WEBHOOK_BASE_URL: str = ""
+    # client משותף ל-Bot API (app/core/http_clients.py) — keep-alive ו-pool חיבורים
+    # במקום DNS + TCP + TLS לכל הודעה. HTTP/2 דורש את החבילה h2 (httpx[http2])
+    TELEGRAM_API_BASE_URL: str = "https://api.telegram.org"
+    TELEGRAM_HTTP_TIMEOUT_SECONDS: float = 30.0
+    TELEGRAM_HTTP_MAX_CONNECTIONS: int = 100
+    TELEGRAM_HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    TELEGRAM_HTTP_KEEPALIVE_EXPIRY_SECONDS: float = 30.0
+    TELEGRAM_HTTP2: bool = False
+    # קליטה מהירה של updates — ה-webhook מוסיף ל-Redis Stream ומחזיר מיד, ו-consumer
+    # ב-worker runtime מעבד לפי הסדר לכל צ'אט (ראה app/domain/services/telegram_inbound_queue.py).
+    # דורש worker עם WORKER_RUNTIME_ENABLED. False = עיבוד inline בתוך ה-webhook
+    TELEGRAM_INBOUND_QUEUE_ENABLED: bool = False
+    TELEGRAM_INBOUND_SHARDS: int = 8  # streams נפרדים — כל shard מעובד ע"י consumer אחד
+    TELEGRAM_INBOUND_CONCURRENCY: int = 16  # updates במקביל לכל consumer (צ'אטים שונים)
+    # backlog מקסימלי ל-shard — מעבר לו ה-webhook מחזיר 503 ו-Telegram שולח שוב
+    TELEGRAM_INBOUND_MAX_BACKLOG: int = 10000
+    # מסירות בלי ack (קריסה באמצע עיבוד) לפני מעבר ל-dead letter
+    TELEGRAM_INBOUND_MAX_DELIVERIES: int = 3
+    TELEGRAM_INBOUND_LEASE_SECONDS: int = 30  # lease של consumer על shard
+    TELEGRAM_INBOUND_BLOCK_SECONDS: int = 5  # timeout של XREADGROUP — תדירות חידוש lease
+    # סף התראה לגיל ה-update הוותיק שממתין לעיבוד (שניות)
+    TELEGRAM_INBOUND_BACKLOG_ALERT_SECONDS: int = 30
+
+    @field_validator(
+        "TELEGRAM_INBOUND_SHARDS",
+        "TELEGRAM_INBOUND_CONCURRENCY",
+        "TELEGRAM_INBOUND_MAX_BACKLOG",
+        "TELEGRAM_INBOUND_MAX_DELIVERIES",
+        mode="after",
+    )
+    @classmethod
+    def validate_telegram_inbound(cls, v: int) -> int:
+        """0 shards / מקביליות / backlog היה עוצר את קליטת ה-updates"""
+        if v < 1:
+            raise ValueError("Telegram inbound queue sizes must be at least 1")
+        return v
 
     # ביטול אוטומטי של משלוחים שלא נתפסו
     AUTO_CANCEL_UNCAPTURED_HOURS: int = 24  # שעות עד ביטול אוטומטי
     AUTO_CANCEL_WARNING_MINUTES: int = 30  # דקות לפני ביטול — שליחת התראה לשולח
     AUTO_CANCEL_CHECK_INTERVAL_SECONDS: int = 900  # כל 15 דקות
 
+    # Celery worker runtime — event loop, DB engine ו-Redis אחד לכל תהליך worker
+    # במקום loop + engine חדשים לכל task (ראה app/workers/runtime.py)
+    WORKER_RUNTIME_ENABLED: bool = True
+
     # Credit settings
     DEFAULT_CREDIT_LIMIT: float = -500.0  # Minimum balance allowed (500₪ credit)
     DELIVERY_FEE: float = 10.0  # Fee per delivery
@@ -124,12 +189,72 @@ class Settings(BaseSettings):
     # Base delay is multiplied by 2**retry_count (capped by OUTBOX_MAX_BACKOFF_SECONDS)
     OUTBOX_RETRY_BASE_SECONDS: int = 30
     OUTBOX_MAX_BACKOFF_SECONDS: int = 3600  # 1 hour cap to prevent multi-day delays
+    # תפיסת הודעות ב-batch (SELECT ... FOR UPDATE SKIP LOCKED) — כמה הודעות לכל tick
+    OUTBOX_BATCH_SIZE: int = 50
+    # משך ה-lease של worker על הודעה שתפס. אחרי פקיעה — worker אחר רשאי לתפוס מחדש
+    # (למשל אחרי קריסה). לא קצר מ-task_time_limit של Celery כדי למנוע שליחה כפולה.
+    OUTBOX_CLAIM_LEASE_SECONDS: int = 300
+    # התעוררות מיידית של ה-dispatcher אחרי commit (Redis list + BLPOP) במקום
+    # המתנה ל-tick של Beat. Beat נשאר כ-safety sweep כל OUTBOX_SWEEP_INTERVAL_SECONDS
+    OUTBOX_WAKEUP_ENABLED: bool = True
+    OUTBOX_WAKEUP_BLOCK_SECONDS: int = 5  # timeout של BLPOP — תדירות בדיקת כיבוי
+    OUTBOX_WAKEUP_MAX_BATCHES: int = 20  # תקרת batches לכל התעוררות
+    OUTBOX_SWEEP_INTERVAL_SECONDS: float = 10.0
+    # שליחה מקבילית של ה-batch — הודעות לנמענים שונים נשלחות במקביל,
+    # הודעות לאותו recipient_id נשלחות בסדר. False = לולאה סדרתית (ההתנהגות הקודמת)
+    OUTBOX_CONCURRENT_DISPATCH: bool = False
+    # מגבלת שליחות בו-זמניות לכל פלטפורמה (semaphore) במצב מקבילי
+    OUTBOX_WHATSAPP_CONCURRENCY: int = 5
+    OUTBOX_TELEGRAM_CONCURRENCY: int = 10
+    # גודל chunk בשליחת BROADCAST_COURIERS דרך טבלת ה-fan-out — חוסם זיכרון
+    # ומספר שליחות בו-זמניות לכל broadcast
+    OUTBOX_FANOUT_CHUNK_SIZE: int = 100
+    # נתיבי עדיפות (MessagePriority) — כל נתיב נתפס ומרוקן בנפרד עם תקציב batch
+    # משלו, כך ש-broadcast גדול לא מעכב תגובות אינטראקטיביות. False = תור FIFO אחד
+    OUTBOX_PRIORITY_LANES_ENABLED: bool = True
+    OUTBOX_INTERACTIVE_BATCH_SIZE: int = 20
+    OUTBOX_NORMAL_BATCH_SIZE: int = 50
+    OUTBOX_BULK_BATCH_SIZE: int = 20
+    # איחוד הודעות טקסט ממתינות לאותו נמען (platform + recipient_id) לשליחה אחת,
+    # עד מגבלת האורך של הפלטפורמה — פחות קריאות API ופחות צריכת rate limit לצ'אט.
+    # רק הודעות שנוצרו בתוך החלון מההודעה הראשונה בקבוצה
+    OUTBOX_COALESCE_ENABLED: bool = False
+    OUTBOX_COALESCE_WINDOW_SECONDS: float = 2.0
+    # טלמטריה של ה-dispatcher (היסטוגרמות latency ומוני תוצאות ב-Redis) —
+    # נחשפת ב-/admin/debug/outbox/metrics ובפורמט Prometheus
+    OUTBOX_METRICS_ENABLED: bool = True
+    # סף התראה לגיל ההודעה הוותיקה שממתינה לשליחה (שניות)
+    OUTBOX_OLDEST_PENDING_ALERT_SECONDS: int = 60
+
+    @field_validator(
+        "OUTBOX_WHATSAPP_CONCURRENCY",
+        "OUTBOX_TELEGRAM_CONCURRENCY",
+        "OUTBOX_FANOUT_CHUNK_SIZE",
+        "OUTBOX_INTERACTIVE_BATCH_SIZE",
+        "OUTBOX_NORMAL_BATCH_SIZE",
+        "OUTBOX_BULK_BATCH_SIZE",
+        mode="after",
+    )
+    @classmethod
+    def validate_outbox_concurrency(cls, v: int) -> int:
+        """semaphore / chunk / batch בגודל 0 היה תוקע את השליחה לחלוטין"""
+        if v < 1:
+            raise ValueError("Outbox concurrency, chunk and batch sizes must be at least 1")
+        return v
 
     # WhatsApp Gateway retry settings
     # מספר ניסיונות מקסימלי לשליחת הודעה (כולל הניסיון הראשון)
     WHATSAPP_MAX_RETRIES: int = 3
     # קודי HTTP שנחשבים לשגיאות זמניות ומצדיקים retry (מופרדים בפסיקים)
     WHATSAPP_TRANSIENT_STATUS_CODES: str = "502,503,504,429"
+    # client משותף לגטוויי (app/core/http_clients.py) — pool חיבורים עם keep-alive
+    WHATSAPP_GATEWAY_HTTP_TIMEOUT_SECONDS: float = 30.0
+    WHATSAPP_GATEWAY_HTTP_MAX_CONNECTIONS: int = 20
+    WHATSAPP_GATEWAY_HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 10
+    WHATSAPP_GATEWAY_HTTP_KEEPALIVE_EXPIRY_SECONDS: float = 30.0
+    # שליחות במקביל ב-send_text_bulk — לא יותר מה-keep-alive pool, כדי
+    # שכל broadcast יעבור על חיבורים פתוחים במקום לפתוח חיבורים חדשים
+    WHATSAPP_BULK_SEND_CONCURRENCY: int = 10
 
     @field_validator("WHATSAPP_MAX_RETRIES", mode="after")
     @classmethod
@@ -139,6 +264,63 @@ class Settings(BaseSettings):
             raise ValueError("WHATSAPP_MAX_RETRIES must be at least 1")
         return v
 
+    # Rate limiting — שליחות יוצאות (GCRA משותף ב-Redis, ראה app/core/rate_limiter.py)
+    OUTBOUND_RATE_LIMIT_ENABLED: bool = True
+    # המתנה מקומית מקסימלית למכסה / ל-retry_after לפני כשלון זמני
+    OUTBOUND_RATE_LIMIT_MAX_WAIT_SECONDS: float = 30.0
+    # כמה פעמים לכבד retry_after של 429 לפני שמעבירים את השגיאה לקורא
+    OUTBOUND_RATE_LIMIT_MAX_429_RETRIES: int = 2
+    # הודעות רצופות מותרות לצ'אט לפני שהקצב היציב נאכף
+    OUTBOUND_RATE_LIMIT_CHAT_BURST: int = 3
+    TELEGRAM_RATE_LIMIT_GLOBAL_PER_SECOND: int = 25  # מגבלת Telegram ~30/s לבוט
+    TELEGRAM_RATE_LIMIT_CHAT_PER_SECOND: float = 1.0
+    TELEGRAM_RATE_LIMIT_GROUP_PER_MINUTE: int = 20
+    WHATSAPP_RATE_LIMIT_GLOBAL_PER_SECOND: int = 20
+    WHATSAPP_RATE_LIMIT_CHAT_PER_SECOND: float = 1.0
+    WHATSAPP_RATE_LIMIT_GROUP_PER_MINUTE: int = 20
+
+    @field_validator(
+        "TELEGRAM_RATE_LIMIT_GLOBAL_PER_SECOND",
+        "TELEGRAM_RATE_LIMIT_CHAT_PER_SECOND",
+        "TELEGRAM_RATE_LIMIT_GROUP_PER_MINUTE",
+        "WHATSAPP_RATE_LIMIT_GLOBAL_PER_SECOND",
+        "WHATSAPP_RATE_LIMIT_CHAT_PER_SECOND",
+        "WHATSAPP_RATE_LIMIT_GROUP_PER_MINUTE",
+        "OUTBOUND_RATE_LIMIT_CHAT_BURST",
+        mode="after",
+    )
+    @classmethod
+    def validate_outbound_rate_limits(cls, v: float) -> float:
+        """קצב 0 היה חוסם את השליחה לחלוטין (חלוקה באפס ב-GCRA)"""
+        if v <= 0:
+            raise ValueError("Outbound rate limits must be greater than 0")
+        return v
+
+    # Circuit breaker — מצב משותף לכל ה-workers ב-Redis (ראה app/core/circuit_breaker.py).
+    # memory = מצב לכל תהליך בנפרד (בדיקות / פיתוח מקומי)
+    CIRCUIT_BREAKER_BACKEND: str = "redis"
+    # כל כמה זמן breaker סגור מרענן את המצב המשותף — בין רענונים אין קריאות רשת
+    CIRCUIT_BREAKER_SYNC_INTERVAL_SECONDS: float = 1.0
+    # חלון זמן (sliding window) ל-breakers של גטוויי WhatsApp — נפתח גם לפי
+    # שיעור כשלונות ושיעור קריאות איטיות, לא רק לפי כשלונות רצופים
+    CIRCUIT_BREAKER_WINDOW_SECONDS: float = 60.0
+    CIRCUIT_BREAKER_WINDOW_MIN_CALLS: int = 10
+    CIRCUIT_BREAKER_FAILURE_RATE_THRESHOLD: float = 0.5
+    # קריאה שנמשכה לפחות כך נחשבת איטית (גם אם הצליחה)
+    CIRCUIT_BREAKER_SLOW_CALL_SECONDS: float = 10.0
+    CIRCUIT_BREAKER_SLOW_CALL_RATE_THRESHOLD: float = 0.5
+
+    @field_validator("CIRCUIT_BREAKER_BACKEND", mode="before")
+    @classmethod
+    def validate_circuit_breaker_backend(cls, v: str) -> str:
+        v = v.strip().lower()
+        if v not in VALID_CIRCUIT_BREAKER_BACKENDS:
+            raise ValueError(
+                f"CIRCUIT_BREAKER_BACKEND='{v}' לא נתמך. "
+                f"ערכים מותרים: {', '.join(sorted(VALID_CIRCUIT_BREAKER_BACKENDS))}"
+            )
+        return v
+
     # Rate limiting — webhooks
     WEBHOOK_RATE_LIMIT_MAX_REQUESTS: int = 100  # מספר בקשות מקסימלי לכל IP
     WEBHOOK_RATE_LIMIT_WINDOW_SECONDS: int = 60  # חלון זמן בשניות
@@ -159,6 +341,82 @@ class Settings(BaseSettings):
             raise ValueError("WEBHOOK_RATE_LIMIT_WINDOW_SECONDS must be greater than 0")
         return v
 
+    # מטמון זיהוי משתמשים ב-webhooks (ראה app/domain/services/user_identity_cache.py).
+    # TTL קצר — שינוי תפקיד/אישור/חסימה מבטל מיד; שינוי מבני אחר מתעדכן עד ה-TTL.
+    # השכבה המקומית לא מקבלת ביטולים מתהליכים אחרים — לכן TTL של שניות בודדות
+    USER_IDENTITY_CACHE_ENABLED: bool = True
+    USER_IDENTITY_CACHE_TTL_SECONDS: int = 60
+    USER_IDENTITY_CACHE_LOCAL_TTL_SECONDS: float = 5.0
+    USER_IDENTITY_CACHE_LOCAL_MAX_ENTRIES: int = 10000
+
+    @field_validator(
+        "USER_IDENTITY_CACHE_TTL_SECONDS",
+        "USER_IDENTITY_CACHE_LOCAL_MAX_ENTRIES",
+        mode="after",
+    )
+    @classmethod
+    def validate_user_identity_cache_positive(cls, v: int) -> int:
+        if v < 1:
+            raise ValueError("User identity cache TTL and size must be at least 1")
+        return v
+
+    # מטמון יכולות תפקיד לניתוב תפריט (ראה app/domain/services/role_capabilities.py).
+    # שינוי סדרנים / בעלים / תחנות דרך ה-ORM מבטל מיד; עדכון ישיר — עד ה-TTL
+    ROLE_CAPABILITY_CACHE_ENABLED: bool = True
+    ROLE_CAPABILITY_CACHE_TTL_SECONDS: int = 300
+
+    @field_validator("ROLE_CAPABILITY_CACHE_TTL_SECONDS", mode="after")
+    @classmethod
+    def validate_role_capability_cache_ttl(cls, v: int) -> int:
+        if v < 1:
+            raise ValueError("ROLE_CAPABILITY_CACHE_TTL_SECONDS must be at least 1")
+        return v
+
+    # מרווח מינימלי בין עדכוני last_message_at של סשן נהג בניתוב התפריט.
+    # ה-timeout של 24 שעות נמדד מ-last_message_at, ולכן תזכורת וניתוק עלולים
+    # להגיע עד מרווח אחד לפני 24 שעות מההודעה האחרונה.
+    # 0 = עדכון בכל הודעה (ההתנהגות הקודמת)
+    DRIVER_SESSION_TOUCH_INTERVAL_SECONDS: int = 30
+
+    @field_validator("DRIVER_SESSION_TOUCH_INTERVAL_SECONDS", mode="after")
+    @classmethod
+    def validate_driver_session_touch_interval(cls, v: int) -> int:
+        if v < 0:
+            raise ValueError("DRIVER_SESSION_TOUCH_INTERVAL_SECONDS must be non-negative")
+        return v
+
+    # unit of work לשיחה (ראה conversation_unit_of_work ב-app/state_machine/manager.py).
+    # כבוי = כל מעבר state / עדכון context מבצע commit מיידי (ההתנהגות הקודמת)
+    STATE_MANAGER_UNIT_OF_WORK_ENABLED: bool = True
+
+    # Idempotency של הודעות webhook (ראה app/domain/services/webhook_idempotency.py).
+    # redis = רכישה וסימון ב-Redis, webhook_events כ-fallback וכ-audit ב-batch.
+    # db = רכישה וסימון מול הטבלה עם commit לכל הודעה (ההתנהגות הקודמת)
+    WEBHOOK_IDEMPOTENCY_BACKEND: str = "redis"
+    # כמה זמן הודעה שהושלמה נחסמת מעיבוד חוזר ב-Redis (כמו ניקוי webhook_events)
+    WEBHOOK_IDEMPOTENCY_COMPLETED_TTL_SECONDS: int = 7 * 24 * 60 * 60
+    WEBHOOK_IDEMPOTENCY_AUDIT_ENABLED: bool = True
+    WEBHOOK_IDEMPOTENCY_AUDIT_FLUSH_SECONDS: float = 2.0
+    WEBHOOK_IDEMPOTENCY_AUDIT_BATCH_SIZE: int = 200
+
+    @field_validator("WEBHOOK_IDEMPOTENCY_BACKEND", mode="before")
+    @classmethod
+    def validate_webhook_idempotency_backend(cls, v: str) -> str:
+        v = v.strip().lower()
+        if v not in VALID_WEBHOOK_IDEMPOTENCY_BACKENDS:
+            raise ValueError(
+                f"WEBHOOK_IDEMPOTENCY_BACKEND='{v}' לא נתמך. "
+                f"ערכים מותרים: {', '.join(sorted(VALID_WEBHOOK_IDEMPOTENCY_BACKENDS))}"
+            )
+        return v
+
+    @field_validator("WEBHOOK_IDEMPOTENCY_AUDIT_BATCH_SIZE", mode="after")
+    @classmethod
+    def validate_webhook_idempotency_batch(cls, v: int) -> int:
+        if v < 1:
+            raise ValueError("WEBHOOK_IDEMPOTENCY_AUDIT_BATCH_SIZE must be at least 1")
+        return v
+
     # Admin debug endpoints — מפתח API לגישה ל-endpoints דיאגנוסטיים
     ADMIN_API_KEY: str = ""  # openssl rand -hex 32
 
@@ -267,6 +525,20 @@ class Settings(BaseSettings):
     UPLOAD_DIR: str = "./uploads"
     MAX_FILE_SIZE: int = 10 * 1024 * 1024  # 10MB
 
+    # Media relay — cache מקומי למדיה שמועברת בין פלטפורמות (media_relay.py).
+    # ריק = תיקייה בתוך ה-temp של המערכת. LRU לפי גודל כולל, לכל תהליך
+    MEDIA_CACHE_DIR: str = ""
+    MEDIA_CACHE_MAX_BYTES: int = 256 * 1024 * 1024  # 256MB
+    MEDIA_CACHE_MAX_FILE_BYTES: int = 20 * 1024 * 1024  # מגבלת getFile של Bot API
+    MEDIA_CACHE_TTL_SECONDS: int = 3600  # קבצים (כולל KYC) לא נשמרים יותר מזה
+
+    @field_validator("MEDIA_CACHE_TTL_SECONDS", mode="after")
+    @classmethod
+    def validate_media_cache_ttl(cls, v: int) -> int:
+        if v < 1:
+            raise ValueError("MEDIA_CACHE_TTL_SECONDS must be at least 1")
+        return v
+
     class Config:
         env_file = ".env"
         case_sensitive = True
@@ -318,14 +318,23 @@ class ExternalServiceException(AppException):
         status_code = getattr(response, "status_code", None)
         response_text = getattr(response, "text", "") or ""
 
+        details: dict[str, Any] = {
+            "operation": operation,
+            "status_code": status_code,
+            "response_text": response_text[:max_response_chars],
+        }
+        if status_code == 429:
+            # retry_after משמש את ה-rate limiter להמתנה במקום כשלון חוזר
+            from app.core.rate_limiter import parse_retry_after
+
+            retry_after = parse_retry_after(response)
+            if retry_after is not None:
+                details["retry_after"] = retry_after
+
         # cls צפוי להיות subclass שמקבל (message, details)
         return cls(  # type: ignore[misc]
             message=message or f"{operation} returned status {status_code}",
-            details={
-                "operation": operation,
-                "status_code": status_code,
-                "response_text": response_text[:max_response_chars],
-            },
+            details=details,
         )
 
 
@@ -377,6 +386,18 @@ class CircuitBreakerOpenError(ExternalServiceException):
         )
 
 
+class OutboundRateLimitError(ExternalServiceException):
+    """Raised when waiting for the outbound rate limit exceeds the local budget"""
+
+    def __init__(self, service_name: str, bucket: str, wait_seconds: float):
+        super().__init__(
+            service_name=service_name,
+            message=f"{service_name} rate limit wait {wait_seconds:.1f}s exceeds budget",
+            error_code=ErrorCode.EXTERNAL_SERVICE_UNAVAILABLE,
+            details={"bucket": bucket, "retry_after_seconds": wait_seconds}
+        )
+
+
 class StateMachineException(AppException):
     """Base exception for state machine errors"""
 
@@ -0,0 +1,121 @@
+"""
+HTTP Clients — httpx.AsyncClient משותפים עם connection pooling לשירותים חיצוניים.
+
+client חדש לכל קריאה משלם על DNS + TCP + TLS בכל הודעה. כאן נשמר client אחד
+לכל שירות, עם keep-alive ו-pool של חיבורים, שמשותף לכל הקוראים בתהליך.
+
+client של httpx קשור ל-event loop שבו נפתחו החיבורים שלו, ולכן ה-cache הוא
+לכל loop: ב-FastAPI וב-worker runtime יש loop אחד לכל התהליך (client אחד),
+וב-task של Celery עם loop זמני (get_event_loop) נוצר client ל-task בלבד.
+close_http_clients סוגר את ה-clients של ה-loop הנוכחי — נקרא ב-shutdown של
+האפליקציה ושל ה-worker runtime.
+"""
+from __future__ import annotations
+
+import asyncio
+import weakref
+from typing import Callable
+
+import httpx
+
+from app.core.config import settings
+from app.core.logging import get_logger
+
+logger = get_logger(__name__)
+
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, httpx.AsyncClient]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _http2_available() -> bool:
+    """HTTP/2 ב-httpx דורש את החבילה האופציונלית h2 (httpx[http2])"""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _get_client(name: str, build: Callable[[], httpx.AsyncClient]) -> httpx.AsyncClient:
+    """ה-client של השירות ב-loop הנוכחי — נוצר בקריאה הראשונה"""
+    loop = asyncio.get_running_loop()
+    clients = _clients.setdefault(loop, {})
+    client = clients.get(name)
+    if client is None or client.is_closed:
+        client = build()
+        clients[name] = client
+    return client
+
+
+def _build_telegram_client() -> httpx.AsyncClient:
+    http2 = settings.TELEGRAM_HTTP2 and _http2_available()
+    if settings.TELEGRAM_HTTP2 and not http2:
+        logger.warning("TELEGRAM_HTTP2 מופעל אבל החבילה h2 לא מותקנת — שימוש ב-HTTP/1.1")
+    return httpx.AsyncClient(
+        timeout=settings.TELEGRAM_HTTP_TIMEOUT_SECONDS,
+        limits=httpx.Limits(
+            max_connections=settings.TELEGRAM_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.TELEGRAM_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.TELEGRAM_HTTP_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        http2=http2,
+    )
+
+
+def get_telegram_client() -> httpx.AsyncClient:
+    """client משותף ל-Telegram Bot API. אין לסגור אותו (לא async with)."""
+    return _get_client("telegram", _build_telegram_client)
+
+
+def _build_whatsapp_gateway_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=settings.WHATSAPP_GATEWAY_HTTP_TIMEOUT_SECONDS,
+        limits=httpx.Limits(
+            max_connections=settings.WHATSAPP_GATEWAY_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.WHATSAPP_GATEWAY_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.WHATSAPP_GATEWAY_HTTP_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+    )
+
+
+def get_whatsapp_gateway_client() -> httpx.AsyncClient:
+    """client משותף ל-WPPConnect Gateway. אין לסגור אותו (לא async with)."""
+    return _get_client("whatsapp_gateway", _build_whatsapp_gateway_client)
+
+
+def _build_whatsapp_cloud_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=settings.WHATSAPP_CLOUD_API_HTTP_TIMEOUT_SECONDS,
+        limits=httpx.Limits(
+            max_connections=settings.WHATSAPP_CLOUD_API_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.WHATSAPP_CLOUD_API_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.WHATSAPP_CLOUD_API_HTTP_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+    )
+
+
+def get_whatsapp_cloud_client() -> httpx.AsyncClient:
+    """client משותף ל-Graph API (session של pywa_async). אין לסגור אותו."""
+    return _get_client("whatsapp_cloud", _build_whatsapp_cloud_client)
+
+
+def telegram_api_url(method: str, *, file: bool = False) -> str:
+    """URL של מתודה ב-Bot API (או של הורדת קובץ — file=True עם file_path)"""
+    base = settings.TELEGRAM_API_BASE_URL.rstrip("/")
+    if file:
+        return f"{base}/file/bot{settings.TELEGRAM_BOT_TOKEN}/{method}"
+    return f"{base}/bot{settings.TELEGRAM_BOT_TOKEN}/{method}"
+
+
+async def close_http_clients() -> None:
+    """סגירת ה-clients של ה-loop הנוכחי — ב-shutdown של האפליקציה / ה-worker."""
+    clients = _clients.pop(asyncio.get_running_loop(), {})
+    for name, client in clients.items():
+        try:
+            await client.aclose()
+        except Exception as e:
+            logger.warning(
+                "כשלון בסגירת HTTP client",
+                extra_data={"client": name, "error": str(e)},
+            )
@@ -0,0 +1,348 @@
+"""
+Outbound Rate Limiter — הגבלת קצב משותפת לכל ה-workers על שליחות יוצאות.
+
+Telegram מגביל ~30 הודעות בשנייה לבוט, ~1 לשנייה לצ'אט פרטי ו-20 לדקה
+לקבוצה. כמה Celery workers ו-background tasks של uvicorn ששולחים במקביל
+חורגים מזה, מקבלים 429 — והכשלונות פותחים את ה-circuit breaker.
+
+המימוש הוא GCRA (Generic Cell Rate Algorithm — token bucket בלי טיימר מילוי):
+לכל bucket נשמר ב-Redis ה-TAT (theoretical arrival time) בלבד. סקריפט Lua
+בודק את כל ה-buckets של השליחה (גלובלי + צ'אט/קבוצה) ומעדכן את כולם
+אטומית, לפי השעון של Redis — כך כל התהליכים חולקים את אותה מכסה.
+
+כש-Redis לא זמין — fallback ל-GCRA מקומי בתהליך (מגביל לפחות את התהליך
+עצמו במקום להיכשל פתוח לגמרי).
+
+retry_after מ-429 "דוחף" את ה-TAT של ה-bucket קדימה — השליחות הבאות לאותו
+צ'אט ממתינות מקומית במקום להישלח ולהיכשל שוב.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import math
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Sequence, TypeVar
+
+from app.core.circuit_breaker import exclude_from_latency
+from app.core.config import settings
+from app.core.exceptions import OutboundRateLimitError
+from app.core.logging import get_logger
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+_KEY_PREFIX = "ratelimit:"
+
+# KEYS = buckets, ARGV = [emission_ms, tolerance_ms] לכל bucket.
+# מחזיר 0 אם מותר (ומעדכן את כל ה-buckets), אחרת זמן המתנה ב-ms.
+_ACQUIRE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + tonumber(t[2]) / 1000
+local tats = {}
+local wait = 0
+for i = 1, #KEYS do
+    local tolerance = tonumber(ARGV[2 * i])
+    local tat = tonumber(redis.call('GET', KEYS[i]) or now)
+    if tat < now then tat = now end
+    tats[i] = tat
+    local w = tat - tolerance - now
+    if w > wait then wait = w end
+end
+if wait > 0 then return math.ceil(wait) end
+for i = 1, #KEYS do
+    local new_tat = tats[i] + tonumber(ARGV[2 * i - 1])
+    redis.call('SET', KEYS[i], tostring(new_tat), 'PX', math.ceil(new_tat - now) + 1000)
+end
+return 0
+"""
+
+# KEYS = buckets, ARGV = [penalty_ms, tolerance_ms] לכל bucket — TAT לא לפני now + penalty.
+_PENALIZE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + tonumber(t[2]) / 1000
+for i = 1, #KEYS do
+    local target = now + tonumber(ARGV[2 * i - 1]) + tonumber(ARGV[2 * i])
+    local tat = tonumber(redis.call('GET', KEYS[i]) or 0)
+    if target > tat then
+        redis.call('SET', KEYS[i], tostring(target), 'PX', math.ceil(target - now) + 1000)
+    end
+end
+return 0
+"""
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """bucket בודד: rate הודעות לכל period שניות, עם burst הודעות רצופות."""
+
+    key: str
+    rate: float
+    period: float = 1.0
+    burst: int = 1
+
+    @property
+    def emission_ms(self) -> float:
+        """מרווח בין הודעות במצב יציב"""
+        return self.period * 1000.0 / self.rate
+
+    @property
+    def tolerance_ms(self) -> float:
+        """כמה מוקדם מה-TAT מותר לשלוח — מאפשר burst"""
+        return self.emission_ms * (self.burst - 1)
+
+
+class OutboundRateLimiter:
+    """GCRA מעל Redis עם fallback מקומי."""
+
+    def __init__(self) -> None:
+        # fallback מקומי: key → TAT במילישניות (monotonic). threading.Lock ולא
+        # asyncio.Lock — ה-limiter משותף ל-loop של ה-runtime ול-loops אחרים בתהליך
+        self._local_tats: dict[str, float] = {}
+        self._local_lock = threading.Lock()
+
+    async def acquire(
+        self, limits: Sequence[RateLimit], *, max_wait: float | None = None
+    ) -> float:
+        """המתנה עד שכל ה-buckets מאפשרים שליחה. מחזיר את זמן ההמתנה הכולל (שניות).
+
+        זורק OutboundRateLimitError אם ההמתנה חורגת מ-max_wait.
+        """
+        if not limits or not settings.OUTBOUND_RATE_LIMIT_ENABLED:
+            return 0.0
+        if max_wait is None:
+            max_wait = settings.OUTBOUND_RATE_LIMIT_MAX_WAIT_SECONDS
+
+        waited = 0.0
+        while True:
+            wait_ms = await self._try_acquire(limits)
+            if wait_ms <= 0:
+                return waited
+            wait = wait_ms / 1000.0
+            if waited + wait > max_wait:
+                bucket = limits[-1].key
+                raise OutboundRateLimitError(bucket.split(":", 1)[0], bucket, waited + wait)
+            await asyncio.sleep(wait)
+            waited += wait
+
+    async def penalize(self, limits: Sequence[RateLimit], seconds: float) -> None:
+        """חסימת ה-buckets ל-seconds שניות (retry_after מהשרת)."""
+        if not limits or seconds <= 0 or not settings.OUTBOUND_RATE_LIMIT_ENABLED:
+            return
+        penalty_ms = seconds * 1000.0
+        try:
+            redis = await self._get_redis()
+            await redis.eval(
+                _PENALIZE_SCRIPT,
+                len(limits),
+                *[_KEY_PREFIX + limit.key for limit in limits],
+                *self._script_args(limits, first=lambda _: penalty_ms),
+            )
+            return
+        except Exception as e:
+            logger.debug(
+                "Redis rate limiter לא זמין — penalty מקומי",
+                extra_data={"error": str(e)},
+            )
+        with self._local_lock:
+            now = time.monotonic() * 1000.0
+            for limit in limits:
+                target = now + penalty_ms + limit.tolerance_ms
+                if target > self._local_tats.get(limit.key, 0.0):
+                    self._local_tats[limit.key] = target
+
+    async def _try_acquire(self, limits: Sequence[RateLimit]) -> float:
+        try:
+            redis = await self._get_redis()
+            result = await redis.eval(
+                _ACQUIRE_SCRIPT,
+                len(limits),
+                *[_KEY_PREFIX + limit.key for limit in limits],
+                *self._script_args(limits, first=lambda limit: limit.emission_ms),
+            )
+            return float(result)
+        except Exception as e:
+            logger.debug(
+                "Redis rate limiter לא זמין — GCRA מקומי",
+                extra_data={"error": str(e)},
+            )
+        return await self._try_acquire_local(limits)
+
+    async def _try_acquire_local(self, limits: Sequence[RateLimit]) -> float:
+        with self._local_lock:
+            now = time.monotonic() * 1000.0
+            tats = [max(self._local_tats.get(limit.key, now), now) for limit in limits]
+            wait = max(
+                tat - limit.tolerance_ms - now for tat, limit in zip(tats, limits)
+            )
+            if wait > 0:
+                return math.ceil(wait)
+            for tat, limit in zip(tats, limits):
+                self._local_tats[limit.key] = tat + limit.emission_ms
+            return 0.0
+
+    @staticmethod
+    def _script_args(
+        limits: Sequence[RateLimit], *, first: Callable[[RateLimit], float]
+    ) -> list[str]:
+        args: list[str] = []
+        for limit in limits:
+            args.append(repr(first(limit)))
+            args.append(repr(limit.tolerance_ms))
+        return args
+
+    @staticmethod
+    async def _get_redis() -> Any:
+        from app.core.redis_client import get_redis
+
+        return await get_redis()
+
+
+_limiter: OutboundRateLimiter | None = None
+
+
+def get_outbound_rate_limiter() -> OutboundRateLimiter:
+    """limiter משותף לתהליך"""
+    global _limiter
+    if _limiter is None:
+        _limiter = OutboundRateLimiter()
+    return _limiter
+
+
+def telegram_rate_limits(chat_id: str | int) -> list[RateLimit]:
+    """buckets לשליחה לצ'אט טלגרם — גלובלי לבוט + צ'אט פרטי/קבוצה.
+
+    ה-bucket האחרון הוא הספציפי ביותר — עליו חל retry_after.
+    """
+    chat = str(chat_id)
+    limits = [
+        RateLimit(
+            "telegram:global",
+            rate=settings.TELEGRAM_RATE_LIMIT_GLOBAL_PER_SECOND,
+            burst=settings.TELEGRAM_RATE_LIMIT_GLOBAL_PER_SECOND,
+        )
+    ]
+    if chat.startswith("-"):
+        # chat_id שלילי = קבוצה / ערוץ
+        limits.append(
+            RateLimit(
+                f"telegram:group:{chat}",
+                rate=settings.TELEGRAM_RATE_LIMIT_GROUP_PER_MINUTE,
+                period=60.0,
+            )
+        )
+    else:
+        limits.append(
+            RateLimit(
+                f"telegram:chat:{chat}",
+                rate=settings.TELEGRAM_RATE_LIMIT_CHAT_PER_SECOND,
+                burst=settings.OUTBOUND_RATE_LIMIT_CHAT_BURST,
+            )
+        )
+    return limits
+
+
+def whatsapp_rate_limits(to: str) -> list[RateLimit]:
+    """buckets לשליחה דרך ה-gateway — גלובלי + צ'אט/קבוצה (@g.us)"""
+    limits = [
+        RateLimit(
+            "whatsapp:global",
+            rate=settings.WHATSAPP_RATE_LIMIT_GLOBAL_PER_SECOND,
+            burst=settings.WHATSAPP_RATE_LIMIT_GLOBAL_PER_SECOND,
+        )
+    ]
+    if to.endswith("@g.us"):
+        limits.append(
+            RateLimit(
+                f"whatsapp:group:{to}",
+                rate=settings.WHATSAPP_RATE_LIMIT_GROUP_PER_MINUTE,
+                period=60.0,
+            )
+        )
+    else:
+        limits.append(
+            RateLimit(
+                f"whatsapp:chat:{to}",
+                rate=settings.WHATSAPP_RATE_LIMIT_CHAT_PER_SECOND,
+                burst=settings.OUTBOUND_RATE_LIMIT_CHAT_BURST,
+            )
+        )
+    return limits
+
+
+def get_retry_after(exc: BaseException) -> float | None:
+    """retry_after (שניות) משגיאת 429 של TelegramError/WhatsAppError, אם קיים"""
+    details = getattr(exc, "details", None)
+    if not isinstance(details, dict) or details.get("status_code") != 429:
+        return None
+    retry_after = details.get("retry_after")
+    if retry_after is None:
+        return None
+    try:
+        return float(retry_after)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_retry_after(response: Any) -> float | None:
+    """חילוץ retry_after מתשובת HTTP — parameters.retry_after של Telegram או header Retry-After"""
+    try:
+        data = json.loads(getattr(response, "text", "") or "")
+        retry_after = (data.get("parameters") or {}).get("retry_after")
+        if isinstance(retry_after, (int, float)):
+            return float(retry_after)
+    except (ValueError, AttributeError, TypeError):
+        pass
+    headers = getattr(response, "headers", None) or {}
+    try:
+        value = headers.get("Retry-After")
+    except AttributeError:
+        return None
+    if not isinstance(value, (str, int, float)):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+async def call_with_rate_limit(
+    limits: Sequence[RateLimit],
+    call: Callable[[], Awaitable[T]],
+) -> T:
+    """קריאה ל-API חיצוני דרך ה-limiter, עם כיבוד retry_after.
+
+    429 עם retry_after לא מתפשט (ולא נספר ב-circuit breaker) — ה-bucket
+    הספציפי נחסם לזמן שהשרת ביקש והקריאה מנוסה שוב, עד
+    OUTBOUND_RATE_LIMIT_MAX_429_RETRIES פעמים.
+    """
+    limiter = get_outbound_rate_limiter()
+    for attempt in range(settings.OUTBOUND_RATE_LIMIT_MAX_429_RETRIES):
+        # המתנה למכסה היא מקומית — לא נספרת ב-latency של השירות ב-circuit breaker
+        exclude_from_latency(await limiter.acquire(limits))
+        try:
+            return await call()
+        except Exception as exc:
+            retry_after = get_retry_after(exc)
+            if (
+                retry_after is None
+                or not settings.OUTBOUND_RATE_LIMIT_ENABLED
+                or retry_after > settings.OUTBOUND_RATE_LIMIT_MAX_WAIT_SECONDS
+            ):
+                raise
+            logger.warning(
+                "429 מהשרת — ממתינים ל-retry_after לפני שליחה חוזרת",
+                extra_data={
+                    "bucket": limits[-1].key if limits else None,
+                    "retry_after": retry_after,
+                    "attempt": attempt + 1,
+                },
+            )
+            await limiter.penalize(limits[-1:], retry_after)
+
+    # ניסיון אחרון — 429 נוסף מתפשט לקורא
+    exclude_from_latency(await limiter.acquire(limits))
+    return await call()
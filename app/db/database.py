@@ -1,6 +1,7 @@
 """
 Database Connection and Session Management
 """
+import asyncio
 from contextlib import asynccontextmanager
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import declarative_base
@@ -34,15 +35,60 @@ async def get_db() -> AsyncSession:
             await session.close()
 
 
+# session maker של ה-worker runtime (app/workers/runtime.py) — engine עם pool
+# אחד לכל תהליך Celery, קשור ל-event loop של ה-runtime בלבד
+_worker_session_maker: async_sessionmaker | None = None
+_worker_loop: asyncio.AbstractEventLoop | None = None
+
+
+def bind_worker_session_maker(
+    session_maker: async_sessionmaker, loop: asyncio.AbstractEventLoop
+) -> None:
+    """רישום ה-session maker של ה-worker runtime עבור get_task_session."""
+    global _worker_session_maker, _worker_loop
+    _worker_session_maker = session_maker
+    _worker_loop = loop
+
+
+def unbind_worker_session_maker() -> None:
+    """ביטול הרישום — get_task_session חוזר ל-engine per-call."""
+    global _worker_session_maker, _worker_loop
+    _worker_session_maker = None
+    _worker_loop = None
+
+
+def _get_bound_worker_session_maker() -> async_sessionmaker | None:
+    """ה-session maker של ה-runtime, רק אם רצים על ה-loop שלו."""
+    if _worker_session_maker is None:
+        return None
+    try:
+        running_loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+    return _worker_session_maker if running_loop is _worker_loop else None
+
+
 @asynccontextmanager
 async def get_task_session():
     """
     יצירת סשן DB עבור Celery tasks.
 
-    יוצר engine חדש per-task ומשחרר אותו בסיום — הכרחי כי Celery
+    כשה-worker runtime פעיל (worker_process_init) — סשן מה-pool המשותף שלו,
+    בלי connect/handshake חדש לכל הודעה.
+
+    אחרת יוצר engine חדש per-task ומשחרר אותו בסיום — הכרחי כי Celery
     יוצר event loop חדש לכל task, ו-engine שנקשר ל-loop ישן ייכשל.
     dispose() עטוף ב-try/finally כדי להבטיח שחרור גם בשגיאה.
     """
+    worker_session_maker = _get_bound_worker_session_maker()
+    if worker_session_maker is not None:
+        async with worker_session_maker() as session:
+            try:
+                yield session
+            finally:
+                await session.close()
+        return
+
     task_engine = create_async_engine(
         settings.DATABASE_URL,
         echo=settings.DEBUG,
@@ -680,6 +680,28 @@ async def run_migration_016(conn: AsyncConnection) -> None:
     """))
 
 
+async def run_migration_017(conn: AsyncConnection) -> None:
+    """מיגרציה 017 — conversation_sessions.context_data מ-JSON ל-JSONB.
+
+    StateManager כותב patch חלקי (context_data - ARRAY[...] || patch) — אופרטורים
+    שקיימים רק ל-JSONB. ההמרה רצה רק כשהעמודה עדיין json (זהה ל-021 ב-migrations/).
+    """
+    await conn.execute(text("""
+        DO $$ BEGIN
+            IF EXISTS (
+                SELECT 1 FROM information_schema.columns
+                WHERE table_schema = current_schema()
+                  AND table_name = 'conversation_sessions'
+                  AND column_name = 'context_data'
+                  AND data_type = 'json'
+            ) THEN
+                ALTER TABLE conversation_sessions
+                    ALTER COLUMN context_data TYPE JSONB USING context_data::jsonb;
+            END IF;
+        END $$;
+    """))
+
+
 async def run_all_migrations(conn: AsyncConnection) -> None:
     """הרצת כל המיגרציות ברצף (ללא ALTER TYPE — ראה add_enum_values)."""
     logger.info("Running migration 001...")
@@ -714,3 +736,5 @@ async def run_all_migrations(conn: AsyncConnection) -> None:
     await run_migration_015(conn)
     logger.info("Running migration 016...")
     await run_migration_016(conn)
+    logger.info("Running migration 017...")
+    await run_migration_017(conn)
@@ -6,6 +6,7 @@ from app.db.models.conversation_session import ConversationSession
 from app.db.models.courier_wallet import CourierWallet
 from app.db.models.wallet_ledger import WalletLedger
 from app.db.models.outbox_message import OutboxMessage
+from app.db.models.outbox_fanout import OutboxFanoutRecipient
 from app.db.models.user import User
 from app.db.models.station import Station
 from app.db.models.station_dispatcher import StationDispatcher
@@ -28,6 +29,7 @@ __all__ = [
     "CourierWallet",
     "WalletLedger",
     "OutboxMessage",
+    "OutboxFanoutRecipient",
     "User",
     "Station",
     "StationDispatcher",
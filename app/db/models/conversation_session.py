@@ -3,6 +3,7 @@ Conversation Session Model - State Machine Tracking
 """
 from datetime import datetime
 from sqlalchemy import Column, Integer, BigInteger, String, DateTime, ForeignKey, JSON, UniqueConstraint
+from sqlalchemy.dialects.postgresql import JSONB
 
 from app.db.database import Base
 
@@ -20,7 +21,8 @@ class ConversationSession(Base):
     current_state = Column(String(100), nullable=False, default="INITIAL")
 
     # Context data for the current flow (pickup/dropoff collection etc.)
-    context_data = Column(JSON, default=dict)
+    # JSONB בפרודקשן — StateManager מעדכן רק מפתחות שהשתנו; JSON ב-SQLite (בדיקות)
+    context_data = Column(JSON().with_variant(JSONB(), "postgresql"), default=dict)
 
     # Timestamps
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,62 @@
+"""
+Outbox Fan-out Model — שורת מסירה לנמען בודד של הודעת broadcast.
+
+הודעת outbox עם recipient_id=BROADCAST_COURIERS מתפרקת בעיבוד הראשון לשורה
+לכל שליח מאושר (INSERT ... SELECT, בלי לטעון את השליחים לזיכרון). השליחה
+עוברת על השורות ב-chunks ומעדכנת כל שורה בנפרד — כך retry של ההודעה שולח
+רק לנמענים שעדיין PENDING, ומי שכבר קיבל לא מקבל שוב.
+
+פרסום נסיעה (BROADCAST_RIDE_POSTING_<id>) משתמש באותן שורות, אבל הן נוצרות
+כבר בזמן הפרסום; recipient_id שלהן הוא "קהל:פלטפורמה:יעד" (קבוצה או נהג).
+"""
+import enum
+from datetime import datetime
+
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    DateTime,
+    Enum as SQLEnum,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    UniqueConstraint,
+)
+
+from app.db.database import Base
+
+
+class FanoutStatus(str, enum.Enum):
+    PENDING = "pending"  # ממתין לשליחה / ל-retry
+    SENT = "sent"        # נמסר בהצלחה
+    FAILED = "failed"    # נכשל סופית (שגיאה קבועה או מיצוי ניסיונות)
+
+
+class OutboxFanoutRecipient(Base):
+    """נמען בודד של הודעת broadcast ב-outbox"""
+
+    __tablename__ = "outbox_fanout_recipients"
+
+    id = Column(Integer, primary_key=True, index=True)
+    outbox_message_id = Column(
+        Integer,
+        ForeignKey("outbox_messages.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    user_id = Column(BigInteger, nullable=True)
+    recipient_id = Column(String(100), nullable=False)  # טלפון או chat_id
+
+    status = Column(SQLEnum(FanoutStatus), default=FanoutStatus.PENDING, nullable=False)
+    retry_count = Column(Integer, default=0, nullable=False)
+    last_error = Column(String(1000), nullable=True)
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint(
+            "outbox_message_id", "recipient_id", name="uq_fanout_message_recipient"
+        ),
+        Index("ix_fanout_message_status", "outbox_message_id", "status"),
+    )
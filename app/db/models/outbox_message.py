@@ -3,7 +3,7 @@ Outbox Message Model - Transactional Outbox Pattern
 """
 import enum
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, Enum as SQLEnum, JSON, Boolean
+from sqlalchemy import Column, Integer, SmallInteger, String, DateTime, Enum as SQLEnum, JSON, Boolean
 
 from app.db.database import Base
 
@@ -20,6 +20,30 @@ class MessageStatus(str, enum.Enum):
     FAILED = "failed"
 
 
+class MessagePriority(enum.IntEnum):
+    """נתיב שליחה — ערך נמוך נשלח קודם. כל נתיב נתפס ומרוקן בנפרד"""
+    INTERACTIVE = 0  # תגובה לפעולת משתמש שממתין לה (תפיסה, אישור סדרן, OTP)
+    NORMAL = 1
+    BULK = 2  # broadcasts ותזכורות — נפח גדול, רגישות נמוכה לזמן
+
+
+# סוגי הודעות שלא מופיעים כאן — NORMAL
+MESSAGE_TYPE_PRIORITIES: dict[str, MessagePriority] = {
+    "capture_notification_sender": MessagePriority.INTERACTIVE,
+    "delivery_request_notification": MessagePriority.INTERACTIVE,
+    "delivery_decision_notification": MessagePriority.INTERACTIVE,
+    "panel_otp": MessagePriority.INTERACTIVE,
+    "delivery_broadcast": MessagePriority.BULK,
+    "ride_posting_broadcast": MessagePriority.BULK,
+    "expiry_warning": MessagePriority.BULK,
+}
+
+
+def priority_for_message_type(message_type: str) -> MessagePriority:
+    """עדיפות ההודעה לפי סוגה"""
+    return MESSAGE_TYPE_PRIORITIES.get(message_type, MessagePriority.NORMAL)
+
+
 class OutboxMessage(Base):
     """Pending broadcasts with retry tracking for transactional outbox pattern"""
 
@@ -32,6 +56,8 @@ class OutboxMessage(Base):
 
     message_type = Column(String(50), nullable=False)  # e.g., "delivery_broadcast", "confirmation"
     message_content = Column(JSON, nullable=False)
+    # נגזר מ-message_type (priority_for_message_type) — אינדקס חלקי ב-SQL, ראה schema.sql
+    priority = Column(SmallInteger, default=MessagePriority.NORMAL, nullable=False)
 
     status = Column(SQLEnum(MessageStatus), default=MessageStatus.PENDING, index=True)
     retry_count = Column(Integer, default=0)
@@ -41,6 +67,8 @@ class OutboxMessage(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     processed_at = Column(DateTime, nullable=True)
     next_retry_at = Column(DateTime, nullable=True)  # אינדקס חלקי ב-SQL — ראה schema.sql
+    # lease של worker שתפס את ההודעה (PROCESSING) — אחרי פקיעה ניתן לתפוס מחדש
+    locked_until = Column(DateTime, nullable=True)
 
     # Error tracking
     last_error = Column(String(1000), nullable=True)
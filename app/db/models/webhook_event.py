@@ -3,6 +3,9 @@ Webhook Event Model - טבלת idempotency למניעת עיבוד כפול של
 
 כל הודעה נכנסת נרשמת לפי message_id. רק הודעות עם status=completed
 נחסמות מ-retry. הודעות שנכשלו (processing ישן / failed) מאפשרות retry.
+
+הרכישה עצמה רצה ב-Redis (app/domain/services/webhook_idempotency.py) —
+הטבלה משמשת fallback כש-Redis לא זמין ו-audit שנכתב ב-batch.
 """
 from datetime import datetime, timezone
 
@@ -5,13 +5,16 @@ import base64
 import mimetypes
 from html import escape as html_escape
 import httpx
-from typing import Any, Optional
+from typing import Any, BinaryIO, Optional
 
 from app.core.config import settings
 from app.core.logging import get_logger
 from app.core.circuit_breaker import get_telegram_circuit_breaker, get_whatsapp_cloud_circuit_breaker
 from app.core.exceptions import TelegramError
+from app.core.http_clients import get_telegram_client, telegram_api_url
+from app.core.rate_limiter import call_with_rate_limit, telegram_rate_limits
 from app.core.validation import PhoneNumberValidator, TextSanitizer
+from app.domain.services.media_relay import CachedMedia, get_media_relay
 from app.domain.services.whatsapp import get_whatsapp_admin_provider, get_whatsapp_group_provider
 
 logger = get_logger(__name__)
@@ -792,9 +795,9 @@ class AdminNotificationService:
         return guessed or "application/octet-stream"
 
     @staticmethod
-    async def _download_telegram_file_as_data_url(file_id: str) -> Optional[str]:
+    async def _fetch_telegram_media(file_id: str) -> Optional[CachedMedia]:
         """
-        הורדת קובץ מטלגרם והמרה ל-data URL עבור שליחה בוואטסאפ.
+        הורדת קובץ מטלגרם ל-media relay — stream לדיסק, פעם אחת לכל file_id.
         """
         if not settings.TELEGRAM_BOT_TOKEN:
             logger.warning(
@@ -803,49 +806,55 @@ class AdminNotificationService:
             )
             return None
 
-        base_url = f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}"
         circuit_breaker = get_telegram_circuit_breaker()
 
-        async def _fetch() -> tuple[str, bytes, str | None]:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{base_url}/getFile",
-                    json={"file_id": file_id},
-                    timeout=30.0,
+        async def _fetch(sink: BinaryIO) -> str:
+            client = get_telegram_client()
+            response = await client.post(
+                telegram_api_url("getFile"),
+                json={"file_id": file_id},
+                timeout=30.0,
+            )
+            if response.status_code != 200:
+                raise TelegramError.from_response(
+                    "getFile",
+                    response,
+                    message=f"getFile returned status {response.status_code}",
                 )
-                if response.status_code != 200:
-                    raise TelegramError.from_response(
-                        "getFile",
-                        response,
-                        message=f"getFile returned status {response.status_code}",
-                    )
 
-                payload = response.json()
-                if not payload.get("ok") or not payload.get("result"):
-                    raise TelegramError(
-                        "getFile returned ok=false",
-                        details={"file_id": file_id, "response": payload},
-                    )
+            payload = response.json()
+            if not payload.get("ok") or not payload.get("result"):
+                raise TelegramError(
+                    "getFile returned ok=false",
+                    details={"file_id": file_id, "response": payload},
+                )
 
-                file_path = payload["result"].get("file_path")
-                if not file_path:
-                    raise TelegramError(
-                        "getFile missing file_path",
-                        details={"file_id": file_id, "response": payload},
-                    )
+            file_path = payload["result"].get("file_path")
+            if not file_path:
+                raise TelegramError(
+                    "getFile missing file_path",
+                    details={"file_id": file_id, "response": payload},
+                )
 
-                file_url = f"https://api.telegram.org/file/bot{settings.TELEGRAM_BOT_TOKEN}/{file_path}"
-                file_response = await client.get(file_url, timeout=30.0)
+            async with client.stream(
+                "GET", telegram_api_url(file_path, file=True), timeout=30.0
+            ) as file_response:
                 if file_response.status_code != 200:
+                    await file_response.aread()
                     raise TelegramError.from_response(
                         "downloadFile",
                         file_response,
                         message=f"downloadFile returned status {file_response.status_code}",
                     )
-                return file_path, file_response.content, file_response.headers.get("content-type")
+                async for chunk in file_response.aiter_bytes():
+                    sink.write(chunk)
+                content_type = file_response.headers.get("content-type")
+            return AdminNotificationService._pick_mime_type(file_path, content_type)
 
         try:
-            file_path, content, content_type = await circuit_breaker.execute(_fetch)
+            return await get_media_relay().get_or_fetch(
+                "telegram", file_id, lambda sink: circuit_breaker.execute(_fetch, sink)
+            )
         except Exception as e:
             logger.error(
                 "Failed to download Telegram file for WhatsApp forwarding",
@@ -854,18 +863,22 @@ class AdminNotificationService:
             )
             return None
 
-        mime_type = AdminNotificationService._pick_mime_type(file_path, content_type)
-        encoded = base64.b64encode(content).decode("ascii")
-        return f"data:{mime_type};base64,{encoded}"
+    @staticmethod
+    async def _download_telegram_file_as_data_url(file_id: str) -> Optional[str]:
+        """
+        הורדת קובץ מטלגרם והמרה ל-data URL עבור שליחה בוואטסאפ.
+        """
+        media = await AdminNotificationService._fetch_telegram_media(file_id)
+        return media.as_data_url() if media else None
 
     @staticmethod
-    async def _download_cloud_api_media_as_data_url(media_id: str) -> Optional[str]:
+    async def _fetch_cloud_api_media(media_id: str) -> Optional[CachedMedia]:
         """
-        הורדת מדיה מ-WhatsApp Cloud API והמרה ל-data URL.
+        הורדת מדיה מ-WhatsApp Cloud API ל-media relay.
 
         Cloud API media IDs הם טוקנים זמניים של Meta — לא ניתן לשלוח אותם
         ישירות דרך send_image. צריך לפנות ל-API, לקבל URL להורדה,
-        להוריד את התוכן ולהמיר ל-data URI.
+        ולהוריד את התוכן (stream לדיסק, פעם אחת לכל media id).
         """
         token = settings.WHATSAPP_CLOUD_API_TOKEN
         if not token:
@@ -877,7 +890,7 @@ class AdminNotificationService:
 
         circuit_breaker = get_whatsapp_cloud_circuit_breaker()
 
-        async def _fetch() -> tuple[bytes, str | None]:
+        async def _fetch(sink: BinaryIO) -> Optional[str]:
             async with httpx.AsyncClient() as client:
                 # שלב 1: קבלת URL להורדה מ-Meta
                 meta_resp = await client.get(
@@ -893,7 +906,7 @@ class AdminNotificationService:
                             "status": meta_resp.status_code,
                         },
                     )
-                    return b"", None
+                    return None
 
                 download_url = meta_resp.json().get("url")
                 if not download_url:
@@ -901,28 +914,34 @@ class AdminNotificationService:
                         "Cloud API getMedia — חסר URL להורדה",
                         extra_data={"media_id": media_id[:8] + "..."},
                     )
-                    return b"", None
+                    return None
 
                 # שלב 2: הורדת התוכן (דורש אותו Bearer token)
-                content_resp = await client.get(
+                async with client.stream(
+                    "GET",
                     download_url,
                     headers={"Authorization": f"Bearer {token}"},
                     timeout=30.0,
-                )
-                if content_resp.status_code != 200:
-                    logger.error(
-                        "Cloud API media download נכשל",
-                        extra_data={
-                            "media_id": media_id[:8] + "...",
-                            "status": content_resp.status_code,
-                        },
-                    )
-                    return b"", None
+                ) as content_resp:
+                    if content_resp.status_code != 200:
+                        logger.error(
+                            "Cloud API media download נכשל",
+                            extra_data={
+                                "media_id": media_id[:8] + "...",
+                                "status": content_resp.status_code,
+                            },
+                        )
+                        return None
+                    async for chunk in content_resp.aiter_bytes():
+                        sink.write(chunk)
+                    content_type = content_resp.headers.get("content-type")
 
-                return content_resp.content, content_resp.headers.get("content-type")
+            return (content_type or "image/jpeg").split(";")[0].strip()
 
         try:
-            content, content_type = await circuit_breaker.execute(_fetch)
+            return await get_media_relay().get_or_fetch(
+                "whatsapp_cloud", media_id, lambda sink: circuit_breaker.execute(_fetch, sink)
+            )
         except Exception as e:
             logger.error(
                 "כשלון בהורדת מדיה מ-Cloud API",
@@ -931,12 +950,35 @@ class AdminNotificationService:
             )
             return None
 
-        if not content:
-            return None
+    @staticmethod
+    async def _download_cloud_api_media_as_data_url(media_id: str) -> Optional[str]:
+        """
+        הורדת מדיה מ-WhatsApp Cloud API והמרה ל-data URL.
+        """
+        media = await AdminNotificationService._fetch_cloud_api_media(media_id)
+        return media.as_data_url() if media else None
 
-        mime_type = (content_type or "image/jpeg").split(";")[0].strip()
-        encoded = base64.b64encode(content).decode("ascii")
-        return f"data:{mime_type};base64,{encoded}"
+    @staticmethod
+    async def _fetch_url_media(url: str) -> Optional[CachedMedia]:
+        """הורדת מדיה מ-URL (WPPConnect) ל-media relay"""
+
+        async def _fetch(sink: BinaryIO) -> Optional[str]:
+            async with httpx.AsyncClient() as client:
+                async with client.stream("GET", url, timeout=30.0) as resp:
+                    if resp.status_code != 200:
+                        return None
+                    async for chunk in resp.aiter_bytes():
+                        sink.write(chunk)
+                    return resp.headers.get("content-type", "image/jpeg").split(";")[0]
+
+        try:
+            return await get_media_relay().get_or_fetch("url", url, _fetch)
+        except Exception as e:
+            logger.warning(
+                "כשלון בהורדת תמונת הפקדה מ-URL",
+                extra_data={"error": str(e)},
+            )
+            return None
 
     @staticmethod
     async def _resolve_whatsapp_media_url(
@@ -970,7 +1012,7 @@ class AdminNotificationService:
         if not settings.TELEGRAM_BOT_TOKEN:
             return False
 
-        url = f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/sendMessage"
+        url = telegram_api_url("sendMessage")
 
         payload = {
             "chat_id": chat_id,
@@ -980,16 +1022,19 @@ class AdminNotificationService:
 
         circuit_breaker = get_telegram_circuit_breaker()
 
+        async def _post():
+            client = get_telegram_client()
+            response = await client.post(url, json=payload, timeout=30.0)
+            if response.status_code != 200:
+                raise TelegramError.from_response(
+                    "sendMessage",
+                    response,
+                    message=f"sendMessage returned status {response.status_code}",
+                )
+            return True
+
         async def _send():
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, json=payload, timeout=30.0)
-                if response.status_code != 200:
-                    raise TelegramError.from_response(
-                        "sendMessage",
-                        response,
-                        message=f"sendMessage returned status {response.status_code}",
-                    )
-                return True
+            return await call_with_rate_limit(telegram_rate_limits(chat_id), _post)
 
         try:
             return await circuit_breaker.execute(_send)
@@ -1011,7 +1056,7 @@ class AdminNotificationService:
         if not settings.TELEGRAM_BOT_TOKEN:
             return False
 
-        url = f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/sendMessage"
+        url = telegram_api_url("sendMessage")
 
         payload = {
             "chat_id": chat_id,
@@ -1024,16 +1069,19 @@ class AdminNotificationService:
 
         circuit_breaker = get_telegram_circuit_breaker()
 
+        async def _post():
+            client = get_telegram_client()
+            response = await client.post(url, json=payload, timeout=30.0)
+            if response.status_code != 200:
+                raise TelegramError.from_response(
+                    "sendMessage",
+                    response,
+                    message=f"sendMessage returned status {response.status_code}",
+                )
+            return True
+
         async def _send():
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, json=payload, timeout=30.0)
-                if response.status_code != 200:
-                    raise TelegramError.from_response(
-                        "sendMessage",
-                        response,
-                        message=f"sendMessage returned status {response.status_code}",
-                    )
-                return True
+            return await call_with_rate_limit(telegram_rate_limits(chat_id), _post)
 
         try:
             return await circuit_breaker.execute(_send)
@@ -1058,7 +1106,6 @@ class AdminNotificationService:
             logger.warning("Telegram bot token not configured for photo forwarding")
             return False
 
-        base_url = f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}"
         circuit_breaker = get_telegram_circuit_breaker()
 
         # בדיקה חד-פעמית אם ה-CB מאפשר קריאות.
@@ -1076,16 +1123,16 @@ class AdminNotificationService:
         # ניסיון ראשון: sendPhoto — בלי circuit breaker כי כשלון כאן צפוי
         # (file_id ממסמך לא עובד עם sendPhoto).
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{base_url}/sendPhoto",
-                    json={"chat_id": chat_id, "photo": file_id},
-                    timeout=30.0,
-                )
-                if response.status_code == 200:
-                    # דיווח הצלחה ל-CB כדי שלא יישאר תקוע ב-HALF_OPEN
-                    await circuit_breaker.record_success()
-                    return True
+            client = get_telegram_client()
+            response = await client.post(
+                telegram_api_url("sendPhoto"),
+                json={"chat_id": chat_id, "photo": file_id},
+                timeout=30.0,
+            )
+            if response.status_code == 200:
+                # דיווח הצלחה ל-CB כדי שלא יישאר תקוע ב-HALF_OPEN
+                await circuit_breaker.record_success()
+                return True
         except Exception as e:
             logger.warning(
                 "sendPhoto נכשל, ממשיך ל-sendDocument fallback",
@@ -1099,20 +1146,20 @@ class AdminNotificationService:
         )
 
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{base_url}/sendDocument",
-                    json={"chat_id": chat_id, "document": file_id},
-                    timeout=30.0,
+            client = get_telegram_client()
+            response = await client.post(
+                telegram_api_url("sendDocument"),
+                json={"chat_id": chat_id, "document": file_id},
+                timeout=30.0,
+            )
+            if response.status_code != 200:
+                raise TelegramError.from_response(
+                    "sendDocument",
+                    response,
+                    message=f"sendDocument returned status {response.status_code}",
                 )
-                if response.status_code != 200:
-                    raise TelegramError.from_response(
-                        "sendDocument",
-                        response,
-                        message=f"sendDocument returned status {response.status_code}",
-                    )
-                await circuit_breaker.record_success()
-                return True
+            await circuit_breaker.record_success()
+            return True
         except Exception as e:
             await circuit_breaker.record_failure(e)
             logger.error(
@@ -1137,8 +1184,9 @@ class AdminNotificationService:
         if not settings.TELEGRAM_BOT_TOKEN:
             return False
 
-        # --- המרה ל-bytes ---
+        # --- איתור המדיה: data URI מפוענח לזיכרון, השאר דרך ה-media relay ---
         image_bytes: bytes | None = None
+        media: Optional[CachedMedia] = None
         mime_type = "image/jpeg"
 
         if file_id.startswith("data:"):
@@ -1154,59 +1202,42 @@ class AdminNotificationService:
                 )
                 return False
         elif file_id.startswith(("http://", "https://")):
-            try:
-                async with httpx.AsyncClient() as client:
-                    resp = await client.get(file_id, timeout=30.0)
-                    if resp.status_code == 200:
-                        mime_type = resp.headers.get("content-type", "image/jpeg").split(";")[0]
-                        image_bytes = resp.content
-            except Exception as e:
-                logger.warning(
-                    "כשלון בהורדת תמונת הפקדה מ-URL",
-                    extra_data={"error": str(e)},
-                )
-                return False
+            media = await AdminNotificationService._fetch_url_media(file_id)
         else:
             # Cloud API media ID — מוריד דרך Meta Graph API
-            data_uri = await AdminNotificationService._download_cloud_api_media_as_data_url(file_id)
-            if data_uri:
-                try:
-                    header, b64_data = data_uri.split(",", 1)
-                    mime_type = header.split(":")[1].split(";")[0] if ":" in header else "image/jpeg"
-                    image_bytes = base64.b64decode(b64_data)
-                except Exception as e:
-                    logger.warning(
-                        "כשלון בפענוח data URI לאחר הורדה מ-Cloud API",
-                        extra_data={"error": str(e)},
-                        exc_info=True,
-                    )
-                    return False
+            media = await AdminNotificationService._fetch_cloud_api_media(file_id)
 
-        if not image_bytes:
+        if media is not None:
+            mime_type = media.mime_type
+        elif not image_bytes:
             return False
 
         # --- העלאה לטלגרם ---
         ext = mimetypes.guess_extension(mime_type) or ".jpg"
         circuit_breaker = get_telegram_circuit_breaker()
 
-        async def _upload() -> bool:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/sendPhoto",
-                    data={"chat_id": chat_id},
-                    files={"photo": (f"deposit{ext}", image_bytes, mime_type)},
-                    timeout=30.0,
+        async def _upload(photo: BinaryIO | bytes) -> bool:
+            client = get_telegram_client()
+            response = await client.post(
+                telegram_api_url("sendPhoto"),
+                data={"chat_id": chat_id},
+                files={"photo": (f"deposit{ext}", photo, mime_type)},
+                timeout=30.0,
+            )
+            if response.status_code != 200:
+                raise TelegramError.from_response(
+                    "sendPhoto (upload)",
+                    response,
+                    message=f"sendPhoto upload returned status {response.status_code}",
                 )
-                if response.status_code != 200:
-                    raise TelegramError.from_response(
-                        "sendPhoto (upload)",
-                        response,
-                        message=f"sendPhoto upload returned status {response.status_code}",
-                    )
-                return True
+            return True
 
         try:
-            return await circuit_breaker.execute(_upload)
+            if media is None:
+                return await circuit_breaker.execute(_upload, image_bytes)
+            # העלאה ישירות מהקובץ ב-cache — httpx קורא ושולח אותו ב-chunks
+            with media.open() as photo:
+                return await circuit_breaker.execute(_upload, photo)
         except Exception as e:
             logger.error(
                 "כשלון בהעלאת צילום הפקדה לטלגרם",
@@ -15,6 +15,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db.models.driver_session import DriverSession
 from app.db.models.driver_search import DriverSearch, DriverSearchStatus
+from app.core.config import settings
 from app.core.logging import get_logger
 
 logger = get_logger(__name__)
@@ -28,6 +29,13 @@ _REMINDER_THRESHOLD = timedelta(
 )  # 23 שעות 58 דקות
 _EXPIRY_THRESHOLD = timedelta(hours=SESSION_DURATION_HOURS)
 
+# סימון ב-Redis שהסשן עודכן לאחרונה — touch_session_throttled מדלג עליו
+_TOUCHED_KEY_PREFIX = "driver:session:touched:"
+
+
+def _touched_key(user_id: int) -> str:
+    return f"{_TOUCHED_KEY_PREFIX}{user_id}"
+
 
 class DriverSessionService:
     """שירות ניהול סשנים — מעקב פעילות ולוגיקת 24 שעות"""
@@ -114,6 +122,53 @@ class DriverSessionService:
         await self.db.refresh(session)
         return session
 
+    async def touch_session_throttled(self, user_id: int) -> None:
+        """
+        touch_session לכל היותר פעם ב-DRIVER_SESSION_TOUCH_INTERVAL_SECONDS.
+
+        ניתוב התפריט נוגע בסשן בכל הודעה — SELECT + UPDATE + commit כדי להזיז
+        את last_message_at בשניות, מול חלון של 24 שעות. סשן פעיל שעודכן בתוך
+        המרווח לא נכתב שוב; disconnect_session מוחק את הסימון כך שההודעה
+        הבאה אחרי ניתוק מחדשת את הסשן מיד. Redis לא זמין — touch רגיל.
+
+        שינוי התנהגות מול touch_session: last_message_at עלול לפגר עד מרווח
+        אחד אחרי ההודעה האחרונה, ולכן התזכורת והניתוק (24 שעות מ-
+        last_message_at) מגיעים עד מרווח אחד מוקדם יותר. תזכורת שכבר נשלחה
+        מתאפסת כרגיל — היא נשלחת רק אחרי 23:58 שעות בלי touch, והסימון פג מזמן.
+
+        Args:
+            user_id: מזהה המשתמש
+        """
+        interval = settings.DRIVER_SESSION_TOUCH_INTERVAL_SECONDS
+        if interval <= 0:
+            await self.touch_session(user_id)
+            return
+
+        try:
+            from app.core.redis_client import get_redis
+
+            redis = await get_redis()
+            if await redis.get(_touched_key(user_id)) is not None:
+                return
+        except Exception as e:
+            logger.warning(
+                "Redis לא זמין ל-throttle של סשן נהג — touch רגיל",
+                extra_data={"user_id": user_id, "error": str(e)},
+            )
+            await self.touch_session(user_id)
+            return
+
+        session = await self.touch_session(user_id)
+        if session is None or not session.is_active:
+            return
+        try:
+            await redis.set(_touched_key(user_id), "1", ex=interval)
+        except Exception as e:
+            logger.warning(
+                "כשלון בסימון touch של סשן נהג ב-Redis",
+                extra_data={"user_id": user_id, "error": str(e)},
+            )
+
     async def is_session_active(self, user_id: int) -> bool:
         """
         בדיקה אם לנהג יש סשן פעיל.
@@ -218,6 +273,7 @@ class DriverSessionService:
         paused_count = result.rowcount
 
         await self.db.commit()
+        await self._clear_touch_mark(user_id)
 
         logger.info(
             "סשן נהג נותק — חיפושים הושהו",
@@ -228,6 +284,20 @@ class DriverSessionService:
         )
         return paused_count
 
+    async def _clear_touch_mark(self, user_id: int) -> None:
+        """מחיקת סימון ה-throttle — ההודעה הבאה מחדשת את הסשן"""
+        try:
+            from app.core.redis_client import get_redis
+
+            redis = await get_redis()
+            await redis.delete(_touched_key(user_id))
+        except Exception as e:
+            # הסימון יפקע לבד אחרי DRIVER_SESSION_TOUCH_INTERVAL_SECONDS
+            logger.warning(
+                "כשלון במחיקת סימון touch של סשן נהג מ-Redis",
+                extra_data={"user_id": user_id, "error": str(e)},
+            )
+
     async def _get_session(self, user_id: int) -> DriverSession | None:
         """שליפת סשן לפי user_id"""
         result = await self.db.execute(
@@ -0,0 +1,276 @@
+"""
+Media Relay — cache מקומי למדיה שמועברת בין פלטפורמות (סלפי, ת.ז., צילומי הפקדה).
+
+עד עכשיו כל העברה הורידה את הקובץ כולו לזיכרון, המירה ל-base64 (+33%)
+והעבירה מחרוזת הלאה — ואותו קובץ הורד מחדש לכל מנהל ולכל קבוצה. כאן:
+
+1. ההורדה נכתבת ב-stream לקובץ ב-cache, chunk אחרי chunk — הקובץ לא נטען
+   לזיכרון בשלמותו
+2. המפתח הוא hash של (מקור, מזהה) — file_id של טלגרם, media id של Cloud API
+   או URL של WPPConnect. העברה נוספת של אותה מדיה לא מורידה שוב
+3. הורדות מקבילות של אותה מדיה מתאחדות להורדה אחת
+4. פינוי LRU לפי גודל כולל (MEDIA_CACHE_MAX_BYTES), וקובץ שנשמר לפני יותר
+   מ-MEDIA_CACHE_TTL_SECONDS נמחק — המדיה כוללת תמונות KYC
+
+הצרכנים מקבלים CachedMedia: open() לשליחה כ-multipart ישירות מהקובץ (httpx
+קורא ושולח אותו ב-chunks), או as_data_url() לספקים שדורשים data URI.
+
+ה-cache הוא לכל תהליך: כל תהליך כותב לתת-תיקייה משלו בתוך MEDIA_CACHE_DIR,
+כך שהמגבלה על הגודל הכולל נכונה והניקוי של תהליך אחד לא נוגע בקבצים של
+אחר. התיקיות נוצרות בהרשאות 0o700. תת-תיקייה שלא נכתב אליה כלום במשך
+ה-TTL (תהליך שהסתיים) נמחקת כשתהליך חדש עולה.
+"""
+from __future__ import annotations
+
+import asyncio
+import base64
+import hashlib
+import mimetypes
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Awaitable, BinaryIO, Callable, Optional
+
+from app.core.config import settings
+from app.core.logging import get_logger
+
+logger = get_logger(__name__)
+
+_PART_SUFFIX = ".part"
+_DIR_MODE = 0o700
+
+# מקבל קובץ פתוח לכתיבה ומזרים אליו את התוכן. מחזיר את ה-MIME type,
+# או None אם המדיה לא זמינה (לא נשמר ב-cache, וכך גם תוכן ריק)
+MediaFetcher = Callable[[BinaryIO], Awaitable[Optional[str]]]
+
+
+class MediaTooLargeError(Exception):
+    """המדיה חורגת מ-MEDIA_CACHE_MAX_FILE_BYTES"""
+
+
+@dataclass(frozen=True)
+class CachedMedia:
+    path: Path
+    mime_type: str
+    size: int
+
+    @property
+    def extension(self) -> str:
+        return mimetypes.guess_extension(self.mime_type) or ".bin"
+
+    def open(self) -> BinaryIO:
+        return self.path.open("rb")
+
+    def as_data_url(self) -> str:
+        """data URI — לספקים שלא מקבלים קובץ (WPPConnect Gateway)"""
+        encoded = base64.b64encode(self.path.read_bytes()).decode("ascii")
+        return f"data:{self.mime_type};base64,{encoded}"
+
+
+class _LimitedSink:
+    """עטיפה לקובץ היעד שעוצרת הורדה שחורגת מהמגבלה"""
+
+    def __init__(self, file: BinaryIO, limit: int) -> None:
+        self._file = file
+        self._limit = limit
+        self.written = 0
+
+    def write(self, chunk: bytes) -> int:
+        self.written += len(chunk)
+        if self.written > self._limit:
+            raise MediaTooLargeError(f"media exceeds {self._limit} bytes")
+        return self._file.write(chunk)
+
+
+class MediaRelay:
+    """cache של מדיה על דיסק עם פינוי LRU לפי גודל ותפוגה לפי גיל.
+
+    directory שייכת ל-relay הזה בלבד. ttl_seconds=None — בלי תפוגה.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        max_bytes: int,
+        max_file_bytes: int,
+        ttl_seconds: Optional[float] = None,
+    ) -> None:
+        self._dir = directory
+        self._max_bytes = max_bytes
+        self._max_file_bytes = max_file_bytes
+        self._ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, CachedMedia] = OrderedDict()
+        # מועד השמירה של כל רשומה (time.time) — לתפוגה
+        self._stored_at: dict[str, float] = {}
+        self._total_bytes = 0
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._loaded = False
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    @staticmethod
+    def cache_key(source: str, media_id: str) -> str:
+        return hashlib.sha256(f"{source}:{media_id}".encode("utf-8")).hexdigest()
+
+    def _load_index(self) -> None:
+        """בניית האינדקס מקבצים שנשארו בתיקייה (למשל אחרי restart)"""
+        if self._loaded:
+            return
+        self._dir.mkdir(mode=_DIR_MODE, parents=True, exist_ok=True)
+        files = []
+        for path in self._dir.iterdir():
+            stat = path.stat()
+            # .part שנשאר — הורדה של ה-relay הזה שנקטעה (התיקייה לא משותפת)
+            if path.suffix == _PART_SUFFIX or self._is_expired(stat.st_mtime):
+                path.unlink(missing_ok=True)
+                continue
+            files.append((stat.st_mtime, path, stat.st_size))
+        for mtime, path, size in sorted(files):
+            mime_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+            self._entries[path.stem] = CachedMedia(path, mime_type, size)
+            self._stored_at[path.stem] = mtime
+            self._total_bytes += size
+        self._loaded = True
+        self._evict()
+
+    def _is_expired(self, stored_at: float, now: float | None = None) -> bool:
+        if self._ttl_seconds is None:
+            return False
+        return (time.time() if now is None else now) - stored_at >= self._ttl_seconds
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._stored_at.pop(key, None)
+        self._total_bytes -= entry.size
+        # קורא שכבר פתח את הקובץ ממשיך לקרוא אותו גם אחרי unlink
+        entry.path.unlink(missing_ok=True)
+
+    def _evict(self, keep: str | None = None) -> None:
+        now = time.time()
+        for key in [k for k, stored_at in self._stored_at.items() if self._is_expired(stored_at, now)]:
+            if key != keep:
+                self._remove(key)
+        while self._total_bytes > self._max_bytes and len(self._entries) > 1:
+            key = next(iter(self._entries))
+            if key == keep:
+                break
+            self._remove(key)
+
+    def get(self, source: str, media_id: str) -> Optional[CachedMedia]:
+        self._load_index()
+        key = self.cache_key(source, media_id)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if not entry.path.exists() or self._is_expired(self._stored_at[key]):
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    async def get_or_fetch(
+        self, source: str, media_id: str, fetch: MediaFetcher
+    ) -> Optional[CachedMedia]:
+        """המדיה מה-cache, או הורדה דרך fetch ושמירה.
+
+        קריאות מקבילות לאותה מדיה ממתינות להורדה אחת. exception של fetch
+        עובר לקורא שהפעיל את ההורדה; הממתינים האחרים מקבלים None.
+        """
+        entry = self.get(source, media_id)
+        if entry is not None:
+            return entry
+
+        key = self.cache_key(source, media_id)
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        entry = None
+        try:
+            entry = await self._download(key, fetch)
+            return entry
+        finally:
+            self._inflight.pop(key, None)
+            future.set_result(entry)
+
+    async def _download(self, key: str, fetch: MediaFetcher) -> Optional[CachedMedia]:
+        part = self._dir / f"{key}.{uuid.uuid4().hex}{_PART_SUFFIX}"
+        # התיקייה נמחקת ע"י _sweep_stale_dirs אם לא נכתב אליה כלום במשך ה-TTL
+        self._dir.mkdir(mode=_DIR_MODE, parents=True, exist_ok=True)
+        try:
+            with part.open("wb") as file:
+                sink = _LimitedSink(file, self._max_file_bytes)
+                mime_type = await fetch(sink)  # type: ignore[arg-type]
+            if mime_type is None or sink.written == 0:
+                return None
+            entry = CachedMedia(
+                self._dir / f"{key}{mimetypes.guess_extension(mime_type) or '.bin'}",
+                mime_type,
+                sink.written,
+            )
+            os.replace(part, entry.path)
+        finally:
+            part.unlink(missing_ok=True)
+
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._total_bytes -= previous.size
+        self._entries[key] = entry
+        self._stored_at[key] = time.time()
+        self._total_bytes += entry.size
+        self._evict(keep=key)
+        return entry
+
+
+def _sweep_stale_dirs(root: Path, ttl_seconds: float) -> None:
+    """מחיקת תיקיות של תהליכים שהסתיימו (וקבצים מהמבנה השטוח הישן) אחרי ה-TTL"""
+    cutoff = time.time() - ttl_seconds
+    for path in root.iterdir():
+        try:
+            if path.stat().st_mtime >= cutoff:
+                continue
+            if path.is_dir():
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                path.unlink(missing_ok=True)
+        except OSError as e:
+            logger.warning(
+                "כשלון בניקוי cache מדיה ישן",
+                extra_data={"path": str(path), "error": str(e)},
+            )
+
+
+_relay: Optional[MediaRelay] = None
+
+
+def get_media_relay() -> MediaRelay:
+    """ה-relay של התהליך — נוצר בשימוש הראשון לפי ההגדרות"""
+    global _relay
+    if _relay is None:
+        root = Path(settings.MEDIA_CACHE_DIR or os.path.join(
+            tempfile.gettempdir(), "shipmentbot-media"
+        ))
+        root.mkdir(mode=_DIR_MODE, parents=True, exist_ok=True)
+        _sweep_stale_dirs(root, settings.MEDIA_CACHE_TTL_SECONDS)
+        _relay = MediaRelay(
+            root / f"{os.getpid()}-{uuid.uuid4().hex[:8]}",
+            max_bytes=settings.MEDIA_CACHE_MAX_BYTES,
+            max_file_bytes=settings.MEDIA_CACHE_MAX_FILE_BYTES,
+            ttl_seconds=settings.MEDIA_CACHE_TTL_SECONDS,
+        )
+    return _relay
+
+
+def reset_media_relay() -> None:
+    """איפוס ה-relay (לבדיקות / שינוי הגדרות)"""
+    global _relay
+    _relay = None
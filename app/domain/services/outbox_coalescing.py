@@ -0,0 +1,118 @@
+"""
+Outbox Coalescing — איחוד הודעות טקסט ממתינות לאותו נמען לשליחה אחת.
+
+פעולה אחת (למשל תפיסת משלוח) יכולה להכניס ל-outbox כמה הודעות לאותו צ'אט
+באותה טרנזקציה. כל אחת היא קריאת API נפרדת ונספרת במכסת ה-rate limit של
+הצ'אט. כאן ה-dispatcher מאחד הודעות שנתפסו באותו batch:
+
+1. רק הודעות ישירות (לא BROADCAST_*) עם message_text
+2. לפי (platform, recipient_id), בסדר FIFO — הסדר בין ההודעות נשמר
+3. בתוך חלון זמן מההודעה הראשונה בקבוצה (created_at)
+4. עד מגבלת האורך של הפלטפורמה
+5. הודעה עם inline_keyboard סוגרת את הקבוצה — המקלדת מוצמדת להודעה
+   המאוחדת, והטקסט שלה הוא האחרון, כך שהכפתורים נשארים צמודים לטקסט שלהם
+
+ההודעה המאוחדת היא OutboxMessage זמני (לא נשמר) עם ה-id של ההודעה הראשונה;
+התוצאה שלה מוחלת על כל ההודעות בקבוצה (OutboxTransitions.coalesce).
+"""
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from typing import Sequence
+
+from app.db.models.outbox_message import MessagePlatform, OutboxMessage
+
+# מגבלת אורך טקסט להודעה — Telegram sendMessage ו-WhatsApp Cloud API
+MAX_TEXT_LENGTH: dict[MessagePlatform, int] = {
+    MessagePlatform.TELEGRAM: 4096,
+    MessagePlatform.WHATSAPP: 4096,
+}
+
+COALESCE_SEPARATOR = "\n\n"
+
+
+def _is_coalescable(message: OutboxMessage) -> bool:
+    """הודעה ישירה עם טקסט בלבד (ואולי מקלדת) — ניתנת לאיחוד"""
+    if message.recipient_id.startswith("BROADCAST_"):
+        return False
+    content = message.message_content or {}
+    return isinstance(content.get("message_text"), str) and bool(content["message_text"])
+
+
+def _merge(group: list[OutboxMessage]) -> OutboxMessage:
+    """הודעה זמנית שמאחדת את טקסטי הקבוצה — מקלדת (אם יש) מההודעה האחרונה"""
+    lead = group[0]
+    content: dict = {
+        "message_text": COALESCE_SEPARATOR.join(
+            m.message_content["message_text"] for m in group
+        ),
+        "coalesced_ids": [m.id for m in group],
+    }
+    keyboard = group[-1].message_content.get("inline_keyboard")
+    if keyboard:
+        content["inline_keyboard"] = keyboard
+    return OutboxMessage(
+        id=lead.id,
+        platform=lead.platform,
+        recipient_id=lead.recipient_id,
+        message_type=lead.message_type,
+        message_content=content,
+        priority=lead.priority,
+        status=lead.status,
+        retry_count=lead.retry_count,
+        max_retries=lead.max_retries,
+        created_at=lead.created_at,
+    )
+
+
+def coalesce_outbox_messages(
+    messages: Sequence[OutboxMessage], *, window_seconds: float
+) -> list[tuple[OutboxMessage, list[OutboxMessage]]]:
+    """איחוד הודעות batch לשליחה.
+
+    Returns:
+        (הודעה לשליחה, ההודעות המקוריות שהיא מכסה) לכל שליחה, לפי סדר
+        ההודעה הראשונה בכל קבוצה. הודעה שלא אוחדה — (ההודעה, [ההודעה]).
+    """
+    window = timedelta(seconds=window_seconds)
+    groups: list[list[OutboxMessage]] = []
+    # הקבוצה הפתוחה לכל נמען — הודעה חדשה מצטרפת אליה או פותחת קבוצה חדשה
+    open_groups: dict[tuple[MessagePlatform, str], list[OutboxMessage]] = {}
+    open_lengths: dict[tuple[MessagePlatform, str], int] = {}
+
+    for message in messages:
+        key = (message.platform, message.recipient_id)
+        if not _is_coalescable(message):
+            # הודעה שלא מתאחדת סוגרת את הקבוצה הפתוחה — שומרים על הסדר
+            open_groups.pop(key, None)
+            groups.append([message])
+            continue
+
+        text_length = len(message.message_content["message_text"])
+        group = open_groups.get(key)
+        if group is not None:
+            merged_length = open_lengths[key] + len(COALESCE_SEPARATOR) + text_length
+            started = group[0].created_at or datetime.utcnow()
+            created = message.created_at or datetime.utcnow()
+            if (
+                merged_length <= MAX_TEXT_LENGTH[message.platform]
+                and created - started <= window
+            ):
+                group.append(message)
+                open_lengths[key] = merged_length
+                if message.message_content.get("inline_keyboard"):
+                    open_groups.pop(key)
+                continue
+
+        group = [message]
+        groups.append(group)
+        if message.message_content.get("inline_keyboard"):
+            open_groups.pop(key, None)
+        else:
+            open_groups[key] = group
+            open_lengths[key] = text_length
+
+    return [
+        (group[0] if len(group) == 1 else _merge(group), group)
+        for group in groups
+    ]
@@ -0,0 +1,269 @@
+"""
+Outbox Metrics — טלמטריה של throughput ו-latency של ה-outbox dispatcher.
+
+ה-workers רושמים, לכל message_type ו-platform:
+- outbox_enqueue_to_claim_seconds — מרגע שההודעה ניתנת לתפיסה (created_at,
+  או next_retry_at ב-retry) ועד שנתפסה. זה ה-lag של התור
+- outbox_claim_to_sent_seconds — מהתפיסה ועד שהשליחה הצליחה
+- outbox_send_duration_seconds — משך קריאת השליחה עצמה
+- outbox_retry_count — מספר ה-retries שקדמו לתוצאה סופית (sent / dead letter)
+- outbox_messages_total — מונה תוצאות: sent / retry / dead
+
+התצפיות נאספות בזיכרון במהלך batch ונכתבות ל-Redis ב-pipeline אחד (hash
+לכל מטריקה), כך שכל התהליכים מצטברים לאותן היסטוגרמות וה-API קורא אותן.
+עומק התור והגיל של ההודעה הוותיקה נמדדים מה-DB בזמן הקריאה
+(OutboxService.get_queue_stats). הכתיבה best-effort — כשלון Redis לא עוצר שליחה.
+
+render_prometheus מייצא את הכל בפורמט Prometheus text exposition.
+"""
+from __future__ import annotations
+
+from bisect import bisect_left
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+
+from app.core.logging import get_logger
+from app.db.models.outbox_message import MessagePlatform, OutboxMessage
+
+logger = get_logger(__name__)
+
+_KEY_PREFIX = "outbox:metrics:"
+
+LATENCY_BUCKETS: tuple[float, ...] = (
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0,
+)
+RETRY_BUCKETS: tuple[float, ...] = (0, 1, 2, 3, 5, 10)
+
+# שם → (תיאור, buckets)
+HISTOGRAMS: dict[str, tuple[str, tuple[float, ...]]] = {
+    "outbox_enqueue_to_claim_seconds": (
+        "Time from a message becoming claimable until a worker claimed it",
+        LATENCY_BUCKETS,
+    ),
+    "outbox_claim_to_sent_seconds": (
+        "Time from claim until the message was sent successfully",
+        LATENCY_BUCKETS,
+    ),
+    "outbox_send_duration_seconds": (
+        "Duration of a single outbox send attempt",
+        LATENCY_BUCKETS,
+    ),
+    "outbox_retry_count": (
+        "Retries before a message reached a final state (sent or dead letter)",
+        RETRY_BUCKETS,
+    ),
+}
+COUNTERS: dict[str, str] = {
+    "outbox_messages_total": "Outbox send outcomes (sent, retry, dead)",
+}
+
+
+def _platform_value(platform: MessagePlatform | str) -> str:
+    return platform.value if isinstance(platform, MessagePlatform) else str(platform)
+
+
+def _format_le(bound: float) -> str:
+    return f"{bound:g}"
+
+
+class OutboxMetrics:
+    """תצפיות של batch אחד — נכתבות ל-Redis ב-flush"""
+
+    def __init__(self) -> None:
+        # (metric, message_type, platform) → [counts לכל bucket + Inf, sum]
+        self._histograms: dict[tuple[str, str, str], list[float]] = {}
+        self._counters: dict[tuple[str, str, str, str], int] = defaultdict(int)
+
+    def observe(self, metric: str, message: OutboxMessage, value: float) -> None:
+        buckets = HISTOGRAMS[metric][1]
+        key = (metric, message.message_type, _platform_value(message.platform))
+        series = self._histograms.setdefault(key, [0.0] * (len(buckets) + 2))
+        series[bisect_left(buckets, value)] += 1
+        series[-1] += value
+
+    def increment(self, metric: str, message: OutboxMessage, outcome: str) -> None:
+        self._counters[(metric, message.message_type, _platform_value(message.platform), outcome)] += 1
+
+    def record_claim(self, messages: list[OutboxMessage], claimed_at: datetime) -> None:
+        for message in messages:
+            ready_at = message.next_retry_at or message.created_at or claimed_at
+            self.observe(
+                "outbox_enqueue_to_claim_seconds",
+                message,
+                max(0.0, (claimed_at - ready_at).total_seconds()),
+            )
+
+    def record_outcomes(
+        self,
+        sent: list[OutboxMessage],
+        failed: list[OutboxMessage],
+        dead_ids: set[int],
+        claimed_at: datetime,
+    ) -> None:
+        now = datetime.utcnow()
+        for message in sent:
+            self.increment("outbox_messages_total", message, "sent")
+            self.observe(
+                "outbox_claim_to_sent_seconds", message, (now - claimed_at).total_seconds()
+            )
+            self.observe("outbox_retry_count", message, message.retry_count or 0)
+        for message in failed:
+            if message.id in dead_ids:
+                self.increment("outbox_messages_total", message, "dead")
+                self.observe("outbox_retry_count", message, message.retry_count or 0)
+            else:
+                self.increment("outbox_messages_total", message, "retry")
+
+    async def flush(self) -> None:
+        """כתיבת התצפיות ל-Redis ב-round trip אחד. כשלון נרשם ללוג בלבד."""
+        if not self._histograms and not self._counters:
+            return
+        try:
+            from app.core.redis_client import get_redis
+
+            redis = await get_redis()
+            pipe = redis.pipeline(transaction=False)
+            for (metric, message_type, platform), series in self._histograms.items():
+                buckets = HISTOGRAMS[metric][1]
+                key = f"{_KEY_PREFIX}{metric}"
+                prefix = f"{message_type}|{platform}"
+                bounds = [_format_le(b) for b in buckets] + ["+Inf"]
+                for bound, count in zip(bounds, series[:-1]):
+                    if count:
+                        pipe.hincrby(key, f"{prefix}|{bound}", int(count))
+                pipe.hincrby(key, f"{prefix}|count", int(sum(series[:-1])))
+                pipe.hincrbyfloat(key, f"{prefix}|sum", series[-1])
+            for (metric, message_type, platform, outcome), count in self._counters.items():
+                pipe.hincrby(
+                    f"{_KEY_PREFIX}{metric}", f"{message_type}|{platform}|{outcome}", count
+                )
+            await pipe.execute()
+        except Exception as e:
+            logger.warning(
+                "כשלון בכתיבת מטריקות outbox",
+                extra_data={"error": str(e)},
+            )
+        finally:
+            self._histograms.clear()
+            self._counters.clear()
+
+
+@dataclass
+class HistogramSeries:
+    metric: str
+    message_type: str
+    platform: str
+    buckets: dict[str, int]  # le → ספירה מצטברת (כולל +Inf)
+    count: int
+    sum: float
+
+
+@dataclass
+class CounterSeries:
+    metric: str
+    message_type: str
+    platform: str
+    outcome: str
+    value: int
+
+
+async def read_outbox_metrics() -> tuple[list[HistogramSeries], list[CounterSeries]]:
+    """קריאת ההיסטוגרמות והמונים המצטברים מ-Redis"""
+    from app.core.redis_client import get_redis
+
+    redis = await get_redis()
+    pipe = redis.pipeline(transaction=False)
+    names = list(HISTOGRAMS) + list(COUNTERS)
+    for name in names:
+        pipe.hgetall(f"{_KEY_PREFIX}{name}")
+    raw = dict(zip(names, await pipe.execute()))
+
+    histograms: list[HistogramSeries] = []
+    for metric, (_, buckets) in HISTOGRAMS.items():
+        by_labels: dict[tuple[str, str], dict[str, str]] = defaultdict(dict)
+        for field, value in (raw.get(metric) or {}).items():
+            message_type, platform, part = field.rsplit("|", 2)
+            by_labels[(message_type, platform)][part] = value
+        for (message_type, platform), parts in sorted(by_labels.items()):
+            cumulative: dict[str, int] = {}
+            running = 0
+            for bound in [_format_le(b) for b in buckets] + ["+Inf"]:
+                running += int(parts.get(bound, 0))
+                cumulative[bound] = running
+            histograms.append(HistogramSeries(
+                metric=metric,
+                message_type=message_type,
+                platform=platform,
+                buckets=cumulative,
+                count=int(parts.get("count", 0)),
+                sum=float(parts.get("sum", 0.0)),
+            ))
+
+    counters: list[CounterSeries] = []
+    for metric in COUNTERS:
+        for field, value in sorted((raw.get(metric) or {}).items()):
+            message_type, platform, outcome = field.rsplit("|", 2)
+            counters.append(CounterSeries(metric, message_type, platform, outcome, int(value)))
+    return histograms, counters
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels: str) -> str:
+    return "{" + ",".join(f'{k}="{_escape_label(str(v))}"' for k, v in labels.items()) + "}"
+
+
+def render_prometheus(
+    histograms: list[HistogramSeries],
+    counters: list[CounterSeries],
+    queue_stats: list[dict],
+) -> str:
+    """ייצוא בפורמט Prometheus text exposition (version 0.0.4)"""
+    lines: list[str] = []
+
+    for metric, (help_text, _) in HISTOGRAMS.items():
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} histogram")
+        for histogram in (h for h in histograms if h.metric == metric):
+            base = {"message_type": histogram.message_type, "platform": histogram.platform}
+            for bound, count in histogram.buckets.items():
+                lines.append(f"{metric}_bucket{_labels(**base, le=bound)} {count}")
+            lines.append(f"{metric}_sum{_labels(**base)} {histogram.sum:g}")
+            lines.append(f"{metric}_count{_labels(**base)} {histogram.count}")
+
+    for metric, help_text in COUNTERS.items():
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} counter")
+        for counter in (c for c in counters if c.metric == metric):
+            labels = _labels(
+                message_type=counter.message_type,
+                platform=counter.platform,
+                outcome=counter.outcome,
+            )
+            lines.append(f"{metric}{labels} {counter.value}")
+
+    lines.append("# HELP outbox_queue_depth Outbox messages waiting or in flight")
+    lines.append("# TYPE outbox_queue_depth gauge")
+    for row in queue_stats:
+        labels = _labels(
+            message_type=row["message_type"], platform=row["platform"], status=row["status"]
+        )
+        lines.append(f"outbox_queue_depth{labels} {row['depth']}")
+
+    lines.append(
+        "# HELP outbox_oldest_pending_age_seconds "
+        "Age of the oldest claimable pending message"
+    )
+    lines.append("# TYPE outbox_oldest_pending_age_seconds gauge")
+    for row in queue_stats:
+        if row["status"] != "pending":
+            continue
+        labels = _labels(message_type=row["message_type"], platform=row["platform"])
+        lines.append(
+            f"outbox_oldest_pending_age_seconds{labels} {row['oldest_age_seconds']:g}"
+        )
+
+    return "\n".join(lines) + "\n"
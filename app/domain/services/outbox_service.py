@@ -8,21 +8,63 @@ from __future__ import annotations
 
 from datetime import datetime, timedelta
 from html import escape
-from typing import List
+from typing import Iterable, List, Sequence
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import or_, select
+from sqlalchemy.orm import aliased
+from sqlalchemy import (
+    Boolean,
+    DateTime,
+    Integer,
+    Text,
+    and_,
+    case,
+    column,
+    func,
+    insert,
+    literal,
+    or_,
+    select,
+    union_all,
+    update,
+    values,
+)
 
 from app.core.config import settings
 from app.core.logging import get_logger
-from app.db.models.outbox_message import OutboxMessage, MessagePlatform, MessageStatus
+from app.db.models.outbox_message import (
+    MessagePlatform,
+    MessagePriority,
+    MessageStatus,
+    OutboxMessage,
+    priority_for_message_type,
+)
 from app.db.models.dead_letter_message import DeadLetterMessage, DeadLetterStatus
+from app.db.models.outbox_fanout import FanoutStatus, OutboxFanoutRecipient
 from app.db.models.delivery import Delivery
 from app.db.models.station import Station
-from app.db.models.user import User
+from app.db.models.user import ApprovalStatus, User, UserRole
+from app.domain.services.outbox_wakeup import mark_outbox_wakeup_pending
 
 logger = get_logger(__name__)
 
 
+# הודעת fan-out של פרסום נסיעה — recipient_id הוא הקידומת + מזהה ההודעה
+RIDE_POSTING_BROADCAST_PREFIX = "BROADCAST_RIDE_POSTING_"
+
+RIDE_AUDIENCE_GROUP = "group"
+RIDE_AUDIENCE_DRIVER = "driver"
+
+
+def ride_fanout_recipient(audience: str, platform: MessagePlatform, target: str) -> str:
+    """recipient_id של שורת fan-out בפרסום נסיעה — קהל, פלטפורמה ויעד"""
+    return f"{audience}:{platform.value}:{target}"
+
+
+def parse_ride_fanout_recipient(recipient_id: str) -> tuple[str, MessagePlatform, str]:
+    audience, platform, target = recipient_id.split(":", 2)
+    return audience, MessagePlatform(platform), target
+
+
 def _calculate_backoff_seconds(
     retry_count: int,
     *,
@@ -62,6 +104,65 @@ def _calculate_backoff_seconds(
     return min(backoff, max_backoff_seconds)
 
 
+def _log_lost_leases(transition: str, message_ids: Sequence[int], updated: Iterable[int]) -> None:
+    """רישום הודעות שהמעבר שלהן דולג — ה-lease פקע וההודעה נתפסה מחדש"""
+    lost = sorted(set(message_ids) - set(updated))
+    if lost:
+        logger.warning(
+            "מעבר סטטוס ב-outbox דולג — ה-lease כבר לא שייך ל-worker הזה",
+            extra_data={"transition": transition, "message_ids": lost, "count": len(lost)},
+        )
+
+
+class OutboxTransitions:
+    """מעברי סטטוס שנאספו במהלך עיבוד batch — מוחלים יחד ב-apply_transitions.
+
+    חושף את אותו ממשק כמו OutboxService.mark_as_sent/mark_as_failed, כך שקוד
+    השליחה לא צריך לדעת אם הוא רושם מעבר או מבצע אותו מיד.
+    """
+
+    def __init__(self, messages: Sequence[OutboxMessage]) -> None:
+        self._messages = {message.id: message for message in messages}
+        self._sent: dict[int, None] = {}
+        self._failed: dict[int, tuple[str, bool]] = {}
+        # הודעה מאוחדת (outbox_coalescing) — מזהה ההודעה שנשלחה → כל ההודעות שהיא מכסה
+        self._coalesced: dict[int, list[int]] = {}
+
+    def coalesce(self, lead_id: int, message_ids: Sequence[int]) -> None:
+        """מעבר שנרשם ל-lead_id יוחל על כל message_ids (שליחה מאוחדת אחת)"""
+        self._coalesced[lead_id] = list(message_ids)
+
+    async def mark_as_sent(self, message_id: int) -> None:
+        for target in self._coalesced.get(message_id, (message_id,)):
+            self._failed.pop(target, None)
+            self._sent[target] = None
+
+    async def mark_as_failed(
+        self, message_id: int, error: str, *, is_transient: bool = True
+    ) -> None:
+        for target in self._coalesced.get(message_id, (message_id,)):
+            self._sent.pop(target, None)
+            self._failed[target] = (error, is_transient)
+
+    @property
+    def sent_ids(self) -> list[int]:
+        return list(self._sent)
+
+    @property
+    def sent_messages(self) -> list[OutboxMessage]:
+        return [self._messages[message_id] for message_id in self._sent]
+
+    @property
+    def failures(self) -> list[tuple[OutboxMessage, str, bool]]:
+        return [
+            (self._messages[message_id], error, is_transient)
+            for message_id, (error, is_transient) in self._failed.items()
+        ]
+
+    def __len__(self) -> int:
+        return len(self._sent) + len(self._failed)
+
+
 class OutboxService:
     """
     Service for managing outbox messages.
@@ -86,9 +187,13 @@ class OutboxService:
             recipient_id=recipient_id,
             message_type=message_type,
             message_content=message_content,
+            priority=priority_for_message_type(message_type),
             status=MessageStatus.PENDING
         )
         self.db.add(message)
+        if settings.OUTBOX_WAKEUP_ENABLED:
+            # אחרי commit — התעוררות מיידית של ה-dispatcher במקום המתנה ל-Beat
+            mark_outbox_wakeup_pending(self.db)
         return message
 
     async def queue_delivery_broadcast(
@@ -403,6 +508,98 @@ class OutboxService:
         messages.append(msg)
         return messages
 
+    async def queue_ride_posting_broadcast(
+        self,
+        *,
+        group_text: str,
+        driver_text: str,
+        recipients: Sequence[tuple[str, int | None]],
+        report_to: tuple[MessagePlatform, str] | None = None,
+    ) -> OutboxMessage | None:
+        """הפצת פרסום נסיעה לקבוצות ולנהגים תואמים כהודעת fan-out אחת.
+
+        שורות ה-fan-out נוצרות כאן (לא בעיבוד, כמו בשידור לשליחים) — הנמענים
+        ידועים בזמן הפרסום. ה-worker שולח אותן ב-chunks במקביל ובסיום מדווח
+        לנהג המפרסם כמה קבוצות ונהגים קיבלו את הנסיעה. לא מבצע commit.
+
+        Args:
+            group_text: ההודעה לקבוצות
+            driver_text: ההודעה הפרטית לנהגים עם חיפוש תואם
+            recipients: (recipient_id מ-ride_fanout_recipient, user_id או None)
+            report_to: (פלטפורמה, נמען) לדיווח הסיכום, או None
+        """
+        unique = list(dict(recipients).items())
+        if not unique:
+            return None
+
+        if report_to is not None:
+            platform, report_recipient = report_to
+        else:
+            platform, report_recipient = parse_ride_fanout_recipient(unique[0][0])[1], None
+
+        message = await self.queue_message(
+            platform=platform,
+            recipient_id=RIDE_POSTING_BROADCAST_PREFIX,
+            message_type="ride_posting_broadcast",
+            message_content={
+                "group_text": group_text,
+                "driver_text": driver_text,
+                "report_recipient": report_recipient,
+            },
+        )
+        await self.db.flush()
+        # נמען ייחודי לכל פרסום — פרסומים שונים לא מתעכבים זה אחרי זה ב-batch
+        message.recipient_id = f"{RIDE_POSTING_BROADCAST_PREFIX}{message.id}"
+
+        now = datetime.utcnow()
+        await self.db.execute(
+            insert(OutboxFanoutRecipient),
+            [
+                {
+                    "outbox_message_id": message.id,
+                    "user_id": user_id,
+                    "recipient_id": recipient_id,
+                    "status": FanoutStatus.PENDING,
+                    "retry_count": 0,
+                    "created_at": now,
+                }
+                for recipient_id, user_id in unique
+            ],
+        )
+        return message
+
+    async def get_queue_stats(self) -> list[dict]:
+        """עומק התור לפי message_type / platform / status (PENDING ו-PROCESSING)
+        והגיל של ההודעה הוותיקה שניתנת לתפיסה — שאילתה אחת עם GROUP BY.
+
+        הגיל נמדד מ-next_retry_at (אם יש) או created_at — הודעה שממתינה
+        ל-backoff עדיין לא מאחרת.
+        """
+        now = datetime.utcnow()
+        result = await self.db.execute(
+            select(
+                OutboxMessage.message_type,
+                OutboxMessage.platform,
+                OutboxMessage.status,
+                func.count(OutboxMessage.id),
+                func.min(func.coalesce(OutboxMessage.next_retry_at, OutboxMessage.created_at)),
+            )
+            .where(OutboxMessage.status.in_([MessageStatus.PENDING, MessageStatus.PROCESSING]))
+            .group_by(OutboxMessage.message_type, OutboxMessage.platform, OutboxMessage.status)
+        )
+        return [
+            {
+                "message_type": message_type,
+                "platform": platform.value,
+                "status": row_status.value,
+                "depth": depth,
+                "oldest_age_seconds": (
+                    max(0.0, (now - oldest).total_seconds()) if oldest else 0.0
+                ),
+            }
+            for message_type, platform, row_status, depth, oldest in result.all()
+        ]
+
     async def get_pending_messages(self, limit: int = 100) -> List[OutboxMessage]:
         """שליפת הודעות ממתינות לעיבוד.
 
@@ -425,6 +622,479 @@ class OutboxService:
         )
         return list(result.scalars().all())
 
+    async def claim_message(self, message_id: int) -> datetime | None:
+        """תפיסה אטומית של הודעה בודדת — UPDATE ... WHERE status = 'PENDING'.
+
+        מחזיר את ערך ה-lease (locked_until) שאיתו ההודעה נתפסה, או None אם
+        ההודעה כבר נתפסה/עובדה ע"י worker אחר.
+        """
+        lease = datetime.utcnow() + timedelta(seconds=settings.OUTBOX_CLAIM_LEASE_SECONDS)
+        result = await self.db.execute(
+            update(OutboxMessage)
+            .where(
+                OutboxMessage.id == message_id,
+                OutboxMessage.status == MessageStatus.PENDING,
+            )
+            .values(status=MessageStatus.PROCESSING, locked_until=lease)
+        )
+        await self.db.commit()
+        return lease if result.rowcount > 0 else None
+
+    async def extend_lease(
+        self, message: OutboxMessage, *, lease_seconds: int | None = None
+    ) -> bool:
+        """הארכת ה-lease של הודעה בעיבוד — רק אם ה-worker הזה עדיין מחזיק בו.
+
+        מגודר כמו מעברי הסטטוס (PROCESSING + locked_until זהה לערך שבזיכרון).
+        בהצלחה message.locked_until מתעדכן לערך החדש. מבצע commit.
+
+        Returns:
+            False אם ה-lease פקע והודעה נתפסה מחדש (או כבר לא PROCESSING)
+        """
+        if lease_seconds is None:
+            lease_seconds = settings.OUTBOX_CLAIM_LEASE_SECONDS
+        lease = datetime.utcnow() + timedelta(seconds=lease_seconds)
+        result = await self.db.execute(
+            update(OutboxMessage)
+            .where(
+                OutboxMessage.id == message.id,
+                OutboxMessage.status == MessageStatus.PROCESSING,
+                OutboxMessage.locked_until == message.locked_until,
+            )
+            .values(locked_until=lease)
+            .execution_options(synchronize_session=False)
+        )
+        await self.db.commit()
+        if result.rowcount == 0:
+            return False
+        message.locked_until = lease
+        return True
+
+    async def claim_pending_messages(
+        self,
+        limit: int = 50,
+        *,
+        lease_seconds: int | None = None,
+        priorities: Sequence[MessagePriority] | None = None,
+    ) -> List[OutboxMessage]:
+        """תפיסת batch של הודעות לעיבוד ב-round trip אחד.
+
+        UPDATE ... WHERE id IN (SELECT ... FOR UPDATE SKIP LOCKED) RETURNING —
+        כמה workers יכולים לרוקן את הטבלה במקביל בלי להתחרות על אותן שורות:
+        שורה שנעולה ע"י worker אחר פשוט מדולגת.
+
+        ההודעות מוחזרות בסטטוס PROCESSING עם lease (locked_until). הודעה
+        שה-lease שלה פקע (worker קרס באמצע) נחשבת שוב ניתנת לתפיסה.
+        מבצע commit כדי לשחרר את נעילות השורות מיד.
+
+        priorities מגביל את התפיסה לנתיבי עדיפות מסוימים (ראה MessagePriority).
+        בלי סינון — עדיפות גבוהה קודם, ובתוך כל עדיפות FIFO.
+
+        סדר לכל נמען: הודעה לא נתפסת כל עוד הודעה קודמת לאותו recipient_id
+        נמצאת בעיבוד (PROCESSING עם lease חי) — אצל worker אחר, נתיב wake-up
+        אחר או ה-sweep של Beat — או ממתינה ל-retry (PENDING עם next_retry_at
+        בעתיד). הודעות לאותו נמען שנתפסות יחד נשלחות בסדר ע"י
+        _dispatch_concurrently.
+        """
+        now = datetime.utcnow()
+        if lease_seconds is None:
+            lease_seconds = settings.OUTBOX_CLAIM_LEASE_SECONDS
+
+        older = aliased(OutboxMessage)
+        older_in_flight = (
+            select(older.id)
+            .where(
+                older.recipient_id == OutboxMessage.recipient_id,
+                older.id < OutboxMessage.id,
+                or_(
+                    and_(
+                        older.status == MessageStatus.PROCESSING,
+                        older.locked_until >= now,
+                    ),
+                    # הודעה קודמת ב-backoff — הבאות ממתינות לה
+                    and_(
+                        older.status == MessageStatus.PENDING,
+                        older.next_retry_at > now,
+                    ),
+                ),
+            )
+            .exists()
+        )
+
+        claimable_ids = (
+            select(OutboxMessage.id)
+            .where(
+                or_(
+                    and_(
+                        OutboxMessage.status == MessageStatus.PENDING,
+                        or_(
+                            OutboxMessage.next_retry_at.is_(None),
+                            OutboxMessage.next_retry_at <= now,
+                        ),
+                    ),
+                    # lease שפקע — ה-worker שתפס כנראה קרס
+                    and_(
+                        OutboxMessage.status == MessageStatus.PROCESSING,
+                        OutboxMessage.locked_until.is_not(None),
+                        OutboxMessage.locked_until < now,
+                    ),
+                ),
+                ~older_in_flight,
+            )
+            .order_by(OutboxMessage.priority, OutboxMessage.created_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        if priorities is not None:
+            claimable_ids = claimable_ids.where(OutboxMessage.priority.in_(priorities))
+        result = await self.db.execute(
+            update(OutboxMessage)
+            .where(OutboxMessage.id.in_(claimable_ids))
+            .values(
+                status=MessageStatus.PROCESSING,
+                locked_until=now + timedelta(seconds=lease_seconds),
+            )
+            .returning(OutboxMessage)
+            .execution_options(synchronize_session=False, populate_existing=True)
+        )
+        messages = list(result.scalars().all())
+        await self.db.commit()
+
+        # RETURNING לא מבטיח סדר — עדיפות ואז FIFO לפי created_at
+        messages.sort(key=lambda m: (m.priority, m.created_at or now, m.id))
+        return messages
+
+    # ==================== Fan-out של broadcast לשליחים ====================
+
+    async def fan_out_courier_broadcast(self, message: OutboxMessage) -> int:
+        """פירוק הודעת BROADCAST_COURIERS לשורת מסירה לכל שליח מאושר.
+
+        INSERT ... SELECT ברמת ה-DB — השליחים לא נטענים לזיכרון. אידמפוטנטי:
+        אם ההודעה כבר פורקה (retry, או worker שקרס באמצע), לא נוצרות שורות
+        חדשות — ממשיכים מהשורות הקיימות.
+
+        Returns:
+            מספר הנמענים הכולל של ההודעה
+        """
+        total = await self.count_fanout_recipients(message.id)
+        if total:
+            return total
+
+        if message.platform == MessagePlatform.WHATSAPP:
+            recipient_column = User.phone_number
+        else:
+            recipient_column = User.telegram_chat_id
+
+        couriers = select(
+            literal(message.id),
+            User.id,
+            recipient_column,
+            literal(FanoutStatus.PENDING, OutboxFanoutRecipient.status.type),
+            literal(0),
+            literal(datetime.utcnow(), OutboxFanoutRecipient.created_at.type),
+        ).where(
+            User.role == UserRole.COURIER,
+            User.is_active == True,
+            User.platform == message.platform.value,
+            User.approval_status == ApprovalStatus.APPROVED,
+            recipient_column.is_not(None),
+        )
+        await self.db.execute(
+            insert(OutboxFanoutRecipient).from_select(
+                ["outbox_message_id", "user_id", "recipient_id", "status",
+                 "retry_count", "created_at"],
+                couriers,
+            )
+        )
+        await self.db.commit()
+        return await self.count_fanout_recipients(message.id)
+
+    async def count_fanout_recipients(self, message_id: int) -> int:
+        """מספר שורות ה-fan-out של הודעה (כל הסטטוסים)"""
+        result = await self.db.execute(
+            select(func.count(OutboxFanoutRecipient.id)).where(
+                OutboxFanoutRecipient.outbox_message_id == message_id
+            )
+        )
+        return result.scalar_one()
+
+    async def get_fanout_status_counts(self, message_id: int) -> dict[FanoutStatus, int]:
+        """ספירת שורות ה-fan-out של הודעה לפי סטטוס"""
+        result = await self.db.execute(
+            select(OutboxFanoutRecipient.status, func.count(OutboxFanoutRecipient.id))
+            .where(OutboxFanoutRecipient.outbox_message_id == message_id)
+            .group_by(OutboxFanoutRecipient.status)
+        )
+        counts = {status: 0 for status in FanoutStatus}
+        counts.update({status: count for status, count in result.all()})
+        return counts
+
+    async def get_ride_fanout_counts(
+        self, message_id: int
+    ) -> dict[tuple[str, FanoutStatus], int]:
+        """ספירת שורות פרסום נסיעה לפי (קהל, סטטוס) — בשאילתה אחת"""
+        audience = case(
+            (
+                OutboxFanoutRecipient.recipient_id.like(f"{RIDE_AUDIENCE_GROUP}:%"),
+                literal(RIDE_AUDIENCE_GROUP),
+            ),
+            else_=literal(RIDE_AUDIENCE_DRIVER),
+        )
+        result = await self.db.execute(
+            select(audience, OutboxFanoutRecipient.status, func.count(OutboxFanoutRecipient.id))
+            .where(OutboxFanoutRecipient.outbox_message_id == message_id)
+            .group_by(audience, OutboxFanoutRecipient.status)
+        )
+        return {(row_audience, row_status): count for row_audience, row_status, count in result.all()}
+
+    async def get_pending_fanout_chunk(
+        self, message_id: int, *, after_id: int = 0, limit: int = 100
+    ) -> List[OutboxFanoutRecipient]:
+        """chunk הבא של נמענים ממתינים — keyset pagination לפי id"""
+        result = await self.db.execute(
+            select(OutboxFanoutRecipient)
+            .where(
+                OutboxFanoutRecipient.outbox_message_id == message_id,
+                OutboxFanoutRecipient.status == FanoutStatus.PENDING,
+                OutboxFanoutRecipient.id > after_id,
+            )
+            .order_by(OutboxFanoutRecipient.id)
+            .limit(limit)
+        )
+        return list(result.scalars().all())
+
+    async def record_fanout_results(
+        self,
+        recipients: List[OutboxFanoutRecipient],
+        outcomes: List[tuple[bool, bool, str]],
+        *,
+        max_retries: int,
+    ) -> None:
+        """עדכון תוצאות chunk ב-executemany אחד ו-commit — התקדמות נשמרת לכל chunk.
+
+        Args:
+            recipients: שורות ה-chunk
+            outcomes: (success, is_transient, error) לכל שורה, באותו סדר
+            max_retries: מספר ניסיונות מקסימלי לנמען לפני FAILED
+        """
+        now = datetime.utcnow()
+        params = []
+        for recipient, (success, is_transient, error) in zip(recipients, outcomes):
+            # executemany דורש אותם מפתחות בכל השורות
+            if success:
+                status, retry_count, sent_at, last_error = (
+                    FanoutStatus.SENT, recipient.retry_count, now, None
+                )
+            else:
+                retry_count = recipient.retry_count + 1
+                exhausted = not is_transient or retry_count >= max_retries
+                status = FanoutStatus.FAILED if exhausted else FanoutStatus.PENDING
+                sent_at, last_error = None, (error or "Send failed")[:1000]
+            params.append({
+                "id": recipient.id,
+                "status": status,
+                "retry_count": retry_count,
+                "sent_at": sent_at,
+                "last_error": last_error,
+            })
+
+        if params:
+            await self.db.execute(update(OutboxFanoutRecipient), params)
+        await self.db.commit()
+
+    # ==================== מעברי סטטוס ל-batch ====================
+
+    async def apply_transitions(self, transitions: OutboxTransitions) -> list[int]:
+        """החלת כל מעברי ה-batch — UPDATE אחד להצלחות, אחד לכשלונות, commit אחד.
+
+        כל מעבר מגודר ב-lease שאיתו ההודעה נתפסה (status = PROCESSING ו-
+        locked_until זהה). הודעה שה-lease שלה פקע ונתפסה מחדש ע"י worker אחר
+        שייכת לו — המעבר שלנו מדולג ונרשם ללוג, כדי לא להחזיר ל-PENDING הודעה
+        שכבר נשלחה או לדרוס את retry_count שלה.
+
+        Returns:
+            מזהי ההודעות שהועברו ל-dead letter queue
+        """
+        await self.mark_many_as_sent(transitions.sent_messages)
+        dead_ids = await self.mark_many_as_failed(transitions.failures)
+        await self.db.commit()
+        return dead_ids
+
+    async def mark_many_as_sent(self, messages: Sequence[OutboxMessage]) -> list[int]:
+        """סימון הודעות כנשלחו — רק שורות שה-lease שלהן עדיין שלנו. לא מבצע commit.
+
+        UPDATE אחד לכל ערך lease (הודעות שנתפסו יחד חולקות אותו ערך).
+
+        Returns:
+            מזהי ההודעות שעודכנו
+        """
+        if not messages:
+            return []
+
+        by_lease: dict[datetime | None, list[int]] = {}
+        for message in messages:
+            by_lease.setdefault(message.locked_until, []).append(message.id)
+
+        now = datetime.utcnow()
+        updated: list[int] = []
+        for lease, message_ids in by_lease.items():
+            result = await self.db.execute(
+                update(OutboxMessage)
+                .where(
+                    OutboxMessage.id.in_(message_ids),
+                    OutboxMessage.status == MessageStatus.PROCESSING,
+                    OutboxMessage.locked_until == lease,
+                )
+                .values(
+                    status=MessageStatus.SENT,
+                    processed_at=now,
+                    locked_until=None,
+                )
+                .returning(OutboxMessage.id)
+                .execution_options(synchronize_session=False)
+            )
+            updated.extend(result.scalars().all())
+
+        _log_lost_leases("sent", [message.id for message in messages], updated)
+        return updated
+
+    async def mark_many_as_failed(
+        self, failures: Sequence[tuple[OutboxMessage, str, bool]]
+    ) -> list[int]:
+        """סימון הודעות ככושלות — retry עם backoff או dead letter, בלי SELECT לכל הודעה.
+
+        אותה סמנטיקה כמו mark_as_failed: שגיאה קבועה → dead letter מיידי,
+        שגיאה זמנית → retry_count + 1 ו-backoff, עד max_retries. הערכים
+        מחושבים מההודעות שכבר נטענו (claim_pending_messages מחזיר אותן),
+        ונכתבים ב-UPDATE ... FROM אחד + INSERT מרובה ל-dead letters.
+        הודעה שה-lease שלה כבר לא שלנו מדולגת (ראה apply_transitions).
+        לא מבצע commit.
+
+        Args:
+            failures: (הודעה, שגיאה, is_transient) לכל הודעה שנכשלה
+
+        Returns:
+            מזהי ההודעות שהועברו ל-dead letter queue
+        """
+        if not failures:
+            return []
+
+        now = datetime.utcnow()
+        rows: list[dict] = []
+        dead_letters: list[dict] = []
+        for message, error, is_transient in failures:
+            retry_count = message.retry_count or 0
+            if is_transient:
+                retry_count += 1
+            dead = not is_transient or retry_count >= message.max_retries
+            next_retry_at = now + timedelta(
+                seconds=_calculate_backoff_seconds(
+                    retry_count,
+                    base_seconds=settings.OUTBOX_RETRY_BASE_SECONDS,
+                    max_backoff_seconds=settings.OUTBOX_MAX_BACKOFF_SECONDS,
+                )
+            )
+            rows.append({
+                "id": message.id,
+                "lease": message.locked_until,
+                "dead": dead,
+                "retry_count": retry_count,
+                "next_retry_at": next_retry_at,
+                "last_error": error,
+            })
+            if dead:
+                dead_letters.append({
+                    "original_message_id": message.id,
+                    "platform": message.platform.value if isinstance(message.platform, MessagePlatform) else message.platform,
+                    "recipient_id": message.recipient_id,
+                    "message_type": message.message_type,
+                    "message_content": message.message_content,
+                    "retry_count": retry_count,
+                    "last_error": error,
+                    "failure_reason": "permanent" if not is_transient else "max_retries_exceeded",
+                    "status": DeadLetterStatus.FAILED,
+                    "original_created_at": message.created_at,
+                })
+
+        updated = set(await self._update_failed_rows(rows))
+        _log_lost_leases("failed", [row["id"] for row in rows], updated)
+
+        dead_letters = [d for d in dead_letters if d["original_message_id"] in updated]
+        if dead_letters:
+            await self.db.execute(insert(DeadLetterMessage), dead_letters)
+            logger.warning(
+                "הודעות הועברו ל-dead letter queue",
+                extra_data={
+                    "message_ids": [d["original_message_id"] for d in dead_letters],
+                    "count": len(dead_letters),
+                },
+            )
+        return [d["original_message_id"] for d in dead_letters]
+
+    async def _update_failed_rows(self, rows: list[dict]) -> list[int]:
+        """UPDATE outbox_messages ... FROM <שורות הכשלון> — statement אחד לכל הכשלונות.
+
+        ב-PostgreSQL המקור הוא (VALUES ...); SQLite לא תומך ב-alias לעמודות
+        VALUES — שם המקור הוא SELECT ... UNION ALL. מחזיר את המזהים שעודכנו.
+        """
+        if self.db.get_bind().dialect.name == "postgresql":
+            failed_rows = values(
+                column("id", Integer),
+                column("lease", DateTime),
+                column("dead", Boolean),
+                column("retry_count", Integer),
+                column("next_retry_at", DateTime),
+                column("last_error", Text),
+                name="failed_rows",
+            ).data([
+                (
+                    row["id"], row["lease"], row["dead"], row["retry_count"],
+                    row["next_retry_at"], row["last_error"],
+                )
+                for row in rows
+            ])
+        else:
+            selects = [
+                select(
+                    literal(row["id"], Integer).label("id"),
+                    literal(row["lease"], DateTime).label("lease"),
+                    literal(row["dead"], Boolean).label("dead"),
+                    literal(row["retry_count"], Integer).label("retry_count"),
+                    literal(row["next_retry_at"], DateTime).label("next_retry_at"),
+                    literal(row["last_error"], Text).label("last_error"),
+                )
+                for row in rows
+            ]
+            source = selects[0] if len(selects) == 1 else union_all(*selects)
+            failed_rows = source.subquery("failed_rows")
+
+        status_type = OutboxMessage.status.type
+        result = await self.db.execute(
+            update(OutboxMessage)
+            .where(
+                OutboxMessage.id == failed_rows.c.id,
+                OutboxMessage.status == MessageStatus.PROCESSING,
+                OutboxMessage.locked_until == failed_rows.c.lease,
+            )
+            .values(
+                status=case(
+                    (failed_rows.c.dead, literal(MessageStatus.FAILED, status_type)),
+                    else_=literal(MessageStatus.PENDING, status_type),
+                ),
+                retry_count=failed_rows.c.retry_count,
+                # dead letter שומר את next_retry_at הקודם, כמו mark_as_failed
+                next_retry_at=case(
+                    (failed_rows.c.dead, OutboxMessage.next_retry_at),
+                    else_=failed_rows.c.next_retry_at,
+                ),
+                last_error=failed_rows.c.last_error,
+                locked_until=None,
+            )
+            .returning(OutboxMessage.id)
+            .execution_options(synchronize_session=False)
+        )
+        return list(result.scalars().all())
+
     async def mark_as_processing(self, message_id: int) -> None:
         """Mark message as being processed"""
         result = await self.db.execute(
@@ -444,6 +1114,7 @@ class OutboxService:
         if message:
             message.status = MessageStatus.SENT
             message.processed_at = datetime.utcnow()
+            message.locked_until = None
             await self.db.commit()
 
     async def mark_as_failed(
@@ -462,6 +1133,7 @@ class OutboxService:
         message = result.scalar_one_or_none()
         if message:
             message.last_error = error
+            message.locked_until = None
 
             # שגיאה קבועה (4xx) → dead letter מיידי, בלי retry נוסף
             if not is_transient:
@@ -540,6 +1212,7 @@ class OutboxService:
             recipient_id=dead_letter.recipient_id,
             message_type=dead_letter.message_type,
             message_content=dead_letter.message_content,
+            priority=priority_for_message_type(dead_letter.message_type),
             status=MessageStatus.PENDING,
             retry_count=0,
         )
@@ -0,0 +1,76 @@
+"""
+Outbox Wake-up — העברת הודעות outbox לשליחה מיד אחרי commit.
+
+בלי מנגנון זה הודעה שנוספה ל-outbox ממתינה עד 10 שניות ל-tick הבא של
+process-outbox-every-10-seconds ב-Beat. כאן:
+
+1. OutboxService.queue_message מסמן את הסשן כ"יש הודעות חדשות"
+2. אחרי commit מוצלח — דחיפת token לרשימת Redis (OUTBOX_WAKEUP_KEY)
+3. listener ב-worker runtime (BLPOP) מתעורר ומרוקן את ה-outbox מיד
+
+הרשימה נחתכת לאיבר אחד — burst של הודעות מייצר התעוררות אחת, כי ה-dispatcher
+מרוקן את כל מה שממתין. Beat נשאר כ-safety sweep (retries, Redis לא זמין).
+"""
+from __future__ import annotations
+
+import asyncio
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.logging import get_logger
+
+logger = get_logger(__name__)
+
+OUTBOX_WAKEUP_KEY = "outbox:wakeup"
+
+# מפתח ב-session.info — האם נוספו הודעות outbox בטרנזקציה הנוכחית
+_WAKEUP_PENDING = "outbox_wakeup_pending"
+
+# הפניות חזקות ל-tasks של ההתראה — מונע איסוף שלהם ע"י ה-GC באמצע ריצה
+_notify_tasks: set[asyncio.Task] = set()
+
+
+async def notify_outbox_wakeup() -> None:
+    """דחיפת token התעוררות ל-dispatcher. כשלון לא נזרק — Beat יאסוף את ההודעה."""
+    try:
+        from app.core.redis_client import get_redis
+
+        redis = await get_redis()
+        await redis.lpush(OUTBOX_WAKEUP_KEY, "1")
+        # token אחד מספיק — ה-dispatcher מרוקן את כל ההודעות הממתינות
+        await redis.ltrim(OUTBOX_WAKEUP_KEY, 0, 0)
+    except Exception as e:
+        logger.warning(
+            "כשלון בשליחת התעוררות ל-outbox dispatcher — ההודעה תישלח ב-sweep הבא",
+            extra_data={"error": str(e)},
+        )
+
+
+def _on_after_commit(session: Session) -> None:
+    """אחרי commit עם הודעות outbox חדשות — תזמון התראה ל-dispatcher."""
+    if not session.info.pop(_WAKEUP_PENDING, False):
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # סשן sync מחוץ ל-event loop — אין איך לשלוח, Beat יאסוף
+        return
+    task = loop.create_task(notify_outbox_wakeup())
+    _notify_tasks.add(task)
+    task.add_done_callback(_notify_tasks.discard)
+
+
+def _on_after_rollback(session: Session) -> None:
+    """rollback — ההודעות לא נשמרו, אין מה להעיר."""
+    session.info.pop(_WAKEUP_PENDING, None)
+
+
+def mark_outbox_wakeup_pending(db: AsyncSession) -> None:
+    """סימון שהטרנזקציה הנוכחית מוסיפה הודעות outbox — התראה תישלח אחרי commit."""
+    sync_session = db.sync_session
+    sync_session.info[_WAKEUP_PENDING] = True
+    if not event.contains(sync_session, "after_commit", _on_after_commit):
+        event.listen(sync_session, "after_commit", _on_after_commit)
+        event.listen(sync_session, "after_rollback", _on_after_rollback)
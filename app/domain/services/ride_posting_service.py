@@ -7,16 +7,23 @@
 import re
 from dataclasses import dataclass
 from html import escape
-from typing import Optional
+from typing import Optional, Sequence
 
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.logging import get_logger
 from app.core.validation import TextSanitizer
+from app.db.models.outbox_message import MessagePlatform
 from app.db.models.station import Station
 from app.db.models.user import User
 from app.domain.services.city_abbreviation_service import CityAbbreviationService
+from app.domain.services.outbox_service import (
+    RIDE_AUDIENCE_DRIVER,
+    RIDE_AUDIENCE_GROUP,
+    OutboxService,
+    ride_fanout_recipient,
+)
 
 logger = get_logger(__name__)
 
@@ -41,8 +48,18 @@ class ParsedRidePosting:
     price: float  # מחיר בש"ח
 
 
+@dataclass
+class RideBroadcast:
+    """תוצאת העברת פרסום נסיעה להפצה — המספרים בפועל נשלחים לנהג בסיום"""
+
+    message_text: str  # הודעת הנסיעה המפורמטת
+    groups_total: int = 0  # קבוצות רלוונטיות
+    groups_queued: int = 0  # קבוצות שהועברו להפצה
+    drivers_queued: int = 0  # נהגים עם חיפוש תואם שהועברו להפצה
+
+
 class RidePostingService:
-    """שירות פרסום נסיעות — פרסור, ולידציה והפצה לקבוצות"""
+    """שירות פרסום נסיעות — פרסור, ולידציה והפצה לקבוצות (דרך ה-outbox)"""
 
     def __init__(self, db: AsyncSession) -> None:
         self._db = db
@@ -253,166 +270,159 @@ class RidePostingService:
             f"🧑‍✈️ <b>נהג:</b> {escape(driver_name)}\n"
         )
 
-    async def post_ride(
+    async def queue_ride_broadcast(
         self,
         user: User,
         posting: ParsedRidePosting,
-    ) -> tuple[bool, str, int, int]:
+        driver_user_ids: Sequence[int] = (),
+    ) -> RideBroadcast:
         """
-        פרסום נסיעה — הפצה לקבוצות רלוונטיות.
+        פרסום נסיעה — הפצה לקבוצות רלוונטיות ולנהגים עם חיפוש תואם דרך ה-outbox.
+
+        השליחה עצמה לא מתבצעת בבקשת ה-webhook: נוצרת הודעת fan-out אחת
+        שה-worker מפיץ במקביל, ובסיומה הנהג המפרסם מקבל סיכום עם המספרים
+        בפועל. מבצע commit.
 
         Args:
-            user: אובייקט המשתמש (נהג)
+            user: אובייקט המשתמש (נהג / סדרן) שמפרסם
             posting: פרטי הנסיעה
+            driver_user_ids: נהגים עם חיפוש תואם להודעה פרטית
 
         Returns:
-            tuple של (הצליח, הודעת תוצאה, מספר קבוצות שנשלחו בהצלחה, סה"כ קבוצות רלוונטיות)
+            RideBroadcast עם מספר הקבוצות והנהגים שהועברו להפצה
         """
         driver_name = user.full_name or user.name or "נהג"
         message = self.format_ride_message(posting, driver_name)
+        broadcast = RideBroadcast(message_text=message)
 
         groups = await self.get_relevant_groups(posting.origin, posting.destination)
+        broadcast.groups_total = len(groups)
 
-        if not groups:
+        recipients: list[tuple[str, int | None]] = []
+        for group in groups:
+            platform = group["platform"]
+            if platform not in (MessagePlatform.TELEGRAM.value, MessagePlatform.WHATSAPP.value):
+                logger.warning(
+                    "פלטפורמה לא מוכרת לשליחת פרסום",
+                    extra_data={"platform": platform},
+                )
+                continue
+            recipients.append((
+                ride_fanout_recipient(
+                    RIDE_AUDIENCE_GROUP, MessagePlatform(platform), group["group_chat_id"]
+                ),
+                None,
+            ))
+        group_recipients = len({recipient for recipient, _ in recipients})
+
+        driver_recipients = await self._matching_driver_recipients(driver_user_ids)
+        recipients.extend(driver_recipients)
+
+        if not recipients:
             logger.info(
-                "לא נמצאו קבוצות רלוונטיות לפרסום",
+                "לא נמצאו נמענים לפרסום נסיעה",
                 extra_data={
                     "user_id": user.id,
                     "origin": posting.origin,
                     "destination": posting.destination,
                 },
             )
-            return True, message, 0, 0
-
-        sent_count = 0
-        for group in groups:
-            try:
-                platform = group["platform"]
-                group_chat_id = group["group_chat_id"]
-
-                if platform == "telegram":
-                    from app.api.webhooks.telegram import send_telegram_message
-
-                    await send_telegram_message(group_chat_id, message)
-                    sent_count += 1
-                elif platform == "whatsapp":
-                    from app.domain.services.whatsapp import (
-                        get_whatsapp_group_provider,
-                    )
-
-                    wa_provider = get_whatsapp_group_provider()
-                    if wa_provider:
-                        # הסרת HTML tags לוואטסאפ
-                        plain_message = re.sub(r"<[^>]+>", "", message)
-                        await wa_provider.send_text(group_chat_id, plain_message)
-                        sent_count += 1
-                else:
-                    logger.warning(
-                        "פלטפורמה לא מוכרת לשליחת פרסום",
-                        extra_data={"platform": platform},
-                    )
-            except Exception as e:
-                logger.error(
-                    "כשלון בשליחת פרסום נסיעה לקבוצה",
-                    extra_data={
-                        "user_id": user.id,
-                        "group_chat_id": group.get("group_chat_id"),
-                        "error": str(e),
-                    },
-                    exc_info=True,
+            return broadcast
+
+        try:
+            # savepoint — כשלון כאן לא מבטל עבודה קודמת של הקורא (למשל יצירת הנסיעה)
+            async with self._db.begin_nested():
+                await OutboxService(self._db).queue_ride_posting_broadcast(
+                    group_text=message,
+                    driver_text=f"🔔 <b>נסיעה תואמת לחיפוש שלך!</b>\n\n{message}",
+                    recipients=recipients,
+                    report_to=self._report_target(user),
                 )
+            await self._db.commit()
+        except Exception as e:
+            logger.error(
+                "כשלון בתזמון הפצת פרסום נסיעה",
+                extra_data={"user_id": user.id, "error": str(e)},
+                exc_info=True,
+            )
+            return broadcast
 
+        broadcast.groups_queued = group_recipients
+        broadcast.drivers_queued = len(driver_recipients)
         logger.info(
-            "פרסום נסיעה הושלם",
+            "פרסום נסיעה הועבר להפצה",
             extra_data={
                 "user_id": user.id,
                 "origin": posting.origin,
                 "destination": posting.destination,
-                "groups_total": len(groups),
-                "groups_sent": sent_count,
+                "groups_total": broadcast.groups_total,
+                "groups_queued": broadcast.groups_queued,
+                "drivers_queued": broadcast.drivers_queued,
             },
         )
+        return broadcast
 
-        return True, message, sent_count, len(groups)
-
-    async def notify_matching_drivers(
+    async def post_ride(
         self,
+        user: User,
         posting: ParsedRidePosting,
-        driver_name: str,
-        driver_user_ids: list[int],
-    ) -> int:
+    ) -> tuple[bool, str, int, int]:
         """
-        שליחת הודעה פרטית לנהגים עם חיפושים תואמים למסלול הנסיעה.
+        פרסום נסיעה — הפצה לקבוצות רלוונטיות (דרך ה-outbox).
 
         Args:
+            user: אובייקט המשתמש (נהג)
             posting: פרטי הנסיעה
-            driver_name: שם הנהג שפרסם
-            driver_user_ids: רשימת מזהי משתמשים לשליחה
 
         Returns:
-            מספר הודעות שנשלחו בהצלחה
+            tuple של (הצליח, הודעת תוצאה, מספר קבוצות שהועברו להפצה, סה"כ קבוצות רלוונטיות)
         """
-        if not driver_user_ids:
-            return 0
+        broadcast = await self.queue_ride_broadcast(user, posting)
+        return True, broadcast.message_text, broadcast.groups_queued, broadcast.groups_total
 
-        from app.db.models.user import User
-
-        message = self.format_ride_message(posting, driver_name)
-        notification_text = (
-            f"🔔 <b>נסיעה תואמת לחיפוש שלך!</b>\n\n"
-            f"{message}"
-        )
+    async def _matching_driver_recipients(
+        self, driver_user_ids: Sequence[int]
+    ) -> list[tuple[str, int | None]]:
+        """נמעני fan-out לנהגים עם חיפוש תואם — טלגרם אם מחובר, אחרת WhatsApp"""
+        if not driver_user_ids:
+            return []
 
         # שליפת כל הנהגים בשאילתה אחת במקום N+1
         result = await self._db.execute(
             select(User.id, User.telegram_chat_id, User.phone_number)
             .where(User.id.in_(driver_user_ids))
         )
-        drivers = result.all()
-
-        sent_count = 0
-        failed_count = 0
-        for driver in drivers:
-            try:
-                if driver.telegram_chat_id:
-                    from app.api.webhooks.telegram import (
-                        send_telegram_message_raising,
-                    )
-
-                    await send_telegram_message_raising(
-                        str(driver.telegram_chat_id), notification_text
-                    )
-                    sent_count += 1
-                elif (
-                    driver.phone_number
-                    and not driver.phone_number.startswith("tg:")
-                    and not driver.phone_number.endswith("@g.us")
-                ):
-                    from app.api.webhooks.whatsapp import (
-                        send_whatsapp_message_raising,
-                    )
+        recipients: list[tuple[str, int | None]] = []
+        for driver in result.all():
+            if driver.telegram_chat_id:
+                recipients.append((
+                    ride_fanout_recipient(
+                        RIDE_AUDIENCE_DRIVER,
+                        MessagePlatform.TELEGRAM,
+                        str(driver.telegram_chat_id),
+                    ),
+                    driver.id,
+                ))
+            elif (
+                driver.phone_number
+                and not driver.phone_number.startswith("tg:")
+                and not driver.phone_number.endswith("@g.us")
+            ):
+                recipients.append((
+                    ride_fanout_recipient(
+                        RIDE_AUDIENCE_DRIVER, MessagePlatform.WHATSAPP, driver.phone_number
+                    ),
+                    driver.id,
+                ))
+        return recipients
 
-                    await send_whatsapp_message_raising(
-                        driver.phone_number, notification_text
-                    )
-                    sent_count += 1
-            except Exception as e:
-                failed_count += 1
-                logger.error(
-                    "כשלון בשליחת התראת נסיעה תואמת לנהג",
-                    extra_data={"user_id": driver.id, "error": str(e)},
-                    exc_info=True,
-                )
-
-        logger.info(
-            "התראות נסיעה תואמת נשלחו לנהגים",
-            extra_data={
-                "driver_name": driver_name,
-                "origin": posting.origin,
-                "destination": posting.destination,
-                "total_drivers": len(driver_user_ids),
-                "sent_count": sent_count,
-                "failed_count": failed_count,
-            },
-        )
-        return sent_count
+    @staticmethod
+    def _report_target(user: User) -> tuple[MessagePlatform, str] | None:
+        """לאן לשלוח את סיכום ההפצה — לפי הפלטפורמה של המשתמש"""
+        if user.platform == MessagePlatform.TELEGRAM.value and user.telegram_chat_id:
+            return MessagePlatform.TELEGRAM, str(user.telegram_chat_id)
+        if user.phone_number and not user.phone_number.startswith("tg:"):
+            return MessagePlatform.WHATSAPP, user.phone_number
+        if user.telegram_chat_id:
+            return MessagePlatform.TELEGRAM, str(user.telegram_chat_id)
+        return None
@@ -0,0 +1,224 @@
+"""
+Role Capabilities — רשומת יכולות מחושבת מראש לניתוב תפריט לפי תפקיד.
+
+איפוס לתפריט (_resolve_role_state / _resolve_role_state_wa) שאל בכל הודעה את
+אותן שאלות: האם המשתמש סדרן פעיל בתחנה (StationDispatcher + Station), והאם
+לבעל תחנה יש תחנה פעילה (StationOwner + fallback ל-owner_id). כאן התשובות
+נשמרות ב-Redis כרשומה אחת לכל משתמש:
+
+- user:capabilities:<user_id> → {dispatcher_station_id, owned_station_ids, generation}
+- user:capabilities:generation → מונה גלובלי
+
+ביטול: listener גלובלי על Session מזהה שינוי ב-StationDispatcher / StationOwner
+(כולל add_dispatcher / remove_dispatcher / add_owner / remove_owner ב-StationService
+ויצירה ישירה בפאנל האדמין) ואחרי commit מוחק את הרשומות של המשתמשים שנגעו בהם.
+שינוי ב-Station עצמה (is_active / owner_id) משפיע על כל מי שקשור לתחנה — לכן
+מעלה את המונה הגלובלי, ורשומה עם generation ישן נחשבת החטאה. עד שהמחיקה
+ב-Redis מסתיימת, התהליך שביצע את ה-commit מחשב מה-DB.
+
+שינוי שעוקף את ה-ORM (UPDATE ישיר) צריך לקרוא ל-invalidate_role_capabilities;
+כל שינוי אחר מתעדכן לכל המאוחר כשה-TTL פוקע.
+"""
+from __future__ import annotations
+
+import json
+from collections.abc import Hashable
+from dataclasses import dataclass
+
+from sqlalchemy import inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.db.models.station import Station
+from app.db.models.station_dispatcher import StationDispatcher
+from app.db.models.station_owner import StationOwner
+from app.domain.services.session_invalidation import SessionInvalidation
+
+logger = get_logger(__name__)
+
+_KEY_PREFIX = "user:capabilities:"
+_GENERATION_KEY = "user:capabilities:generation"
+
+# שדות ב-Station שמשנים את היכולות של המשויכים אליה
+_WATCHED_STATION_FIELDS = ("is_active", "owner_id")
+
+# מפתח הביטול לשינוי בתחנה — כל הרשומות (generation), לצד user ids
+_ALL_USERS = "*"
+
+
+@dataclass(frozen=True)
+class RoleCapabilities:
+    """יכולות משתמש שקובעות את תפריט היעד"""
+
+    dispatcher_station_id: int | None
+    owned_station_ids: tuple[int, ...]
+
+    @property
+    def owner_station_id(self) -> int | None:
+        """התחנה שבעל התחנה מנהל — כמו StationService.get_station_by_owner"""
+        return self.owned_station_ids[0] if self.owned_station_ids else None
+
+
+def _key(user_id: int) -> str:
+    return f"{_KEY_PREFIX}{user_id}"
+
+
+def _is_pending(user_id: int) -> bool:
+    # ביטול שעדיין לא הגיע ל-Redis — התהליך הזה לא סומך על הרשומה עד אז
+    return _invalidation.is_pending(_ALL_USERS) or _invalidation.is_pending(user_id)
+
+
+async def get_role_capabilities(db: AsyncSession, user_id: int) -> RoleCapabilities:
+    """יכולות המשתמש — מ-Redis אם יש רשומה עדכנית, אחרת חישוב מה-DB ושמירה."""
+    if not settings.ROLE_CAPABILITY_CACHE_ENABLED or _is_pending(user_id):
+        return await _compute(db, user_id)
+
+    try:
+        from app.core.redis_client import get_redis
+
+        redis = await get_redis()
+        pipe = redis.pipeline(transaction=False)
+        pipe.get(_GENERATION_KEY)
+        pipe.get(_key(user_id))
+        raw_generation, raw_record = await pipe.execute()
+        generation = str(raw_generation or 0)
+    except Exception as e:
+        logger.warning(
+            "Redis לא זמין למטמון יכולות תפקיד — חישוב מה-DB",
+            extra_data={"user_id": user_id, "error": str(e)},
+        )
+        return await _compute(db, user_id)
+
+    if raw_record is not None:
+        record = json.loads(raw_record)
+        if record.get("generation") == generation:
+            return RoleCapabilities(
+                dispatcher_station_id=record["dispatcher_station_id"],
+                owned_station_ids=tuple(record["owned_station_ids"]),
+            )
+
+    capabilities = await _compute(db, user_id)
+    # ה-generation נקרא לפני החישוב — שינוי בתחנה באמצע משאיר רשומה שפגה מיד
+    await _store(user_id, capabilities, generation)
+    return capabilities
+
+
+async def _compute(db: AsyncSession, user_id: int) -> RoleCapabilities:
+    from app.domain.services.station_service import StationService
+
+    station_service = StationService(db)
+    dispatcher_station = await station_service.get_dispatcher_station(user_id)
+    owned_stations = await station_service.get_stations_by_owner(user_id)
+    return RoleCapabilities(
+        dispatcher_station_id=dispatcher_station.id if dispatcher_station else None,
+        owned_station_ids=tuple(station.id for station in owned_stations),
+    )
+
+
+async def _store(user_id: int, capabilities: RoleCapabilities, generation: str) -> None:
+    if _is_pending(user_id):
+        return
+    record = {
+        "dispatcher_station_id": capabilities.dispatcher_station_id,
+        "owned_station_ids": list(capabilities.owned_station_ids),
+        "generation": generation,
+    }
+    try:
+        from app.core.redis_client import get_redis
+
+        redis = await get_redis()
+        await redis.set(
+            _key(user_id),
+            json.dumps(record),
+            ex=settings.ROLE_CAPABILITY_CACHE_TTL_SECONDS,
+        )
+    except Exception as e:
+        logger.warning(
+            "כשלון בשמירת יכולות תפקיד ב-Redis",
+            extra_data={"user_id": user_id, "error": str(e)},
+        )
+
+
+async def invalidate_role_capabilities(*user_ids: int, all_users: bool = False) -> None:
+    """
+    ביטול רשומות יכולות — של משתמשים מסוימים, או של כולם (all_users).
+
+    נקרא אוטומטית אחרי commit שמשנה סדרנים / בעלים / תחנות דרך ה-ORM; יש
+    לקרוא ידנית אחרי UPDATE ישיר על הטבלאות האלה.
+    """
+    if not user_ids and not all_users:
+        return
+    try:
+        from app.core.redis_client import get_redis
+
+        redis = await get_redis()
+        if all_users:
+            await redis.incr(_GENERATION_KEY)
+        if user_ids:
+            await redis.delete(*(_key(user_id) for user_id in user_ids))
+    except Exception as e:
+        # הרשומות ב-Redis יפקעו לבד אחרי ROLE_CAPABILITY_CACHE_TTL_SECONDS
+        logger.warning(
+            "כשלון בביטול מטמון יכולות תפקיד ב-Redis",
+            extra_data={"user_ids": list(user_ids), "all_users": all_users, "error": str(e)},
+        )
+
+
+def reset_role_capabilities() -> None:
+    """ניקוי ביטולים ממתינים בתהליך (לבדיקות)"""
+    _invalidation.reset()
+
+
+# ── ביטול אוטומטי אחרי commit ──
+
+
+def _attribute_values(obj: object, field: str) -> set[object]:
+    """הערך הנוכחי והקודם של שדה (לשינוי user_id / owner_id)"""
+    history = inspect(obj).attrs[field].history
+    values = {getattr(obj, field)}
+    values.update(history.deleted or ())
+    return {value for value in values if value is not None}
+
+
+def _collect_changes(session: Session) -> set[Hashable]:
+    """משתמשים שהשתנו ב-flush, ו-_ALL_USERS כשתחנה השתנתה"""
+    changed: set[Hashable] = set()
+    stations_changed = False
+
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, (StationDispatcher, StationOwner)):
+            changed.update(_attribute_values(obj, "user_id"))
+
+    for obj in session.new:
+        if isinstance(obj, Station):
+            # תחנה חדשה — רק הבעלים דרך owner_id מושפע
+            changed.update(_attribute_values(obj, "owner_id"))
+    for obj in session.dirty:
+        if not isinstance(obj, Station):
+            continue
+        state = inspect(obj)
+        if any(state.attrs[field].history.has_changes() for field in _WATCHED_STATION_FIELDS):
+            stations_changed = True
+    if any(isinstance(obj, Station) for obj in session.deleted):
+        stations_changed = True
+
+    if stations_changed:
+        changed.add(_ALL_USERS)
+    return changed
+
+
+async def _invalidate_after_commit(keys: frozenset[Hashable]) -> None:
+    user_ids = [key for key in keys if key != _ALL_USERS]
+    await invalidate_role_capabilities(*user_ids, all_users=_ALL_USERS in keys)
+
+
+_invalidation = SessionInvalidation(
+    "role_capabilities", _collect_changes, _invalidate_after_commit
+)
+
+
+def register_role_capability_listeners() -> None:
+    """רישום listeners גלובליים על Session — בהפעלת האפליקציה וה-worker."""
+    _invalidation.register()
@@ -0,0 +1,100 @@
+"""
+Session Invalidation — ביטול רשומות מטמון אחרי commit, דרך listeners גלובליים על Session.
+
+מטמון שנגזר מטבלאות (user_identity_cache, role_capabilities) צריך לדעת מה
+השתנה בטרנזקציה, ולבטל רק אחרי commit מוצלח:
+
+- after_flush — collect(session) מחזיר את המפתחות שהשתנו ב-flush (למשל user ids).
+  המפתחות נצברים ב-session.info עד סוף הטרנזקציה
+- after_commit — on_commit (סינכרוני, למשל שכבה מקומית בתהליך) ואז invalidate
+  כ-task ברקע. עד שה-task מסתיים המפתחות מסומנים כ-pending (is_pending), כך
+  שהתהליך שביצע את ה-commit לא סומך על רשומה שעוד לא נמחקה
+- after_rollback — המפתחות נזנחים
+
+בלי event loop רץ (commit מקוד סינכרוני) רק on_commit רץ — הרשומות ב-Redis
+יפקעו לבד כשה-TTL שלהן פוקע.
+"""
+from __future__ import annotations
+
+import asyncio
+from collections import Counter
+from collections.abc import Awaitable, Callable, Hashable
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+Collector = Callable[[Session], set[Hashable]]
+
+
+class SessionInvalidation:
+    """listeners של after_flush / after_commit / after_rollback למטמון אחד"""
+
+    def __init__(
+        self,
+        name: str,
+        collect: Collector,
+        invalidate: Callable[[frozenset[Hashable]], Awaitable[None]],
+        *,
+        on_commit: Callable[[frozenset[Hashable]], None] | None = None,
+    ) -> None:
+        # מפתח ב-session.info — מה השתנה בטרנזקציה הנוכחית
+        self._info_key = f"{name}_changed"
+        self._collect = collect
+        self._invalidate = invalidate
+        self._on_commit = on_commit
+        # הפניות חזקות ל-tasks של ביטול ב-Redis
+        self._tasks: set[asyncio.Task] = set()
+        # ביטולים שעדיין לא הגיעו ל-Redis
+        self._pending: Counter[Hashable] = Counter()
+
+    def is_pending(self, key: Hashable) -> bool:
+        return self._pending[key] > 0
+
+    def register(self) -> None:
+        """רישום ה-listeners על Session — פעם אחת לתהליך."""
+        if event.contains(Session, "after_flush", self._on_after_flush):
+            return
+        event.listen(Session, "after_flush", self._on_after_flush)
+        event.listen(Session, "after_commit", self._on_after_commit)
+        event.listen(Session, "after_rollback", self._on_after_rollback)
+
+    async def drain(self) -> None:
+        """המתנה לביטולים שבדרך ל-Redis"""
+        await asyncio.gather(*list(self._tasks))
+
+    def reset(self) -> None:
+        """ניקוי ביטולים ממתינים בתהליך (לבדיקות)"""
+        self._pending.clear()
+
+    def _on_after_flush(self, session: Session, flush_context: object) -> None:
+        changed = self._collect(session)
+        if changed:
+            session.info.setdefault(self._info_key, set()).update(changed)
+
+    def _on_after_commit(self, session: Session) -> None:
+        changed = session.info.pop(self._info_key, None)
+        if not changed:
+            return
+        keys = frozenset(changed)
+        if self._on_commit is not None:
+            self._on_commit(keys)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._pending.update(keys)
+        task = loop.create_task(self._invalidate_after_commit(keys))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _on_after_rollback(self, session: Session) -> None:
+        session.info.pop(self._info_key, None)
+
+    async def _invalidate_after_commit(self, keys: frozenset[Hashable]) -> None:
+        try:
+            await self._invalidate(keys)
+        finally:
+            for key in keys:
+                self._pending[key] -= 1
+                if self._pending[key] <= 0:
+                    del self._pending[key]
@@ -0,0 +1,655 @@
+"""
+Telegram Inbound Queue — קליטה מהירה של updates לתור עמיד (Redis Streams).
+
+במצב הרגיל ה-webhook מריץ את כל העבודה לפני שהוא מחזיר 200: זיהוי משתמש,
+state machine, commits ושליחות. update איטי גורם ל-Telegram לשלוח אותו שוב,
+ו-burst של updates תופס את כל ה-workers של uvicorn. כשהתור פעיל
+(TELEGRAM_INBOUND_QUEUE_ENABLED):
+
+1. ה-webhook מאמת את ה-update, מוסיף אותו ל-stream ומחזיר מיד
+2. ה-streams מחולקים ל-shards לפי hash של ה-chat — כל ה-updates של צ'אט
+   נמצאים באותו stream, לפי סדר ההגעה
+3. בכל worker runtime רץ TelegramInboundConsumer. כל shard מוחזק ע"י consumer
+   אחד בלבד (lease ב-Redis), ובתוך ה-consumer updates של אותו צ'אט רצים
+   בשרשרת וצ'אטים שונים רצים במקביל (עד TELEGRAM_INBOUND_CONCURRENCY)
+4. אחרי עיבוד — XACK + XDEL. אורך ה-stream הוא לכן ה-backlog האמיתי
+5. consumer שמקבל shard (עלייה, או lease שפקע אחרי קריסה) לוקח קודם את
+   ה-entries שנשארו pending ומעבד אותם לפני entries חדשים. entry נלקח רק
+   אחרי שהיה idle לפחות TELEGRAM_INBOUND_LEASE_SECONDS — עד אז לא קוראים
+   entries חדשים מה-shard
+
+update שהעיבוד שלו נכשל, או שנמסר TELEGRAM_INBOUND_MAX_DELIVERIES פעמים בלי
+ack (קריסה חוזרת), עובר ל-dead letter stream. replay_dead_letters (וגם
+scripts/replay_telegram_inbound.py) מחזיר אותם לתור.
+
+backpressure: כשה-backlog של shard מגיע ל-TELEGRAM_INBOUND_MAX_BACKLOG,
+enqueue_update זורק InboundBacklogFull וה-webhook מחזיר 503 — Telegram שומר
+את ה-update אצלו ושולח שוב. אם Redis לא זמין, enqueue_update מחזיר None
+וה-webhook מעבד inline כמו קודם.
+
+ההבטחה היא at-least-once: קריסה אחרי העיבוד ולפני ה-ack תעבד את ה-update שוב.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import socket
+import time
+import uuid
+import zlib
+from bisect import bisect_left
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from app.core.config import settings
+from app.core.logging import get_logger, set_correlation_id
+
+if TYPE_CHECKING:
+    from redis.asyncio import Redis
+
+logger = get_logger(__name__)
+
+INBOUND_STREAM_PREFIX = "telegram:inbound:"
+INBOUND_DEAD_STREAM_KEY = "telegram:inbound:dead"
+INBOUND_GROUP = "telegram-inbound"
+_LEASE_KEY_PREFIX = "telegram:inbound:lease:"
+_METRICS_KEY = "telegram:inbound:metrics"
+
+LATENCY_BUCKETS: tuple[float, ...] = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# מונים ב-hash של המטריקות
+COUNTERS: dict[str, str] = {
+    "enqueued": "Updates appended to the inbound stream",
+    "processed": "Updates processed and acknowledged",
+    "dead": "Updates moved to the dead letter stream",
+    "rejected": "Updates rejected with 503 because the shard backlog was full",
+    "inline_fallback": "Updates processed inline because Redis was unavailable",
+    "reclaimed": "Pending updates taken over from another consumer",
+    "replayed": "Dead letters returned to the inbound stream",
+}
+
+InboundHandler = Callable[[dict], Awaitable[None]]
+
+
+class InboundBacklogFull(Exception):
+    """ה-backlog של ה-shard מלא — ה-webhook מחזיר 503 ו-Telegram ישלח שוב"""
+
+    def __init__(self, shard: int, backlog: int) -> None:
+        super().__init__(f"Telegram inbound shard {shard} backlog is full ({backlog})")
+        self.shard = shard
+        self.backlog = backlog
+
+
+def shard_for(chat_key: str) -> int:
+    """shard קבוע לצ'אט — כל ה-updates שלו באותו stream"""
+    return zlib.crc32(chat_key.encode("utf-8")) % settings.TELEGRAM_INBOUND_SHARDS
+
+
+def stream_key(shard: int) -> str:
+    return f"{INBOUND_STREAM_PREFIX}{shard}"
+
+
+def _lease_key(shard: int) -> str:
+    return f"{_LEASE_KEY_PREFIX}{shard}"
+
+
+def _entry_age_seconds(entry_id: str, now_ms: float | None = None) -> float:
+    """גיל entry לפי ה-timestamp שב-id של Redis (<ms>-<seq>)"""
+    now_ms = time.time() * 1000 if now_ms is None else now_ms
+    return max(0.0, (now_ms - int(entry_id.split("-", 1)[0])) / 1000)
+
+
+async def enqueue_update(payload: dict, chat_key: str) -> str | None:
+    """הוספת update ל-stream של הצ'אט.
+
+    מחזיר את ה-id של ה-entry, או None אם Redis לא זמין (הקורא מעבד inline).
+    זורק InboundBacklogFull כשה-shard מלא.
+    """
+    shard = shard_for(chat_key)
+    key = stream_key(shard)
+    try:
+        from app.core.redis_client import get_redis
+
+        redis = await get_redis()
+        backlog = await redis.xlen(key)
+        if backlog >= settings.TELEGRAM_INBOUND_MAX_BACKLOG:
+            await redis.hincrby(_METRICS_KEY, "rejected", 1)
+            raise InboundBacklogFull(shard, backlog)
+
+        pipe = redis.pipeline(transaction=False)
+        pipe.xadd(key, {"chat": chat_key, "update": json.dumps(payload, ensure_ascii=False)})
+        pipe.hincrby(_METRICS_KEY, "enqueued", 1)
+        entry_id, _ = await pipe.execute()
+        return entry_id
+    except InboundBacklogFull:
+        raise
+    except Exception as e:
+        logger.warning(
+            "כשלון בהוספת update לתור הנכנס — עיבוד inline",
+            extra_data={"error": str(e), "shard": shard},
+        )
+        await record_inline_fallback()
+        return None
+
+
+async def record_inline_fallback() -> None:
+    try:
+        from app.core.redis_client import get_redis
+
+        redis = await get_redis()
+        await redis.hincrby(_METRICS_KEY, "inline_fallback", 1)
+    except Exception:
+        pass
+
+
+class TelegramInboundConsumer:
+    """consumer לאורך חיי ה-worker: leases על shards, שרשרת לכל צ'אט ו-ack.
+
+    handler מקבל את ה-payload של ה-update (dict) ומעבד אותו. חריגה ממנו
+    מעבירה את ה-update ל-dead letter.
+    """
+
+    def __init__(self, handler: InboundHandler, name: str | None = None) -> None:
+        self._handler = handler
+        # סיומת ייחודית לכל הפעלה — אחרי restart עם אותו pid, ה-entries שנשארו
+        # pending אצל ההפעלה הקודמת שייכים ל-consumer אחר ונלקחים ב-_take_over
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._owned: set[int] = set()
+        # shards שנשארו בהם entries pending של consumer אחר שעוד לא נלקחו
+        self._reclaiming: set[int] = set()
+        self._slots = asyncio.Semaphore(settings.TELEGRAM_INBOUND_CONCURRENCY)
+        # הזנב של השרשרת לכל צ'אט — entry חדש ממתין לקודם באותו צ'אט
+        self._chat_tails: dict[str, asyncio.Task] = {}
+        self._in_flight: set[asyncio.Task] = set()
+        # תצפיות latency מאז ה-flush האחרון: [counts לכל bucket + Inf, sum]
+        self._latency: list[float] = [0.0] * (len(LATENCY_BUCKETS) + 2)
+        self._counts: dict[str, int] = {}
+
+    @property
+    def owned_shards(self) -> set[int]:
+        return set(self._owned)
+
+    @property
+    def _max_buffered(self) -> int:
+        # entries שנקראו ועוד לא הסתיימו — לא קוראים עוד מעבר לזה
+        return settings.TELEGRAM_INBOUND_CONCURRENCY * 4
+
+    async def run(self) -> None:
+        """לולאת הקריאה — רצה עד ביטול (כיבוי ה-worker)."""
+        logger.info("Telegram inbound consumer started", extra_data={"consumer": self.name})
+        try:
+            while True:
+                try:
+                    await self.poll_once()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning(
+                        "כשלון בקריאה מהתור הנכנס של טלגרם — ניסיון חוזר",
+                        extra_data={"error": str(e), "consumer": self.name},
+                    )
+                    await asyncio.sleep(settings.TELEGRAM_INBOUND_BLOCK_SECONDS)
+        finally:
+            tasks = list(self._in_flight)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self._release_leases()
+            await self._flush_metrics()
+
+    async def poll_once(self, block_seconds: float | None = None) -> int:
+        """רענון leases, קריאת batch מה-shards שבבעלות וחלוקה לשרשראות.
+
+        מחזיר את מספר ה-entries שנקראו.
+        """
+        from app.core.redis_client import get_redis
+
+        redis = await get_redis()
+        await self._refresh_leases(redis)
+        await self._flush_metrics()
+
+        block = settings.TELEGRAM_INBOUND_BLOCK_SECONDS if block_seconds is None else block_seconds
+        readable = self._owned - self._reclaiming
+        if not readable:
+            await asyncio.sleep(block)
+            return 0
+        capacity = self._max_buffered - len(self._in_flight)
+        if capacity <= 0:
+            # backpressure פנימי — ממתינים שמשהו יסתיים לפני קריאה נוספת
+            await asyncio.wait(
+                list(self._in_flight), timeout=block, return_when=asyncio.FIRST_COMPLETED
+            )
+            return 0
+
+        response = await redis.xreadgroup(
+            INBOUND_GROUP,
+            self.name,
+            {stream_key(shard): ">" for shard in sorted(readable)},
+            count=capacity,
+            block=int(block * 1000),
+        )
+        read = 0
+        for stream, entries in response or []:
+            for entry_id, fields in entries:
+                self._dispatch(stream, entry_id, fields)
+                read += 1
+        return read
+
+    async def drain(self) -> None:
+        """המתנה לסיום כל ה-entries שבעבודה (בדיקות / כיבוי מסודר)."""
+        while self._in_flight:
+            await asyncio.gather(*list(self._in_flight), return_exceptions=True)
+        await self._flush_metrics()
+
+    # ── leases ──
+
+    async def _refresh_leases(self, redis: Redis) -> None:
+        """לקיחת shards פנויים וחידוש ה-lease על shards שבבעלות.
+
+        ה-lease פוקע אחרי TELEGRAM_INBOUND_LEASE_SECONDS בלי חידוש — consumer
+        שקרס משחרר את ה-shards שלו לאחרים.
+        """
+        ttl = settings.TELEGRAM_INBOUND_LEASE_SECONDS
+        shards = range(settings.TELEGRAM_INBOUND_SHARDS)
+        pipe = redis.pipeline(transaction=False)
+        for shard in shards:
+            pipe.set(_lease_key(shard), self.name, nx=True, ex=ttl)
+            pipe.get(_lease_key(shard))
+        results = await pipe.execute()
+
+        owned = {shard for shard, holder in zip(shards, results[1::2]) if holder == self.name}
+        acquired = owned - self._owned
+        lost = self._owned - owned
+        if lost:
+            logger.warning(
+                "lease על shards של התור הנכנס אבד",
+                extra_data={"consumer": self.name, "shards": sorted(lost)},
+            )
+
+        renew = redis.pipeline(transaction=False)
+        for shard in owned - acquired:
+            renew.expire(_lease_key(shard), ttl)
+        await renew.execute()
+
+        self._owned = owned
+        self._reclaiming &= owned
+        for shard in sorted(acquired | self._reclaiming):
+            if await self._take_over(redis, shard):
+                self._reclaiming.discard(shard)
+            else:
+                self._reclaiming.add(shard)
+
+    async def _release_leases(self) -> None:
+        if not self._owned:
+            return
+        try:
+            from app.core.redis_client import get_redis
+
+            redis = await get_redis()
+            for shard in self._owned:
+                if await redis.get(_lease_key(shard)) == self.name:
+                    await redis.delete(_lease_key(shard))
+        except Exception as e:
+            logger.warning(
+                "כשלון בשחרור leases של התור הנכנס",
+                extra_data={"error": str(e), "consumer": self.name},
+            )
+        self._owned = set()
+        self._reclaiming = set()
+
+    async def _take_over(self, redis: Redis, shard: int) -> bool:
+        """shard חדש בבעלות: יצירת ה-group ולקיחת entries שנשארו pending.
+
+        ה-entries נלקחים לפי הסדר ומשורשרים לפני כל entry חדש — כך update
+        שנתקע אצל consumer שקרס לא נעקף ע"י update מאוחר יותר מאותו צ'אט.
+        entry נלקח רק אחרי TELEGRAM_INBOUND_LEASE_SECONDS בלי מסירה — consumer
+        שה-lease שלו פקע אבל עדיין חי לא מאבד entry שהוא באמצע לעבד.
+
+        מחזיר False אם נשאר entry שעוד לא נלקח — ה-shard לא נקרא עד שהוא נלקח
+        (ניסיון חוזר בכל רענון leases).
+        """
+        key = stream_key(shard)
+        try:
+            await redis.xgroup_create(key, INBOUND_GROUP, id="0", mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+        min_idle_ms = settings.TELEGRAM_INBOUND_LEASE_SECONDS * 1000
+        start = "-"
+        while True:
+            page = await redis.xpending_range(key, INBOUND_GROUP, start, "+", self._max_buffered)
+            if not page:
+                return True
+            start = f"({page[-1]['message_id']}"
+            pending = []
+            blocked = False
+            for entry in page:
+                if entry["consumer"] == self.name:
+                    continue
+                if entry["time_since_delivered"] < min_idle_ms:
+                    # entries מאוחרים יותר ממתינים — אחרת הם יעקפו את זה
+                    blocked = True
+                    break
+                pending.append(entry)
+            if pending:
+                deliveries = {p["message_id"]: p["times_delivered"] for p in pending}
+                claimed = await redis.xclaim(
+                    key, INBOUND_GROUP, self.name, min_idle_ms, list(deliveries)
+                )
+                self._count("reclaimed", len(claimed))
+                for entry_id, fields in claimed:
+                    if deliveries.get(entry_id, 0) >= settings.TELEGRAM_INBOUND_MAX_DELIVERIES:
+                        await self._dead_letter(
+                            redis, key, entry_id, fields, "max deliveries exceeded"
+                        )
+                    else:
+                        self._dispatch(key, entry_id, fields)
+                if len(claimed) < len(deliveries):
+                    return False
+            if blocked:
+                return False
+
+    # ── עיבוד ──
+
+    def _dispatch(self, stream: str, entry_id: str, fields: dict) -> None:
+        chat_key = fields.get("chat") or entry_id
+        previous = self._chat_tails.get(chat_key)
+        task = asyncio.create_task(self._process(previous, stream, entry_id, fields))
+        self._chat_tails[chat_key] = task
+        self._in_flight.add(task)
+
+        def _done(done: asyncio.Task) -> None:
+            self._in_flight.discard(done)
+            if self._chat_tails.get(chat_key) is done:
+                del self._chat_tails[chat_key]
+
+        task.add_done_callback(_done)
+
+    async def _process(
+        self,
+        previous: asyncio.Task | None,
+        stream: str,
+        entry_id: str,
+        fields: dict,
+    ) -> None:
+        if previous is not None:
+            # סדר לכל צ'אט — כשלון של הקודם לא עוצר את הבא
+            await asyncio.gather(previous, return_exceptions=True)
+
+        from app.core.redis_client import get_redis
+
+        async with self._slots:
+            set_correlation_id()
+            try:
+                await self._handler(json.loads(fields["update"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(
+                    "עיבוד update מהתור הנכנס נכשל — מעבר ל-dead letter",
+                    extra_data={"entry_id": entry_id, "stream": stream, "error": str(e)},
+                    exc_info=True,
+                )
+                await self._dead_letter(await get_redis(), stream, entry_id, fields, str(e))
+                return
+
+        redis = await get_redis()
+        pipe = redis.pipeline(transaction=False)
+        pipe.xack(stream, INBOUND_GROUP, entry_id)
+        pipe.xdel(stream, entry_id)
+        await pipe.execute()
+        self._count("processed")
+        self._observe_latency(_entry_age_seconds(entry_id))
+
+    async def _dead_letter(
+        self, redis: Redis, stream: str, entry_id: str, fields: dict, error: str
+    ) -> None:
+        pipe = redis.pipeline(transaction=False)
+        pipe.xadd(INBOUND_DEAD_STREAM_KEY, {
+            "chat": fields.get("chat", ""),
+            "update": fields.get("update", ""),
+            "source_id": entry_id,
+            "error": error[:500],
+        })
+        pipe.xack(stream, INBOUND_GROUP, entry_id)
+        pipe.xdel(stream, entry_id)
+        await pipe.execute()
+        self._count("dead")
+
+    # ── מטריקות ──
+
+    def _count(self, counter: str, amount: int = 1) -> None:
+        if amount:
+            self._counts[counter] = self._counts.get(counter, 0) + amount
+
+    def _observe_latency(self, seconds: float) -> None:
+        self._latency[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self._latency[-1] += seconds
+
+    async def _flush_metrics(self) -> None:
+        """כתיבת המונים וה-latency ל-Redis ב-pipeline אחד. best-effort."""
+        if not self._counts and not any(self._latency[:-1]):
+            return
+        counts, self._counts = self._counts, {}
+        latency, self._latency = self._latency, [0.0] * (len(LATENCY_BUCKETS) + 2)
+        try:
+            from app.core.redis_client import get_redis
+
+            redis = await get_redis()
+            pipe = redis.pipeline(transaction=False)
+            for counter, amount in counts.items():
+                pipe.hincrby(_METRICS_KEY, counter, amount)
+            bounds = [f"{b:g}" for b in LATENCY_BUCKETS] + ["+Inf"]
+            for bound, count in zip(bounds, latency[:-1]):
+                if count:
+                    pipe.hincrby(_METRICS_KEY, f"latency|{bound}", int(count))
+            if any(latency[:-1]):
+                pipe.hincrby(_METRICS_KEY, "latency|count", int(sum(latency[:-1])))
+                pipe.hincrbyfloat(_METRICS_KEY, "latency|sum", latency[-1])
+            await pipe.execute()
+        except Exception as e:
+            logger.warning(
+                "כשלון בכתיבת מטריקות התור הנכנס",
+                extra_data={"error": str(e)},
+            )
+
+
+# ── מטריקות backpressure ──
+
+
+@dataclass
+class InboundShardStats:
+    shard: int
+    backlog: int  # entries שלא עובדו (כולל pending)
+    pending: int  # נקראו ע"י consumer ועוד לא אושרו
+    oldest_age_seconds: float
+    consumer: str | None  # מחזיק ה-lease
+
+
+@dataclass
+class InboundQueueStats:
+    shards: list[InboundShardStats]
+    dead_letters: int
+    counters: dict[str, int]
+    latency_buckets: dict[str, int]  # le → ספירה מצטברת (כולל +Inf)
+    latency_count: int
+    latency_sum: float
+
+    @property
+    def backlog(self) -> int:
+        return sum(s.backlog for s in self.shards)
+
+    @property
+    def oldest_age_seconds(self) -> float:
+        return max((s.oldest_age_seconds for s in self.shards), default=0.0)
+
+
+async def read_inbound_stats() -> InboundQueueStats:
+    """מצב התור מכל ה-shards + המונים המצטברים, ב-round trip אחד"""
+    from app.core.redis_client import get_redis
+
+    redis = await get_redis()
+    shards = range(settings.TELEGRAM_INBOUND_SHARDS)
+    pipe = redis.pipeline(transaction=False)
+    for shard in shards:
+        pipe.xlen(stream_key(shard))
+        pipe.xrange(stream_key(shard), "-", "+", count=1)
+        pipe.get(_lease_key(shard))
+    pipe.xlen(INBOUND_DEAD_STREAM_KEY)
+    pipe.hgetall(_METRICS_KEY)
+    results = await pipe.execute()
+
+    # pending לכל shard — רק ל-shards שקיים בהם group
+    pending: dict[int, int] = {}
+    for shard in shards:
+        if not results[shard * 3]:
+            continue
+        try:
+            summary = await redis.xpending(stream_key(shard), INBOUND_GROUP)
+            pending[shard] = int(summary.get("pending", 0))
+        except Exception:
+            pending[shard] = 0
+
+    now_ms = time.time() * 1000
+    stats: list[InboundShardStats] = []
+    for shard in shards:
+        backlog, first, holder = results[shard * 3: shard * 3 + 3]
+        stats.append(InboundShardStats(
+            shard=shard,
+            backlog=int(backlog or 0),
+            pending=pending.get(shard, 0),
+            oldest_age_seconds=round(_entry_age_seconds(first[0][0], now_ms), 3) if first else 0.0,
+            consumer=holder,
+        ))
+
+    raw = results[-1] or {}
+    cumulative: dict[str, int] = {}
+    running = 0
+    for bound in [f"{b:g}" for b in LATENCY_BUCKETS] + ["+Inf"]:
+        running += int(raw.get(f"latency|{bound}", 0))
+        cumulative[bound] = running
+    return InboundQueueStats(
+        shards=stats,
+        dead_letters=int(results[-2] or 0),
+        counters={name: int(raw.get(name, 0)) for name in COUNTERS},
+        latency_buckets=cumulative,
+        latency_count=int(raw.get("latency|count", 0)),
+        latency_sum=float(raw.get("latency|sum", 0.0)),
+    )
+
+
+def render_prometheus(stats: InboundQueueStats) -> str:
+    """ייצוא מצב התור בפורמט Prometheus text exposition"""
+    lines = [
+        "# HELP telegram_inbound_backlog Unprocessed updates in the inbound stream",
+        "# TYPE telegram_inbound_backlog gauge",
+    ]
+    lines += [f'telegram_inbound_backlog{{shard="{s.shard}"}} {s.backlog}' for s in stats.shards]
+    lines += [
+        "# HELP telegram_inbound_pending Updates read by a consumer and not acknowledged yet",
+        "# TYPE telegram_inbound_pending gauge",
+    ]
+    lines += [f'telegram_inbound_pending{{shard="{s.shard}"}} {s.pending}' for s in stats.shards]
+    lines += [
+        "# HELP telegram_inbound_oldest_age_seconds Age of the oldest unprocessed update",
+        "# TYPE telegram_inbound_oldest_age_seconds gauge",
+    ]
+    lines += [
+        f'telegram_inbound_oldest_age_seconds{{shard="{s.shard}"}} {s.oldest_age_seconds:g}'
+        for s in stats.shards
+    ]
+    lines += [
+        "# HELP telegram_inbound_dead_letters Updates in the dead letter stream",
+        "# TYPE telegram_inbound_dead_letters gauge",
+        f"telegram_inbound_dead_letters {stats.dead_letters}",
+        "# HELP telegram_inbound_updates_total Inbound update outcomes",
+        "# TYPE telegram_inbound_updates_total counter",
+    ]
+    lines += [
+        f'telegram_inbound_updates_total{{outcome="{name}"}} {value}'
+        for name, value in stats.counters.items()
+    ]
+    lines += [
+        "# HELP telegram_inbound_latency_seconds Time from webhook receipt until the update was processed",
+        "# TYPE telegram_inbound_latency_seconds histogram",
+    ]
+    lines += [
+        f'telegram_inbound_latency_seconds_bucket{{le="{bound}"}} {count}'
+        for bound, count in stats.latency_buckets.items()
+    ]
+    lines += [
+        f"telegram_inbound_latency_seconds_count {stats.latency_count}",
+        f"telegram_inbound_latency_seconds_sum {stats.latency_sum:g}",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+# ── replay ──
+
+
+@dataclass
+class DeadLetter:
+    entry_id: str
+    chat: str
+    source_id: str
+    error: str
+    update: dict
+
+
+async def list_dead_letters(count: int = 100) -> list[DeadLetter]:
+    """ה-dead letters הוותיקים ביותר, לפי הסדר"""
+    from app.core.redis_client import get_redis
+
+    redis = await get_redis()
+    entries = await redis.xrange(INBOUND_DEAD_STREAM_KEY, "-", "+", count=count)
+    return [
+        DeadLetter(
+            entry_id=entry_id,
+            chat=fields.get("chat", ""),
+            source_id=fields.get("source_id", ""),
+            error=fields.get("error", ""),
+            update=json.loads(fields.get("update") or "{}"),
+        )
+        for entry_id, fields in entries
+    ]
+
+
+async def replay_dead_letters(
+    entry_ids: list[str] | None = None, count: int = 100
+) -> list[str]:
+    """החזרת dead letters לתור הנכנס (לפי הסדר) ומחיקתם מה-dead letter stream.
+
+    entry_ids=None — עד count מהוותיקים ביותר. מחזיר את ה-ids שהוחזרו.
+    ה-updates נכנסים לסוף ה-stream של הצ'אט — אחרי updates שהגיעו בינתיים.
+    """
+    from app.core.redis_client import get_redis
+
+    redis = await get_redis()
+    if entry_ids is None:
+        entries = await redis.xrange(INBOUND_DEAD_STREAM_KEY, "-", "+", count=count)
+    else:
+        entries = []
+        for entry_id in entry_ids:
+            entries += await redis.xrange(INBOUND_DEAD_STREAM_KEY, entry_id, entry_id)
+
+    replayed: list[str] = []
+    for entry_id, fields in entries:
+        chat_key = fields.get("chat") or entry_id
+        pipe = redis.pipeline(transaction=False)
+        pipe.xadd(stream_key(shard_for(chat_key)), {
+            "chat": chat_key,
+            "update": fields.get("update", ""),
+        })
+        pipe.xdel(INBOUND_DEAD_STREAM_KEY, entry_id)
+        pipe.hincrby(_METRICS_KEY, "replayed", 1)
+        await pipe.execute()
+        replayed.append(entry_id)
+    if replayed:
+        logger.info(
+            "dead letters של התור הנכנס הוחזרו לעיבוד",
+            extra_data={"count": len(replayed)},
+        )
+    return replayed
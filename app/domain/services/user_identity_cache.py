@@ -0,0 +1,292 @@
+"""
+User Identity Cache — מטמון קצר-TTL לזיהוי משתמש ב-webhooks.
+
+כל הודעה נכנסת עוברת get_or_create_user — ב-Telegram שאילתה ממוינת על
+telegram_chat_id, ב-WhatsApp עד שלוש שאילתות (BSUID, sender, טלפון) עם מיון.
+כאן נשמר המיפוי מזהה → snapshot מצומצם של המשתמש, בשתי שכבות:
+
+1. מקומית בתהליך — TTL קצר (USER_IDENTITY_CACHE_LOCAL_TTL_SECONDS), LRU חסום
+2. Redis — משותף לכל ה-workers (USER_IDENTITY_CACHE_TTL_SECONDS)
+
+מפתחות:
+- user:identity:<kind>:<identifier> → user_id
+- user:snapshot:<user_id> → {id, role, approval_status, platform}
+
+פגיעה במטמון מחליפה את שאילתות החיפוש ב-db.get(User, id) לפי primary key
+(ללא שאילתה כשהמשתמש כבר ב-identity map של הסשן). המשתמש שנטען נבדק מול
+המזהה (predicate של הקורא) — אי-התאמה מוחקת את הרשומה וחוזרים לחיפוש המלא.
+
+ביטול: listener גלובלי על Session מזהה שינוי ב-role / approval_status /
+is_active / מזהים של User (כולל מחיקה) ואחרי commit מוחק את ה-snapshot של
+המשתמש — מיפוי identity שמצביע ל-snapshot חסר נחשב החטאה. שינוי שעוקף את
+ה-ORM (UPDATE ישיר) צריך לקרוא ל-invalidate_user_identity. שינוי מבני אחר
+(למשל משתמש חדש עם אותו טלפון) מתעדכן לכל המאוחר כשה-TTL פוקע.
+"""
+from __future__ import annotations
+
+import json
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable, Iterable
+from dataclasses import asdict, dataclass
+
+from sqlalchemy import inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.db.models.user import User
+from app.domain.services.session_invalidation import SessionInvalidation
+
+logger = get_logger(__name__)
+
+_IDENTITY_PREFIX = "user:identity:"
+_SNAPSHOT_PREFIX = "user:snapshot:"
+
+# שדות שמשנים את תוצאת הזיהוי או את ה-snapshot
+_WATCHED_FIELDS = (
+    "role",
+    "approval_status",
+    "is_active",
+    "platform",
+    "telegram_chat_id",
+    "phone_number",
+    "external_user_id",
+)
+
+
+@dataclass(frozen=True)
+class UserSnapshot:
+    """תמונת מצב מצומצמת של משתמש מזוהה"""
+
+    user_id: int
+    role: str | None
+    approval_status: str | None
+    platform: str | None
+
+    @classmethod
+    def from_user(cls, user: User) -> UserSnapshot:
+        return cls(
+            user_id=user.id,
+            role=user.role.value if user.role else None,
+            approval_status=user.approval_status.value if user.approval_status else None,
+            platform=user.platform,
+        )
+
+
+class _LocalCache:
+    """מילון עם TTL ו-LRU חסום — לכל תהליך"""
+
+    def __init__(self) -> None:
+        self._entries: OrderedDict[object, tuple[object, float]] = OrderedDict()
+
+    def get(self, key: object) -> object | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: object, value: object) -> None:
+        ttl = settings.USER_IDENTITY_CACHE_LOCAL_TTL_SECONDS
+        self._entries[key] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > settings.USER_IDENTITY_CACHE_LOCAL_MAX_ENTRIES:
+            self._entries.popitem(last=False)
+
+    def pop(self, key: object) -> None:
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+_local_identities = _LocalCache()
+_local_snapshots = _LocalCache()
+
+
+def _identity_key(kind: str, identifier: str) -> str:
+    return f"{_IDENTITY_PREFIX}{kind}:{identifier}"
+
+
+def _snapshot_key(user_id: int) -> str:
+    return f"{_SNAPSHOT_PREFIX}{user_id}"
+
+
+async def get_user_snapshot(kind: str, identifier: str) -> UserSnapshot | None:
+    """snapshot לפי מזהה — מקומי קודם, אחר כך Redis. None בהחטאה או כש-Redis לא זמין."""
+    if not settings.USER_IDENTITY_CACHE_ENABLED or not identifier:
+        return None
+
+    key = _identity_key(kind, identifier)
+    user_id = _local_identities.get(key)
+    if user_id is not None:
+        snapshot = _local_snapshots.get(user_id)
+        if snapshot is not None:
+            return snapshot
+
+    try:
+        from app.core.redis_client import get_redis
+
+        redis = await get_redis()
+        if user_id is None:
+            raw_id = await redis.get(key)
+            if raw_id is None:
+                return None
+            user_id = int(raw_id)
+        raw_snapshot = await redis.get(_snapshot_key(user_id))
+    except Exception as e:
+        logger.warning(
+            "Redis לא זמין למטמון זיהוי משתמשים — חיפוש ב-DB",
+            extra_data={"error": str(e)},
+        )
+        return None
+
+    if raw_snapshot is None:
+        # ה-snapshot בוטל (שינוי תפקיד / אישור / חסימה) או פקע
+        _local_identities.pop(key)
+        return None
+
+    snapshot = UserSnapshot(**json.loads(raw_snapshot))
+    _local_identities.set(key, user_id)
+    _local_snapshots.set(user_id, snapshot)
+    return snapshot
+
+
+async def load_cached_user(
+    db: AsyncSession,
+    kind: str,
+    identifier: str,
+    matches: Callable[[User], bool],
+) -> User | None:
+    """
+    טעינת המשתמש שמזוהה ב-cache לפי primary key.
+
+    matches — בדיקת הקורא שהמשתמש שנטען עדיין מתאים למזהה. אם לא (או שהמשתמש
+    נמחק) — הרשומה נמחקת ומוחזר None, והקורא מבצע את החיפוש המלא.
+    """
+    snapshot = await get_user_snapshot(kind, identifier)
+    if snapshot is None:
+        return None
+
+    user = await db.get(User, snapshot.user_id)
+    if user is None or not matches(user):
+        await forget_identity(kind, identifier)
+        return None
+    return user
+
+
+async def remember_user(kind: str, identifier: str, user: User) -> None:
+    """שמירת מיפוי מזהה → משתמש. כשלון ב-Redis נרשם ללוג בלבד."""
+    if not settings.USER_IDENTITY_CACHE_ENABLED or not identifier or user.id is None:
+        return
+
+    key = _identity_key(kind, identifier)
+    snapshot = UserSnapshot.from_user(user)
+    _local_identities.set(key, user.id)
+    _local_snapshots.set(user.id, snapshot)
+    try:
+        from app.core.redis_client import get_redis
+
+        redis = await get_redis()
+        ttl = settings.USER_IDENTITY_CACHE_TTL_SECONDS
+        pipe = redis.pipeline(transaction=False)
+        pipe.set(key, str(user.id), ex=ttl)
+        pipe.set(_snapshot_key(user.id), json.dumps(asdict(snapshot)), ex=ttl)
+        await pipe.execute()
+    except Exception as e:
+        logger.warning(
+            "כשלון בשמירת מטמון זיהוי משתמש ב-Redis",
+            extra_data={"user_id": user.id, "error": str(e)},
+        )
+
+
+async def forget_identity(kind: str, identifier: str) -> None:
+    """מחיקת מיפוי מזהה בודד"""
+    key = _identity_key(kind, identifier)
+    _local_identities.pop(key)
+    try:
+        from app.core.redis_client import get_redis
+
+        redis = await get_redis()
+        await redis.delete(key)
+    except Exception as e:
+        logger.warning(
+            "כשלון במחיקת מיפוי זיהוי מ-Redis",
+            extra_data={"error": str(e)},
+        )
+
+
+async def invalidate_user_identity(*user_ids: int) -> None:
+    """
+    ביטול ה-snapshot של משתמשים — כל המיפויים שמצביעים אליהם הופכים להחטאה.
+
+    נקרא אוטומטית אחרי commit שמשנה User דרך ה-ORM; יש לקרוא ידנית אחרי
+    UPDATE ישיר על טבלת users.
+    """
+    _forget_local_snapshots(user_ids)
+    if not user_ids:
+        return
+    try:
+        from app.core.redis_client import get_redis
+
+        redis = await get_redis()
+        await redis.delete(*(_snapshot_key(user_id) for user_id in user_ids))
+    except Exception as e:
+        # ה-snapshot ב-Redis יפקע לבד אחרי USER_IDENTITY_CACHE_TTL_SECONDS
+        logger.warning(
+            "כשלון בביטול מטמון זיהוי משתמש ב-Redis",
+            extra_data={"user_ids": list(user_ids), "error": str(e)},
+        )
+
+
+def _forget_local_snapshots(user_ids: Iterable[int]) -> None:
+    for user_id in user_ids:
+        _local_snapshots.pop(user_id)
+
+
+def reset_identity_cache() -> None:
+    """ניקוי השכבה המקומית (לבדיקות)"""
+    _local_identities.clear()
+    _local_snapshots.clear()
+
+
+# ── ביטול אוטומטי אחרי commit ──
+
+
+def _collect_changed_users(session: Session) -> set[Hashable]:
+    """משתמשים שהשתנו בשדות רלוונטיים (או נמחקו) ב-flush"""
+    changed: set[Hashable] = set()
+    for obj in session.deleted:
+        if isinstance(obj, User) and obj.id is not None:
+            changed.add(obj.id)
+    for obj in session.dirty:
+        if not isinstance(obj, User) or obj.id is None:
+            continue
+        state = inspect(obj)
+        if any(state.attrs[field].history.has_changes() for field in _WATCHED_FIELDS):
+            changed.add(obj.id)
+    return changed
+
+
+async def _invalidate_after_commit(user_ids: frozenset[Hashable]) -> None:
+    await invalidate_user_identity(*user_ids)
+
+
+# השכבה המקומית מתבטלת מיד ב-commit — גם בלי event loop
+_invalidation = SessionInvalidation(
+    "user_identity",
+    _collect_changed_users,
+    _invalidate_after_commit,
+    on_commit=_forget_local_snapshots,
+)
+
+
+def register_identity_cache_listeners() -> None:
+    """רישום listeners גלובליים על Session — בהפעלת האפליקציה וה-worker."""
+    _invalidation.register()
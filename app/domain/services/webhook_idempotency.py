@@ -0,0 +1,342 @@
+"""
+Webhook Idempotency — מניעת עיבוד כפול של הודעות webhook (WhatsApp / Cloud API).
+
+שכבה ראשונה ב-Redis: SET NX על webhook:idem:<message_id> עם TTL של
+STALE_PROCESSING_SECONDS רוכש את ההודעה, וסימון completed מחליף את הערך עם
+TTL ארוך. הודעה שהעיבוד שלה נכשל נשארת processing עד שה-TTL פוקע — ואז retry
+מותר, כמו הודעה "תקועה" בטבלה. הודעה שהושלמה ב-fallback בזמן ש-Redis לא היה
+זמין נזכרת בתהליך, ומפתח ה-completed שלה נכתב ל-Redis בפעולה המוצלחת הבאה —
+כך SET NX לא צריך בדיקה מול הטבלה, וכפילות אחרי ש-Redis חוזר נחסמת.
+
+טבלת webhook_events נשארת:
+- fallback — כש-Redis לא זמין (או WEBHOOK_IDEMPOTENCY_BACKEND=db) הרכישה
+  והסימון רצים מול ה-DB עם commit מיידי, כמו קודם
+- audit — כל רכישה וסימון ב-Redis נאספים בזיכרון ונכתבים ל-DB ב-batch
+  (upsert אחד לכל WEBHOOK_IDEMPOTENCY_AUDIT_FLUSH_SECONDS), מחוץ לנתיב הבקשה
+
+כך הודעה חדשה לא משלמת על שני commits סינכרוניים. כתיבת ה-audit היא
+best-effort — כשלון נרשם ללוג בלבד.
+"""
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING
+
+from sqlalchemy import select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.db.models.webhook_event import WebhookEvent
+
+if TYPE_CHECKING:
+    from redis.asyncio import Redis
+
+logger = get_logger(__name__)
+
+_KEY_PREFIX = "webhook:idem:"
+STALE_PROCESSING_SECONDS = 120  # הודעה ב-processing יותר מ-2 דקות = תקועה, מאפשרים retry
+
+_PROCESSING = "processing"
+_COMPLETED = "completed"
+
+# הודעות שהושלמו ב-DB בזמן ש-Redis לא היה זמין — ממתינות לכתיבה ל-Redis.
+# חסום בגודל: בהפסקה ארוכה הישנות ביותר נזנחות (ה-DB עדיין מחזיק אותן)
+_FALLBACK_COMPLETED_LIMIT = 10_000
+_fallback_completed: dict[str, None] = {}
+
+
+def _key(message_id: str) -> str:
+    return f"{_KEY_PREFIX}{message_id}"
+
+
+async def try_acquire_message(db: AsyncSession, message_id: str, platform: str) -> bool:
+    """
+    ניסיון לרכוש הודעה לעיבוד.
+    מחזיר True אם ההודעה חדשה (או תקועה) ואפשר לעבד, False אם כפולה.
+    """
+    if not message_id:
+        return True  # הודעה ללא ID — מאפשרים עיבוד (אין מה לדדפ)
+
+    if settings.WEBHOOK_IDEMPOTENCY_BACKEND == "redis":
+        acquired = await _redis_try_acquire(message_id)
+        if acquired is not None:
+            if acquired:
+                _audit.record(message_id, platform, _PROCESSING)
+            return acquired
+
+    return await _db_try_acquire(db, message_id, platform)
+
+
+async def mark_message_completed(db: AsyncSession, message_id: str) -> None:
+    """סימון הודעה כ-completed אחרי עיבוד מוצלח."""
+    if not message_id:
+        return
+
+    if settings.WEBHOOK_IDEMPOTENCY_BACKEND == "redis" and await _redis_mark_completed(message_id):
+        _audit.record(message_id, None, _COMPLETED)
+        return
+
+    await _db_mark_completed(db, message_id)
+    if settings.WEBHOOK_IDEMPOTENCY_BACKEND == "redis":
+        _remember_fallback_completed(message_id)
+
+
+# ── Redis ──
+
+
+def _remember_fallback_completed(message_id: str) -> None:
+    _fallback_completed[message_id] = None
+    while len(_fallback_completed) > _FALLBACK_COMPLETED_LIMIT:
+        del _fallback_completed[next(iter(_fallback_completed))]
+
+
+async def _backfill_fallback_completed(redis: Redis) -> None:
+    """כתיבת completed ל-Redis להודעות שהושלמו ב-fallback — לפני SET NX הבא"""
+    for message_id in list(_fallback_completed):
+        await redis.set(
+            _key(message_id),
+            _COMPLETED,
+            ex=settings.WEBHOOK_IDEMPOTENCY_COMPLETED_TTL_SECONDS,
+        )
+        _fallback_completed.pop(message_id, None)
+
+
+async def _redis_try_acquire(message_id: str) -> bool | None:
+    """SET NX — None אם Redis לא זמין (הקורא נופל ל-DB)"""
+    try:
+        from app.core.redis_client import get_redis
+
+        redis = await get_redis()
+        if _fallback_completed:
+            await _backfill_fallback_completed(redis)
+        if await redis.set(_key(message_id), _PROCESSING, nx=True, ex=STALE_PROCESSING_SECONDS):
+            return True
+        status = await redis.get(_key(message_id))
+    except Exception as e:
+        logger.warning(
+            "Redis לא זמין ל-idempotency — בדיקה מול ה-DB",
+            extra_data={"message_id": message_id, "error": str(e)},
+        )
+        return None
+
+    if status is None:
+        # ה-TTL פקע בין ה-SET ל-GET — ניסיון נוסף אחד
+        return await _redis_try_acquire(message_id)
+    logger.info(
+        "Skipping completed duplicate message" if status == _COMPLETED
+        else "Skipping in-progress message",
+        extra_data={"message_id": message_id},
+    )
+    return False
+
+
+async def _redis_mark_completed(message_id: str) -> bool:
+    try:
+        from app.core.redis_client import get_redis
+
+        redis = await get_redis()
+        await redis.set(
+            _key(message_id),
+            _COMPLETED,
+            ex=settings.WEBHOOK_IDEMPOTENCY_COMPLETED_TTL_SECONDS,
+        )
+        return True
+    except Exception as e:
+        logger.warning(
+            "Redis לא זמין לסימון completed — סימון ב-DB",
+            extra_data={"message_id": message_id, "error": str(e)},
+        )
+        return False
+
+
+# ── DB (fallback) ──
+
+
+async def _db_try_acquire(db: AsyncSession, message_id: str, platform: str) -> bool:
+    """
+    רכישה מול טבלת webhook_events.
+    גישה אופטימיסטית: INSERT קודם, טיפול בקיים אחר כך.
+    """
+    # ניסיון אופטימיסטי — הוספת הודעה חדשה ב-savepoint
+    try:
+        async with db.begin_nested():
+            db.add(WebhookEvent(
+                message_id=message_id,
+                platform=platform,
+                status=_PROCESSING,
+                created_at=datetime.now(timezone.utc),
+            ))
+        # commit מיידי כדי שהרשומה תישמר גם אם העיבוד נכשל —
+        # מונע retry מיידי ומכריח המתנה של STALE_PROCESSING_SECONDS
+        await db.commit()
+        return True
+    except IntegrityError:
+        pass  # הודעה כבר קיימת — בדיקה אם completed או stale
+
+    # הודעה קיימת — בדיקה אם כבר הושלמה
+    result = await db.execute(
+        select(WebhookEvent.status, WebhookEvent.created_at)
+        .where(WebhookEvent.message_id == message_id)
+    )
+    row = result.one_or_none()
+    if not row:
+        return False
+
+    if row.status == _COMPLETED:
+        logger.info(
+            "Skipping completed duplicate message",
+            extra_data={"message_id": message_id},
+        )
+        return False
+
+    # ניסיון retry אטומי — UPDATE רק אם ההודעה תקועה מעבר ל-threshold
+    threshold = datetime.now(timezone.utc) - timedelta(seconds=STALE_PROCESSING_SECONDS)
+    update_result = await db.execute(
+        update(WebhookEvent)
+        .where(
+            WebhookEvent.message_id == message_id,
+            WebhookEvent.status == _PROCESSING,
+            WebhookEvent.created_at < threshold,
+        )
+        .values(created_at=datetime.now(timezone.utc))
+    )
+
+    if update_result.rowcount > 0:
+        # commit מיידי — אותה סיבה כמו ב-INSERT
+        await db.commit()
+        logger.warning(
+            "Retrying stale processing message",
+            extra_data={"message_id": message_id},
+        )
+        return True
+
+    logger.info(
+        "Skipping in-progress message",
+        extra_data={"message_id": message_id},
+    )
+    return False
+
+
+async def _db_mark_completed(db: AsyncSession, message_id: str) -> None:
+    """
+    סימון completed בטבלה + commit.
+
+    upsert ולא UPDATE — הרכישה אולי רצה ב-Redis וה-audit שלה עוד לא נכתב
+    (או כבוי), ואז אין שורה לעדכן.
+    """
+    dialect = db.get_bind().dialect.name
+    insert = pg_insert if dialect == "postgresql" else sqlite_insert
+    statement = insert(WebhookEvent).values(
+        message_id=message_id,
+        platform=_audit.platform_of(message_id) or "unknown",
+        status=_COMPLETED,
+        created_at=datetime.now(timezone.utc),
+    )
+    await db.execute(statement.on_conflict_do_update(
+        index_elements=[WebhookEvent.message_id],
+        set_={"status": _COMPLETED},
+    ))
+    await db.commit()
+
+
+# ── audit ב-batch ──
+
+
+class _AuditBuffer:
+    """רשומות idempotency שממתינות לכתיבה ל-webhook_events.
+
+    רשומה אחת לכל message_id — completed שמגיע לפני ה-flush מחליף את
+    ה-processing, כך שהודעה רגילה נכתבת כשורה אחת.
+    """
+
+    def __init__(self) -> None:
+        # message_id → (platform, status, created_at)
+        self._pending: dict[str, tuple[str | None, str, datetime]] = {}
+        self._flush_task: asyncio.Task | None = None
+
+    def record(self, message_id: str, platform: str | None, status: str) -> None:
+        if not settings.WEBHOOK_IDEMPOTENCY_AUDIT_ENABLED:
+            return
+        previous = self._pending.get(message_id)
+        if previous is not None:
+            platform = platform or previous[0]
+            created_at = previous[2]
+        else:
+            created_at = datetime.now(timezone.utc)
+        self._pending[message_id] = (platform, status, created_at)
+        self._schedule()
+
+    def platform_of(self, message_id: str) -> str | None:
+        pending = self._pending.get(message_id)
+        return pending[0] if pending is not None else None
+
+    def _schedule(self) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        task = self._flush_task
+        if task is not None and not task.done() and task.get_loop() is loop:
+            return
+        full = len(self._pending) >= settings.WEBHOOK_IDEMPOTENCY_AUDIT_BATCH_SIZE
+        delay = 0.0 if full else settings.WEBHOOK_IDEMPOTENCY_AUDIT_FLUSH_SECONDS
+        self._flush_task = loop.create_task(self._flush_after(delay))
+
+    async def _flush_after(self, delay: float) -> None:
+        if delay:
+            await asyncio.sleep(delay)
+        await self.flush()
+
+    async def flush(self) -> None:
+        """upsert של כל הרשומות הממתינות — statement לכל batch, commit אחד."""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        rows = [
+            {
+                "message_id": message_id,
+                "platform": platform or "unknown",
+                "status": status,
+                "created_at": created_at,
+            }
+            for message_id, (platform, status, created_at) in pending.items()
+        ]
+        try:
+            from app.db import database
+
+            async with database.AsyncSessionLocal() as db:
+                dialect = db.get_bind().dialect.name
+                insert = pg_insert if dialect == "postgresql" else sqlite_insert
+                batch_size = settings.WEBHOOK_IDEMPOTENCY_AUDIT_BATCH_SIZE
+                for start in range(0, len(rows), batch_size):
+                    statement = insert(WebhookEvent).values(rows[start:start + batch_size])
+                    # completed לא חוזר ל-processing (רשומה שכבר הושלמה ב-fallback)
+                    statement = statement.on_conflict_do_update(
+                        index_elements=[WebhookEvent.message_id],
+                        set_={"status": statement.excluded.status},
+                        where=WebhookEvent.status != _COMPLETED,
+                    )
+                    await db.execute(statement)
+                await db.commit()
+        except Exception as e:
+            logger.warning(
+                "כשלון בכתיבת audit של idempotency ל-webhook_events",
+                extra_data={"error": str(e), "rows": len(rows)},
+            )
+        # רשומות שנוספו בזמן ה-flush
+        if self._pending:
+            self._flush_task = None
+            self._schedule()
+
+
+_audit = _AuditBuffer()
+
+
+async def flush_idempotency_audit() -> None:
+    """כתיבת ה-audit שנשאר בזיכרון — לקרוא ב-shutdown."""
+    await _audit.flush()
@@ -6,8 +6,12 @@
 """
 from __future__ import annotations
 
+import asyncio
 from abc import ABC, abstractmethod
-from typing import Optional
+from typing import Optional, Sequence
+
+# מקביליות ברירת מחדל ל-send_text_bulk כשהספק לא מגדיר אחרת
+DEFAULT_BULK_CONCURRENCY = 10
 
 
 class BaseWhatsAppProvider(ABC):
@@ -73,6 +77,38 @@ class BaseWhatsAppProvider(ABC):
             WhatsAppError: בכשלון שליחה או כש-media_url ריק.
         """
 
+    async def send_text_bulk(
+        self,
+        messages: Sequence[tuple[str, str]],
+        *,
+        concurrency: Optional[int] = None,
+    ) -> list[Optional[Exception]]:
+        """
+        שליחת הרבה הודעות טקסט (בלי כפתורים) — למשל broadcast לשליחים.
+
+        ההודעות נשלחות דרך send_text עם מספר חסום של בקשות במקביל, כך
+        שהן זורמות על מספר קטן של חיבורים פתוחים במקום לפתוח חיבור לכל
+        הודעה. כשלון של הודעה אחת לא עוצר את השאר.
+
+        Args:
+            messages: זוגות (נמען, טקסט) — הטקסט נשלח as-is.
+            concurrency: מספר שליחות במקביל (ברירת מחדל: DEFAULT_BULK_CONCURRENCY).
+
+        Returns:
+            לכל הודעה, לפי הסדר — None בהצלחה או ה-exception שנזרק.
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency or DEFAULT_BULK_CONCURRENCY))
+
+        async def _send_one(to: str, text: str) -> Optional[Exception]:
+            async with semaphore:
+                try:
+                    await self.send_text(to=to, text=text)
+                except Exception as exc:
+                    return exc
+            return None
+
+        return list(await asyncio.gather(*(_send_one(to, text) for to, text in messages)))
+
     # ── עיצוב טקסט ──
 
     @abstractmethod
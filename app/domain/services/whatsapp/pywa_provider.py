@@ -3,12 +3,18 @@ PyWa Provider — מימוש ממשק BaseWhatsAppProvider מעל Cloud API (Met
 
 משתמש בספריית pywa לשליחת הודעות דרך WhatsApp Cloud API.
 תומך ב-inline buttons, מדיה עשירה, ו-retry עם circuit breaker.
+
+ה-client הוא pywa_async — הקריאות לא חוסמות את ה-event loop. הוא עובד על
+ה-httpx client המשותף של Graph API (pool חיבורים לכל loop), ומספר הקריאות
+במקביל חסום ב-WHATSAPP_CLOUD_API_MAX_CONCURRENCY — כך broadcast גדול לא
+מציף את Graph API ולא תופס את כל החיבורים על חשבון תשובות ל-webhooks.
 """
 from __future__ import annotations
 
 import asyncio
 import base64
-from typing import Optional
+import weakref
+from typing import Optional, Sequence
 
 from app.core.circuit_breaker import CircuitBreaker
 from app.core.config import settings
@@ -27,6 +33,32 @@ _MAX_LIST_ROWS = 10
 _MAX_BUTTON_CALLBACK_LEN = 256
 _MAX_LIST_ROW_CALLBACK_LEN = 200
 
+# semaphore לכל event loop — asyncio.Semaphore קשור ל-loop שבו הוא ממתין
+_call_slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _cloud_api_slot() -> asyncio.Semaphore:
+    """מגבלת הקריאות במקביל ל-Cloud API ב-loop הנוכחי"""
+    loop = asyncio.get_running_loop()
+    slot = _call_slots.get(loop)
+    if slot is None:
+        slot = asyncio.Semaphore(max(1, settings.WHATSAPP_CLOUD_API_MAX_CONCURRENCY))
+        _call_slots[loop] = slot
+    return slot
+
+
+def _new_pywa_client(session):
+    """בניית pywa client — סינכרוני, רץ ב-thread"""
+    from pywa_async import WhatsApp as PyWaClient
+
+    return PyWaClient(
+        phone_id=settings.WHATSAPP_CLOUD_API_PHONE_ID,
+        token=settings.WHATSAPP_CLOUD_API_TOKEN,
+        session=session,
+    )
+
 
 class PyWaProvider(BaseWhatsAppProvider):
     """
@@ -42,17 +74,38 @@ class PyWaProvider(BaseWhatsAppProvider):
 
         # אתחול עצלן — נטען רק כשנדרש, מונע import errors בבדיקות
         self._client = None
+        self._client_loop: asyncio.AbstractEventLoop | None = None
+        self._client_pending: asyncio.Task | None = None
 
-    def _get_client(self):
-        """אתחול עצלן של pywa client."""
-        if self._client is None:
-            from pywa_async import WhatsApp as PyWaClient
+    async def _get_client(self):
+        """אתחול עצלן של pywa client.
 
-            self._client = PyWaClient(
-                phone_id=settings.WHATSAPP_CLOUD_API_PHONE_ID,
-                token=settings.WHATSAPP_CLOUD_API_TOKEN,
-            )
-        return self._client
+        ה-session הוא ה-client המשותף של ה-loop הנוכחי — ב-loop חדש (task של
+        Celery) נוצר pywa client חדש במקום להשתמש בחיבורים של loop אחר.
+        ה-import של pywa_async ובניית ה-client (חצי שנייה בפעם הראשונה) רצים
+        ב-thread, וקריאות מקבילות ממתינות לבנייה אחת.
+        """
+        loop = asyncio.get_running_loop()
+        if self._client is not None and self._client_loop in (None, loop):
+            return self._client
+
+        pending = self._client_pending
+        if pending is None or pending.get_loop() is not loop:
+            pending = loop.create_task(self._build_client())
+            self._client_pending = pending
+        return await asyncio.shield(pending)
+
+    async def _build_client(self):
+        from app.core.http_clients import get_whatsapp_cloud_client
+
+        session = get_whatsapp_cloud_client()
+        try:
+            client = await asyncio.to_thread(_new_pywa_client, session)
+        finally:
+            self._client_pending = None
+        self._client = client
+        self._client_loop = asyncio.get_running_loop()
+        return client
 
     # ── ממשק ציבורי ──
 
@@ -82,14 +135,16 @@ class PyWaProvider(BaseWhatsAppProvider):
     ) -> None:
         """הרצה עם retry ו-exponential backoff.
 
-        עוטף כל קריאה ל-Cloud API.
+        עוטף כל קריאה ל-Cloud API. כל ניסיון תופס מקום במגבלת המקביליות,
+        וה-backoff שבין ניסיונות משחרר אותו.
         זורק WhatsAppError אם כל הניסיונות נכשלו.
         """
         last_error: Exception | None = None
 
         for attempt in range(self._max_retries):
             try:
-                await func()
+                async with _cloud_api_slot():
+                    await func()
                 return
             except Exception as exc:
                 last_error = exc
@@ -268,6 +323,22 @@ class PyWaProvider(BaseWhatsAppProvider):
 
     # ── שליחת הודעות ──
 
+    async def send_text_bulk(
+        self,
+        messages: Sequence[tuple[str, str]],
+        *,
+        concurrency: Optional[int] = None,
+    ) -> list[Optional[Exception]]:
+        """שליחה מרובה — בלי מגבלה נוספת כברירת מחדל.
+
+        הקריאות עצמן כבר חסומות ב-WHATSAPP_CLOUD_API_MAX_CONCURRENCY לכל התהליך,
+        ומגבלה ברמת ה-bulk הייתה מחזיקה מקום גם בזמן backoff של הודעה שנכשלה.
+        """
+        return await super().send_text_bulk(
+            messages,
+            concurrency=concurrency or len(messages),
+        )
+
     async def send_text(
         self,
         to: str,
@@ -306,7 +377,7 @@ class PyWaProvider(BaseWhatsAppProvider):
             if footer:
                 final_text = f"{final_text}\n\n`{footer}`"
 
-        client = self._get_client()
+        client = await self._get_client()
 
         async def _send_single() -> None:
             await client.send_message(
@@ -342,7 +413,7 @@ class PyWaProvider(BaseWhatsAppProvider):
         phone_masked = PhoneNumberValidator.mask(to)
 
         formatted_caption = self.format_text(caption) if caption else None
-        client = self._get_client()
+        client = await self._get_client()
 
         # pywa לא תומך ב-data URIs ישירות — ממירים ל-bytes
         media_content: str | bytes = media_url
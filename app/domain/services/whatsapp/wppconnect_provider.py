@@ -3,18 +3,26 @@ WPPConnect Provider — מימוש ממשק BaseWhatsAppProvider מעל הגטו
 
 עוטף את הקריאות ל-WPPConnect Gateway (Node.js) בממשק אחיד,
 כולל retry, circuit breaker, והמרת HTML → WhatsApp markdown.
+כל הבקשות עוברות על client משותף עם keep-alive (http_clients) — broadcast
+למאות שליחים לא פותח חיבור TCP חדש לכל הודעה.
 """
 from __future__ import annotations
 
 import asyncio
-from typing import Optional
+from typing import Optional, Sequence
 
 import httpx
 
-from app.core.circuit_breaker import CircuitBreaker
+from app.core.circuit_breaker import CircuitBreaker, exclude_from_latency
 from app.core.config import settings
 from app.core.exceptions import WhatsAppError
+from app.core.http_clients import get_whatsapp_gateway_client
 from app.core.logging import get_logger
+from app.core.rate_limiter import (
+    get_outbound_rate_limiter,
+    parse_retry_after,
+    whatsapp_rate_limits,
+)
 from app.core.validation import PhoneNumberValidator, convert_html_to_whatsapp
 from app.domain.services.whatsapp.base_provider import BaseWhatsAppProvider
 
@@ -69,75 +77,86 @@ class WPPConnectProvider(BaseWhatsAppProvider):
         זורק WhatsAppError אם כל הניסיונות נכשלו.
         """
         phone_masked = PhoneNumberValidator.mask(payload.get("phone", ""))
-
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            for attempt in range(self._max_retries):
-                try:
-                    response = await client.post(
-                        f"{self._gateway_url}/{endpoint}",
-                        json=payload,
+        # מכסה משותפת לכל ה-workers — גלובלית + לצ'אט/קבוצה
+        limiter = get_outbound_rate_limiter()
+        rate_limits = whatsapp_rate_limits(payload.get("phone", ""))
+
+        client = get_whatsapp_gateway_client()
+        for attempt in range(self._max_retries):
+            exclude_from_latency(await limiter.acquire(rate_limits))
+            try:
+                response = await client.post(
+                    f"{self._gateway_url}/{endpoint}",
+                    json=payload,
+                )
+                if response.status_code == 200:
+                    return
+
+                if (
+                    response.status_code in self._transient_status_codes
+                    and attempt < self._max_retries - 1
+                ):
+                    backoff = 2 ** attempt
+                    if response.status_code == 429:
+                        # Retry-After מהגטוויי — חסימת ה-bucket גם ל-workers אחרים
+                        retry_after = parse_retry_after(response)
+                        if retry_after is not None:
+                            await limiter.penalize(rate_limits[-1:], retry_after)
+                            backoff = 0
+                    logger.warning(
+                        f"שגיאה זמנית ב-{operation_name}, מנסה שוב",
+                        extra_data={
+                            "phone": phone_masked,
+                            "status_code": response.status_code,
+                            "attempt": attempt + 1,
+                            "max_retries": self._max_retries,
+                            "backoff_seconds": backoff,
+                        },
                     )
-                    if response.status_code == 200:
-                        return
-
-                    if (
-                        response.status_code in self._transient_status_codes
-                        and attempt < self._max_retries - 1
-                    ):
-                        backoff = 2 ** attempt
-                        logger.warning(
-                            f"שגיאה זמנית ב-{operation_name}, מנסה שוב",
-                            extra_data={
-                                "phone": phone_masked,
-                                "status_code": response.status_code,
-                                "attempt": attempt + 1,
-                                "max_retries": self._max_retries,
-                                "backoff_seconds": backoff,
-                            },
-                        )
+                    if backoff:
                         await asyncio.sleep(backoff)
-                        continue
-
-                    raise WhatsAppError.from_response(
-                        endpoint,
-                        response,
-                        message=f"gateway /{endpoint} returned status {response.status_code}",
+                    continue
+
+                raise WhatsAppError.from_response(
+                    endpoint,
+                    response,
+                    message=f"gateway /{endpoint} returned status {response.status_code}",
+                )
+            except httpx.TimeoutException:
+                if attempt < self._max_retries - 1:
+                    backoff = 2 ** attempt
+                    logger.warning(
+                        f"{operation_name} timeout, מנסה שוב",
+                        extra_data={
+                            "phone": phone_masked,
+                            "attempt": attempt + 1,
+                            "backoff_seconds": backoff,
+                        },
                     )
-                except httpx.TimeoutException:
-                    if attempt < self._max_retries - 1:
-                        backoff = 2 ** attempt
-                        logger.warning(
-                            f"{operation_name} timeout, מנסה שוב",
-                            extra_data={
-                                "phone": phone_masked,
-                                "attempt": attempt + 1,
-                                "backoff_seconds": backoff,
-                            },
-                        )
-                        await asyncio.sleep(backoff)
-                        continue
-                    raise WhatsAppError(
-                        message=f"gateway /{endpoint} timeout after retries",
-                        details={"timeout": True, "attempts": self._max_retries},
-                    )
-                except httpx.RequestError as exc:
-                    if attempt < self._max_retries - 1:
-                        backoff = 2 ** attempt
-                        logger.warning(
-                            f"שגיאת רשת ב-{operation_name}, מנסה שוב",
-                            extra_data={
-                                "phone": phone_masked,
-                                "error": str(exc),
-                                "attempt": attempt + 1,
-                                "backoff_seconds": backoff,
-                            },
-                        )
-                        await asyncio.sleep(backoff)
-                        continue
-                    raise WhatsAppError(
-                        message=f"gateway /{endpoint} network error: {str(exc)}",
-                        details={"network_error": True, "attempts": self._max_retries},
+                    await asyncio.sleep(backoff)
+                    continue
+                raise WhatsAppError(
+                    message=f"gateway /{endpoint} timeout after retries",
+                    details={"timeout": True, "attempts": self._max_retries},
+                )
+            except httpx.RequestError as exc:
+                if attempt < self._max_retries - 1:
+                    backoff = 2 ** attempt
+                    logger.warning(
+                        f"שגיאת רשת ב-{operation_name}, מנסה שוב",
+                        extra_data={
+                            "phone": phone_masked,
+                            "error": str(exc),
+                            "attempt": attempt + 1,
+                            "backoff_seconds": backoff,
+                        },
                     )
+                    await asyncio.sleep(backoff)
+                    continue
+                raise WhatsAppError(
+                    message=f"gateway /{endpoint} network error: {str(exc)}",
+                    details={"network_error": True, "attempts": self._max_retries},
+                )
 
     # ── שליחת הודעות ──
 
@@ -175,6 +194,19 @@ class WPPConnectProvider(BaseWhatsAppProvider):
 
         await self._circuit_breaker.execute(_send)
 
+    async def send_text_bulk(
+        self,
+        messages: Sequence[tuple[str, str]],
+        *,
+        concurrency: Optional[int] = None,
+    ) -> list[Optional[Exception]]:
+        """שליחה מרובה — ברירת המחדל למקביליות היא WHATSAPP_BULK_SEND_CONCURRENCY,
+        כך שהבקשות זורמות על חיבורי ה-keep-alive הקיימים של ה-pool."""
+        return await super().send_text_bulk(
+            messages,
+            concurrency=concurrency or settings.WHATSAPP_BULK_SEND_CONCURRENCY,
+        )
+
     async def send_media(
         self,
         to: str,
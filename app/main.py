@@ -204,6 +204,14 @@ async def startup() -> None:
     from app.db.audit_events import register_audit_listeners
     register_audit_listeners()
 
+    # ביטול מטמון זיהוי משתמשים אחרי commit שמשנה תפקיד/אישור/מזהים
+    from app.domain.services.user_identity_cache import register_identity_cache_listeners
+    register_identity_cache_listeners()
+
+    # ביטול מטמון יכולות תפקיד אחרי commit שמשנה סדרנים/בעלים/תחנות
+    from app.domain.services.role_capabilities import register_role_capability_listeners
+    register_role_capability_listeners()
+
     # רישום webhook של טלגרם — מבטיח שהטוקן הנוכחי מצביע ל-URL הנכון
     await _register_telegram_webhook()
 
@@ -215,9 +223,15 @@ async def shutdown() -> None:
     # סגירת PostHog — שליחת אירועים שנותרו בתור
     from app.core.posthog import shutdown_posthog
     shutdown_posthog()
+    # כתיבת audit של idempotency שנשאר בזיכרון (לפני סגירת ה-DB)
+    from app.domain.services.webhook_idempotency import flush_idempotency_audit
+    await flush_idempotency_audit()
     # סגירת חיבור Redis
     from app.core.redis_client import close_redis
     await close_redis()
+    # סגירת ה-HTTP clients המשותפים (Telegram Bot API)
+    from app.core.http_clients import close_http_clients
+    await close_http_clients()
     # סגירת חיבורי מסד הנתונים למניעת connection pool exhaustion
     await engine.dispose()
     logger.info("Database connections disposed")
@@ -964,52 +964,50 @@ class DriverStateHandler:
                 price=price,
             )
 
-            success, formatted_message, sent_count, total_groups = (
-                await self.ride_posting_service.post_ride(user, posting)
-            )
-
-            # שליחת הודעות פרטיות לנהגים עם חיפושים תואמים — תמיד, גם כשאין קבוצות
+            # נהגים עם חיפושים תואמים מקבלים הודעה פרטית — תמיד, גם כשאין קבוצות
             matching_ids = await self.search_service.get_matching_driver_user_ids(
                 origin_city=posting.origin,
                 destination_city=posting.destination,
                 exclude_user_id=user.id,
             )
-            driver_name = user.full_name or user.name or "נהג"
-            notified_count = await self.ride_posting_service.notify_matching_drivers(
-                posting, driver_name, matching_ids
+            # ההפצה עצמה רצה ב-outbox worker — כאן רק אישור מיידי, הסיכום יישלח בסיום
+            broadcast = await self.ride_posting_service.queue_ride_broadcast(
+                user, posting, matching_ids
             )
+            formatted_message = broadcast.message_text
 
-            if sent_count > 0:
-                notified_text = ""
-                if notified_count > 0:
-                    notified_text = f"📨 נשלח ל-{notified_count} נהגים עם חיפוש תואם.\n"
+            notified_text = ""
+            if broadcast.drivers_queued > 0:
+                notified_text = (
+                    f"📨 הועבר להפצה ל-{broadcast.drivers_queued} נהגים עם חיפוש תואם.\n"
+                )
+            summary_text = ""
+            if broadcast.groups_queued > 0 or broadcast.drivers_queued > 0:
+                summary_text = "📊 סיכום ההפצה יישלח אליך בסיום.\n"
+
+            if broadcast.groups_queued > 0:
                 confirmation = (
                     f"✅ <b>הנסיעה פורסמה בהצלחה!</b>\n\n"
                     f"{formatted_message}\n"
-                    f"📢 פורסם ב-{sent_count} קבוצות.\n"
+                    f"📢 הועבר להפצה ל-{broadcast.groups_queued} קבוצות.\n"
                     f"{notified_text}"
+                    f"{summary_text}"
                 )
-            elif total_groups == 0:
-                notified_text = ""
-                if notified_count > 0:
-                    notified_text = f"📨 נשלח ל-{notified_count} נהגים עם חיפוש תואם.\n"
+            elif broadcast.groups_total == 0:
                 confirmation = (
                     f"⚠️ <b>לא נמצאו קבוצות רלוונטיות</b>\n\n"
                     f"{formatted_message}\n"
                     f"לא נמצאו קבוצות מתאימות למסלול "
                     f"{escape(posting.origin)} → {escape(posting.destination)}.\n"
                     f"{notified_text}"
+                    f"{summary_text}"
                 )
             else:
-                # נמצאו קבוצות אבל כל השליחות נכשלו
-                notified_text = ""
-                if notified_count > 0:
-                    notified_text = f"📨 עם זאת, נשלח ל-{notified_count} נהגים עם חיפוש תואם.\n"
+                # נמצאו קבוצות אבל ההעברה להפצה נכשלה
                 confirmation = (
                     f"❌ <b>שגיאה בפרסום הנסיעה</b>\n\n"
                     f"{formatted_message}\n"
-                    f"נמצאו {total_groups} קבוצות רלוונטיות אך השליחה נכשלה.\n"
-                    f"{notified_text}"
+                    f"נמצאו {broadcast.groups_total} קבוצות רלוונטיות אך השליחה נכשלה.\n"
                     f"נסה שוב מאוחר יותר."
                 )
 
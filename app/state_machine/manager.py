@@ -1,10 +1,27 @@
 """
 State Manager - Handles state transitions and context management
+
+Unit of work: בתוך conversation_unit_of_work(db) כל StateManager על אותו סשן
+טוען את ה-ConversationSession פעם אחת להודעה, משנה state ו-context בזיכרון,
+וכותב אותם ב-UPDATE אחד — ב-commit הבא של ה-handler או ביציאה מהבלוק.
+
+Context patch: שינויי context נשמרים כ-patch — מפתחות שנקבעו ומפתחות שנמחקו.
+ב-PostgreSQL ה-UPDATE שולח רק אותם (context_data - ARRAY[...] || patch על
+JSONB), במקום להעתיק את כל ה-dict ולכתוב אותו מחדש. ב-SQLite (בדיקות) — כתיבת
+הערך המלא דרך ה-ORM, עם אותה תוצאה.
 """
 import copy
-from typing import Optional, Any
+from collections.abc import Iterable
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Optional, Any
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import Text, cast, event, func, literal_column, select, update
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import flag_modified, set_committed_value
+from sqlalchemy.sql.dml import Update
+from sqlalchemy.sql.elements import ColumnElement
 
 from app.db.models.conversation_session import ConversationSession
 from app.state_machine.states import (
@@ -21,10 +38,209 @@ from app.state_machine.states import (
     DRIVER_TRANSITIONS,
     ADMIN_TRANSITIONS,
 )
+from app.core.config import settings
 from app.core.logging import get_logger
 
 logger = get_logger(__name__)
 
+# מפתח ב-session.info — ה-unit of work הפעיל של הסשן
+_UNIT_OF_WORK_KEY = "conversation_unit_of_work"
+
+
+def _value_changed(old: Any, new: Any) -> bool:
+    # dict / list עלולים להשתנות במקום (אותו אובייקט) — תמיד נכתבים
+    return isinstance(new, (dict, list)) or old != new
+
+
+def context_patch_expression(updates: dict, removed: Iterable[str]) -> ColumnElement:
+    """ביטוי JSONB ל-PostgreSQL: (context_data - ARRAY[removed]) || updates"""
+    expression: ColumnElement = func.coalesce(
+        ConversationSession.context_data, literal_column("'{}'::jsonb"), type_=JSONB
+    )
+    removed = sorted(removed)
+    if removed:
+        expression = expression.op("-", return_type=JSONB)(cast(removed, ARRAY(Text)))
+    if updates:
+        expression = expression.op("||", return_type=JSONB)(cast(updates, JSONB))
+    return expression
+
+
+@dataclass
+class _StagedSession:
+    """state ו-context של שיחה, כפי שהם אחרי השינויים שטרם נכתבו"""
+
+    session: ConversationSession
+    state: str
+    context: dict
+    # patch מאז הכתיבה האחרונה — מפתח נמצא לכל היותר באחד מהשניים
+    updates: dict = field(default_factory=dict)
+    removed: set = field(default_factory=set)
+    dirty: bool = False
+
+    @classmethod
+    def load(cls, session: ConversationSession) -> "_StagedSession":
+        # עותק רדוד — ה-patch מחליף מפתחות ולא משנה ערכים במקום. ערכים מקוננים
+        # משותפים עם הערך הטעון, לכן get_context מחזיר deepcopy ל-handlers
+        return cls(
+            session=session,
+            state=session.current_state,
+            context=dict(session.context_data or {}),
+        )
+
+    def set_state(self, state: str) -> None:
+        self.state = state
+        self.dirty = True
+
+    def patch(self, updates: dict, remove: Iterable[str] = ()) -> None:
+        for key in remove:
+            if key in self.context:
+                del self.context[key]
+                self.updates.pop(key, None)
+                self.removed.add(key)
+        for key, value in updates.items():
+            self.context[key] = value
+            self.updates[key] = value
+            self.removed.discard(key)
+        self.dirty = True
+
+    def replace(self, context: dict) -> None:
+        """החלפת ה-context — נשמרת כ-patch מול הערך הנוכחי"""
+        removed = [key for key in self.context if key not in context]
+        updates = {
+            key: value
+            for key, value in context.items()
+            if key not in self.context or _value_changed(self.context[key], value)
+        }
+        self.patch(updates, removed)
+
+    def patch_statement(self) -> Update:
+        """UPDATE ל-PostgreSQL — state ורק המפתחות שב-patch"""
+        values: dict[str, Any] = {"current_state": self.state}
+        if self.updates or self.removed:
+            values["context_data"] = context_patch_expression(self.updates, self.removed)
+        return (
+            update(ConversationSession)
+            .where(ConversationSession.id == self.session.id)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+
+    def write(self, session: Session) -> None:
+        """כתיבת state וה-patch לשורה — UPDATE אחד"""
+        if not self.dirty:
+            return
+        conversation = self.session
+        if session.get_bind().dialect.name == "postgresql":
+            session.execute(self.patch_statement())
+            set_committed_value(conversation, "current_state", self.state)
+            set_committed_value(conversation, "context_data", dict(self.context))
+        else:
+            # SQLite — הערך המלא דרך ה-ORM; flag_modified כי dict שווה לא נכתב
+            conversation.current_state = self.state
+            if self.updates or self.removed:
+                conversation.context_data = dict(self.context)
+                flag_modified(conversation, "context_data")
+        self.updates = {}
+        self.removed = set()
+        self.dirty = False
+
+
+class ConversationUnitOfWork:
+    """שינויי שיחה שממתינים לכתיבה — לכל (user_id, platform) רשומה אחת"""
+
+    def __init__(self) -> None:
+        self._staged: dict[tuple[int, str], _StagedSession] = {}
+
+    def get(self, user_id: int, platform: str) -> Optional[_StagedSession]:
+        return self._staged.get((user_id, platform))
+
+    def stage(self, user_id: int, platform: str, session: ConversationSession) -> _StagedSession:
+        staged = _StagedSession.load(session)
+        self._staged[(user_id, platform)] = staged
+        return staged
+
+    def has_pending(self) -> bool:
+        return any(staged.dirty for staged in self._staged.values())
+
+    def discard(self) -> None:
+        """ביטול השינויים שעוד לא נכתבו — הטעינה הבאה קוראת מה-DB"""
+        self._staged.clear()
+
+    def apply(self, session: Session) -> None:
+        """כתיבת השינויים הממתינים בטרנזקציה של הסשן"""
+        for staged in self._staged.values():
+            staged.write(session)
+
+    def _on_before_commit(self, session: Session) -> None:
+        # commit של ה-handler (למשל אחרי יצירת משלוח) כולל את השינויים עד כה
+        self.apply(session)
+
+
+def _active_unit_of_work(db: AsyncSession) -> Optional[ConversationUnitOfWork]:
+    info = getattr(db, "info", None)
+    if not isinstance(info, dict):
+        return None
+    return info.get(_UNIT_OF_WORK_KEY)
+
+
+@asynccontextmanager
+async def conversation_unit_of_work(
+    db: AsyncSession,
+) -> AsyncIterator[Optional[ConversationUnitOfWork]]:
+    """
+    unit of work לעיבוד הודעה אחת.
+
+    ביציאה תקינה — commit אחד לשינויים שנשארו. חריגה מבטלת את השינויים
+    שעוד לא נכתבו (commit שכבר בוצע בתוך הבלוק נשאר). בלוק מקונן על אותו
+    סשן משתמש ב-unit of work החיצוני.
+    """
+    existing = _active_unit_of_work(db)
+    if (
+        existing is not None
+        or not settings.STATE_MANAGER_UNIT_OF_WORK_ENABLED
+        # סשן מדומה (mock) — בלי session.info אמיתי אין היכן לרשום
+        or not isinstance(getattr(db, "info", None), dict)
+    ):
+        yield existing
+        return
+
+    unit_of_work = ConversationUnitOfWork()
+    sync_session = db.sync_session
+    db.info[_UNIT_OF_WORK_KEY] = unit_of_work
+    event.listen(sync_session, "before_commit", unit_of_work._on_before_commit)
+    try:
+        yield unit_of_work
+        if unit_of_work.has_pending():
+            # ה-listener כותב את השינויים בתוך ה-commit
+            await db.commit()
+    finally:
+        event.remove(sync_session, "before_commit", unit_of_work._on_before_commit)
+        db.info.pop(_UNIT_OF_WORK_KEY, None)
+
+
+async def commit_conversation_state(db: AsyncSession) -> None:
+    """
+    כתיבת השינויים הממתינים של ה-unit of work הפעיל — commit אחד.
+
+    ל-webhook שמסמן הודעה כ-completed בתוך ה-unit of work: ה-state נכתב לפני
+    הסימון, וכשל בכתיבה משאיר את ההודעה פתוחה ל-retry.
+    """
+    unit_of_work = _active_unit_of_work(db)
+    if unit_of_work is not None and unit_of_work.has_pending():
+        await db.commit()
+
+
+def discard_conversation_state(db: AsyncSession) -> None:
+    """
+    ביטול השינויים הממתינים של ה-unit of work הפעיל.
+
+    ל-webhook שבולע את החריגה של הודעה שנכשלה — כמו חריגה בתוך
+    conversation_unit_of_work, השינויים שלא נכתבו לא ייכתבו ביציאה.
+    """
+    unit_of_work = _active_unit_of_work(db)
+    if unit_of_work is not None:
+        unit_of_work.discard()
+
 
 class StateManager:
     """Manages conversation state transitions"""
@@ -58,8 +274,29 @@ class StateManager:
 
         return session
 
+    async def _load(self, user_id: int, platform: str) -> _StagedSession:
+        """השיחה לעדכון — בתוך unit of work נטענת פעם אחת ונשמרת בו"""
+        unit_of_work = _active_unit_of_work(self.db)
+        if unit_of_work is None:
+            return _StagedSession.load(await self.get_or_create_session(user_id, platform))
+        staged = unit_of_work.get(user_id, platform)
+        if staged is None:
+            session = await self.get_or_create_session(user_id, platform)
+            staged = unit_of_work.stage(user_id, platform, session)
+        return staged
+
+    async def _save(self, staged: _StagedSession) -> None:
+        """בלי unit of work — כתיבה ו-commit מיידיים; בתוכו — ב-commit הבא"""
+        if _active_unit_of_work(self.db) is not None:
+            return
+        await self.db.run_sync(staged.write)
+        await self.db.commit()
+
     async def get_current_state(self, user_id: int, platform: str) -> str:
         """Get current state for a user"""
+        unit_of_work = _active_unit_of_work(self.db)
+        if unit_of_work is not None:
+            return (await self._load(user_id, platform)).state
         session = await self.get_or_create_session(user_id, platform)
         return session.current_state
 
@@ -74,8 +311,8 @@ class StateManager:
         Transition to a new state if valid.
         Returns True if transition was successful.
         """
-        session = await self.get_or_create_session(user_id, platform)
-        current_state = session.current_state
+        staged = await self._load(user_id, platform)
+        current_state = staged.state
 
         # Validate transition
         if not self._is_valid_transition(current_state, new_state):
@@ -90,17 +327,11 @@ class StateManager:
             )
             return False
 
-        # Update state
-        session.current_state = new_state
-
-        # Update context if provided - deep copy to trigger SQLAlchemy change detection
-        # ולהבטיח שאובייקטים מקוננים (lists, dicts) לא ישותפו עם המקור
+        staged.set_state(new_state)
+        # רק המפתחות שבעדכון נכתבים — לא כל ה-context
         if context_update:
-            current_context = copy.deepcopy(session.context_data or {})
-            current_context.update(context_update)
-            session.context_data = current_context
-
-        await self.db.commit()
+            staged.patch(context_update)
+        await self._save(staged)
         return True
 
     async def force_state(
@@ -111,16 +342,23 @@ class StateManager:
         context: Optional[dict] = None
     ) -> None:
         """Force state change without validation (for admin/reset)"""
-        session = await self.get_or_create_session(user_id, platform)
-        session.current_state = new_state
+        staged = await self._load(user_id, platform)
+        staged.set_state(new_state)
         if context is not None:
-            session.context_data = context
-        await self.db.commit()
+            staged.replace(context)
+        await self._save(staged)
 
     async def get_context(self, user_id: int, platform: str) -> dict:
         """Get context data for current session"""
-        session = await self.get_or_create_session(user_id, platform)
-        return session.context_data or {}
+        unit_of_work = _active_unit_of_work(self.db)
+        if unit_of_work is not None:
+            context = (await self._load(user_id, platform)).context
+        else:
+            session = await self.get_or_create_session(user_id, platform)
+            context = session.context_data or {}
+        # deepcopy — שינוי במקום (גם ברשימה / dict מקונן) לא עוקף את ה-patch
+        # ולא דולף לערך הטעון או ל-context של ה-unit of work
+        return copy.deepcopy(context)
 
     async def update_context(
         self,
@@ -130,17 +368,30 @@ class StateManager:
         value: Any
     ) -> None:
         """Update a single context key"""
-        session = await self.get_or_create_session(user_id, platform)
-        context = copy.deepcopy(session.context_data or {})
-        context[key] = value
-        session.context_data = context
-        await self.db.commit()
+        await self.patch_context(user_id, platform, {key: value})
+
+    async def patch_context(
+        self,
+        user_id: int,
+        platform: str,
+        updates: Optional[dict] = None,
+        remove: Iterable[str] = (),
+    ) -> None:
+        """
+        עדכון חלקי של ה-context — קביעת מפתחות ומחיקת מפתחות.
+
+        ב-PostgreSQL נכתבים רק המפתחות האלה (JSONB merge), בלי לשכתב את כל
+        ה-context.
+        """
+        staged = await self._load(user_id, platform)
+        staged.patch(updates or {}, remove)
+        await self._save(staged)
 
     async def clear_context(self, user_id: int, platform: str) -> None:
         """Clear all context data"""
-        session = await self.get_or_create_session(user_id, platform)
-        session.context_data = {}
-        await self.db.commit()
+        staged = await self._load(user_id, platform)
+        staged.replace({})
+        await self._save(staged)
 
     def _is_valid_transition(self, current: str, target: str) -> bool:
         """Check if transition from current to target state is valid"""
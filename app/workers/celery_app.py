@@ -23,12 +23,41 @@ celery_app = Celery(
 
 
 # סגירת PostHog בכיבוי worker — שליחת אירועים שנותרו בתור
-from celery.signals import worker_shutdown  # noqa: E402
+from celery.signals import (  # noqa: E402
+    worker_process_init,
+    worker_process_shutdown,
+    worker_shutdown,
+)
 
 @worker_shutdown.connect
 def _on_worker_shutdown(**kwargs: object) -> None:
     shutdown_posthog()
 
+
+# worker runtime — event loop, DB engine ו-Redis אחד לכל תהליך (אחרי fork)
+@worker_process_init.connect
+def _on_worker_process_init(**kwargs: object) -> None:
+    # שינויי משתמשים ותחנות ב-tasks מבטלים את מטמוני הזיהוי והיכולות של ה-webhooks
+    from app.domain.services.user_identity_cache import register_identity_cache_listeners
+    register_identity_cache_listeners()
+    from app.domain.services.role_capabilities import register_role_capability_listeners
+    register_role_capability_listeners()
+    if settings.WORKER_RUNTIME_ENABLED:
+        from app.workers.runtime import start_worker_runtime
+        runtime = start_worker_runtime()
+        if settings.OUTBOX_WAKEUP_ENABLED:
+            from app.workers.tasks import outbox_wakeup_listener
+            runtime.spawn(outbox_wakeup_listener())
+        if settings.TELEGRAM_INBOUND_QUEUE_ENABLED:
+            from app.workers.tasks import telegram_inbound_listener
+            runtime.spawn(telegram_inbound_listener())
+
+
+@worker_process_shutdown.connect
+def _on_worker_process_shutdown(**kwargs: object) -> None:
+    from app.workers.runtime import stop_worker_runtime
+    stop_worker_runtime()
+
 # Celery configuration
 celery_app.conf.update(
     task_serializer="json",
@@ -45,9 +74,12 @@ celery_app.conf.update(
 
 # Beat schedule for periodic tasks
 celery_app.conf.beat_schedule = {
+    # safety sweep — הנתיב הראשי הוא התעוררות מיידית אחרי commit
+    # (ראה app/domain/services/outbox_wakeup.py); ה-sweep אוסף retries והודעות
+    # שההתראה עליהן אבדה (Redis לא זמין)
     "process-outbox-every-10-seconds": {
         "task": "app.workers.tasks.process_outbox_messages",
-        "schedule": 10.0,
+        "schedule": settings.OUTBOX_SWEEP_INTERVAL_SECONDS,
     },
     "cleanup-old-messages-daily": {
         "task": "app.workers.tasks.cleanup_old_messages",
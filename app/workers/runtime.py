@@ -0,0 +1,192 @@
+"""
+Worker Runtime — event loop, DB engine ו-Redis client אחד לכל תהליך Celery.
+
+בלי runtime, כל task יוצר event loop חדש ו-get_task_session() יוצר ומשחרר
+engine שלם בכל קריאה — כל הודעת outbox משלמת על TCP connect + TLS/auth
+handshake ל-PostgreSQL. ה-runtime מופעל מ-signal של worker_process_init
+(אחרי fork) ומחזיק:
+
+- event loop יחיד שרץ ב-thread ייעודי לאורך חיי התהליך
+- engine אסינכרוני עם connection pool, משותף לכל ה-tasks
+- Redis client (ה-singleton של get_redis) שנקשר ל-loop הזה ולא נסגר בין tasks
+
+run_async() ב-tasks.py מגיש coroutines ל-runtime כשהוא פעיל, ונופל חזרה
+ל-loop per-task כשלא (בדיקות, pool מסוג solo בלי worker_process_init).
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+from typing import Any, Coroutine, TypeVar
+
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.db import database
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+
+class WorkerRuntime:
+    """event loop + engine + Redis לאורך חיי תהליך worker."""
+
+    def __init__(self) -> None:
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+        self._engine: AsyncEngine | None = None
+        self._session_maker: async_sessionmaker[AsyncSession] | None = None
+        self._background: set[asyncio.Task] = set()
+
+    @property
+    def is_running(self) -> bool:
+        return self._loop is not None and self._loop.is_running()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop | None:
+        return self._loop
+
+    @property
+    def engine(self) -> AsyncEngine | None:
+        return self._engine
+
+    def start(self) -> None:
+        """הפעלת ה-loop ב-thread ייעודי ואתחול engine + Redis עליו."""
+        if self.is_running:
+            return
+
+        loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def _run_loop() -> None:
+            asyncio.set_event_loop(loop)
+            loop.call_soon(started.set)
+            loop.run_forever()
+
+        self._thread = threading.Thread(
+            target=_run_loop, name="worker-runtime-loop", daemon=True
+        )
+        self._thread.start()
+        started.wait()
+        self._loop = loop
+
+        self.run(self._init_resources())
+        logger.info("Worker runtime started")
+
+    def run(self, coro: Coroutine[Any, Any, T], timeout: float | None = None) -> T:
+        """הגשת coroutine ל-loop של ה-runtime והמתנה לתוצאה (חוסם)."""
+        if self._loop is None:
+            raise RuntimeError("Worker runtime is not running")
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        return future.result(timeout)
+
+    def spawn(self, coro: Coroutine[Any, Any, Any]) -> None:
+        """הרצת coroutine ברקע על ה-loop של ה-runtime עד לעצירתו (למשל listener)."""
+
+        async def _start() -> None:
+            task = asyncio.ensure_future(coro)
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+
+        self.run(_start())
+
+    def stop(self) -> None:
+        """שחרור engine + Redis, עצירת ה-loop והמתנה ל-thread."""
+        loop = self._loop
+        if loop is None:
+            return
+
+        try:
+            self.run(self._close_resources(), timeout=30)
+        except Exception as e:
+            logger.warning(
+                "כשלון בשחרור משאבי worker runtime",
+                extra_data={"error": str(e)},
+            )
+
+        loop.call_soon_threadsafe(loop.stop)
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+        loop.close()
+
+        self._loop = None
+        self._thread = None
+        logger.info("Worker runtime stopped")
+
+    async def _init_resources(self) -> None:
+        self._engine = create_async_engine(
+            settings.DATABASE_URL,
+            echo=settings.DEBUG,
+            pool_pre_ping=True,
+            pool_size=5,
+            max_overflow=10,
+        )
+        self._session_maker = async_sessionmaker(
+            bind=self._engine,
+            class_=AsyncSession,
+            expire_on_commit=False,
+        )
+        database.bind_worker_session_maker(self._session_maker, self._loop)
+
+        # Redis singleton נקשר ל-loop הזה — נוצר פעם אחת ולא נסגר בין tasks
+        try:
+            from app.core.redis_client import get_redis
+            await get_redis()
+        except Exception as e:
+            # Redis לא זמין בהפעלה — get_redis ינסה שוב בקריאה הבאה
+            logger.warning(
+                "Redis לא זמין באתחול worker runtime",
+                extra_data={"error": str(e)},
+            )
+
+    async def _close_resources(self) -> None:
+        background = list(self._background)
+        for task in background:
+            task.cancel()
+        if background:
+            await asyncio.gather(*background, return_exceptions=True)
+
+        database.unbind_worker_session_maker()
+        try:
+            from app.core.http_clients import close_http_clients
+            from app.core.redis_client import close_redis
+            await close_http_clients()
+            await close_redis()
+        finally:
+            if self._engine is not None:
+                await self._engine.dispose()
+            self._engine = None
+            self._session_maker = None
+
+
+_runtime: WorkerRuntime | None = None
+
+
+def get_worker_runtime() -> WorkerRuntime | None:
+    """ה-runtime של התהליך הנוכחי, או None אם לא הופעל."""
+    return _runtime
+
+
+def start_worker_runtime() -> WorkerRuntime:
+    """הפעלת runtime לתהליך — נקרא מ-worker_process_init."""
+    global _runtime
+    if _runtime is None:
+        _runtime = WorkerRuntime()
+    _runtime.start()
+    return _runtime
+
+
+def stop_worker_runtime() -> None:
+    """עצירת ה-runtime — נקרא מ-worker_process_shutdown."""
+    global _runtime
+    if _runtime is not None:
+        runtime = _runtime
+        _runtime = None
+        runtime.stop()
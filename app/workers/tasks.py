@@ -9,21 +9,40 @@ from __future__ import annotations
 
 import asyncio
 import time
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from contextlib import contextmanager
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Awaitable, Callable
 
 if TYPE_CHECKING:
     from sqlalchemy.ext.asyncio import AsyncSession
 
+    from app.domain.services.whatsapp.base_provider import BaseWhatsAppProvider
+
 from app.workers.celery_app import celery_app
 from app.db.database import get_task_session
-from app.db.models.outbox_message import OutboxMessage, MessagePlatform, MessageStatus
+from app.db.models.outbox_message import (
+    MessagePlatform,
+    MessagePriority,
+    MessageStatus,
+    OutboxMessage,
+)
+from app.db.models.outbox_fanout import FanoutStatus
 from app.db.models.user import User, UserRole, ApprovalStatus
-from app.domain.services.outbox_service import OutboxService
+from app.domain.services.outbox_coalescing import coalesce_outbox_messages
+from app.domain.services.outbox_metrics import OutboxMetrics
+from app.domain.services.outbox_service import (
+    RIDE_AUDIENCE_DRIVER,
+    RIDE_AUDIENCE_GROUP,
+    RIDE_POSTING_BROADCAST_PREFIX,
+    OutboxService,
+    OutboxTransitions,
+    parse_ride_fanout_recipient,
+)
 from app.domain.services.whatsapp import get_whatsapp_provider, get_whatsapp_group_provider
 from app.core.logging import get_logger, set_correlation_id
 from app.core.circuit_breaker import get_telegram_circuit_breaker
+from app.core.rate_limiter import call_with_rate_limit, telegram_rate_limits
 from app.core.exceptions import TelegramError
 from app.core.validation import PhoneNumberValidator
 from sqlalchemy import select
@@ -53,6 +72,9 @@ def get_event_loop():
                 "כשלון בסגירת Redis בסיום task",
                 extra_data={"error": str(e)},
             )
+        # סגירת ה-HTTP clients של ה-loop — החיבורים שלהם קשורים אליו
+        from app.core.http_clients import close_http_clients
+        loop.run_until_complete(close_http_clients())
         try:
             # Cancel all pending tasks
             pending = asyncio.all_tasks(loop)
@@ -67,10 +89,20 @@ def get_event_loop():
 
 
 def run_async(coro):
-    """Helper to run async code in sync Celery task with proper cleanup"""
+    """Helper to run async code in sync Celery task with proper cleanup
+
+    כשה-worker runtime פעיל (ראה app/workers/runtime.py) ה-coroutine מוגש
+    ל-loop הקבוע שלו — engine ו-Redis משותפים לכל ה-tasks בתהליך.
+    אחרת נוצר event loop חדש ל-task בלבד.
+    """
     # Set correlation ID for task tracking
     set_correlation_id()
 
+    from app.workers.runtime import get_worker_runtime
+    runtime = get_worker_runtime()
+    if runtime is not None and runtime.is_running:
+        return runtime.run(coro)
+
     with get_event_loop() as loop:
         return loop.run_until_complete(coro)
 
@@ -173,23 +205,60 @@ async def _send_whatsapp_message(phone: str, content: dict) -> SendResult:
         await provider.send_text(to=phone, text=formatted_text)
         return SendResult(success=True)
     except Exception as exc:
-        is_transient = _is_transient_error(exc)
-        logger.error(
-            "WhatsApp send error",
-            extra_data={
-                "phone": PhoneNumberValidator.mask(phone),
-                "error": str(exc),
-                "is_transient": is_transient,
-            },
-            exc_info=True,
+        return _whatsapp_send_failure(phone, exc)
+
+
+def _whatsapp_send_failure(phone: str, exc: Exception) -> SendResult:
+    """רישום כשלון שליחת WhatsApp וסיווגו (transient/permanent)"""
+    is_transient = _is_transient_error(exc)
+    logger.error(
+        "WhatsApp send error",
+        extra_data={
+            "phone": PhoneNumberValidator.mask(phone),
+            "error": str(exc),
+            "is_transient": is_transient,
+        },
+        exc_info=exc,
+    )
+    return SendResult(success=False, is_transient=is_transient, error=str(exc))
+
+
+async def _send_whatsapp_bulk(phones: list[str], content: dict) -> list[SendResult]:
+    """
+    שליחת אותה הודעה להרבה נמענים דרך send_text_bulk של הספק — מספר חסום
+    של בקשות במקביל על חיבורי ה-keep-alive, במקום gather של כל הנמענים.
+    ניתוב לספק כמו ב-_send_whatsapp_message (קבוצה / פרטי).
+
+    מחזירה SendResult לכל נמען, לפי הסדר.
+    """
+    message_text = content.get("message_text", "")
+    by_provider: dict[int, tuple["BaseWhatsAppProvider", list[int]]] = {}
+    for index, phone in enumerate(phones):
+        if phone.endswith("@g.us"):
+            provider = get_whatsapp_group_provider()
+        else:
+            provider = get_whatsapp_provider()
+        by_provider.setdefault(id(provider), (provider, []))[1].append(index)
+
+    results: list[SendResult] = [SendResult(success=False)] * len(phones)
+    for provider, indexes in by_provider.values():
+        formatted_text = provider.format_text(message_text)
+        errors = await provider.send_text_bulk(
+            [(phones[i], formatted_text) for i in indexes]
         )
-        return SendResult(success=False, is_transient=is_transient, error=str(exc))
+        for index, exc in zip(indexes, errors):
+            results[index] = (
+                SendResult(success=True)
+                if exc is None
+                else _whatsapp_send_failure(phones[index], exc)
+            )
+    return results
 
 
 async def _send_telegram_message(chat_id: str, content: dict) -> bool:
     """Send message via Telegram Bot API with circuit breaker protection"""
-    import httpx
     from app.core.config import settings
+    from app.core.http_clients import get_telegram_client, telegram_api_url
 
     if not settings.TELEGRAM_BOT_TOKEN:
         logger.warning("Telegram bot token not configured")
@@ -197,8 +266,8 @@ async def _send_telegram_message(chat_id: str, content: dict) -> bool:
 
     circuit_breaker = get_telegram_circuit_breaker()
 
-    async def _send():
-        url = f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/sendMessage"
+    async def _post():
+        url = telegram_api_url("sendMessage")
         payload = {
             "chat_id": chat_id,
             "text": content.get("message_text", ""),
@@ -209,15 +278,19 @@ async def _send_telegram_message(chat_id: str, content: dict) -> bool:
             payload["reply_markup"] = {
                 "inline_keyboard": content["inline_keyboard"]
             }
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, json=payload, timeout=30.0)
-            if response.status_code != 200:
-                raise TelegramError.from_response(
-                    "sendMessage",
-                    response,
-                    message=f"sendMessage returned status {response.status_code}",
-                )
-            return True
+        client = get_telegram_client()
+        response = await client.post(url, json=payload, timeout=30.0)
+        if response.status_code != 200:
+            raise TelegramError.from_response(
+                "sendMessage",
+                response,
+                message=f"sendMessage returned status {response.status_code}",
+            )
+        return True
+
+    async def _send():
+        # מכסה משותפת לכל ה-workers; 429 עם retry_after ממתין במקום להיכשל
+        return await call_with_rate_limit(telegram_rate_limits(chat_id), _post)
 
     try:
         return await circuit_breaker.execute(_send)
@@ -266,99 +339,281 @@ async def _get_dispatcher_recipients(
     return list(result.scalars().all())
 
 
-async def _process_single_message(message: OutboxMessage) -> tuple:
-    """Process a single outbox message"""
-    async with get_task_session() as db:
-        outbox_service = OutboxService(db)
+def _fanout_outcome(result: object) -> tuple[bool, bool, str]:
+    """נרמול תוצאת שליחה לנמען בודד ל-(success, is_transient, error)"""
+    if isinstance(result, BaseException):
+        is_transient = (
+            _is_transient_error(result) if isinstance(result, Exception) else True
+        )
+        return False, is_transient, str(result)
+    if isinstance(result, SendResult):
+        return result.success, result.is_transient, result.error
+    return bool(result), True, "" if result else "Send failed"
+
+
+async def _send_courier_broadcast(
+    outbox_service: OutboxService,
+    message: OutboxMessage,
+    status: OutboxService | OutboxTransitions,
+) -> tuple:
+    """שליחת BROADCAST_COURIERS דרך טבלת ה-fan-out.
+
+    ההודעה מתפרקת לשורת מסירה לכל שליח, והשורות הממתינות נשלחות ב-chunks
+    בגודל OUTBOX_FANOUT_CHUNK_SIZE — זיכרון חסום, והתקדמות נשמרת אחרי כל chunk.
+    נמען שנכשל זמנית נשאר PENDING; ההודעה עצמה חוזרת ל-retry (backoff רגיל)
+    ושולחת שוב רק לנמענים שעדיין ממתינים.
+    """
+    total = await outbox_service.fan_out_courier_broadcast(message)
+    if not total:
+        logger.warning(
+            "Broadcast has no recipients",
+            extra_data={
+                "message_id": message.id,
+                "platform": message.platform.value
+            }
+        )
+        await status.mark_as_failed(
+            message.id,
+            "No recipients available for broadcast"
+        )
+        return False, "No recipients available for broadcast"
+
+    content = message.message_content
+
+    async def _send_chunk(recipients: list[str]) -> list:
+        if message.platform == MessagePlatform.WHATSAPP:
+            # send_text_bulk — ה-chunk זורם על חיבורי ה-keep-alive של הגטוויי
+            return await _send_whatsapp_bulk(recipients, content)
+        return await asyncio.gather(
+            *(_send_telegram_message(r, content) for r in recipients),
+            return_exceptions=True,
+        )
+
+    counts = await _drain_fanout(outbox_service, message, _send_chunk)
+    if counts is None:
+        return False, _FANOUT_LEASE_LOST
+    return await _finish_fanout(status, message, total, counts)
+
+
+_FANOUT_LEASE_LOST = "Fan-out lease lost — another worker continues the broadcast"
+
+
+async def _drain_fanout(
+    outbox_service: OutboxService,
+    message: OutboxMessage,
+    send_chunk: Callable[[list[str]], Awaitable[list]],
+) -> dict[FanoutStatus, int] | None:
+    """שליחת שורות ה-fan-out הממתינות ב-chunks בגודל OUTBOX_FANOUT_CHUNK_SIZE.
+
+    זיכרון חסום, והתקדמות נשמרת אחרי כל chunk. broadcast גדול (אלפי נמענים
+    תחת rate limit) ארוך מ-OUTBOX_CLAIM_LEASE_SECONDS — לכן ה-lease מוארך אחרי
+    כל chunk. אם ההארכה נכשלת (ה-lease פקע וההודעה נתפסה מחדש) הריקון נעצר
+    ומוחזר None: ה-worker החדש ממשיך מהשורות הממתינות, ואין מעבר סטטוס.
+    אחרת מחזיר ספירה לפי סטטוס.
+    """
+    from app.core.config import settings
+
+    after_id = 0
+    while True:
+        chunk = await outbox_service.get_pending_fanout_chunk(
+            message.id, after_id=after_id, limit=settings.OUTBOX_FANOUT_CHUNK_SIZE
+        )
+        if not chunk:
+            break
+        after_id = chunk[-1].id
+        results = await send_chunk([r.recipient_id for r in chunk])
+        await outbox_service.record_fanout_results(
+            chunk,
+            [_fanout_outcome(r) for r in results],
+            max_retries=message.max_retries,
+        )
+        if not await outbox_service.extend_lease(message):
+            logger.warning(
+                "ה-lease של הודעת fan-out אבד — עצירת השליחה",
+                extra_data={"message_id": message.id, "after_id": after_id},
+            )
+            return None
+
+    return await outbox_service.get_fanout_status_counts(message.id)
+
+
+async def _finish_fanout(
+    status: OutboxService | OutboxTransitions,
+    message: OutboxMessage,
+    total: int,
+    counts: dict[FanoutStatus, int],
+) -> tuple:
+    """מעבר הסטטוס של הודעת fan-out לפי תוצאות השורות.
+
+    נמען שנכשל זמנית נשאר PENDING; ההודעה חוזרת ל-retry (backoff רגיל)
+    ושולחת שוב רק לנמענים שעדיין ממתינים.
+    """
+    sent = counts[FanoutStatus.SENT]
+    pending = counts[FanoutStatus.PENDING]
+
+    if pending:
+        # נמענים שנכשלו זמנית — retry של ההודעה ישלח רק להם
+        await status.mark_as_failed(
+            message.id,
+            f"{pending}/{total} recipients pending retry",
+            is_transient=True,
+        )
+        if sent:
+            return True, (
+                f"Partial broadcast: {sent}/{total} succeeded, "
+                f"{pending} pending retry"
+            )
+        return False, "Broadcast failed"
+
+    if sent == total:
+        await status.mark_as_sent(message.id)
+        return True, f"Broadcast sent to {sent}/{total} recipients"
+    if sent:
+        # השאר נכשלו סופית (שגיאה קבועה / מיצוי ניסיונות) — אין מה לנסות שוב
+        await status.mark_as_sent(message.id)
+        return True, f"Partial broadcast: {sent}/{total} succeeded"
+
+    await status.mark_as_failed(
+        message.id,
+        "All recipients failed",
+        is_transient=False,
+    )
+    return False, "Broadcast failed"
 
-        # נעילה אטומית — UPDATE ... WHERE status = 'PENDING'
-        # אם rowcount == 0, worker אחר כבר תפס את ההודעה (מונע שליחה כפולה)
-        from sqlalchemy import update as sa_update
-        claim_result = await db.execute(
-            sa_update(OutboxMessage)
-            .where(
-                OutboxMessage.id == message.id,
-                OutboxMessage.status == MessageStatus.PENDING,
+
+async def _send_ride_posting_broadcast(
+    outbox_service: OutboxService,
+    message: OutboxMessage,
+    status: OutboxService | OutboxTransitions,
+) -> tuple:
+    """הפצת פרסום נסיעה — קבוצות ונהגים תואמים, ודיווח סיכום לנהג המפרסם.
+
+    כל chunk מתפצל לפי (קהל, פלטפורמה) והחלקים נשלחים במקביל: WhatsApp דרך
+    send_text_bulk, Telegram ב-gather (המכסה המשותפת של ה-rate limiter חלה).
+    הסיכום נשלח פעם אחת, כשלא נשארו נמענים ממתינים.
+    """
+    total = await outbox_service.count_fanout_recipients(message.id)
+    if not total:
+        await status.mark_as_failed(
+            message.id, "No recipients for ride posting", is_transient=False
+        )
+        return False, "No recipients for ride posting"
+
+    content = message.message_content
+    texts = {
+        RIDE_AUDIENCE_GROUP: content.get("group_text", ""),
+        RIDE_AUDIENCE_DRIVER: content.get("driver_text", ""),
+    }
+
+    async def _send_chunk(recipient_ids: list[str]) -> list:
+        parts: dict[tuple[str, MessagePlatform], list[int]] = {}
+        targets: list[str] = []
+        for index, recipient_id in enumerate(recipient_ids):
+            audience, platform, target = parse_ride_fanout_recipient(recipient_id)
+            parts.setdefault((audience, platform), []).append(index)
+            targets.append(target)
+
+        async def _send_part(audience: str, platform: MessagePlatform, indexes: list[int]) -> list:
+            part_content = {"message_text": texts[audience]}
+            if platform == MessagePlatform.WHATSAPP:
+                return await _send_whatsapp_bulk([targets[i] for i in indexes], part_content)
+            return await asyncio.gather(
+                *(_send_telegram_message(targets[i], part_content) for i in indexes),
+                return_exceptions=True,
             )
-            .values(status=MessageStatus.PROCESSING)
+
+        part_results = await asyncio.gather(
+            *(_send_part(audience, platform, indexes)
+              for (audience, platform), indexes in parts.items())
         )
-        await db.commit()
-        if claim_result.rowcount == 0:
-            return True, "Already processed or in progress"
+        results: list = [None] * len(recipient_ids)
+        for indexes, part in zip(parts.values(), part_results):
+            for index, result in zip(indexes, part):
+                results[index] = result
+        return results
+
+    if await _drain_fanout(outbox_service, message, _send_chunk) is None:
+        return False, _FANOUT_LEASE_LOST
+    counts = await outbox_service.get_ride_fanout_counts(message.id)
+    by_status = {
+        fanout_status: sum(n for (_, s), n in counts.items() if s == fanout_status)
+        for fanout_status in FanoutStatus
+    }
+    outcome = await _finish_fanout(status, message, total, by_status)
+
+    report_recipient = content.get("report_recipient")
+    if report_recipient and not by_status[FanoutStatus.PENDING]:
+        await _send_ride_posting_report(message.platform, report_recipient, counts)
+    return outcome
+
+
+async def _send_ride_posting_report(
+    platform: MessagePlatform,
+    recipient: str,
+    counts: dict[tuple[str, FanoutStatus], int],
+) -> None:
+    """סיכום ההפצה לנהג המפרסם — best-effort, לא משפיע על סטטוס ההודעה"""
+
+    def _line(audience: str, label: str) -> str:
+        audience_total = sum(n for (a, _), n in counts.items() if a == audience)
+        if not audience_total:
+            return ""
+        sent = counts.get((audience, FanoutStatus.SENT), 0)
+        return f"{label}: {sent}/{audience_total}\n"
+
+    text = (
+        "📊 <b>סיכום הפצת הנסיעה</b>\n\n"
+        + _line(RIDE_AUDIENCE_GROUP, "📢 קבוצות")
+        + _line(RIDE_AUDIENCE_DRIVER, "📨 נהגים עם חיפוש תואם")
+    )
+    try:
+        if platform == MessagePlatform.WHATSAPP:
+            await _send_whatsapp_message(recipient, {"message_text": text})
+        else:
+            await _send_telegram_message(recipient, {"message_text": text})
+    except Exception as e:
+        logger.warning(
+            "כשלון בשליחת סיכום הפצת נסיעה",
+            extra_data={"platform": platform.value, "error": str(e)},
+        )
+
+
+async def _process_single_message(
+    message: OutboxMessage,
+    *,
+    claimed: bool = False,
+    transitions: OutboxTransitions | None = None,
+) -> tuple:
+    """Process a single outbox message
+
+    Args:
+        message: הודעת ה-outbox לעיבוד
+        claimed: האם ההודעה כבר נתפסה (PROCESSING + lease) ע"י
+            OutboxService.claim_pending_messages — אם כן, מדלגים על התפיסה הבודדת
+        transitions: אם סופק — מעבר הסטטוס (SENT / retry / dead letter) נרשם
+            בו ומוחל יחד עם שאר ה-batch, במקום UPDATE + commit להודעה בודדת
+    """
+    async with get_task_session() as db:
+        outbox_service = OutboxService(db)
+        status = transitions if transitions is not None else outbox_service
+
+        # נעילה אטומית — אם ההודעה לא נתפסה, worker אחר כבר תפס אותה (מונע שליחה כפולה)
+        if not claimed:
+            lease = await outbox_service.claim_message(message.id)
+            if lease is None:
+                return True, "Already processed or in progress"
+            # הארכת ה-lease ב-fan-out מגודרת בערך שאיתו נתפסה ההודעה
+            message.locked_until = lease
 
         try:
             content = message.message_content
 
             # Handle broadcast messages
             if message.recipient_id == "BROADCAST_COURIERS":
-                recipients = await _get_courier_recipients(db, message.platform)
-
-                # אם אין נמענים - לא לסמן כנשלח, להחזיר שגיאה
-                if not recipients:
-                    logger.warning(
-                        "Broadcast has no recipients",
-                        extra_data={
-                            "message_id": message.id,
-                            "platform": message.platform.value
-                        }
-                    )
-                    await outbox_service.mark_as_failed(
-                        message.id,
-                        "No recipients available for broadcast"
-                    )
-                    return False, "No recipients available for broadcast"
-
-                # Send to all recipients in parallel for better performance
-                if message.platform == MessagePlatform.WHATSAPP:
-                    tasks = [
-                        _send_whatsapp_message(r.phone_number, content)
-                        for r in recipients
-                    ]
-                else:
-                    tasks = [
-                        _send_telegram_message(r.telegram_chat_id, content)
-                        for r in recipients if r.telegram_chat_id
-                    ]
+                return await _send_courier_broadcast(outbox_service, message, status)
 
-                # בדיקה נוספת אחרי סינון - רלוונטי ל-Telegram כשיש נמענים בלי chat_id
-                if not tasks:
-                    logger.warning(
-                        "Broadcast has no valid recipients after filtering",
-                        extra_data={
-                            "message_id": message.id,
-                            "platform": message.platform.value,
-                            "total_recipients": len(recipients)
-                        }
-                    )
-                    await outbox_service.mark_as_failed(
-                        message.id,
-                        f"No valid recipients (had {len(recipients)} without chat_id)"
-                    )
-                    return False, f"No valid recipients for {message.platform.value}"
-
-                results = await asyncio.gather(*tasks, return_exceptions=True)
-                success_count = sum(
-                    1 for r in results
-                    if not isinstance(r, BaseException) and bool(r)
-                )
-                total_count = len(results)
-
-                if success_count == total_count:
-                    await outbox_service.mark_as_sent(message.id)
-                    return True, f"Broadcast sent to {success_count}/{total_count} recipients"
-                elif success_count > 0:
-                    await outbox_service.mark_as_sent(message.id)
-                    return True, f"Partial broadcast: {success_count}/{total_count} succeeded"
-                else:
-                    is_transient = _classify_broadcast_failure(
-                        results, message.id, "הברודקאסט"
-                    )
-                    await outbox_service.mark_as_failed(
-                        message.id,
-                        "All recipients failed",
-                        is_transient=is_transient,
-                    )
-                    return False, "Broadcast failed"
+            if message.recipient_id.startswith(RIDE_POSTING_BROADCAST_PREFIX):
+                return await _send_ride_posting_broadcast(outbox_service, message, status)
 
             # שלב 4: שידור לסדרני תחנה
             elif message.recipient_id.startswith("BROADCAST_DISPATCHERS_"):
@@ -376,7 +631,7 @@ async def _process_single_message(message: OutboxMessage) -> tuple:
                             "platform": message.platform.value,
                         }
                     )
-                    await outbox_service.mark_as_failed(
+                    await status.mark_as_failed(
                         message.id,
                         "No dispatchers available for station"
                     )
@@ -397,7 +652,7 @@ async def _process_single_message(message: OutboxMessage) -> tuple:
                     ]
 
                 if not tasks:
-                    await outbox_service.mark_as_failed(
+                    await status.mark_as_failed(
                         message.id,
                         f"No valid dispatcher recipients for {message.platform.value}"
                     )
@@ -410,13 +665,13 @@ async def _process_single_message(message: OutboxMessage) -> tuple:
                 )
 
                 if success_count > 0:
-                    await outbox_service.mark_as_sent(message.id)
+                    await status.mark_as_sent(message.id)
                     return True, f"Sent to {success_count}/{len(results)} dispatchers"
                 else:
                     is_transient = _classify_broadcast_failure(
                         results, message.id, "ברודקאסט הסדרנים"
                     )
-                    await outbox_service.mark_as_failed(
+                    await status.mark_as_failed(
                         message.id,
                         "All dispatchers failed",
                         is_transient=is_transient,
@@ -440,7 +695,7 @@ async def _process_single_message(message: OutboxMessage) -> tuple:
                     error_msg = "Send failed"
 
                 if success:
-                    await outbox_service.mark_as_sent(message.id)
+                    await status.mark_as_sent(message.id)
                     logger.info(
                         "הודעה ישירה נשלחה בהצלחה",
                         extra_data={
@@ -454,7 +709,7 @@ async def _process_single_message(message: OutboxMessage) -> tuple:
                     )
                     return True, "Message sent successfully"
                 else:
-                    await outbox_service.mark_as_failed(
+                    await status.mark_as_failed(
                         message.id, error_msg, is_transient=is_transient
                     )
                     logger.warning(
@@ -469,34 +724,327 @@ async def _process_single_message(message: OutboxMessage) -> tuple:
                     return False, error_msg
 
         except Exception as e:
-            await outbox_service.mark_as_failed(message.id, str(e))
+            await status.mark_as_failed(message.id, str(e))
             return False, str(e)
 
 
-@celery_app.task(name="app.workers.tasks.process_outbox_messages")
-def process_outbox_messages():
+def _group_by_recipient(messages: list[OutboxMessage]) -> list[list[OutboxMessage]]:
+    """חלוקת batch לקבוצות לפי (platform, recipient_id), תוך שמירת סדר FIFO בכל קבוצה"""
+    groups: dict[tuple[MessagePlatform, str], list[OutboxMessage]] = {}
+    for message in messages:
+        groups.setdefault((message.platform, message.recipient_id), []).append(message)
+    return list(groups.values())
+
+
+async def _dispatch_concurrently(
+    messages: list[OutboxMessage],
+    *,
+    platform_limits: dict[MessagePlatform, int],
+    transitions: OutboxTransitions | None = None,
+    metrics: OutboxMetrics | None = None,
+) -> list[dict]:
+    """שליחה מקבילית של הודעות שנתפסו, עם semaphore נפרד לכל פלטפורמה.
+
+    כל נמען מטופל ב-coroutine משלו שעובר על ההודעות שלו בסדר — שתי הודעות
+    לאותו recipient_id לעולם לא יוצאות מחוץ לסדר. נמענים שונים רצים במקביל,
+    עד platform_limits שליחות בו-זמניות לכל פלטפורמה, כך שקריאה איטית אחת
+    ל-Telegram/WPPConnect לא תוקעת את כל ה-batch.
+
+    כל הודעה פותחת סשן משלה (_process_single_message → get_task_session).
     """
-    Process pending messages from the outbox.
-    This task runs periodically to ensure reliable message delivery.
+    semaphores = {
+        platform: asyncio.Semaphore(limit)
+        for platform, limit in platform_limits.items()
+    }
+    results_by_id: dict[int, dict] = {}
+
+    async def _drain_recipient(group: list[OutboxMessage]) -> None:
+        for message in group:
+            try:
+                async with semaphores[message.platform]:
+                    started = time.perf_counter()
+                    success, result = await _process_single_message(
+                        message, claimed=True, transitions=transitions
+                    )
+                    if metrics is not None:
+                        metrics.observe(
+                            "outbox_send_duration_seconds",
+                            message,
+                            time.perf_counter() - started,
+                        )
+            except Exception as e:
+                # ההודעה נשארת PROCESSING עד שה-lease פוקע ונתפסת מחדש
+                logger.error(
+                    "כשלון בלתי צפוי בשליחה מקבילית",
+                    extra_data={"message_id": message.id, "error": str(e)},
+                    exc_info=True,
+                )
+                success, result = False, str(e)
+            results_by_id[message.id] = {
+                "message_id": message.id,
+                "success": success,
+                "result": result,
+            }
+
+    await asyncio.gather(
+        *(_drain_recipient(group) for group in _group_by_recipient(messages))
+    )
+    return [results_by_id[message.id] for message in messages]
+
+
+@dataclass(frozen=True)
+class OutboxLane:
+    """נתיב שליחה ב-outbox — עדיפויות שנתפסות יחד ותקציב ה-batch שלהן"""
+    name: str
+    priorities: tuple[MessagePriority, ...] | None  # None = כל העדיפויות
+    batch_size: int
+
+
+def _outbox_lanes() -> list[OutboxLane]:
+    """נתיבי ה-outbox לפי ההגדרות. כל נתיב מרוקן בנפרד — broadcast גדול
+    בנתיב ה-bulk לא מעכב הודעות בנתיב ה-interactive."""
+    from app.core.config import settings as _cfg
+
+    if not _cfg.OUTBOX_PRIORITY_LANES_ENABLED:
+        return [OutboxLane("all", None, _cfg.OUTBOX_BATCH_SIZE)]
+    return [
+        OutboxLane(
+            "interactive", (MessagePriority.INTERACTIVE,), _cfg.OUTBOX_INTERACTIVE_BATCH_SIZE
+        ),
+        OutboxLane("normal", (MessagePriority.NORMAL,), _cfg.OUTBOX_NORMAL_BATCH_SIZE),
+        OutboxLane("bulk", (MessagePriority.BULK,), _cfg.OUTBOX_BULK_BATCH_SIZE),
+    ]
+
+
+async def _process_outbox_batch(lane: OutboxLane | None = None) -> list[dict]:
+    """תפיסת batch אחד מה-outbox ושליחתו (סדרתי או מקבילי לפי ההגדרות).
+
+    עם lane — רק הודעות בעדיפויות של הנתיב, עד תקציב ה-batch שלו. בלי lane
+    (ה-sweep של Beat) — כל העדיפויות, הגבוהה קודם.
     """
+    from app.core.config import settings as _cfg
 
-    async def _process():
-        async with get_task_session() as db:
-            outbox_service = OutboxService(db)
-            messages = await outbox_service.get_pending_messages(limit=50)
+    async with get_task_session() as db:
+        outbox_service = OutboxService(db)
+        # תפיסת batch ב-round trip אחד (SKIP LOCKED) — כמה workers
+        # יכולים לרוקן את הטבלה במקביל בלי להתחרות על אותן שורות
+        messages = await outbox_service.claim_pending_messages(
+            limit=lane.batch_size if lane else _cfg.OUTBOX_BATCH_SIZE,
+            priorities=lane.priorities if lane else None,
+        )
+
+    if not messages:
+        return []
+
+    claimed_at = datetime.utcnow()
+    metrics = OutboxMetrics() if _cfg.OUTBOX_METRICS_ENABLED else None
+    if metrics is not None:
+        metrics.record_claim(messages, claimed_at)
+
+    # מעברי הסטטוס של כל ה-batch נאספים ומוחלים יחד — UPDATE אחד להצלחות,
+    # אחד לכשלונות ו-commit אחד, במקום SELECT + UPDATE + commit לכל הודעה.
+    # קריסה לפני ההחלה משאירה את ההודעות PROCESSING עד שה-lease פוקע.
+    transitions = OutboxTransitions(messages)
+
+    # איחוד הודעות טקסט לאותו נמען לשליחה אחת — התוצאה מוחלת על כולן
+    outgoing = messages
+    coalesced: dict[int, list[OutboxMessage]] = {}
+    if _cfg.OUTBOX_COALESCE_ENABLED:
+        outgoing = []
+        for send, covered in coalesce_outbox_messages(
+            messages, window_seconds=_cfg.OUTBOX_COALESCE_WINDOW_SECONDS
+        ):
+            outgoing.append(send)
+            if len(covered) > 1:
+                transitions.coalesce(send.id, [m.id for m in covered])
+                coalesced[send.id] = covered
+        if coalesced:
+            logger.info(
+                "הודעות outbox אוחדו לפי נמען",
+                extra_data={"messages": len(messages), "sends": len(outgoing)},
+            )
+
+    if _cfg.OUTBOX_CONCURRENT_DISPATCH:
+        results = await _dispatch_concurrently(
+            outgoing,
+            platform_limits={
+                MessagePlatform.WHATSAPP: _cfg.OUTBOX_WHATSAPP_CONCURRENCY,
+                MessagePlatform.TELEGRAM: _cfg.OUTBOX_TELEGRAM_CONCURRENCY,
+            },
+            transitions=transitions,
+            metrics=metrics,
+        )
+    else:
+        results = []
+        for message in outgoing:
+            try:
+                started = time.perf_counter()
+                success, result = await _process_single_message(
+                    message, claimed=True, transitions=transitions
+                )
+                if metrics is not None:
+                    metrics.observe(
+                        "outbox_send_duration_seconds", message, time.perf_counter() - started
+                    )
+            except Exception as e:
+                # ההודעה נשארת PROCESSING עד שה-lease פוקע ונתפסת מחדש
+                logger.error(
+                    "כשלון בלתי צפוי בשליחת הודעת outbox",
+                    extra_data={"message_id": message.id, "error": str(e)},
+                    exc_info=True,
+                )
+                success, result = False, str(e)
+            results.append({
+                "message_id": message.id,
+                "success": success,
+                "result": result
+            })
+
+    if coalesced:
+        # תוצאה לכל הודעה שנתפסה — _drain_outbox משווה לגודל ה-batch
+        expanded = []
+        for result in results:
+            covered = coalesced.get(result["message_id"])
+            if covered is None:
+                expanded.append(result)
+            else:
+                expanded.extend({**result, "message_id": m.id} for m in covered)
+        results = expanded
 
-            results = []
-            for message in messages:
-                success, result = await _process_single_message(message)
-                results.append({
-                    "message_id": message.id,
-                    "success": success,
-                    "result": result
-                })
+    async with get_task_session() as db:
+        dead_ids = await OutboxService(db).apply_transitions(transitions)
+
+    if metrics is not None:
+        metrics.record_outcomes(
+            transitions.sent_messages,
+            [message for message, _, _ in transitions.failures],
+            set(dead_ids),
+            claimed_at,
+        )
+        await metrics.flush()
 
-            return results
+    return results
 
-    return run_async(_process())
+
+async def _drain_outbox(lane: OutboxLane | None = None) -> int:
+    """ריקון ה-outbox ב-batches עד שה-batch האחרון לא מלא. מחזיר כמה הודעות עובדו.
+
+    בלי lane — כל הנתיבים במקביל, כל אחד עם תקציב ה-batch שלו.
+    """
+    from app.core.config import settings as _cfg
+
+    if lane is None:
+        counts = await asyncio.gather(*(_drain_outbox(l) for l in _outbox_lanes()))
+        return sum(counts)
+
+    processed = 0
+    for _ in range(_cfg.OUTBOX_WAKEUP_MAX_BATCHES):
+        results = await _process_outbox_batch(lane)
+        processed += len(results)
+        if len(results) < lane.batch_size:
+            break
+    return processed
+
+
+async def _drain_lane_on_wakeup(lane: OutboxLane, rerun: set[str]) -> None:
+    """ריקון נתיב אחד אחרי התעוררות. התעוררות שהגיעה בזמן הריקון (rerun)
+    מפעילה סבב נוסף — הודעה שנוספה אחרי ה-batch האחרון לא מחכה ל-Beat."""
+    while True:
+        rerun.discard(lane.name)
+        try:
+            processed = await _drain_outbox(lane)
+            logger.info(
+                "Outbox drained on wake-up",
+                extra_data={"lane": lane.name, "processed": processed},
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(
+                "כשלון בריקון outbox אחרי התעוררות",
+                extra_data={"lane": lane.name, "error": str(e)},
+                exc_info=True,
+            )
+        if lane.name not in rerun:
+            return
+
+
+async def outbox_wakeup_listener() -> None:
+    """listener לאורך חיי ה-worker: BLPOP על OUTBOX_WAKEUP_KEY ו-drain מיידי.
+
+    רץ ברקע על ה-worker runtime (worker_process_init). כמה תהליכים יכולים
+    להאזין במקביל — כל token נמסר לאחד בלבד, והתפיסה ב-SKIP LOCKED מונעת
+    התנגשות עם ה-sweep של Beat.
+
+    כל נתיב עדיפות מרוקן ב-task משלו, והלולאה חוזרת ל-BLPOP בלי לחכות:
+    בזמן ש-broadcast גדול מתרוקן בנתיב ה-bulk, התעוררות חדשה מרוקנת את נתיב
+    ה-interactive מיד. לכל נתיב רץ לכל היותר ריקון אחד בתהליך.
+    """
+    from app.core.config import settings as _cfg
+    from app.core.redis_client import get_redis
+    from app.domain.services.outbox_wakeup import OUTBOX_WAKEUP_KEY
+
+    lane_tasks: dict[str, asyncio.Task] = {}
+    rerun: set[str] = set()
+
+    logger.info("Outbox wake-up listener started")
+    try:
+        while True:
+            try:
+                redis = await get_redis()
+                token = await redis.blpop(
+                    OUTBOX_WAKEUP_KEY, timeout=_cfg.OUTBOX_WAKEUP_BLOCK_SECONDS
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(
+                    "כשלון בהמתנה להתעוררות outbox — ניסיון חוזר",
+                    extra_data={"error": str(e)},
+                )
+                await asyncio.sleep(_cfg.OUTBOX_WAKEUP_BLOCK_SECONDS)
+                continue
+
+            if token is None:
+                continue
+
+            set_correlation_id()
+            for lane in _outbox_lanes():
+                running = lane_tasks.get(lane.name)
+                if running is not None and not running.done():
+                    rerun.add(lane.name)
+                    continue
+                lane_tasks[lane.name] = asyncio.create_task(
+                    _drain_lane_on_wakeup(lane, rerun)
+                )
+    finally:
+        for task in lane_tasks.values():
+            task.cancel()
+        await asyncio.gather(*lane_tasks.values(), return_exceptions=True)
+
+
+async def telegram_inbound_listener() -> None:
+    """consumer של התור הנכנס של טלגרם לאורך חיי ה-worker.
+
+    רץ ברקע על ה-worker runtime (worker_process_init) כש-
+    TELEGRAM_INBOUND_QUEUE_ENABLED. ה-updates מעובדים באותו נתיב כמו ה-webhook
+    (process_queued_telegram_update), בסשן מה-pool של ה-runtime.
+    """
+    from app.api.webhooks.telegram import process_queued_telegram_update
+    from app.domain.services.telegram_inbound_queue import TelegramInboundConsumer
+
+    await TelegramInboundConsumer(process_queued_telegram_update).run()
+
+
+@celery_app.task(name="app.workers.tasks.process_outbox_messages")
+def process_outbox_messages():
+    """
+    Process pending messages from the outbox.
+    This task runs periodically to ensure reliable message delivery.
+
+    הנתיב הראשי הוא outbox_wakeup_listener — ה-task הזה הוא safety sweep.
+    """
+    return run_async(_process_outbox_batch())
 
 
 @celery_app.task(name="app.workers.tasks.send_message")
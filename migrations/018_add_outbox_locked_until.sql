@@ -0,0 +1,4 @@
+-- מיגרציה 018: lease לתפיסת הודעות outbox ב-batch (SELECT ... FOR UPDATE SKIP LOCKED)
+-- locked_until — עד מתי ה-worker שתפס את ההודעה (PROCESSING) מחזיק בה.
+-- אחרי פקיעה (worker קרס באמצע) ההודעה ניתנת לתפיסה מחדש ע"י worker אחר.
+ALTER TABLE outbox_messages ADD COLUMN IF NOT EXISTS locked_until TIMESTAMP;
@@ -0,0 +1,25 @@
+-- מיגרציה 019: טבלת fan-out לנמענים של הודעות BROADCAST_COURIERS
+-- כל broadcast מתפרק לשורת מסירה לשליח — שליחה ב-chunks, התקדמות נשמרת,
+-- ו-retry של ההודעה שולח רק לנמענים שעדיין PENDING.
+-- SQLEnum ללא values_callable שומר member names (uppercase).
+DO $$ BEGIN
+    CREATE TYPE fanoutstatus AS ENUM ('PENDING', 'SENT', 'FAILED');
+EXCEPTION
+    WHEN duplicate_object THEN NULL;
+END $$;
+
+CREATE TABLE IF NOT EXISTS outbox_fanout_recipients (
+    id SERIAL PRIMARY KEY,
+    outbox_message_id INTEGER NOT NULL REFERENCES outbox_messages(id) ON DELETE CASCADE,
+    user_id BIGINT,
+    recipient_id VARCHAR(100) NOT NULL,
+    status fanoutstatus NOT NULL DEFAULT 'PENDING',
+    retry_count INTEGER NOT NULL DEFAULT 0,
+    last_error VARCHAR(1000),
+    created_at TIMESTAMP,
+    sent_at TIMESTAMP,
+    CONSTRAINT uq_fanout_message_recipient UNIQUE (outbox_message_id, recipient_id)
+);
+
+CREATE INDEX IF NOT EXISTS ix_fanout_message_status
+    ON outbox_fanout_recipients(outbox_message_id, status);
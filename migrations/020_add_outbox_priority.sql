@@ -0,0 +1,27 @@
+-- מיגרציה 020: נתיבי עדיפות ב-outbox
+-- priority נגזר מ-message_type (0=interactive, 1=normal, 2=bulk). כל נתיב נתפס
+-- בנפרד, כך ש-broadcast גדול לא מעכב הודעות אינטראקטיביות.
+ALTER TABLE outbox_messages ADD COLUMN IF NOT EXISTS priority SMALLINT NOT NULL DEFAULT 1;
+
+-- מילוי לאחור להודעות שעדיין לא נשלחו
+-- הרשימות חייבות להתאים ל-MESSAGE_TYPE_PRIORITIES ב-app/db/models/outbox_message.py
+UPDATE outbox_messages SET priority = 0
+WHERE status IN ('PENDING', 'PROCESSING')
+  AND message_type IN (
+      'capture_notification_sender',
+      'delivery_request_notification',
+      'delivery_decision_notification',
+      'panel_otp'
+  );
+UPDATE outbox_messages SET priority = 2
+WHERE status IN ('PENDING', 'PROCESSING')
+  AND message_type IN (
+      'delivery_broadcast',
+      'ride_posting_broadcast',
+      'expiry_warning'
+  );
+
+-- תפיסת batch לנתיב: WHERE status = 'PENDING' AND priority = ? ORDER BY created_at
+CREATE INDEX IF NOT EXISTS idx_outbox_pending_lane
+    ON outbox_messages(priority, created_at)
+    WHERE status = 'PENDING';
@@ -0,0 +1,16 @@
+-- מיגרציה 021: conversation_sessions.context_data מ-JSON ל-JSONB
+-- StateManager כותב patch חלקי: (context_data - ARRAY[...]) || patch.
+-- האופרטורים קיימים רק ל-JSONB — על עמודת json כל כתיבת state נכשלת.
+-- idempotent: ההמרה רצה רק כשהעמודה עדיין json (גם run_migration_017 מריץ אותה).
+DO $$ BEGIN
+    IF EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = current_schema()
+          AND table_name = 'conversation_sessions'
+          AND column_name = 'context_data'
+          AND data_type = 'json'
+    ) THEN
+        ALTER TABLE conversation_sessions
+            ALTER COLUMN context_data TYPE JSONB USING context_data::jsonb;
+    END IF;
+END $$;
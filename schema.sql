@@ -169,12 +169,14 @@ CREATE TABLE outbox_messages (
     recipient_id VARCHAR(100) NOT NULL,
     message_type VARCHAR(50) NOT NULL,
     message_content JSONB NOT NULL,
+    priority SMALLINT NOT NULL DEFAULT 1,
     status message_status DEFAULT 'pending',
     retry_count INTEGER DEFAULT 0,
     max_retries INTEGER DEFAULT 3,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     processed_at TIMESTAMP WITH TIME ZONE,
     next_retry_at TIMESTAMP WITH TIME ZONE,
+    locked_until TIMESTAMP WITH TIME ZONE,
     last_error TEXT
 );
 
@@ -182,9 +184,31 @@ CREATE INDEX idx_outbox_status ON outbox_messages(status);
 CREATE INDEX idx_outbox_next_retry ON outbox_messages(next_retry_at)
     WHERE status = 'pending' OR status = 'failed';
 CREATE INDEX idx_outbox_created ON outbox_messages(created_at DESC);
+-- תפיסת batch לכל נתיב עדיפות (0=interactive, 1=normal, 2=bulk)
+CREATE INDEX idx_outbox_pending_lane ON outbox_messages(priority, created_at)
+    WHERE status = 'pending';
 
 COMMENT ON TABLE outbox_messages IS 'Pending broadcasts with retry tracking for reliable messaging';
 
+CREATE TYPE fanoutstatus AS ENUM ('PENDING', 'SENT', 'FAILED');
+
+CREATE TABLE outbox_fanout_recipients (
+    id SERIAL PRIMARY KEY,
+    outbox_message_id INTEGER NOT NULL REFERENCES outbox_messages(id) ON DELETE CASCADE,
+    user_id BIGINT,
+    recipient_id VARCHAR(100) NOT NULL,
+    status fanoutstatus NOT NULL DEFAULT 'PENDING',
+    retry_count INTEGER NOT NULL DEFAULT 0,
+    last_error VARCHAR(1000),
+    created_at TIMESTAMP WITH TIME ZONE,
+    sent_at TIMESTAMP WITH TIME ZONE,
+    CONSTRAINT uq_fanout_message_recipient UNIQUE (outbox_message_id, recipient_id)
+);
+
+CREATE INDEX ix_fanout_message_status ON outbox_fanout_recipients(outbox_message_id, status);
+
+COMMENT ON TABLE outbox_fanout_recipients IS 'Per-recipient delivery rows of BROADCAST_COURIERS outbox messages';
+
 -- =====================================================
 -- Broadcast Messages Table (For tracking sent broadcasts)
 -- =====================================================
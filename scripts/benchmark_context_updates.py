@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Conversation context update benchmark — full rewrite vs JSONB patch.
+
+Runs wizard-like turns against DATABASE_URL (PostgreSQL) in two modes and
+reports CPU time, bound context payload and WAL bytes per turn:
+
+- rewrite: deepcopy of the whole context_data and an ORM write of the full blob
+  (what StateManager did before the context patch)
+- patch:   StateManager.patch_context — only the changed key is sent
+
+Creates a temporary user and conversation and deletes them at the end. Run it
+against a staging database with no other traffic — WAL is measured with
+pg_current_wal_lsn() and includes every write on the server.
+
+Usage:
+    python scripts/benchmark_context_updates.py [--turns 200] [--keys 40]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import copy
+import json
+import sys
+import time
+import uuid
+from pathlib import Path
+
+# לאפשר הרצה מכל תיקיה (למשל ב-Render Shell)
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from sqlalchemy import delete, text  # noqa: E402
+
+from app.db.database import AsyncSessionLocal  # noqa: E402
+from app.db.models.conversation_session import ConversationSession  # noqa: E402
+from app.db.models.user import User, UserRole  # noqa: E402
+from app.state_machine.manager import StateManager  # noqa: E402
+
+_PLATFORM = "telegram"
+
+
+def _wizard_context(keys: int) -> dict:
+    """context בגודל של זרימת אשף ארוכה — שדות טקסט ורשימה מקוננת"""
+    context: dict = {f"field_{i}": f"ערך לדוגמה מספר {i} בזרימת האשף" for i in range(keys)}
+    context["stops"] = [{"city": "תל אביב", "street": "הרצל", "number": str(i)} for i in range(5)]
+    return context
+
+
+async def _wal_lsn(db) -> str:
+    return (await db.execute(text("SELECT pg_current_wal_lsn()"))).scalar_one()
+
+
+async def _wal_bytes(db, start: str) -> int:
+    result = await db.execute(
+        text("SELECT pg_wal_lsn_diff(pg_current_wal_lsn(), CAST(:start AS pg_lsn))"),
+        {"start": start},
+    )
+    return int(result.scalar_one())
+
+
+async def _run_mode(mode: str, turns: int, keys: int) -> dict[str, float]:
+    async with AsyncSessionLocal() as db:
+        user = User(
+            phone_number=f"bench:{uuid.uuid4().hex[:12]}",
+            name="context benchmark",
+            role=UserRole.SENDER,
+            platform=_PLATFORM,
+        )
+        db.add(user)
+        await db.commit()
+        conversation = ConversationSession(
+            user_id=user.id,
+            platform=_PLATFORM,
+            current_state="SENDER.MENU",
+            context_data=_wizard_context(keys),
+        )
+        db.add(conversation)
+        await db.commit()
+
+        state_manager = StateManager(db)
+        cpu = 0.0
+        payload = 0
+        wal = 0
+        try:
+            for turn in range(turns):
+                update = {"step": turn}
+                start_lsn = await _wal_lsn(db)
+                started = time.process_time()
+                if mode == "rewrite":
+                    context = copy.deepcopy(conversation.context_data or {})
+                    context.update(update)
+                    conversation.context_data = context
+                    await db.commit()
+                    payload += len(json.dumps(context, ensure_ascii=False))
+                else:
+                    await state_manager.patch_context(user.id, _PLATFORM, update)
+                    payload += len(json.dumps(update, ensure_ascii=False))
+                cpu += time.process_time() - started
+                wal += await _wal_bytes(db, start_lsn)
+        finally:
+            await db.execute(delete(ConversationSession).where(ConversationSession.user_id == user.id))
+            await db.execute(delete(User).where(User.id == user.id))
+            await db.commit()
+
+    return {
+        "cpu_ms": cpu * 1000 / turns,
+        "payload_bytes": payload / turns,
+        "wal_bytes": wal / turns,
+    }
+
+
+async def _run(args: argparse.Namespace) -> None:
+    print(f"{args.turns} turns, context of {args.keys} keys (per turn averages)")
+    for mode in ("rewrite", "patch"):
+        result = await _run_mode(mode, args.turns, args.keys)
+        print(
+            f"  {mode:<8} cpu={result['cpu_ms']:.3f}ms  "
+            f"context payload={result['payload_bytes']:.0f}B  wal={result['wal_bytes']:.0f}B"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Conversation context update benchmark")
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--keys", type=int, default=40)
+    asyncio.run(_run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Telegram inbound queue — dead letter replay tool.
+
+Lists updates that failed processing (or were delivered too many times
+without an ack) and returns them to the inbound stream.
+
+Usage:
+    python scripts/replay_telegram_inbound.py list [--limit 50]
+    python scripts/replay_telegram_inbound.py replay [--limit 100]
+    python scripts/replay_telegram_inbound.py replay --id 1700000000000-0 --id ...
+
+Uses REDIS_URL from the environment, like the app.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+# לאפשר הרצה מכל תיקיה (למשל `python scripts/replay_telegram_inbound.py` ב-Render Shell)
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from app.core.redis_client import close_redis  # noqa: E402
+from app.domain.services.telegram_inbound_queue import (  # noqa: E402
+    list_dead_letters,
+    replay_dead_letters,
+)
+
+
+async def _list(limit: int) -> None:
+    letters = await list_dead_letters(limit)
+    if not letters:
+        print("No dead letters")
+        return
+    for letter in letters:
+        print(
+            f"{letter.entry_id}  chat={letter.chat}  "
+            f"update_id={letter.update.get('update_id')}  error={letter.error}"
+        )
+
+
+async def _replay(entry_ids: list[str] | None, limit: int) -> None:
+    replayed = await replay_dead_letters(entry_ids, count=limit)
+    print(f"Replayed {len(replayed)} update(s)")
+    for entry_id in replayed:
+        print(f"  {entry_id}")
+
+
+async def _run(args: argparse.Namespace) -> None:
+    try:
+        if args.command == "list":
+            await _list(args.limit)
+        else:
+            await _replay(args.ids or None, args.limit)
+    finally:
+        await close_redis()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Telegram inbound dead letter replay")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    list_parser = sub.add_parser("list", help="show dead letters, oldest first")
+    list_parser.add_argument("--limit", type=int, default=50)
+
+    replay_parser = sub.add_parser("replay", help="return dead letters to the inbound stream")
+    replay_parser.add_argument("--id", dest="ids", action="append", help="entry id (repeatable)")
+    replay_parser.add_argument("--limit", type=int, default=100)
+
+    asyncio.run(_run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
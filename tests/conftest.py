@@ -9,7 +9,11 @@ Provides fixtures for:
 # הגדרת JWT_SECRET_KEY לפני ייבוא app — הולידטור דורש מפתח כש-DEBUG=False
 import os
 os.environ.setdefault("JWT_SECRET_KEY", "test-jwt-secret-key-for-testing-only-do-not-use-in-production")
+# rate limiter יוצא כבוי בבדיקות — הבדיקות שלו מפעילות אותו במפורש (tests/test_rate_limiter.py)
+os.environ.setdefault("OUTBOUND_RATE_LIMIT_ENABLED", "false")
 
+import asyncio
+import time
 import pytest
 from typing import AsyncGenerator
 from unittest.mock import AsyncMock, MagicMock, patch
@@ -319,14 +323,66 @@ async def sample_delivery(delivery_factory, sample_sender) -> Delivery:
 # ============================================================================
 
 @pytest.fixture(autouse=True)
-def reset_circuit_breakers():
-    """Reset circuit breakers between tests"""
+def reset_circuit_breakers(monkeypatch):
+    """Reset circuit breakers between tests (backend מקומי — FakeRedis לא תומך ב-eval)"""
     from app.core.circuit_breaker import CircuitBreaker
+    monkeypatch.setattr(settings, "CIRCUIT_BREAKER_BACKEND", "memory")
     CircuitBreaker.reset_all()
     yield
     CircuitBreaker.reset_all()
 
 
+@pytest.fixture(autouse=True)
+def disable_idempotency_audit(monkeypatch):
+    """בלי כתיבת audit של idempotency ברקע — היא פותחת סשן ל-DB האמיתי"""
+    monkeypatch.setattr(settings, "WEBHOOK_IDEMPOTENCY_AUDIT_ENABLED", False)
+
+
+@pytest.fixture(autouse=True)
+def reset_user_identity_cache():
+    """מטמון זיהוי משתמשים נקי לכל טסט — user ids חוזרים בין DB-ים של טסטים"""
+    from app.domain.services.user_identity_cache import (
+        register_identity_cache_listeners,
+        reset_identity_cache,
+    )
+    register_identity_cache_listeners()
+    reset_identity_cache()
+    yield
+    reset_identity_cache()
+
+
+@pytest.fixture(autouse=True)
+def reset_role_capability_cache():
+    """מטמון יכולות תפקיד נקי לכל טסט — ביטולים ממתינים לא זולגים בין טסטים"""
+    from app.domain.services.role_capabilities import (
+        register_role_capability_listeners,
+        reset_role_capabilities,
+    )
+    register_role_capability_listeners()
+    reset_role_capabilities()
+    yield
+    reset_role_capabilities()
+
+
+@pytest.fixture(autouse=True)
+def reset_http_clients():
+    """איפוס ה-HTTP clients המשותפים — client (או mock) לא זולג בין טסטים"""
+    from app.core import http_clients
+    http_clients._clients.clear()
+    yield
+    http_clients._clients.clear()
+
+
+@pytest.fixture(autouse=True)
+def isolated_media_relay(tmp_path, monkeypatch):
+    """media relay בתיקייה זמנית לכל טסט — cache לא זולג בין טסטים"""
+    from app.domain.services.media_relay import reset_media_relay
+    monkeypatch.setattr(settings, "MEDIA_CACHE_DIR", str(tmp_path / "media-cache"))
+    reset_media_relay()
+    yield
+    reset_media_relay()
+
+
 @pytest.fixture(autouse=True)
 def reset_whatsapp_providers():
     """איפוס ספקי WhatsApp בין בדיקות — מונע זליגת state בין טסטים"""
@@ -368,7 +424,12 @@ class FakeRedis:
         self._store: dict[str, str] = {}
         self._ttls: dict[str, int] = {}
         self._lists: dict[str, list[str]] = {}
+        self._hashes: dict[str, dict[str, str]] = {}
         self._published: list[tuple[str, str]] = []
+        self._streams: dict[str, list[tuple[str, dict[str, str]]]] = {}
+        # stream → group → {"last": id, "pending": {id: [consumer, deliveries]}}
+        self._groups: dict[str, dict[str, dict]] = {}
+        self._last_stream_id = (0, 0)
 
     async def ping(self) -> bool:
         return True
@@ -412,6 +473,12 @@ class FakeRedis:
         if key in self._store:
             self._ttls[key] = ttl
 
+    async def ttl(self, key: str) -> int:
+        """TTL בשניות — -2 למפתח שלא קיים, -1 למפתח בלי תפוגה"""
+        if key not in self._store:
+            return -2
+        return self._ttls.get(key, -1)
+
     async def delete(self, *keys: str) -> None:
         for key in keys:
             self._store.pop(key, None)
@@ -441,19 +508,204 @@ class FakeRedis:
     async def ltrim(self, key: str, start: int, stop: int) -> None:
         """חיתוך רשימה"""
         if key in self._lists:
-            self._lists[key] = self._lists[key][start:stop + 1]
+            self._lists[key] = self._lists[key][start:None if stop == -1 else stop + 1]
 
     async def lrange(self, key: str, start: int, stop: int) -> list[str]:
         """שליפת טווח מרשימה"""
         if key not in self._lists:
             return []
-        return self._lists[key][start:stop + 1]
+        return self._lists[key][start:None if stop == -1 else stop + 1]
+
+    async def blpop(self, key: str, timeout: float = 0) -> tuple[str, str] | None:
+        """BLPOP — שליפה מראש הרשימה, המתנה עד timeout שניות אם ריקה (0 = ללא הגבלה)"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            if self._lists.get(key):
+                return key, self._lists[key].pop(0)
+            if timeout and loop.time() >= deadline:
+                return None
+            await asyncio.sleep(0.01)
+
+    # --- Hashes ---
+
+    async def hincrby(self, key: str, field: str, amount: int = 1) -> int:
+        h = self._hashes.setdefault(key, {})
+        h[field] = str(int(h.get(field, 0)) + amount)
+        return int(h[field])
+
+    async def hincrbyfloat(self, key: str, field: str, amount: float = 1.0) -> float:
+        h = self._hashes.setdefault(key, {})
+        h[field] = repr(float(h.get(field, 0.0)) + amount)
+        return float(h[field])
+
+    async def hgetall(self, key: str) -> dict[str, str]:
+        return dict(self._hashes.get(key, {}))
+
+    def pipeline(self, transaction: bool = True) -> "FakePipeline":
+        return FakePipeline(self)
+
+    # --- Streams ---
+
+    @staticmethod
+    def _stream_id(entry_id: str) -> tuple[int, int]:
+        ms, _, seq = entry_id.partition("-")
+        return int(ms), int(seq or 0)
+
+    def _in_range(self, entry_id: str, start: str, end: str) -> bool:
+        current = self._stream_id(entry_id)
+        if start != "-":
+            exclusive = start.startswith("(")
+            low = self._stream_id(start.lstrip("("))
+            if current < low or (exclusive and current == low):
+                return False
+        return end == "+" or current <= self._stream_id(end)
+
+    async def xadd(self, name: str, fields: dict, id: str = "*", **kwargs) -> str:
+        """XADD — id לפי השעון, עולה תמיד"""
+        ms = int(time.time() * 1000)
+        last_ms, last_seq = self._last_stream_id
+        self._last_stream_id = (ms, 0) if ms > last_ms else (last_ms, last_seq + 1)
+        entry_id = "%d-%d" % self._last_stream_id
+        self._streams.setdefault(name, []).append(
+            (entry_id, {k: str(v) for k, v in fields.items()})
+        )
+        return entry_id
+
+    async def xlen(self, name: str) -> int:
+        return len(self._streams.get(name, []))
+
+    async def xrange(self, name: str, min: str = "-", max: str = "+", count: int | None = None) -> list:
+        entries = [
+            (entry_id, dict(fields))
+            for entry_id, fields in self._streams.get(name, [])
+            if self._in_range(entry_id, min, max)
+        ]
+        return entries[:count] if count else entries
+
+    async def xdel(self, name: str, *ids: str) -> int:
+        before = len(self._streams.get(name, []))
+        self._streams[name] = [e for e in self._streams.get(name, []) if e[0] not in ids]
+        return before - len(self._streams[name])
+
+    async def xgroup_create(self, name: str, groupname: str, id: str = "$", mkstream: bool = False) -> bool:
+        if name not in self._streams:
+            if not mkstream:
+                raise Exception("ERR The XGROUP subcommand requires the key to exist")
+            self._streams[name] = []
+        groups = self._groups.setdefault(name, {})
+        if groupname in groups:
+            raise Exception("BUSYGROUP Consumer Group name already exists")
+        last = self._streams[name][-1][0] if id == "$" and self._streams[name] else "0-0"
+        groups[groupname] = {"last": last, "pending": {}}
+        return True
+
+    async def xreadgroup(
+        self,
+        groupname: str,
+        consumername: str,
+        streams: dict[str, str],
+        count: int | None = None,
+        block: int | None = None,
+    ) -> list:
+        """XREADGROUP עם ">" בלבד — entries חדשים, עם המתנה עד block מילישניות"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (block or 0) / 1000
+        while True:
+            response = []
+            for name in streams:
+                group = self._groups.get(name, {}).get(groupname)
+                if group is None:
+                    raise Exception("NOGROUP No such key or consumer group")
+                fresh = [
+                    (entry_id, dict(fields))
+                    for entry_id, fields in self._streams.get(name, [])
+                    if self._stream_id(entry_id) > self._stream_id(group["last"])
+                ][:count]
+                if fresh:
+                    group["last"] = fresh[-1][0]
+                    now_ms = int(time.time() * 1000)
+                    for entry_id, _ in fresh:
+                        group["pending"][entry_id] = [consumername, 1, now_ms]
+                    response.append([name, fresh])
+            if response or block is None or loop.time() >= deadline:
+                return response
+            await asyncio.sleep(0.01)
+
+    async def xack(self, name: str, groupname: str, *ids: str) -> int:
+        pending = self._groups.get(name, {}).get(groupname, {}).get("pending", {})
+        return sum(1 for entry_id in ids if pending.pop(entry_id, None) is not None)
+
+    async def xpending(self, name: str, groupname: str) -> dict:
+        pending = self._groups.get(name, {}).get(groupname, {}).get("pending", {})
+        return {"pending": len(pending)}
+
+    async def xpending_range(
+        self, name: str, groupname: str, min: str, max: str, count: int, consumername: str | None = None
+    ) -> list[dict]:
+        pending = self._groups.get(name, {}).get(groupname, {}).get("pending", {})
+        now_ms = int(time.time() * 1000)
+        rows = [
+            {
+                "message_id": entry_id,
+                "consumer": consumer,
+                "time_since_delivered": now_ms - delivered_ms,
+                "times_delivered": deliveries,
+            }
+            for entry_id, (consumer, deliveries, delivered_ms) in sorted(
+                pending.items(), key=lambda item: self._stream_id(item[0])
+            )
+            if self._in_range(entry_id, min, max)
+            and (consumername is None or consumer == consumername)
+        ]
+        return rows[:count]
+
+    async def xclaim(
+        self, name: str, groupname: str, consumername: str, min_idle_time: int, message_ids: list[str]
+    ) -> list:
+        pending = self._groups.get(name, {}).get(groupname, {}).get("pending", {})
+        entries = dict(self._streams.get(name, []))
+        now_ms = int(time.time() * 1000)
+        claimed = []
+        for entry_id in message_ids:
+            if entry_id not in pending or entry_id not in entries:
+                continue
+            _, deliveries, delivered_ms = pending[entry_id]
+            if now_ms - delivered_ms < min_idle_time:
+                continue
+            pending[entry_id] = [consumername, deliveries + 1, now_ms]
+            claimed.append((entry_id, dict(entries[entry_id])))
+        return claimed
 
     async def aclose(self) -> None:
         self._store.clear()
         self._ttls.clear()
         self._lists.clear()
+        self._hashes.clear()
         self._published.clear()
+        self._streams.clear()
+        self._groups.clear()
+
+
+class FakePipeline:
+    """pipeline מדומה — אוסף פקודות ומריץ אותן ב-execute, לפי הסדר"""
+
+    def __init__(self, redis: FakeRedis) -> None:
+        self._redis = redis
+        self._commands: list[tuple[str, tuple, dict]] = []
+
+    def __getattr__(self, name: str):
+        def _queue(*args, **kwargs):
+            self._commands.append((name, args, kwargs))
+            return self
+        return _queue
+
+    async def execute(self) -> list:
+        commands, self._commands = self._commands, []
+        return [
+            await getattr(self._redis, name)(*args, **kwargs)
+            for name, args, kwargs in commands
+        ]
 
 
 @pytest.fixture(autouse=True)
@@ -7,6 +7,8 @@
 3. שאילתת הודעות outbox + retry ידני
 4. בדיקת מצב state machine של משתמש + force-state
 """
+from datetime import datetime
+
 import pytest
 from unittest.mock import patch
 
@@ -129,6 +131,29 @@ class TestCircuitBreakersEndpoint:
         assert telegram_cb["failure_count"] >= 2
         assert telegram_cb["retry_after_seconds"] > 0
 
+    @pytest.mark.unit
+    async def test_gateway_breaker_exposes_window_stats(
+        self, test_client: httpx.AsyncClient
+    ) -> None:
+        """breaker של הגטוויי במצב sliding window — שיעורים ו-p95 בתשובה."""
+        from app.core.circuit_breaker import get_whatsapp_circuit_breaker
+
+        cb = get_whatsapp_circuit_breaker()
+        await cb.record_success(duration=0.2)
+        await cb.record_failure(Exception("timeout"), duration=12.0)
+
+        response = await test_client.get(
+            "/api/admin/debug/circuit-breakers",
+            headers=_ADMIN_HEADERS,
+        )
+        data = {item["service"]: item for item in response.json()}
+        window = data["whatsapp"]["window"]
+        assert window["calls"] == 2
+        assert window["failure_rate"] == 0.5
+        assert window["slow_call_rate"] == 0.5
+        assert window["p95_latency_seconds"] > 10.0
+        assert data["telegram"]["window"] is None
+
 
 # ============================================================================
 # Outbox Summary
@@ -186,6 +211,117 @@ class TestOutboxSummary:
         assert data["total"] == 4
 
 
+# ============================================================================
+# Outbox Metrics
+# ============================================================================
+
+
+class TestOutboxMetrics:
+    """בדיקות ל-GET /api/admin/debug/outbox/metrics (+ Prometheus)."""
+
+    @staticmethod
+    async def _record_batch() -> None:
+        """batch של worker: 2 הודעות נתפסו, אחת נשלחה ואחת ל-retry"""
+        from datetime import timedelta
+
+        from app.domain.services.outbox_metrics import OutboxMetrics
+
+        now = datetime.utcnow()
+        sent = OutboxMessage(
+            id=1, platform=MessagePlatform.TELEGRAM, recipient_id="1",
+            message_type="capture_notification_sender", retry_count=0,
+            created_at=now - timedelta(seconds=0.3),
+        )
+        retried = OutboxMessage(
+            id=2, platform=MessagePlatform.TELEGRAM, recipient_id="2",
+            message_type="capture_notification_sender", retry_count=0,
+            created_at=now - timedelta(seconds=20),
+        )
+        metrics = OutboxMetrics()
+        metrics.record_claim([sent, retried], now)
+        metrics.observe("outbox_send_duration_seconds", sent, 0.2)
+        metrics.record_outcomes([sent], [retried], set(), now)
+        await metrics.flush()
+
+    @pytest.mark.unit
+    async def test_metrics_aggregate_histograms_and_queue(
+        self, test_client: httpx.AsyncClient, db_session
+    ) -> None:
+        from datetime import timedelta
+
+        await self._record_batch()
+        db_session.add(OutboxMessage(
+            platform=MessagePlatform.WHATSAPP,
+            recipient_id="972501234567",
+            message_type="expiry_warning",
+            message_content={"message_text": "x"},
+            status=MessageStatus.PENDING,
+            created_at=datetime.utcnow() - timedelta(minutes=5),
+        ))
+        await db_session.commit()
+
+        response = await test_client.get(
+            "/api/admin/debug/outbox/metrics",
+            headers=_ADMIN_HEADERS,
+        )
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["oldest_pending_alert"] is True
+        assert data["oldest_pending_age_seconds"] >= 299
+        assert data["queue"] == [{
+            "message_type": "expiry_warning",
+            "platform": "whatsapp",
+            "status": "pending",
+            "depth": 1,
+            "oldest_age_seconds": pytest.approx(300, abs=5),
+        }]
+
+        claim = next(
+            h for h in data["histograms"] if h["metric"] == "outbox_enqueue_to_claim_seconds"
+        )
+        assert claim["message_type"] == "capture_notification_sender"
+        assert claim["count"] == 2
+        # 0.3 שניות ב-bucket של 0.5, 20 שניות ב-bucket של 30 — מצטבר
+        assert claim["buckets"]["0.25"] == 0
+        assert claim["buckets"]["0.5"] == 1
+        assert claim["buckets"]["30"] == 2
+        assert claim["buckets"]["+Inf"] == 2
+
+        outcomes = {c["outcome"]: c["value"] for c in data["counters"]}
+        assert outcomes == {"sent": 1, "retry": 1}
+
+    @pytest.mark.unit
+    async def test_prometheus_exposition(
+        self, test_client: httpx.AsyncClient, db_session
+    ) -> None:
+        await self._record_batch()
+
+        response = await test_client.get(
+            "/api/admin/debug/outbox/metrics/prometheus",
+            headers=_ADMIN_HEADERS,
+        )
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        body = response.text
+        assert "# TYPE outbox_send_duration_seconds histogram" in body
+        assert (
+            'outbox_send_duration_seconds_bucket{message_type="capture_notification_sender",'
+            'platform="telegram",le="0.25"} 1'
+        ) in body
+        assert (
+            'outbox_messages_total{message_type="capture_notification_sender",'
+            'platform="telegram",outcome="sent"} 1'
+        ) in body
+        assert "# TYPE outbox_oldest_pending_age_seconds gauge" in body
+
+    @pytest.mark.unit
+    async def test_prometheus_requires_api_key(self, test_client: httpx.AsyncClient) -> None:
+        response = await test_client.get("/api/admin/debug/outbox/metrics/prometheus")
+        assert response.status_code == 401
+
+
 # ============================================================================
 # Outbox Messages
 # ============================================================================
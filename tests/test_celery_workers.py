@@ -19,7 +19,7 @@ from datetime import datetime, timedelta, timezone
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
-from sqlalchemy import select
+from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db.models.outbox_message import MessagePlatform, MessageStatus, OutboxMessage
@@ -109,6 +109,13 @@ async def _insert_outbox(
     return msg
 
 
+def _per_recipient_bulk(send):
+    """תחליף ל-_send_whatsapp_bulk שמפעיל send(phone, content) לכל נמען"""
+    async def _bulk(phones, content):
+        return await asyncio.gather(*(send(phone, content) for phone in phones))
+    return _bulk
+
+
 # ============================================================================
 # בדיקות שליחת WhatsApp
 # ============================================================================
@@ -183,6 +190,51 @@ class TestSendWhatsAppMessage:
             assert bool(result) is False
 
 
+class TestSendWhatsAppBulk:
+    """בדיקות ל-_send_whatsapp_bulk — broadcast דרך send_text_bulk של הספק"""
+
+    @staticmethod
+    def _provider(errors: list) -> MagicMock:
+        provider = MagicMock()
+        provider.format_text = lambda text: text.replace("<b>", "*").replace("</b>", "*")
+        provider.send_text_bulk = AsyncMock(return_value=errors)
+        return provider
+
+    @pytest.mark.asyncio
+    async def test_results_per_recipient_in_order(self) -> None:
+        """הודעה אחת לכל הנמענים, ותוצאה מסווגת לכל נמען לפי הסדר"""
+        from app.workers.tasks import _send_whatsapp_bulk
+
+        provider = self._provider([None, ConnectionError("reset"), None])
+        phones = ["+972501111111", "+972502222222", "+972503333333"]
+        with patch("app.workers.tasks.get_whatsapp_provider", return_value=provider):
+            results = await _send_whatsapp_bulk(phones, {"message_text": "<b>משלוח</b>"})
+
+        provider.send_text_bulk.assert_awaited_once_with(
+            [(phone, "*משלוח*") for phone in phones]
+        )
+        assert [r.success for r in results] == [True, False, True]
+        assert results[1].is_transient is True
+        assert "reset" in results[1].error
+
+    @pytest.mark.asyncio
+    async def test_groups_routed_to_group_provider(self) -> None:
+        """קבוצות (@g.us) נשלחות דרך ספק הקבוצות, פרטיים דרך הספק הרגיל"""
+        from app.workers.tasks import _send_whatsapp_bulk
+
+        private = self._provider([None])
+        group = self._provider([None])
+        with patch("app.workers.tasks.get_whatsapp_provider", return_value=private), \
+             patch("app.workers.tasks.get_whatsapp_group_provider", return_value=group):
+            results = await _send_whatsapp_bulk(
+                ["120363000000000000@g.us", "+972501111111"], {"message_text": "היי"}
+            )
+
+        assert all(r.success for r in results)
+        private.send_text_bulk.assert_awaited_once_with([("+972501111111", "היי")])
+        group.send_text_bulk.assert_awaited_once_with([("120363000000000000@g.us", "היי")])
+
+
 # ============================================================================
 # בדיקות שליחת Telegram
 # ============================================================================
@@ -710,8 +762,8 @@ class TestProcessSingleMessage:
             mock_session_ctx.return_value.__aexit__ = AsyncMock(return_value=None)
 
             with patch(
-                "app.workers.tasks._send_whatsapp_message",
-                side_effect=_mock_send,
+                "app.workers.tasks._send_whatsapp_bulk",
+                side_effect=_per_recipient_bulk(_mock_send),
             ):
                 success, result = await _process_single_message(msg)
 
@@ -1450,3 +1502,1172 @@ class TestOutboxServiceIntegration:
         await db_session.refresh(msg)
         assert msg.retry_count == 1
         assert msg.status == MessageStatus.FAILED
+
+
+# ============================================================================
+# בדיקות תפיסת batch (claim_pending_messages)
+# ============================================================================
+
+
+class TestClaimPendingMessages:
+    """בדיקות ל-OutboxService.claim_pending_messages ול-process_outbox_messages"""
+
+    @pytest.mark.asyncio
+    async def test_claim_marks_processing_with_lease(
+        self, db_session: AsyncSession
+    ) -> None:
+        """הודעות שנתפסו עוברות ל-PROCESSING עם locked_until עתידי"""
+        for i in range(3):
+            await _insert_outbox(db_session, recipient_id=f"+97250{i:07d}")
+
+        svc = OutboxService(db_session)
+        before = datetime.utcnow()
+        claimed = await svc.claim_pending_messages(limit=10, lease_seconds=60)
+
+        assert len(claimed) == 3
+        for msg in claimed:
+            await db_session.refresh(msg)
+            assert msg.status == MessageStatus.PROCESSING
+            assert msg.locked_until is not None
+            assert msg.locked_until > before
+
+    @pytest.mark.asyncio
+    async def test_claim_respects_limit_and_fifo_order(
+        self, db_session: AsyncSession
+    ) -> None:
+        """limit נשמר וההודעות חוזרות לפי סדר יצירה"""
+        inserted = []
+        for i in range(5):
+            msg = await _insert_outbox(db_session, recipient_id=f"+97250{i:07d}")
+            msg.created_at = datetime.utcnow() - timedelta(minutes=10 - i)
+            inserted.append(msg)
+        await db_session.commit()
+
+        svc = OutboxService(db_session)
+        claimed = await svc.claim_pending_messages(limit=2)
+
+        assert [m.id for m in claimed] == [inserted[0].id, inserted[1].id]
+
+    @pytest.mark.asyncio
+    async def test_claimed_messages_not_claimed_twice(
+        self, db_session: AsyncSession
+    ) -> None:
+        """תפיסה שנייה לא מחזירה הודעות שכבר נתפסו (lease בתוקף)"""
+        for i in range(4):
+            await _insert_outbox(db_session, recipient_id=f"+97250{i:07d}")
+
+        svc = OutboxService(db_session)
+        first = await svc.claim_pending_messages(limit=2)
+        second = await svc.claim_pending_messages(limit=10)
+
+        assert len(first) == 2
+        assert len(second) == 2
+        assert not {m.id for m in first} & {m.id for m in second}
+
+    @pytest.mark.asyncio
+    async def test_claim_skips_future_retry(self, db_session: AsyncSession) -> None:
+        """הודעה עם next_retry_at עתידי לא נתפסת"""
+        msg = await _insert_outbox(db_session)
+        msg.next_retry_at = datetime.utcnow() + timedelta(hours=1)
+        await db_session.commit()
+
+        svc = OutboxService(db_session)
+        assert await svc.claim_pending_messages() == []
+
+    @pytest.mark.asyncio
+    async def test_expired_lease_is_reclaimed(self, db_session: AsyncSession) -> None:
+        """הודעה ב-PROCESSING שה-lease שלה פקע — נתפסת מחדש"""
+        stale = await _insert_outbox(db_session, status=MessageStatus.PROCESSING)
+        stale.locked_until = datetime.utcnow() - timedelta(minutes=1)
+        live = await _insert_outbox(
+            db_session, recipient_id="+972509999999", status=MessageStatus.PROCESSING
+        )
+        live.locked_until = datetime.utcnow() + timedelta(minutes=5)
+        await db_session.commit()
+
+        svc = OutboxService(db_session)
+        claimed = await svc.claim_pending_messages()
+
+        assert [m.id for m in claimed] == [stale.id]
+
+    @pytest.mark.asyncio
+    async def test_claim_skips_recipient_with_older_message_in_flight(
+        self, db_session: AsyncSession
+    ) -> None:
+        """הודעה לנמען שהודעה קודמת שלו בעיבוד אצל worker אחר — לא נתפסת עד שזו מסתיימת"""
+        svc = OutboxService(db_session)
+        first = await _insert_outbox(db_session, recipient_id="+972500000001")
+        [in_flight] = await svc.claim_pending_messages(limit=1)
+        assert in_flight.id == first.id
+
+        second = await _insert_outbox(db_session, recipient_id="+972500000001")
+        other = await _insert_outbox(db_session, recipient_id="+972500000002")
+
+        claimed = await svc.claim_pending_messages(limit=10)
+        assert [m.id for m in claimed] == [other.id]
+
+        # lease שפקע לא חוסם — ההודעה הקודמת חוזרת לתור יחד עם הבאה
+        first.locked_until = datetime.utcnow() - timedelta(minutes=1)
+        await db_session.commit()
+        claimed = await svc.claim_pending_messages(limit=10)
+        assert [m.id for m in claimed] == [first.id, second.id]
+
+    @pytest.mark.asyncio
+    async def test_claim_skips_recipient_with_older_message_in_retry_backoff(
+        self, db_session: AsyncSession
+    ) -> None:
+        """הודעה קודמת לאותו נמען ממתינה ל-retry — הבאה לא עוקפת אותה"""
+        first = await _insert_outbox(db_session, recipient_id="+972500000001")
+        first.retry_count = 1
+        first.next_retry_at = datetime.utcnow() + timedelta(minutes=5)
+        second = await _insert_outbox(db_session, recipient_id="+972500000001")
+        other = await _insert_outbox(db_session, recipient_id="+972500000002")
+        await db_session.commit()
+
+        svc = OutboxService(db_session)
+        claimed = await svc.claim_pending_messages(limit=10)
+        assert [m.id for m in claimed] == [other.id]
+
+        # ה-backoff הסתיים — שתיהן נתפסות יחד, לפי הסדר
+        first.next_retry_at = datetime.utcnow() - timedelta(seconds=1)
+        await db_session.commit()
+        claimed = await svc.claim_pending_messages(limit=10)
+        assert [m.id for m in claimed] == [first.id, second.id]
+
+    @pytest.mark.asyncio
+    async def test_queue_message_derives_priority(self, db_session: AsyncSession) -> None:
+        """priority נגזר מ-message_type"""
+        from app.db.models.outbox_message import MessagePriority
+
+        svc = OutboxService(db_session)
+        capture = await svc.queue_message(
+            MessagePlatform.WHATSAPP, "+972500000001", "capture_notification_sender", {}
+        )
+        broadcast = await svc.queue_message(
+            MessagePlatform.WHATSAPP, "+972500000002", "delivery_broadcast", {}
+        )
+        card = await svc.queue_message(
+            MessagePlatform.WHATSAPP, "+972500000003", "closed_shipment_card", {}
+        )
+
+        assert capture.priority == MessagePriority.INTERACTIVE
+        assert broadcast.priority == MessagePriority.BULK
+        assert card.priority == MessagePriority.NORMAL
+
+    @pytest.mark.asyncio
+    async def test_claim_by_priority_lane(self, db_session: AsyncSession) -> None:
+        """תפיסה לפי נתיב — רק העדיפויות שלו; בלי סינון עדיפות גבוהה קודם"""
+        from app.db.models.outbox_message import MessagePriority
+
+        bulk = []
+        for i in range(3):
+            msg = await _insert_outbox(db_session, recipient_id=f"+97250{i:07d}")
+            msg.priority = MessagePriority.BULK
+            msg.created_at = datetime.utcnow() - timedelta(minutes=10)
+            bulk.append(msg)
+        interactive = await _insert_outbox(db_session, recipient_id="+972509999999")
+        interactive.priority = MessagePriority.INTERACTIVE
+        await db_session.commit()
+
+        svc = OutboxService(db_session)
+        [first] = await svc.claim_pending_messages(limit=1)
+        lane = await svc.claim_pending_messages(
+            limit=10, priorities=[MessagePriority.INTERACTIVE]
+        )
+        rest = await svc.claim_pending_messages(limit=10, priorities=[MessagePriority.BULK])
+
+        # ההודעה האינטראקטיבית החדשה קודמת ל-broadcast ותיק יותר
+        assert first.id == interactive.id
+        assert lane == []
+        assert {m.id for m in rest} == {m.id for m in bulk}
+
+    @pytest.mark.asyncio
+    async def test_mark_as_sent_clears_lease(self, db_session: AsyncSession) -> None:
+        """mark_as_sent מנקה את ה-lease"""
+        await _insert_outbox(db_session)
+        svc = OutboxService(db_session)
+        [msg] = await svc.claim_pending_messages()
+
+        await svc.mark_as_sent(msg.id)
+
+        await db_session.refresh(msg)
+        assert msg.status == MessageStatus.SENT
+        assert msg.locked_until is None
+
+    @pytest.mark.asyncio
+    async def test_process_single_message_claimed_skips_claim(
+        self, db_session: AsyncSession, mock_whatsapp_gateway
+    ) -> None:
+        """claimed=True — הודעה ב-PROCESSING נשלחת בלי תפיסה נוספת"""
+        from app.workers.tasks import _process_single_message
+
+        await _insert_outbox(db_session)
+        svc = OutboxService(db_session)
+        [msg] = await svc.claim_pending_messages()
+
+        with patch("app.workers.tasks.get_task_session") as mock_session_ctx:
+            mock_session_ctx.return_value.__aenter__ = AsyncMock(
+                return_value=db_session
+            )
+            mock_session_ctx.return_value.__aexit__ = AsyncMock(return_value=None)
+
+            success, result = await _process_single_message(msg, claimed=True)
+
+        assert success is True
+        await db_session.refresh(msg)
+        assert msg.status == MessageStatus.SENT
+
+    @pytest.mark.asyncio
+    async def test_process_outbox_messages_uses_batch_claim(
+        self, db_session: AsyncSession, mock_whatsapp_gateway
+    ) -> None:
+        """process_outbox_messages תופס batch ושולח את כל ההודעות"""
+        from app.workers.tasks import process_outbox_messages
+
+        for i in range(3):
+            await _insert_outbox(db_session, recipient_id=f"+97250{i:07d}")
+
+        with _patch_run_async_for_test():
+            with patch("app.workers.tasks.get_task_session") as mock_session_ctx:
+                mock_session_ctx.return_value.__aenter__ = AsyncMock(
+                    return_value=db_session
+                )
+                mock_session_ctx.return_value.__aexit__ = AsyncMock(return_value=None)
+
+                results = process_outbox_messages()
+
+        assert len(results) == 3
+        assert all(r["success"] for r in results)
+        assert all(r["result"] == "Message sent successfully" for r in results)
+
+
+# ============================================================================
+# בדיקות שליחה מקבילית (_dispatch_concurrently)
+# ============================================================================
+
+
+class TestConcurrentDispatch:
+    """בדיקות למצב השליחה המקבילי עם מגבלות לכל פלטפורמה"""
+
+    @staticmethod
+    def _claimed(msg_id: int, platform: MessagePlatform, recipient_id: str) -> OutboxMessage:
+        msg = _make_outbox_message(
+            platform=platform,
+            recipient_id=recipient_id,
+            status=MessageStatus.PROCESSING,
+        )
+        msg.id = msg_id
+        return msg
+
+    @pytest.mark.asyncio
+    async def test_preserves_per_recipient_order(self) -> None:
+        """הודעות לאותו נמען נשלחות לפי הסדר גם כשהראשונה איטית"""
+        from app.workers.tasks import _dispatch_concurrently
+
+        messages = [
+            self._claimed(1, MessagePlatform.TELEGRAM, "chat-a"),
+            self._claimed(2, MessagePlatform.TELEGRAM, "chat-b"),
+            self._claimed(3, MessagePlatform.TELEGRAM, "chat-a"),
+            self._claimed(4, MessagePlatform.TELEGRAM, "chat-a"),
+        ]
+        sent_order: list[int] = []
+
+        async def _fake_process(message, *, claimed=False, transitions=None):
+            # ההודעה הראשונה ל-chat-a איטית — אסור שהבאות יעקפו אותה
+            await asyncio.sleep(0.05 if message.id == 1 else 0)
+            sent_order.append(message.id)
+            return True, "ok"
+
+        with patch("app.workers.tasks._process_single_message", side_effect=_fake_process):
+            results = await _dispatch_concurrently(
+                messages,
+                platform_limits={MessagePlatform.TELEGRAM: 10, MessagePlatform.WHATSAPP: 10},
+            )
+
+        chat_a = [i for i in sent_order if i in (1, 3, 4)]
+        assert chat_a == [1, 3, 4]
+        # chat-b לא חיכה ל-chat-a האיטי
+        assert sent_order.index(2) < sent_order.index(1)
+        # התוצאות חוזרות בסדר ה-batch המקורי
+        assert [r["message_id"] for r in results] == [1, 2, 3, 4]
+
+    @pytest.mark.asyncio
+    async def test_respects_platform_concurrency_limits(self) -> None:
+        """מספר השליחות הבו-זמניות לא עובר את המגבלה של כל פלטפורמה"""
+        from app.workers.tasks import _dispatch_concurrently
+
+        messages = [
+            self._claimed(i, MessagePlatform.WHATSAPP, f"+97250{i:07d}") for i in range(8)
+        ] + [
+            self._claimed(100 + i, MessagePlatform.TELEGRAM, f"chat-{i}") for i in range(8)
+        ]
+        in_flight = {MessagePlatform.WHATSAPP: 0, MessagePlatform.TELEGRAM: 0}
+        peak = {MessagePlatform.WHATSAPP: 0, MessagePlatform.TELEGRAM: 0}
+
+        async def _fake_process(message, *, claimed=False, transitions=None):
+            in_flight[message.platform] += 1
+            peak[message.platform] = max(peak[message.platform], in_flight[message.platform])
+            await asyncio.sleep(0.01)
+            in_flight[message.platform] -= 1
+            return True, "ok"
+
+        with patch("app.workers.tasks._process_single_message", side_effect=_fake_process):
+            results = await _dispatch_concurrently(
+                messages,
+                platform_limits={MessagePlatform.WHATSAPP: 2, MessagePlatform.TELEGRAM: 3},
+            )
+
+        assert len(results) == 16
+        assert peak[MessagePlatform.WHATSAPP] == 2
+        assert peak[MessagePlatform.TELEGRAM] == 3
+
+    @pytest.mark.asyncio
+    async def test_unexpected_error_does_not_stop_batch(self) -> None:
+        """exception בהודעה אחת לא עוצר את שאר ההודעות של אותו נמען"""
+        from app.workers.tasks import _dispatch_concurrently
+
+        messages = [
+            self._claimed(1, MessagePlatform.WHATSAPP, "+972501111111"),
+            self._claimed(2, MessagePlatform.WHATSAPP, "+972501111111"),
+        ]
+
+        async def _fake_process(message, *, claimed=False, transitions=None):
+            if message.id == 1:
+                raise RuntimeError("DB down")
+            return True, "ok"
+
+        with patch("app.workers.tasks._process_single_message", side_effect=_fake_process):
+            results = await _dispatch_concurrently(
+                messages,
+                platform_limits={MessagePlatform.WHATSAPP: 1, MessagePlatform.TELEGRAM: 1},
+            )
+
+        assert results[0]["success"] is False
+        assert "DB down" in results[0]["result"]
+        assert results[1]["success"] is True
+
+    @pytest.mark.asyncio
+    async def test_process_outbox_messages_concurrent_mode(
+        self, db_session: AsyncSession
+    ) -> None:
+        """OUTBOX_CONCURRENT_DISPATCH=True — process_outbox_messages עובר למצב המקבילי"""
+        from app.core.config import settings
+        from app.workers.tasks import process_outbox_messages
+
+        for i in range(3):
+            await _insert_outbox(db_session, recipient_id=f"+97250{i:07d}")
+
+        dispatched: list[int] = []
+
+        async def _fake_dispatch(messages, *, platform_limits, transitions=None, metrics=None):
+            dispatched.extend(m.id for m in messages)
+            assert platform_limits[MessagePlatform.WHATSAPP] == settings.OUTBOX_WHATSAPP_CONCURRENCY
+            return [{"message_id": m.id, "success": True, "result": "ok"} for m in messages]
+
+        with _patch_run_async_for_test(), \
+             patch.object(settings, "OUTBOX_CONCURRENT_DISPATCH", True), \
+             patch("app.workers.tasks._dispatch_concurrently", side_effect=_fake_dispatch), \
+             patch("app.workers.tasks.get_task_session") as mock_session_ctx:
+            mock_session_ctx.return_value.__aenter__ = AsyncMock(return_value=db_session)
+            mock_session_ctx.return_value.__aexit__ = AsyncMock(return_value=None)
+
+            results = process_outbox_messages()
+
+        assert len(dispatched) == 3
+        assert len(results) == 3
+
+
+# ============================================================================
+# בדיקות התעוררות outbox אחרי commit
+# ============================================================================
+
+
+class TestOutboxWakeup:
+    """בדיקות להתעוררות ה-dispatcher אחרי commit (outbox_wakeup)"""
+
+    @staticmethod
+    async def _flush_notify_tasks() -> None:
+        """המתנה ל-tasks של ההתראה שתוזמנו ב-after_commit"""
+        from app.domain.services import outbox_wakeup
+
+        if outbox_wakeup._notify_tasks:
+            await asyncio.gather(*list(outbox_wakeup._notify_tasks))
+
+    @pytest.mark.asyncio
+    async def test_commit_pushes_single_wakeup_token(
+        self, db_session: AsyncSession, fake_redis
+    ) -> None:
+        """commit עם הודעות חדשות — token אחד ברשימה גם ל-burst"""
+        from app.domain.services.outbox_wakeup import OUTBOX_WAKEUP_KEY
+
+        svc = OutboxService(db_session)
+        for i in range(3):
+            await svc.queue_message(
+                MessagePlatform.WHATSAPP, f"+97250{i:07d}", "test", {"message_text": "x"}
+            )
+        await db_session.commit()
+        await self._flush_notify_tasks()
+
+        assert await fake_redis.lrange(OUTBOX_WAKEUP_KEY, 0, -1) == ["1"]
+
+    @pytest.mark.asyncio
+    async def test_rollback_does_not_wake_dispatcher(
+        self, db_session: AsyncSession, fake_redis
+    ) -> None:
+        """rollback — ההודעות לא נשמרו, אין התעוררות גם ב-commit הבא"""
+        from app.domain.services.outbox_wakeup import OUTBOX_WAKEUP_KEY
+
+        svc = OutboxService(db_session)
+        await svc.queue_message(
+            MessagePlatform.WHATSAPP, "+972501234567", "test", {"message_text": "x"}
+        )
+        await db_session.rollback()
+        await db_session.commit()
+        await self._flush_notify_tasks()
+
+        assert await fake_redis.lrange(OUTBOX_WAKEUP_KEY, 0, -1) == []
+
+    @pytest.mark.asyncio
+    async def test_wakeup_disabled(self, db_session: AsyncSession, fake_redis) -> None:
+        """OUTBOX_WAKEUP_ENABLED=False — אין התעוררות, רק ה-sweep של Beat"""
+        from app.core.config import settings
+        from app.domain.services.outbox_wakeup import OUTBOX_WAKEUP_KEY
+
+        with patch.object(settings, "OUTBOX_WAKEUP_ENABLED", False):
+            svc = OutboxService(db_session)
+            await svc.queue_message(
+                MessagePlatform.WHATSAPP, "+972501234567", "test", {"message_text": "x"}
+            )
+            await db_session.commit()
+        await self._flush_notify_tasks()
+
+        assert await fake_redis.lrange(OUTBOX_WAKEUP_KEY, 0, -1) == []
+
+    @pytest.mark.asyncio
+    async def test_notify_swallows_redis_errors(self) -> None:
+        """Redis לא זמין — ההתראה לא זורקת (Beat יאסוף)"""
+        from app.domain.services.outbox_wakeup import notify_outbox_wakeup
+
+        with patch(
+            "app.core.redis_client.get_redis",
+            AsyncMock(side_effect=ConnectionError("redis down")),
+        ):
+            await notify_outbox_wakeup()
+
+    @pytest.mark.asyncio
+    async def test_listener_drains_on_token(self, fake_redis) -> None:
+        """listener מרוקן את ה-outbox מיד כשמגיע token"""
+        from app.domain.services.outbox_wakeup import OUTBOX_WAKEUP_KEY
+        from app.workers.tasks import outbox_wakeup_listener
+
+        drained = asyncio.Event()
+        lanes: list[str] = []
+
+        async def _fake_drain(lane=None):
+            lanes.append(lane.name)
+            if len(lanes) == 3:
+                drained.set()
+            return 1
+
+        with patch("app.workers.tasks._drain_outbox", side_effect=_fake_drain):
+            listener = asyncio.create_task(outbox_wakeup_listener())
+            try:
+                await fake_redis.lpush(OUTBOX_WAKEUP_KEY, "1")
+                await asyncio.wait_for(drained.wait(), timeout=2)
+            finally:
+                listener.cancel()
+                await asyncio.gather(listener, return_exceptions=True)
+
+        assert await fake_redis.lrange(OUTBOX_WAKEUP_KEY, 0, -1) == []
+        # כל נתיב עדיפות מרוקן בנפרד
+        assert sorted(lanes) == ["bulk", "interactive", "normal"]
+
+    @pytest.mark.asyncio
+    async def test_drain_stops_on_partial_batch(self) -> None:
+        """_drain_outbox ממשיך כל עוד ה-batch מלא ועוצר ב-batch חלקי"""
+        from app.core.config import settings
+        from app.workers.tasks import _drain_outbox
+
+        batches = [[{}] * 2, [{}] * 2, [{}]]
+
+        with patch.object(settings, "OUTBOX_PRIORITY_LANES_ENABLED", False), \
+             patch.object(settings, "OUTBOX_BATCH_SIZE", 2), \
+             patch("app.workers.tasks._process_outbox_batch", side_effect=batches):
+            assert await _drain_outbox() == 5
+
+
+# ============================================================================
+# בדיקות fan-out של BROADCAST_COURIERS
+# ============================================================================
+
+
+class TestBroadcastFanout:
+    """broadcast לשליחים דרך outbox_fanout_recipients — chunks ו-retry לנכשלים בלבד"""
+
+    @staticmethod
+    async def _couriers(user_factory, count: int) -> list[str]:
+        phones = [f"+97250100{i:04d}" for i in range(count)]
+        for phone in phones:
+            await user_factory(
+                phone_number=phone,
+                role=UserRole.COURIER,
+                platform="whatsapp",
+                is_active=True,
+                approval_status=ApprovalStatus.APPROVED,
+            )
+        return phones
+
+    @staticmethod
+    async def _process(db_session: AsyncSession, msg: OutboxMessage, send) -> tuple:
+        from app.workers.tasks import _process_single_message
+
+        with patch("app.workers.tasks.get_task_session") as mock_session_ctx:
+            mock_session_ctx.return_value.__aenter__ = AsyncMock(
+                return_value=db_session
+            )
+            mock_session_ctx.return_value.__aexit__ = AsyncMock(return_value=None)
+            with patch(
+                "app.workers.tasks._send_whatsapp_bulk",
+                side_effect=_per_recipient_bulk(send),
+            ):
+                return await _process_single_message(msg)
+
+    @pytest.mark.asyncio
+    async def test_retry_sends_only_to_failed_recipients(
+        self, db_session: AsyncSession, user_factory
+    ) -> None:
+        """כשלון זמני של נמען אחד — ה-retry שולח רק לו, לא לכל השליחים"""
+        from app.workers.tasks import SendResult
+
+        phones = await self._couriers(user_factory, 3)
+        flaky = phones[1]
+        msg = await _insert_outbox(
+            db_session,
+            recipient_id="BROADCAST_COURIERS",
+            message_content={"message_text": "משלוח"},
+        )
+
+        first_calls: list[str] = []
+
+        async def _first(phone, content):
+            first_calls.append(phone)
+            return SendResult(success=phone != flaky, is_transient=True, error="timeout")
+
+        success, result = await self._process(db_session, msg, _first)
+        assert success is True
+        assert "2/3" in result and "pending retry" in result
+        assert sorted(first_calls) == sorted(phones)
+
+        await db_session.refresh(msg)
+        assert msg.status == MessageStatus.PENDING
+        assert msg.retry_count == 1
+
+        second_calls: list[str] = []
+
+        async def _second(phone, content):
+            second_calls.append(phone)
+            return SendResult(success=True)
+
+        success, result = await self._process(db_session, msg, _second)
+        assert success is True
+        assert "3/3" in result
+        assert second_calls == [flaky]
+
+        await db_session.refresh(msg)
+        assert msg.status == MessageStatus.SENT
+
+    @pytest.mark.asyncio
+    async def test_sends_in_bounded_chunks(
+        self, db_session: AsyncSession, user_factory
+    ) -> None:
+        """השליחה מחולקת ל-chunks — לא יותר מ-OUTBOX_FANOUT_CHUNK_SIZE במקביל"""
+        from app.core.config import settings
+        from app.db.models.outbox_fanout import FanoutStatus, OutboxFanoutRecipient
+
+        await self._couriers(user_factory, 5)
+        msg = await _insert_outbox(
+            db_session,
+            recipient_id="BROADCAST_COURIERS",
+            message_content={"message_text": "משלוח"},
+        )
+
+        in_flight = 0
+        peak = 0
+
+        async def _send(phone, content):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0)
+            in_flight -= 1
+            return True
+
+        with patch.object(settings, "OUTBOX_FANOUT_CHUNK_SIZE", 2):
+            success, result = await self._process(db_session, msg, _send)
+
+        assert success is True
+        assert "5/5" in result
+        assert peak == 2
+
+        rows = (await db_session.execute(
+            select(OutboxFanoutRecipient).where(
+                OutboxFanoutRecipient.outbox_message_id == msg.id
+            )
+        )).scalars().all()
+        assert len(rows) == 5
+        assert all(r.status == FanoutStatus.SENT and r.sent_at for r in rows)
+
+    @pytest.mark.asyncio
+    async def test_permanent_failure_not_retried(
+        self, db_session: AsyncSession, user_factory
+    ) -> None:
+        """שגיאה קבועה לנמען — השורה FAILED וההודעה מסומנת כנשלחה בלי retry"""
+        from app.db.models.outbox_fanout import FanoutStatus, OutboxFanoutRecipient
+        from app.workers.tasks import SendResult
+
+        phones = await self._couriers(user_factory, 2)
+        msg = await _insert_outbox(
+            db_session,
+            recipient_id="BROADCAST_COURIERS",
+            message_content={"message_text": "משלוח"},
+        )
+
+        async def _send(phone, content):
+            if phone == phones[0]:
+                return SendResult(success=False, is_transient=False, error="400")
+            return SendResult(success=True)
+
+        success, result = await self._process(db_session, msg, _send)
+        assert success is True
+        assert "Partial broadcast: 1/2" in result
+
+        await db_session.refresh(msg)
+        assert msg.status == MessageStatus.SENT
+
+        failed = (await db_session.execute(
+            select(OutboxFanoutRecipient).where(
+                OutboxFanoutRecipient.recipient_id == phones[0]
+            )
+        )).scalar_one()
+        assert failed.status == FanoutStatus.FAILED
+        assert failed.last_error == "400"
+
+
+    @pytest.mark.asyncio
+    async def test_lease_extended_per_chunk_and_drain_stops_when_lost(
+        self, db_session: AsyncSession, user_factory
+    ) -> None:
+        """ה-lease מוארך אחרי כל chunk; אם worker אחר תפס מחדש — השליחה נעצרת"""
+        from app.core.config import settings
+        from app.db.models.outbox_fanout import FanoutStatus, OutboxFanoutRecipient
+
+        await self._couriers(user_factory, 3)
+        msg = await _insert_outbox(
+            db_session,
+            recipient_id="BROADCAST_COURIERS",
+            message_content={"message_text": "משלוח"},
+        )
+        foreign_lease = datetime.utcnow() + timedelta(hours=1)
+        leases: list[datetime] = []
+        sent: list[str] = []
+
+        async def _send(phone, content):
+            sent.append(phone)
+            leases.append(msg.locked_until)
+            if len(sent) == 2:
+                # ה-lease פקע ו-worker אחר תפס את ההודעה מחדש
+                await db_session.execute(
+                    update(OutboxMessage)
+                    .where(OutboxMessage.id == msg.id)
+                    .values(locked_until=foreign_lease)
+                    .execution_options(synchronize_session=False)
+                )
+                await db_session.commit()
+            return True
+
+        with patch.object(settings, "OUTBOX_FANOUT_CHUNK_SIZE", 1):
+            success, result = await self._process(db_session, msg, _send)
+
+        assert success is False
+        assert "lease lost" in result
+        assert len(sent) == 2
+        # ה-chunk השני כבר רץ על lease מוארך
+        assert leases[1] > leases[0]
+
+        await db_session.refresh(msg)
+        assert msg.status == MessageStatus.PROCESSING
+        assert msg.locked_until == foreign_lease
+        pending = (await db_session.execute(
+            select(OutboxFanoutRecipient).where(
+                OutboxFanoutRecipient.outbox_message_id == msg.id,
+                OutboxFanoutRecipient.status == FanoutStatus.PENDING,
+            )
+        )).scalars().all()
+        assert len(pending) == 1
+
+
+# ============================================================================
+# בדיקות fan-out של פרסום נסיעה (BROADCAST_RIDE_POSTING_)
+# ============================================================================
+
+
+class TestRidePostingFanout:
+    """פרסום נסיעה — קבוצות ונהגים תואמים בהודעת outbox אחת, וסיכום לנהג המפרסם"""
+
+    @staticmethod
+    async def _queue(db_session: AsyncSession) -> OutboxMessage:
+        from app.domain.services.outbox_service import (
+            RIDE_AUDIENCE_DRIVER,
+            RIDE_AUDIENCE_GROUP,
+            ride_fanout_recipient,
+        )
+
+        msg = await OutboxService(db_session).queue_ride_posting_broadcast(
+            group_text="נסיעה",
+            driver_text="🔔 נסיעה",
+            recipients=[
+                (ride_fanout_recipient(RIDE_AUDIENCE_GROUP, MessagePlatform.WHATSAPP, "g1@g.us"), None),
+                (ride_fanout_recipient(RIDE_AUDIENCE_GROUP, MessagePlatform.WHATSAPP, "g2@g.us"), None),
+                (ride_fanout_recipient(RIDE_AUDIENCE_GROUP, MessagePlatform.TELEGRAM, "-100"), None),
+                (ride_fanout_recipient(RIDE_AUDIENCE_DRIVER, MessagePlatform.TELEGRAM, "555"), 7),
+                # כפילות — נשמרת פעם אחת
+                (ride_fanout_recipient(RIDE_AUDIENCE_GROUP, MessagePlatform.WHATSAPP, "g1@g.us"), None),
+            ],
+            report_to=(MessagePlatform.TELEGRAM, "999"),
+        )
+        await db_session.commit()
+        return msg
+
+    @staticmethod
+    async def _process(db_session: AsyncSession, msg: OutboxMessage, whatsapp, telegram) -> tuple:
+        from app.workers.tasks import _process_single_message
+
+        with patch("app.workers.tasks.get_task_session") as mock_session_ctx:
+            mock_session_ctx.return_value.__aenter__ = AsyncMock(
+                return_value=db_session
+            )
+            mock_session_ctx.return_value.__aexit__ = AsyncMock(return_value=None)
+            with patch(
+                "app.workers.tasks._send_whatsapp_bulk",
+                side_effect=_per_recipient_bulk(whatsapp),
+            ), patch(
+                "app.workers.tasks._send_telegram_message", side_effect=telegram
+            ):
+                return await _process_single_message(msg)
+
+    @pytest.mark.asyncio
+    async def test_queue_creates_single_message_with_rows(
+        self, db_session: AsyncSession
+    ) -> None:
+        """הודעת fan-out אחת בעדיפות BULK ושורה לכל נמען ייחודי"""
+        from app.db.models.outbox_fanout import OutboxFanoutRecipient
+        from app.db.models.outbox_message import MessagePriority
+        from app.domain.services.outbox_service import RIDE_POSTING_BROADCAST_PREFIX
+
+        msg = await self._queue(db_session)
+
+        assert msg.recipient_id == f"{RIDE_POSTING_BROADCAST_PREFIX}{msg.id}"
+        assert msg.priority == MessagePriority.BULK
+        assert msg.message_content["report_recipient"] == "999"
+        rows = (await db_session.execute(
+            select(OutboxFanoutRecipient).where(
+                OutboxFanoutRecipient.outbox_message_id == msg.id
+            )
+        )).scalars().all()
+        assert len(rows) == 4
+        assert {r.user_id for r in rows} == {None, 7}
+
+    @pytest.mark.asyncio
+    async def test_sends_by_audience_and_reports_once(
+        self, db_session: AsyncSession
+    ) -> None:
+        """קבוצות מקבלות את הודעת הקבוצה, נהגים את ההודעה הפרטית; סיכום אחד בסיום"""
+        from app.workers.tasks import SendResult
+
+        msg = await self._queue(db_session)
+        whatsapp_sent: list[tuple[str, str]] = []
+        telegram_sent: list[tuple[str, str]] = []
+
+        async def _whatsapp(phone, content):
+            whatsapp_sent.append((phone, content["message_text"]))
+            # g2 נכשלת זמנית בסבב הראשון
+            return SendResult(success=phone != "g2@g.us", is_transient=True, error="timeout")
+
+        async def _telegram(chat_id, content):
+            telegram_sent.append((chat_id, content["message_text"]))
+            return True
+
+        success, result = await self._process(db_session, msg, _whatsapp, _telegram)
+        assert success is True
+        assert "pending retry" in result
+        assert sorted(whatsapp_sent) == [("g1@g.us", "נסיעה"), ("g2@g.us", "נסיעה")]
+        assert sorted(telegram_sent) == [("-100", "נסיעה"), ("555", "🔔 נסיעה")]
+
+        async def _whatsapp_ok(phone, content):
+            whatsapp_sent.append((phone, content["message_text"]))
+            return SendResult(success=True)
+
+        telegram_sent.clear()
+        success, result = await self._process(db_session, msg, _whatsapp_ok, _telegram)
+        assert success is True
+        assert "4/4" in result
+        # בסבב השני נשלח רק לקבוצה שנכשלה, והסיכום נשלח פעם אחת
+        assert whatsapp_sent[-1] == ("g2@g.us", "נסיעה")
+        assert len(telegram_sent) == 1
+        report_chat, report_text = telegram_sent[0]
+        assert report_chat == "999"
+        assert "קבוצות: 3/3" in report_text
+        assert "נהגים עם חיפוש תואם: 1/1" in report_text
+
+        await db_session.refresh(msg)
+        assert msg.status == MessageStatus.SENT
+
+
+# ============================================================================
+# בדיקות מעברי סטטוס ל-batch (OutboxTransitions / apply_transitions)
+# ============================================================================
+
+
+class TestBulkTransitions:
+    """mark_many_as_sent / mark_many_as_failed — אותה סמנטיקה כמו המעברים הבודדים"""
+
+    @pytest.mark.asyncio
+    async def test_apply_transitions_matches_single_semantics(
+        self, db_session: AsyncSession
+    ) -> None:
+        from app.db.models.dead_letter_message import DeadLetterMessage
+        from app.domain.services.outbox_service import OutboxTransitions
+
+        sent = await _insert_outbox(db_session, recipient_id="+972500000001")
+        retry = await _insert_outbox(db_session, recipient_id="+972500000002")
+        permanent = await _insert_outbox(db_session, recipient_id="+972500000003")
+        exhausted = await _insert_outbox(db_session, recipient_id="+972500000004")
+        exhausted.retry_count = exhausted.max_retries - 1
+        await db_session.commit()
+
+        svc = OutboxService(db_session)
+        claimed = await svc.claim_pending_messages(limit=10)
+        transitions = OutboxTransitions(claimed)
+        await transitions.mark_as_sent(sent.id)
+        await transitions.mark_as_failed(retry.id, "timeout")
+        await transitions.mark_as_failed(permanent.id, "400", is_transient=False)
+        await transitions.mark_as_failed(exhausted.id, "timeout")
+
+        await svc.apply_transitions(transitions)
+        for msg in (sent, retry, permanent, exhausted):
+            await db_session.refresh(msg)
+
+        assert sent.status == MessageStatus.SENT
+        assert sent.processed_at is not None
+        assert sent.locked_until is None
+
+        assert retry.status == MessageStatus.PENDING
+        assert retry.retry_count == 1
+        assert retry.next_retry_at > datetime.utcnow()
+        assert retry.last_error == "timeout"
+        assert retry.locked_until is None
+
+        assert permanent.status == MessageStatus.FAILED
+        assert permanent.retry_count == 0
+        assert exhausted.status == MessageStatus.FAILED
+        assert exhausted.retry_count == exhausted.max_retries
+
+        dead = {
+            d.original_message_id: d
+            for d in (await db_session.execute(select(DeadLetterMessage))).scalars()
+        }
+        assert set(dead) == {permanent.id, exhausted.id}
+        assert dead[permanent.id].failure_reason == "permanent"
+        assert dead[exhausted.id].failure_reason == "max_retries_exceeded"
+        assert dead[exhausted.id].last_error == "timeout"
+
+    @pytest.mark.asyncio
+    async def test_last_transition_wins(self) -> None:
+        from app.domain.services.outbox_service import OutboxTransitions
+
+        msg = _make_outbox_message()
+        msg.id = 7
+        transitions = OutboxTransitions([msg])
+        await transitions.mark_as_failed(7, "timeout")
+        await transitions.mark_as_sent(7)
+
+        assert transitions.sent_ids == [7]
+        assert transitions.failures == []
+        assert len(transitions) == 1
+
+    @pytest.mark.asyncio
+    async def test_postgres_uses_update_from_values(self) -> None:
+        """ב-PostgreSQL — UPDATE ... FROM (VALUES ...) אחד לכל הכשלונות"""
+        from sqlalchemy.dialects.postgresql import asyncpg
+
+        db = MagicMock()
+        db.execute = AsyncMock(return_value=MagicMock())
+        db.get_bind.return_value.dialect.name = "postgresql"
+        msg = _make_outbox_message()
+        msg.id, msg.retry_count, msg.max_retries = 1, 0, 3
+        msg.locked_until = datetime.utcnow()
+
+        await OutboxService(db).mark_many_as_failed([(msg, "timeout", True)])
+
+        assert db.execute.await_count == 1
+        sql = str(db.execute.await_args.args[0].compile(dialect=asyncpg.dialect()))
+        assert "FROM (VALUES" in sql
+        assert "UPDATE outbox_messages" in sql
+        # מגודר ב-lease שאיתו ההודעה נתפסה
+        assert "outbox_messages.locked_until = failed_rows.lease" in sql
+        assert "RETURNING outbox_messages.id" in sql
+
+    @pytest.mark.asyncio
+    async def test_transitions_skip_rows_reclaimed_by_another_worker(
+        self, db_session: AsyncSession
+    ) -> None:
+        """lease שפקע ונתפס מחדש — המעברים של ה-worker הקודם לא דורסים את השורה"""
+        from app.db.models.dead_letter_message import DeadLetterMessage
+        from app.domain.services.outbox_service import OutboxTransitions
+
+        sent = await _insert_outbox(db_session, recipient_id="+972500000011")
+        failed = await _insert_outbox(db_session, recipient_id="+972500000012")
+        permanent = await _insert_outbox(db_session, recipient_id="+972500000013")
+
+        svc = OutboxService(db_session)
+        claimed = await svc.claim_pending_messages(limit=10)
+        # worker אחר תפס מחדש את כל ה-batch אחרי שה-lease פקע
+        await db_session.execute(
+            update(OutboxMessage)
+            .where(OutboxMessage.id.in_([m.id for m in claimed]))
+            .values(locked_until=datetime.utcnow() + timedelta(minutes=10), retry_count=2)
+            # ה-lease שבזיכרון הוא זה שה-worker הראשון תפס איתו
+            .execution_options(synchronize_session=False)
+        )
+        await db_session.commit()
+
+        transitions = OutboxTransitions(claimed)
+        await transitions.mark_as_sent(sent.id)
+        await transitions.mark_as_failed(failed.id, "timeout")
+        await transitions.mark_as_failed(permanent.id, "400", is_transient=False)
+        dead_ids = await svc.apply_transitions(transitions)
+
+        assert dead_ids == []
+        for msg in (sent, failed, permanent):
+            await db_session.refresh(msg)
+            assert msg.status == MessageStatus.PROCESSING
+            assert msg.retry_count == 2
+            assert msg.locked_until is not None
+        assert (await db_session.execute(select(DeadLetterMessage))).first() is None
+
+    @pytest.mark.asyncio
+    async def test_batch_commits_once(self, db_session: AsyncSession) -> None:
+        """_process_outbox_batch — commit אחד למעברי הסטטוס של כל ה-batch"""
+        from app.workers.tasks import SendResult, _process_outbox_batch
+
+        for i in range(5):
+            await _insert_outbox(db_session, recipient_id=f"+97250000001{i}")
+
+        commits = 0
+        real_commit = db_session.commit
+
+        async def _counting_commit():
+            nonlocal commits
+            commits += 1
+            await real_commit()
+
+        with patch("app.workers.tasks.get_task_session") as mock_session_ctx, \
+             patch("app.workers.tasks._send_whatsapp_message",
+                   AsyncMock(return_value=SendResult(success=True))), \
+             patch.object(db_session, "commit", side_effect=_counting_commit):
+            mock_session_ctx.return_value.__aenter__ = AsyncMock(return_value=db_session)
+            mock_session_ctx.return_value.__aexit__ = AsyncMock(return_value=None)
+            results = await _process_outbox_batch()
+
+        assert [r["success"] for r in results] == [True] * 5
+        # commit של ה-claim + commit של המעברים
+        assert commits == 2
+        rows = (await db_session.execute(select(OutboxMessage))).scalars().all()
+        assert {r.status for r in rows} == {MessageStatus.SENT}
+
+
+# ============================================================================
+# בדיקות איחוד הודעות לאותו נמען (outbox_coalescing)
+# ============================================================================
+
+
+class TestOutboxCoalescing:
+    """איחוד הודעות טקסט ממתינות לאותו נמען לשליחה אחת"""
+
+    @staticmethod
+    def _message(
+        message_id: int,
+        text: str,
+        *,
+        recipient_id: str = "12345",
+        keyboard: list | None = None,
+        created_at: datetime | None = None,
+    ) -> OutboxMessage:
+        content = {"message_text": text}
+        if keyboard:
+            content["inline_keyboard"] = keyboard
+        msg = _make_outbox_message(
+            platform=MessagePlatform.TELEGRAM,
+            recipient_id=recipient_id,
+            message_content=content,
+        )
+        msg.id = message_id
+        msg.created_at = created_at or datetime(2026, 1, 1, 12, 0, 0)
+        return msg
+
+    def test_merges_same_recipient_in_order(self) -> None:
+        from app.domain.services.outbox_coalescing import coalesce_outbox_messages
+
+        batch = [
+            self._message(1, "א"),
+            self._message(2, "ב", recipient_id="999"),
+            self._message(3, "ג"),
+        ]
+
+        sends = coalesce_outbox_messages(batch, window_seconds=2)
+
+        assert [[m.id for m in covered] for _, covered in sends] == [[1, 3], [2]]
+        merged = sends[0][0]
+        assert merged.id == 1
+        assert merged.message_content["message_text"] == "א\n\nג"
+        # הודעה שלא אוחדה נשלחת כמו שהיא
+        assert sends[1][0] is batch[1]
+        # ההודעה המקורית לא שונתה
+        assert batch[0].message_content == {"message_text": "א"}
+
+    def test_keyboard_closes_group(self) -> None:
+        """הודעה עם מקלדת אחרונה בקבוצה — המקלדת צמודה לטקסט שלה"""
+        from app.domain.services.outbox_coalescing import coalesce_outbox_messages
+
+        keyboard = [[{"text": "✅ אשר", "callback_data": "approve_delivery_1"}]]
+        batch = [
+            self._message(1, "א"),
+            self._message(2, "בקשה", keyboard=keyboard),
+            self._message(3, "ג"),
+            self._message(4, "ד"),
+        ]
+
+        sends = coalesce_outbox_messages(batch, window_seconds=2)
+
+        assert [[m.id for m in covered] for _, covered in sends] == [[1, 2], [3, 4]]
+        assert sends[0][0].message_content["inline_keyboard"] == keyboard
+        assert sends[0][0].message_content["message_text"].endswith("בקשה")
+        assert "inline_keyboard" not in sends[1][0].message_content
+
+    def test_respects_window_length_and_broadcasts(self) -> None:
+        from app.domain.services.outbox_coalescing import (
+            MAX_TEXT_LENGTH,
+            coalesce_outbox_messages,
+        )
+
+        start = datetime(2026, 1, 1, 12, 0, 0)
+        long_text = "x" * (MAX_TEXT_LENGTH[MessagePlatform.TELEGRAM] - 2)
+        batch = [
+            self._message(1, "א", created_at=start),
+            self._message(2, "ב", created_at=start + timedelta(seconds=5)),
+            self._message(3, long_text, created_at=start + timedelta(seconds=5)),
+            self._message(4, "ג", recipient_id="BROADCAST_COURIERS"),
+            self._message(5, "ד", recipient_id="BROADCAST_COURIERS"),
+        ]
+
+        sends = coalesce_outbox_messages(batch, window_seconds=2)
+
+        assert [[m.id for m in covered] for _, covered in sends] == [
+            [1], [2], [3], [4], [5]
+        ]
+
+    @pytest.mark.asyncio
+    async def test_batch_sends_once_per_recipient(self, db_session: AsyncSession) -> None:
+        """3 הודעות לאותו צ'אט + 1 לצ'אט אחר — 2 קריאות API, כל ה-4 SENT"""
+        from app.core.config import settings
+        from app.workers.tasks import _process_outbox_batch
+
+        for text, chat in [("א", "111"), ("ב", "222"), ("ג", "111"), ("ד", "111")]:
+            await _insert_outbox(
+                db_session,
+                platform=MessagePlatform.TELEGRAM,
+                recipient_id=chat,
+                message_content={"message_text": text},
+            )
+
+        send = AsyncMock(return_value=True)
+        with patch.object(settings, "OUTBOX_COALESCE_ENABLED", True), \
+             patch("app.workers.tasks.get_task_session") as mock_session_ctx, \
+             patch("app.workers.tasks._send_telegram_message", send):
+            mock_session_ctx.return_value.__aenter__ = AsyncMock(return_value=db_session)
+            mock_session_ctx.return_value.__aexit__ = AsyncMock(return_value=None)
+            results = await _process_outbox_batch()
+
+        assert send.await_count == 2
+        texts = {call.args[0]: call.args[1]["message_text"] for call in send.await_args_list}
+        assert texts == {"111": "א\n\nג\n\nד", "222": "ב"}
+        assert len(results) == 4 and all(r["success"] for r in results)
+        rows = (await db_session.execute(select(OutboxMessage))).scalars().all()
+        assert {r.status for r in rows} == {MessageStatus.SENT}
+
+    @pytest.mark.asyncio
+    async def test_failed_merged_send_retries_every_message(
+        self, db_session: AsyncSession
+    ) -> None:
+        from app.core.config import settings
+        from app.workers.tasks import _process_outbox_batch
+
+        for text in ("א", "ב"):
+            await _insert_outbox(
+                db_session,
+                platform=MessagePlatform.TELEGRAM,
+                recipient_id="111",
+                message_content={"message_text": text},
+            )
+
+        with patch.object(settings, "OUTBOX_COALESCE_ENABLED", True), \
+             patch("app.workers.tasks.get_task_session") as mock_session_ctx, \
+             patch("app.workers.tasks._send_telegram_message", AsyncMock(return_value=False)):
+            mock_session_ctx.return_value.__aenter__ = AsyncMock(return_value=db_session)
+            mock_session_ctx.return_value.__aexit__ = AsyncMock(return_value=None)
+            await _process_outbox_batch()
+
+        rows = (await db_session.execute(select(OutboxMessage))).scalars().all()
+        assert len(rows) == 2
+        for row in rows:
+            await db_session.refresh(row)
+            assert row.status == MessageStatus.PENDING
+            assert row.retry_count == 1
+
+
+# ============================================================================
+# בדיקות טלמטריית outbox מה-worker
+# ============================================================================
+
+
+class TestOutboxBatchMetrics:
+    """_process_outbox_batch רושם latency ותוצאות ל-Redis"""
+
+    @pytest.mark.asyncio
+    async def test_batch_records_metrics(self, db_session: AsyncSession) -> None:
+        from app.domain.services.outbox_metrics import read_outbox_metrics
+        from app.workers.tasks import SendResult, _process_outbox_batch
+
+        await _insert_outbox(db_session, recipient_id="+972500000001")
+        permanent = await _insert_outbox(db_session, recipient_id="+972500000002")
+
+        async def _send(phone, content):
+            if phone == permanent.recipient_id:
+                return SendResult(success=False, is_transient=False, error="400")
+            return SendResult(success=True)
+
+        with patch("app.workers.tasks.get_task_session") as mock_session_ctx, \
+             patch("app.workers.tasks._send_whatsapp_message", side_effect=_send):
+            mock_session_ctx.return_value.__aenter__ = AsyncMock(return_value=db_session)
+            mock_session_ctx.return_value.__aexit__ = AsyncMock(return_value=None)
+            await _process_outbox_batch()
+
+        histograms, counters = await read_outbox_metrics()
+        counts = {h.metric: h.count for h in histograms}
+        assert counts == {
+            "outbox_enqueue_to_claim_seconds": 2,
+            "outbox_claim_to_sent_seconds": 1,
+            "outbox_send_duration_seconds": 2,
+            "outbox_retry_count": 2,
+        }
+        assert {c.outcome: c.value for c in counters} == {"sent": 1, "dead": 1}
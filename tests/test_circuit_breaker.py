@@ -3,14 +3,19 @@ Tests for Circuit Breaker Pattern
 """
 import pytest
 import asyncio
-from unittest.mock import AsyncMock
+from unittest.mock import AsyncMock, patch
 
+from app.core import circuit_breaker as cb_module
 from app.core.circuit_breaker import (
     CircuitBreaker,
     CircuitBreakerConfig,
     CircuitState,
-    circuit_breaker
+    RedisCircuitBreaker,
+    SlidingWindow,
+    circuit_breaker,
+    exclude_from_latency,
 )
+from app.core.config import settings
 from app.core.exceptions import CircuitBreakerOpenError
 
 
@@ -197,3 +202,307 @@ class TestCircuitBreaker:
         # Should be blocked now
         with pytest.raises(CircuitBreakerOpenError):
             await decorated_func()
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestSlidingWindow:
+    """חלון זמן נע — מונים, תפוגת buckets והערכת p95"""
+
+    @pytest.mark.unit
+    def test_stats_and_expiry(self):
+        clock = _Clock()
+        window = SlidingWindow(10.0, 5, clock=clock)
+        window.record(0.1, failed=False, slow=False)
+        window.record(0.2, failed=True, slow=False)
+        clock.now += 6.0
+        window.record(12.0, failed=False, slow=True)
+
+        stats = window.stats()
+        assert (stats.calls, stats.failures, stats.slow_calls) == (3, 1, 1)
+        assert stats.failure_rate == pytest.approx(1 / 3)
+
+        # שני הרישומים הראשונים יוצאים מהחלון
+        clock.now += 5.0
+        stats = window.stats()
+        assert (stats.calls, stats.failures, stats.slow_calls) == (1, 0, 1)
+
+        clock.now += 10.0
+        assert window.stats().calls == 0
+        assert window.stats().p95_latency_seconds is None
+
+    @pytest.mark.unit
+    def test_p95_estimate(self):
+        window = SlidingWindow(60.0, 6, clock=_Clock())
+        for _ in range(90):
+            window.record(0.08, failed=False, slow=False)
+        for _ in range(10):
+            window.record(25.0, failed=False, slow=True)
+
+        p95 = window.stats().p95_latency_seconds
+        # ה-95 נופל ב-bucket של 20–30 שניות, חסום בקריאה האיטית ביותר
+        assert 20.0 < p95 <= 25.0
+
+
+class TestSlidingWindowBreaker:
+    """breaker במצב חלון — נפתח לפי שיעור כשלונות ושיעור קריאות איטיות"""
+
+    @pytest.fixture
+    def config(self) -> CircuitBreakerConfig:
+        return CircuitBreakerConfig(
+            failure_threshold=100,
+            timeout_seconds=30.0,
+            window_seconds=60.0,
+            minimum_calls=10,
+            failure_rate_threshold=0.5,
+            slow_call_seconds=10.0,
+            slow_call_rate_threshold=0.5,
+        )
+
+    @pytest.mark.unit
+    async def test_slow_successes_open_circuit(self, config):
+        breaker = CircuitBreaker("gateway", config)
+        for _ in range(5):
+            await breaker.record_success(duration=0.2)
+        for _ in range(4):
+            await breaker.record_success(duration=25.0)
+        assert breaker.is_closed
+
+        await breaker.record_success(duration=25.0)
+
+        assert breaker.is_open
+        assert breaker.get_retry_after() > 0
+        stats = breaker.get_window_stats()
+        # החלון נשמר בזמן שה-circuit פתוח (מסביר למה נפתח) ומתאפס בסגירה
+        assert stats.calls == 10 and stats.slow_call_rate == 0.5
+        with pytest.raises(CircuitBreakerOpenError):
+            await breaker.execute(AsyncMock())
+
+    @pytest.mark.unit
+    async def test_failure_rate_opens_without_consecutive_failures(self, config):
+        breaker = CircuitBreaker("gateway", config)
+        for _ in range(5):
+            await breaker.record_failure(Exception("boom"), duration=0.1)
+            await breaker.record_success(duration=0.1)
+
+        # אין אף פעם יותר מכשלון רצוף אחד, אבל 50% מהקריאות נכשלו
+        assert breaker.is_open
+
+    @pytest.mark.unit
+    async def test_below_minimum_calls_stays_closed(self, config):
+        breaker = CircuitBreaker("gateway", config)
+        for _ in range(9):
+            await breaker.record_success(duration=30.0)
+
+        assert breaker.is_closed
+        assert breaker.get_window_stats().slow_call_rate == 1.0
+
+    @pytest.mark.unit
+    async def test_slow_half_open_probe_reopens(self, config):
+        config.timeout_seconds = 0.01
+        breaker = CircuitBreaker("gateway", config)
+        for _ in range(10):
+            await breaker.record_failure(Exception("boom"), duration=0.1)
+        assert breaker.is_open
+        await asyncio.sleep(0.02)
+        assert await breaker.can_execute()
+
+        await breaker.record_success(duration=15.0)
+
+        assert breaker.is_open
+
+    @pytest.mark.unit
+    async def test_execute_excludes_local_waits_from_latency(self, config):
+        config.slow_call_seconds = 0.05
+        config.minimum_calls = 1
+        breaker = CircuitBreaker("gateway", config)
+
+        async def _waits_for_quota():
+            await asyncio.sleep(0.1)
+            exclude_from_latency(0.1)
+            return "sent"
+
+        assert await breaker.execute(_waits_for_quota) == "sent"
+
+        assert breaker.is_closed
+        stats = breaker.get_window_stats()
+        assert stats.calls == 1 and stats.slow_calls == 0
+
+    @pytest.mark.unit
+    async def test_consecutive_mode_has_no_window(self):
+        breaker = CircuitBreaker("plain", CircuitBreakerConfig())
+        assert breaker.get_window_stats() is None
+
+
+class _SharedStateRedis:
+    """Redis מדומה שמריץ את סקריפטי ה-breaker על hash משותף.
+
+    FakeRedis של הבדיקות לא מריץ Lua — כאן המעברים משוכפלים בפייתון לפי
+    הסקריפט, כדי לבדוק שכמה "תהליכים" (מופעים נפרדים) חולקים מצב.
+    """
+
+    def __init__(self) -> None:
+        self.hashes: dict[str, dict] = {}
+        self.calls = 0
+        self.now_ms = 1_000_000
+
+    async def eval(self, script, numkeys, key, *args):
+        self.calls += 1
+        h = self.hashes.setdefault(
+            key, {"state": "closed", "failures": 0, "successes": 0, "calls": 0, "opened_at": 0}
+        )
+        allowed = 1
+        if script is cb_module._ACQUIRE_SCRIPT:
+            timeout_ms, max_calls = args[0], args[1]
+            if h["state"] == "open":
+                if self.now_ms - h["opened_at"] >= timeout_ms:
+                    h.update(state="half_open", successes=0, calls=0)
+                else:
+                    allowed = 0
+            elif h["state"] == "half_open":
+                if h["calls"] < max_calls:
+                    h["calls"] += 1
+                else:
+                    allowed = 0
+        elif script is cb_module._SUCCESS_SCRIPT:
+            if h["state"] == "half_open":
+                h["successes"] += 1
+                if h["successes"] >= args[0]:
+                    h.update(state="closed", failures=0, successes=0)
+            elif h["state"] == "closed":
+                h["failures"] = 0
+        elif script is cb_module._OPEN_SCRIPT:
+            h.update(state="open", opened_at=self.now_ms)
+        elif script is cb_module._FAILURE_SCRIPT:
+            h["failures"] += 1
+            h["opened_at"] = self.now_ms
+            if h["state"] == "half_open" or h["failures"] >= args[0]:
+                h["state"] = "open"
+        return [
+            allowed, h["state"], h["failures"], h["successes"], h["calls"],
+            self.now_ms - h["opened_at"],
+        ]
+
+
+class TestRedisCircuitBreaker:
+    """backend משותף ב-Redis — מצב אחד לכל ה-workers"""
+
+    @pytest.fixture
+    def redis(self):
+        shared = _SharedStateRedis()
+        with patch(
+            "app.core.redis_client.get_redis", AsyncMock(return_value=shared)
+        ), patch.object(settings, "CIRCUIT_BREAKER_SYNC_INTERVAL_SECONDS", 60.0):
+            yield shared
+
+    @pytest.fixture
+    def config(self) -> CircuitBreakerConfig:
+        return CircuitBreakerConfig(
+            failure_threshold=3, success_threshold=1, timeout_seconds=30.0
+        )
+
+    @pytest.mark.unit
+    async def test_get_instance_uses_configured_backend(self):
+        with patch.object(settings, "CIRCUIT_BREAKER_BACKEND", "redis"):
+            shared = CircuitBreaker.get_instance("backend-redis")
+        local = CircuitBreaker.get_instance("backend-memory")
+
+        assert isinstance(shared, RedisCircuitBreaker)
+        assert type(local) is CircuitBreaker
+
+    @pytest.mark.unit
+    async def test_closed_fast_path_makes_no_redis_calls(self, redis, config):
+        breaker = RedisCircuitBreaker("svc", config)
+        ok = AsyncMock(return_value="ok")
+
+        for _ in range(50):
+            assert await breaker.execute(ok) == "ok"
+
+        # סנכרון ראשון בלבד — הצלחות במצב סגור לא נכתבות
+        assert redis.calls == 1
+
+    @pytest.mark.unit
+    async def test_failures_open_circuit_for_all_processes(self, redis, config):
+        worker_a = RedisCircuitBreaker("telegram", config)
+        worker_b = RedisCircuitBreaker("telegram", config)
+        fail = AsyncMock(side_effect=ConnectionError("down"))
+
+        # שני ה-workers תורמים כשלונות לאותו מונה
+        for breaker in (worker_a, worker_b, worker_a):
+            with pytest.raises(ConnectionError):
+                await breaker.execute(fail)
+
+        assert redis.hashes["circuit:telegram"]["state"] == "open"
+        assert worker_a.is_open
+        # worker_b רואה את המצב הפתוח ברגע שהעותק שלו לא סגור
+        worker_b._synced_at = None
+        with pytest.raises(CircuitBreakerOpenError):
+            await worker_b.execute(AsyncMock())
+        assert worker_b.get_retry_after() > 0
+
+    @pytest.mark.unit
+    async def test_half_open_probe_is_shared(self, redis):
+        config = CircuitBreakerConfig(
+            failure_threshold=1, success_threshold=1, timeout_seconds=30.0,
+            half_open_max_calls=1,
+        )
+        worker_a = RedisCircuitBreaker("wa", config)
+        worker_b = RedisCircuitBreaker("wa", config)
+        with pytest.raises(ConnectionError):
+            await worker_a.execute(AsyncMock(side_effect=ConnectionError()))
+        redis.now_ms += 31_000
+
+        # המעבר ל-half-open ו-probe אחד מותרים; ה-probe השני נחסם בכל ה-workers
+        assert await worker_a.can_execute()
+        assert await worker_b.can_execute()
+        assert not await worker_b.can_execute()
+        assert not await worker_a.can_execute()
+
+        await worker_a.record_success()
+        assert redis.hashes["circuit:wa"]["state"] == "closed"
+        worker_b._synced_at = None
+        assert await worker_b.can_execute()
+        assert worker_b.is_closed
+
+    @pytest.mark.unit
+    async def test_falls_back_to_local_state_when_redis_unavailable(self, config):
+        breaker = RedisCircuitBreaker("svc", config)
+        fail = AsyncMock(side_effect=ConnectionError("down"))
+
+        with patch(
+            "app.core.redis_client.get_redis",
+            AsyncMock(side_effect=ConnectionError("redis down")),
+        ):
+            for _ in range(3):
+                with pytest.raises(ConnectionError):
+                    await breaker.execute(fail)
+            with pytest.raises(CircuitBreakerOpenError):
+                await breaker.execute(AsyncMock())
+
+        assert breaker.is_open
+
+    @pytest.mark.unit
+    async def test_local_window_trip_opens_shared_circuit(self, redis):
+        config = CircuitBreakerConfig(
+            window_seconds=60.0, minimum_calls=4, slow_call_seconds=5.0,
+        )
+        worker_a = RedisCircuitBreaker("gateway", config)
+        worker_b = RedisCircuitBreaker("gateway", config)
+        assert await worker_a.can_execute()
+        calls_after_sync = redis.calls
+
+        for duration in (0.1, 0.1, 20.0):
+            await worker_a.record_success(duration=duration)
+        # הצלחות במצב סגור נספרות בחלון המקומי בלי קריאות ל-Redis
+        assert redis.calls == calls_after_sync
+
+        await worker_a.record_success(duration=20.0)
+
+        assert redis.hashes["circuit:gateway"]["state"] == "open"
+        assert not await worker_b.can_execute()
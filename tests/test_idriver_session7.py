@@ -21,6 +21,7 @@ from app.state_machine.states import DriverState
 from app.state_machine.driver_handler import DriverStateHandler
 from app.domain.services.pricing_service import PricingService, PriceEstimate
 from app.domain.services.ride_posting_service import (
+    RideBroadcast,
     RidePostingService,
     ParsedRidePosting,
 )
@@ -342,6 +343,52 @@ class TestRidePostingService:
         assert sent_count == 0
         assert total_groups == 0
 
+    @pytest.mark.asyncio
+    async def test_queue_ride_broadcast_queues_without_sending(
+        self, db_session, user_factory
+    ) -> None:
+        """ההפצה מועברת ל-outbox — אין שליחה בבקשה, קבוצות ונהגים בהודעה אחת"""
+        from sqlalchemy import select
+
+        from app.db.models.outbox_fanout import OutboxFanoutRecipient
+        from app.db.models.outbox_message import OutboxMessage
+
+        user, _ = await _create_registered_driver(
+            db_session, user_factory, "+972505008002"
+        )
+        other, _ = await _create_registered_driver(
+            db_session, user_factory, "+972505008003"
+        )
+        service = RidePostingService(db_session)
+        posting = ParsedRidePosting(
+            origin="בני ברק", destination="ירושלים", seats=5, price=150.0,
+        )
+        groups = [
+            {"platform": "whatsapp", "group_chat_id": "g1@g.us"},
+            {"platform": "telegram", "group_chat_id": "-100"},
+            {"platform": "sms", "group_chat_id": "x"},
+        ]
+        with patch.object(service, "get_relevant_groups", return_value=groups), \
+             patch("app.api.webhooks.telegram.send_telegram_message") as mock_send:
+            broadcast = await service.queue_ride_broadcast(user, posting, [other.id])
+
+        mock_send.assert_not_called()
+        assert broadcast.groups_total == 3
+        assert broadcast.groups_queued == 2
+        assert broadcast.drivers_queued == 1
+
+        message = (await db_session.execute(select(OutboxMessage))).scalar_one()
+        assert message.message_type == "ride_posting_broadcast"
+        assert message.message_content["report_recipient"] == user.phone_number
+        rows = (await db_session.execute(
+            select(OutboxFanoutRecipient.recipient_id, OutboxFanoutRecipient.user_id)
+        )).all()
+        assert sorted(rows, key=lambda r: r[0]) == [
+            (f"driver:telegram:{other.telegram_chat_id}", other.id),
+            ("group:telegram:-100", None),
+            ("group:whatsapp:g1@g.us", None),
+        ]
+
 
 # ============================================================================
 # בדיקות DriverStateHandler — זרימת מחירון ופרסום
@@ -468,8 +515,8 @@ class TestDriverRidePostingHandler:
         # שלב 2: אישור — מדמה מצב שבו יש קבוצות אבל כולן נכשלות
         with patch.object(
             handler.ride_posting_service,
-            "post_ride",
-            return_value=(True, "הודעת נסיעה", 0, 3),
+            "queue_ride_broadcast",
+            return_value=RideBroadcast(message_text="הודעת נסיעה", groups_total=3),
         ):
             response, new_state = await handler.handle_message(
                 user, "✅ אישור פרסום"
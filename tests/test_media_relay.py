@@ -0,0 +1,180 @@
+"""
+Tests for the media relay (content-addressed on-disk media cache)
+"""
+import asyncio
+import os
+import stat
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.config import settings
+from app.domain.services import media_relay
+from app.domain.services.media_relay import (
+    MediaRelay,
+    MediaTooLargeError,
+    get_media_relay,
+    reset_media_relay,
+)
+
+
+def _fetcher(content: bytes, mime_type: str = "image/jpeg", calls: list | None = None):
+    """fetch שמזרים את content ב-chunks וסופר קריאות"""
+
+    async def _fetch(sink):
+        if calls is not None:
+            calls.append(1)
+        for i in range(0, len(content), 4):
+            sink.write(content[i:i + 4])
+            await asyncio.sleep(0)
+        return mime_type
+
+    return _fetch
+
+
+class TestMediaRelay:
+    """בדיקות cache המדיה"""
+
+    @pytest.fixture
+    def relay(self, tmp_path) -> MediaRelay:
+        return MediaRelay(tmp_path, max_bytes=100, max_file_bytes=50)
+
+    @pytest.mark.asyncio
+    async def test_fetch_stores_file_and_hits_cache(self, relay: MediaRelay) -> None:
+        calls: list = []
+        first = await relay.get_or_fetch("telegram", "f1", _fetcher(b"abcdefghij", calls=calls))
+        second = await relay.get_or_fetch("telegram", "f1", _fetcher(b"other", calls=calls))
+
+        assert first == second
+        assert len(calls) == 1
+        assert first.path.read_bytes() == b"abcdefghij"
+        assert first.path.suffix == ".jpg"
+        assert first.size == 10
+        assert first.as_data_url() == "data:image/jpeg;base64,YWJjZGVmZ2hpag=="
+
+    @pytest.mark.asyncio
+    async def test_key_includes_source(self, relay: MediaRelay) -> None:
+        calls: list = []
+        await relay.get_or_fetch("telegram", "same", _fetcher(b"a", calls=calls))
+        await relay.get_or_fetch("whatsapp_cloud", "same", _fetcher(b"b", calls=calls))
+        assert len(calls) == 2
+
+    @pytest.mark.asyncio
+    async def test_concurrent_fetches_are_deduplicated(self, relay: MediaRelay) -> None:
+        calls: list = []
+        results = await asyncio.gather(*[
+            relay.get_or_fetch("url", "https://x/p.png", _fetcher(b"0123456789", "image/png", calls))
+            for _ in range(5)
+        ])
+
+        assert len(calls) == 1
+        assert len({r.path for r in results}) == 1
+
+    @pytest.mark.asyncio
+    async def test_lru_eviction_by_total_size(self, relay: MediaRelay) -> None:
+        a = await relay.get_or_fetch("t", "a", _fetcher(b"a" * 40))
+        b = await relay.get_or_fetch("t", "b", _fetcher(b"b" * 40))
+        # גישה ל-a הופכת את b לישן ביותר
+        assert relay.get("t", "a") == a
+        c = await relay.get_or_fetch("t", "c", _fetcher(b"c" * 40))
+
+        assert relay.get("t", "b") is None
+        assert not b.path.exists()
+        assert a.path.exists() and c.path.exists()
+        assert relay.total_bytes == 80
+
+    @pytest.mark.asyncio
+    async def test_too_large_is_rejected_and_cleaned_up(self, relay: MediaRelay, tmp_path) -> None:
+        with pytest.raises(MediaTooLargeError):
+            await relay.get_or_fetch("t", "big", _fetcher(b"x" * 51))
+
+        assert relay.get("t", "big") is None
+        assert os.listdir(tmp_path) == []
+
+    @pytest.mark.asyncio
+    async def test_unavailable_or_empty_media_is_not_cached(self, relay: MediaRelay) -> None:
+        async def _missing(sink):
+            return None
+
+        assert await relay.get_or_fetch("t", "m", _missing) is None
+        assert await relay.get_or_fetch("t", "e", _fetcher(b"")) is None
+        assert relay.total_bytes == 0
+
+    @pytest.mark.asyncio
+    async def test_index_is_rebuilt_from_directory(self, relay: MediaRelay, tmp_path) -> None:
+        cached = await relay.get_or_fetch("t", "a", _fetcher(b"hello", "image/png"))
+        (tmp_path / "leftover.123.part").write_bytes(b"partial")
+
+        restarted = MediaRelay(tmp_path, max_bytes=100, max_file_bytes=50)
+        entry = restarted.get("t", "a")
+
+        assert entry is not None
+        assert entry.path == cached.path
+        assert entry.mime_type == "image/png"
+        assert not (tmp_path / "leftover.123.part").exists()
+
+    @pytest.mark.asyncio
+    async def test_expired_entries_are_removed(self, tmp_path, monkeypatch) -> None:
+        clock = [time.time()]
+        monkeypatch.setattr(media_relay, "time", SimpleNamespace(time=lambda: clock[0]))
+        relay = MediaRelay(tmp_path, max_bytes=100, max_file_bytes=50, ttl_seconds=60)
+        old = await relay.get_or_fetch("t", "old", _fetcher(b"kyc-selfie"))
+
+        clock[0] += 30
+        fresh = await relay.get_or_fetch("t", "fresh", _fetcher(b"deposit"))
+        assert relay.get("t", "old") == old
+
+        clock[0] += 31
+        assert relay.get("t", "old") is None
+        assert not old.path.exists()
+        assert relay.get("t", "fresh") == fresh
+        assert relay.total_bytes == fresh.size
+
+
+class TestMediaRelayDirectory:
+    """תיקייה לכל תהליך, הרשאות וניקוי תיקיות ישנות"""
+
+    @pytest.fixture
+    def cache_root(self, tmp_path, monkeypatch):
+        root = tmp_path / "media"
+        monkeypatch.setattr(settings, "MEDIA_CACHE_DIR", str(root))
+        monkeypatch.setattr(settings, "MEDIA_CACHE_TTL_SECONDS", 60)
+        reset_media_relay()
+        yield root
+        reset_media_relay()
+
+    @pytest.mark.asyncio
+    async def test_process_directory_is_private(self, cache_root) -> None:
+        entry = await get_media_relay().get_or_fetch("t", "a", _fetcher(b"id-card"))
+
+        process_dir = entry.path.parent
+        assert process_dir.parent == cache_root
+        assert process_dir.name.startswith(f"{os.getpid()}-")
+        assert stat.S_IMODE(process_dir.stat().st_mode) & 0o077 == 0
+
+    @pytest.mark.asyncio
+    async def test_part_files_of_other_processes_are_kept(self, cache_root) -> None:
+        other = cache_root / "other-process"
+        other.mkdir(parents=True)
+        downloading = other / "abc.123.part"
+        downloading.write_bytes(b"partial")
+
+        await get_media_relay().get_or_fetch("t", "a", _fetcher(b"hello"))
+
+        assert downloading.exists()
+
+    def test_stale_directories_are_swept(self, cache_root) -> None:
+        stale = cache_root / "finished-process"
+        stale.mkdir(parents=True)
+        (stale / "old.jpg").write_bytes(b"kyc")
+        legacy = cache_root / "legacy.jpg"
+        legacy.write_bytes(b"kyc")
+        long_ago = time.time() - 120
+        for path in (stale / "old.jpg", stale, legacy):
+            os.utime(path, (long_ago, long_ago))
+
+        get_media_relay()
+
+        assert not stale.exists()
+        assert not legacy.exists()
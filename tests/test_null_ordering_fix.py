@@ -138,9 +138,9 @@ class TestSourceCodeNullsLast:
     def test_telegram_source_has_nulls_last(self) -> None:
         """קוד telegram.py get_or_create_user כולל nulls_last()."""
         import inspect
-        from app.api.webhooks.telegram import get_or_create_user
+        from app.api.webhooks.telegram import _resolve_telegram_user
 
-        source = inspect.getsource(get_or_create_user)
+        source = inspect.getsource(_resolve_telegram_user)
 
         # שתי שאילתות — ראשית ו-retry
         assert source.count("nulls_last()") >= 2, (
@@ -151,9 +151,9 @@ class TestSourceCodeNullsLast:
     def test_whatsapp_source_has_nulls_last(self) -> None:
         """קוד whatsapp.py get_or_create_user כולל nulls_last()."""
         import inspect
-        from app.api.webhooks.whatsapp import get_or_create_user
+        from app.api.webhooks.whatsapp import _resolve_whatsapp_user
 
-        source = inspect.getsource(get_or_create_user)
+        source = inspect.getsource(_resolve_whatsapp_user)
 
         # שתי שאילתות — sender_key ו-phone
         assert source.count("nulls_last()") >= 2, (
@@ -165,9 +165,9 @@ class TestSourceCodeNullsLast:
         """בטלגרם — כל .desc() ב-order_by חייב להיות עם .nulls_last()."""
         import inspect
         import re
-        from app.api.webhooks.telegram import get_or_create_user
+        from app.api.webhooks.telegram import _resolve_telegram_user
 
-        source = inspect.getsource(get_or_create_user)
+        source = inspect.getsource(_resolve_telegram_user)
 
         # מחפש desc() שלא מלווה ב-.nulls_last()
         # התבנית: .desc() בסוף שורה או לפני פסיק — ללא .nulls_last() אחריו
@@ -187,9 +187,9 @@ class TestSourceCodeNullsLast:
     def test_no_desc_without_nulls_last_in_whatsapp(self) -> None:
         """בוואטסאפ — כל .desc() ב-order_by על עמודות nullable חייב להיות עם .nulls_last()."""
         import inspect
-        from app.api.webhooks.whatsapp import get_or_create_user
+        from app.api.webhooks.whatsapp import _resolve_whatsapp_user
 
-        source = inspect.getsource(get_or_create_user)
+        source = inspect.getsource(_resolve_whatsapp_user)
 
         lines = source.split("\n")
         for line in lines:
@@ -0,0 +1,67 @@
+"""
+בדיקות לסנכרון המילוי לאחור של outbox_messages.priority עם MESSAGE_TYPE_PRIORITIES.
+
+המיגרציות (alembic 008 ו-migrations/020) מחזיקות עותק קפוא של רשימות הסוגים —
+סוג BULK / INTERACTIVE חדש במודל בלי עדכון כאן היה משאיר הודעות ישנות בנתיב NORMAL.
+"""
+from __future__ import annotations
+
+import ast
+import re
+from pathlib import Path
+
+import pytest
+
+from app.db.models.outbox_message import MESSAGE_TYPE_PRIORITIES, MessagePriority
+
+_ROOT = Path(__file__).resolve().parent.parent
+_ALEMBIC_MIGRATION = _ROOT / "alembic" / "versions" / "008_add_outbox_priority.py"
+_SQL_MIGRATION = _ROOT / "migrations" / "020_add_outbox_priority.sql"
+
+
+def _types_for(priority: MessagePriority) -> set[str]:
+    return {
+        message_type
+        for message_type, message_priority in MESSAGE_TYPE_PRIORITIES.items()
+        if message_priority == priority
+    }
+
+
+def _alembic_constant(name: str) -> set[str]:
+    """קריאת tuple ברמת המודול בלי להריץ את המיגרציה"""
+    tree = ast.parse(_ALEMBIC_MIGRATION.read_text(encoding="utf-8"))
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(
+            isinstance(target, ast.Name) and target.id == name for target in node.targets
+        ):
+            return set(ast.literal_eval(node.value))
+    raise AssertionError(f"{name} not found in {_ALEMBIC_MIGRATION.name}")
+
+
+def _sql_types(priority: MessagePriority) -> set[str]:
+    content = _SQL_MIGRATION.read_text(encoding="utf-8")
+    match = re.search(
+        rf"SET priority = {int(priority)}\s+WHERE .*?message_type IN \((.*?)\);",
+        content,
+        re.DOTALL,
+    )
+    assert match is not None, f"no backfill for priority {int(priority)}"
+    return set(re.findall(r"'([^']+)'", match.group(1)))
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(
+    ("constant", "priority"),
+    [
+        ("_INTERACTIVE_TYPES", MessagePriority.INTERACTIVE),
+        ("_BULK_TYPES", MessagePriority.BULK),
+    ],
+)
+def test_alembic_backfill_matches_model(constant: str, priority: MessagePriority) -> None:
+    assert _alembic_constant(constant) == _types_for(priority)
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("priority", [MessagePriority.INTERACTIVE, MessagePriority.BULK])
+def test_sql_backfill_matches_model(priority: MessagePriority) -> None:
+    assert _sql_types(priority) == _types_for(priority)
@@ -6,12 +6,14 @@
 - ביצועי batch operations
 - שימוש בזיכרון בשידורים גדולים
 - Eager loading בשליפות קשורות
+- זמינות ה-event loop בזמן שליחות Cloud API
 """
 import asyncio
 import concurrent.futures
 from contextlib import contextmanager
 from unittest.mock import AsyncMock, MagicMock, patch
 
+import httpx
 import pytest
 from sqlalchemy import event, select
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -122,6 +124,63 @@ class TestN1Prevention:
             f"צפינו ל-1 שאילתא, קיבלנו {counter.count}: {counter.queries}"
         )
 
+    @pytest.mark.asyncio
+    async def test_claim_pending_messages_single_query(
+        self, db_session: AsyncSession, async_engine
+    ) -> None:
+        """תפיסת batch של 50 הודעות — UPDATE ... RETURNING אחד במקום 50 תפיסות"""
+        for i in range(50):
+            db_session.add(OutboxMessage(
+                platform=MessagePlatform.WHATSAPP,
+                recipient_id=f"+97250{i:07d}",
+                message_type="test",
+                message_content={"message_text": f"הודעה {i}"},
+                status=MessageStatus.PENDING,
+            ))
+        await db_session.commit()
+
+        svc = OutboxService(db_session)
+
+        async with QueryCounter(async_engine) as counter:
+            claimed = await svc.claim_pending_messages(limit=50)
+
+        assert len(claimed) == 50
+        assert counter.count == 1, f"צפוי UPDATE אחד, התקבלו {counter.count}: {counter.queries}"
+
+    @pytest.mark.asyncio
+    async def test_batch_status_transitions_set_based(
+        self, db_session: AsyncSession, async_engine
+    ) -> None:
+        """מעברי סטטוס ל-batch של 50 — 3 statements במקום ~100 round trips ו-50 commits"""
+        from app.domain.services.outbox_service import OutboxTransitions
+
+        for i in range(50):
+            db_session.add(OutboxMessage(
+                platform=MessagePlatform.WHATSAPP,
+                recipient_id=f"+97250{i:07d}",
+                message_type="test",
+                message_content={"message_text": f"הודעה {i}"},
+                status=MessageStatus.PENDING,
+            ))
+        await db_session.commit()
+
+        svc = OutboxService(db_session)
+        claimed = await svc.claim_pending_messages(limit=50)
+        transitions = OutboxTransitions(claimed)
+        for i, message in enumerate(claimed):
+            if i < 25:
+                await transitions.mark_as_sent(message.id)
+            elif i < 45:
+                await transitions.mark_as_failed(message.id, "timeout")
+            else:
+                await transitions.mark_as_failed(message.id, "400", is_transient=False)
+
+        async with QueryCounter(async_engine) as counter:
+            await svc.apply_transitions(transitions)
+
+        # UPDATE להצלחות + UPDATE לכשלונות + INSERT ל-dead letters
+        assert counter.count == 3, f"צפויים 3 statements, התקבלו {counter.count}: {counter.queries}"
+
     @pytest.mark.asyncio
     async def test_get_courier_recipients_single_query(
         self, db_session: AsyncSession, user_factory, async_engine
@@ -375,3 +434,925 @@ class TestMemoryUsage:
         # שליפה עם limit=50 (ברירת המחדל של process_outbox_messages)
         messages = await svc.get_pending_messages(limit=50)
         assert len(messages) == 50
+
+
+# ============================================================================
+# בדיקות worker runtime — engine ו-loop אחד לכל תהליך
+# ============================================================================
+
+
+class TestWorkerRuntime:
+    """benchmark: עלות חיבור ל-DB לכל הודעה עם ובלי worker runtime"""
+
+    _MESSAGES = 20
+
+    @staticmethod
+    @contextmanager
+    def _count_connects(database_url: str):
+        """סופר חיבורי DB חדשים (pool connect) על כל engine שנוצר בזמן הבדיקה"""
+        from sqlalchemy.ext.asyncio import create_async_engine as _real_create
+        from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+        from app.core.config import settings
+
+        stats = {"engines": 0, "connects": 0}
+
+        def _counting_create(*args, **kwargs):
+            # aiosqlite על קובץ משתמש ב-NullPool כברירת מחדל — מכריחים pool
+            # אמיתי כדי לשקף את ההתנהגות של asyncpg בפרודקשן
+            kwargs["poolclass"] = AsyncAdaptedQueuePool
+            engine = _real_create(*args, **kwargs)
+            stats["engines"] += 1
+
+            def _on_connect(dbapi_conn, conn_record):
+                stats["connects"] += 1
+
+            event.listen(engine.sync_engine, "connect", _on_connect)
+            return engine
+
+        with patch.object(settings, "DATABASE_URL", database_url), \
+             patch("app.db.database.create_async_engine", _counting_create), \
+             patch("app.workers.runtime.create_async_engine", _counting_create):
+            yield stats
+
+    @staticmethod
+    async def _per_message_query() -> int:
+        """מדמה את דפוס _process_single_message — סשן task חדש לכל הודעה"""
+        from sqlalchemy import text
+
+        from app.db.database import get_task_session
+
+        async with get_task_session() as db:
+            result = await db.execute(text("SELECT 1"))
+            return result.scalar_one()
+
+    def test_without_runtime_connects_per_message(self, tmp_path) -> None:
+        """בלי runtime — engine וחיבור חדשים לכל הודעה (המצב הקודם)"""
+        from app.workers.tasks import run_async
+
+        url = f"sqlite+aiosqlite:///{tmp_path / 'bench.db'}"
+        with self._count_connects(url) as stats:
+            for _ in range(self._MESSAGES):
+                assert run_async(self._per_message_query()) == 1
+
+        assert stats["engines"] == self._MESSAGES
+        assert stats["connects"] == self._MESSAGES
+
+    def test_runtime_reuses_single_pooled_engine(self, tmp_path) -> None:
+        """עם runtime — engine אחד וחיבור אחד מה-pool לכל ההודעות"""
+        from app.workers.runtime import start_worker_runtime, stop_worker_runtime
+        from app.workers.tasks import run_async
+
+        url = f"sqlite+aiosqlite:///{tmp_path / 'bench.db'}"
+        with self._count_connects(url) as stats:
+            start_worker_runtime()
+            try:
+                for _ in range(self._MESSAGES):
+                    assert run_async(self._per_message_query()) == 1
+            finally:
+                stop_worker_runtime()
+
+        assert stats["engines"] == 1
+        assert stats["connects"] == 1
+
+    def test_runtime_keeps_loop_between_tasks(self) -> None:
+        """tasks עוקבים רצים על אותו event loop — Redis/engine לא נקשרים ל-loop סגור"""
+        from app.workers.runtime import start_worker_runtime, stop_worker_runtime
+        from app.workers.tasks import run_async
+
+        async def _current_loop():
+            return asyncio.get_running_loop()
+
+        runtime = start_worker_runtime()
+        try:
+            first = run_async(_current_loop())
+            second = run_async(_current_loop())
+            assert first is second is runtime.loop
+        finally:
+            stop_worker_runtime()
+
+        assert first.is_closed()
+
+
+# ============================================================================
+# בדיקות latency של outbox — enqueue → send
+# ============================================================================
+
+
+def _shared_task_session(db_session: AsyncSession):
+    """get_task_session לבדיקות — אותו סשן לכל נתיבי ה-outbox, גישה אחת בכל פעם
+    (AsyncSession לא תומך בפעולות מקבילות; ב-production לכל נתיב סשן משלו)"""
+    from contextlib import asynccontextmanager
+
+    lock = asyncio.Lock()
+
+    @asynccontextmanager
+    async def _session():
+        async with lock:
+            yield db_session
+
+    return _session
+
+
+class TestOutboxWakeupLatency:
+    """מדידת זמן מ-commit של הודעה ועד שליחתה, עם ובלי התעוררות מיידית"""
+
+    @pytest.mark.asyncio
+    async def test_enqueue_to_send_latency_with_wakeup(
+        self, db_session: AsyncSession, mock_whatsapp_gateway
+    ) -> None:
+        """התעוררות אחרי commit — ההודעה נשלחת תוך שבריר שנייה.
+
+        לפני: הודעה ממתינה ל-tick של Beat — עד OUTBOX_SWEEP_INTERVAL_SECONDS
+        (10 שניות), בממוצע חצי מזה. ראה test_enqueue_to_send_latency_beat_only.
+        """
+        import time
+
+        from app.core.config import settings
+        from app.workers import tasks
+        from app.workers.tasks import outbox_wakeup_listener
+
+        drained = asyncio.Event()
+        real_drain = tasks._drain_outbox
+
+        async def _drain_and_signal(lane=None) -> int:
+            count = await real_drain(lane)
+            if count:
+                drained.set()
+            return count
+
+        with patch("app.workers.tasks.get_task_session", _shared_task_session(db_session)), \
+             patch("app.workers.tasks._drain_outbox", side_effect=_drain_and_signal):
+            listener = asyncio.create_task(outbox_wakeup_listener())
+            try:
+                svc = OutboxService(db_session)
+                msg = await svc.queue_message(
+                    MessagePlatform.WHATSAPP,
+                    "+972501234567",
+                    "capture_notification_sender",
+                    {"message_text": "המשלוח נתפס"},
+                )
+                enqueued_at = time.perf_counter()
+                await db_session.commit()
+
+                latency = None
+                while time.perf_counter() - enqueued_at < 5:
+                    await asyncio.sleep(0.01)
+                    if mock_whatsapp_gateway.post.await_count:
+                        latency = time.perf_counter() - enqueued_at
+                        break
+                # ביטול ה-listener רק אחרי שה-drain סיים (mark_as_sent + commit)
+                await asyncio.wait_for(drained.wait(), timeout=5)
+            finally:
+                listener.cancel()
+                await asyncio.gather(listener, return_exceptions=True)
+
+        await db_session.refresh(msg)
+        assert msg.status == MessageStatus.SENT
+        assert latency is not None
+        assert latency < 1.0
+        assert latency < settings.OUTBOX_SWEEP_INTERVAL_SECONDS / 2
+
+    @pytest.mark.asyncio
+    async def test_enqueue_to_send_latency_beat_only(
+        self, db_session: AsyncSession, mock_whatsapp_gateway
+    ) -> None:
+        """baseline — בלי התעוררות ההודעה נשלחת רק ב-tick הבא של Beat.
+
+        מרווח ה-sweep מוקטן ל-0.5 שניות; ה-tick הראשון אחרי ה-commit נמצא
+        מרווח שלם אחריו, כמו הודעה שנכנסה מיד אחרי tick. עם התעוררות
+        (test_enqueue_to_send_latency_with_wakeup) הזמן לא תלוי במרווח.
+        """
+        import time
+
+        from app.core.config import settings
+        from app.workers import tasks
+
+        sweep_interval = 0.5
+        swept = asyncio.Event()
+
+        async def _beat() -> None:
+            # ה-sweep של Beat — process_outbox_messages כל sweep_interval
+            while True:
+                await asyncio.sleep(settings.OUTBOX_SWEEP_INTERVAL_SECONDS)
+                if await tasks._process_outbox_batch():
+                    swept.set()
+
+        with patch.object(settings, "OUTBOX_WAKEUP_ENABLED", False), \
+             patch.object(settings, "OUTBOX_SWEEP_INTERVAL_SECONDS", sweep_interval), \
+             patch("app.workers.tasks.get_task_session", _shared_task_session(db_session)):
+            svc = OutboxService(db_session)
+            msg = await svc.queue_message(
+                MessagePlatform.WHATSAPP,
+                "+972501234567",
+                "capture_notification_sender",
+                {"message_text": "המשלוח נתפס"},
+            )
+            await db_session.commit()
+            enqueued_at = time.perf_counter()
+            beat = asyncio.create_task(_beat())
+            try:
+                latency = None
+                while time.perf_counter() - enqueued_at < 5:
+                    await asyncio.sleep(0.01)
+                    if mock_whatsapp_gateway.post.await_count:
+                        latency = time.perf_counter() - enqueued_at
+                        break
+                await asyncio.wait_for(swept.wait(), timeout=5)
+            finally:
+                beat.cancel()
+                await asyncio.gather(beat, return_exceptions=True)
+
+        await db_session.refresh(msg)
+        assert msg.status == MessageStatus.SENT
+        assert latency is not None
+        # ההודעה חיכתה ל-tick — לא נשלחה לפני שהמרווח עבר
+        assert latency >= sweep_interval * 0.9
+
+    @pytest.mark.asyncio
+    async def test_interactive_latency_during_bulk_drain(
+        self, db_session: AsyncSession, mock_whatsapp_gateway
+    ) -> None:
+        """נתיבי עדיפות — הודעה אינטראקטיבית נשלחת לפני שה-broadcast שכבר
+        מתרוקן מסתיים.
+
+        לפני: תור FIFO אחד — ההודעה ממתינה מאחורי כל ה-broadcast
+        (כאן 30 הודעות × 50ms ≈ 1.5 שניות, ובפועל כמה ticks של Beat).
+        הבדיקה משווה סדר שליחות ולא זמנים — לא תלויה בעומס על המכונה.
+        """
+        from app.workers import tasks
+        from app.workers.tasks import outbox_wakeup_listener
+
+        bulk_count = 30
+        # סדר השליחות שהסתיימו: "interactive" או "bulk"
+        completed: list[str] = []
+
+        async def _slow_post(url, *args, **kwargs):
+            payload = str(kwargs.get("json"))
+            if "המשלוח נתפס" in payload:
+                completed.append("interactive")
+            else:
+                await asyncio.sleep(0.05)
+                completed.append("bulk")
+            return mock_whatsapp_gateway.post.return_value
+
+        mock_whatsapp_gateway.post.side_effect = _slow_post
+
+        processed = 0
+        all_done = asyncio.Event()
+        real_drain = tasks._drain_outbox
+
+        async def _drain_and_count(lane=None) -> int:
+            nonlocal processed
+            count = await real_drain(lane)
+            processed += count
+            if processed >= bulk_count + 1:
+                all_done.set()
+            return count
+
+        with patch("app.workers.tasks.get_task_session", _shared_task_session(db_session)), \
+             patch("app.workers.tasks._drain_outbox", side_effect=_drain_and_count):
+            listener = asyncio.create_task(outbox_wakeup_listener())
+            try:
+                svc = OutboxService(db_session)
+                for i in range(bulk_count):
+                    await svc.queue_message(
+                        MessagePlatform.WHATSAPP,
+                        f"+97250{i:07d}",
+                        "expiry_warning",
+                        {"message_text": f"תזכורת {i}"},
+                    )
+                await db_session.commit()
+
+                # ה-broadcast כבר בשליחה
+                while mock_whatsapp_gateway.post.await_count < 3:
+                    await asyncio.sleep(0.01)
+
+                await svc.queue_message(
+                    MessagePlatform.WHATSAPP,
+                    "+972509999999",
+                    "capture_notification_sender",
+                    {"message_text": "המשלוח נתפס"},
+                )
+                await db_session.commit()
+
+                await asyncio.wait_for(all_done.wait(), timeout=10)
+            finally:
+                listener.cancel()
+                await asyncio.gather(listener, return_exceptions=True)
+
+        assert completed.count("bulk") == bulk_count
+        # ה-broadcast עוד לא הסתיים כשההודעה האינטראקטיבית נשלחה
+        assert "bulk" in completed[completed.index("interactive") + 1:]
+
+
+class _KeepAliveServer:
+    """שרת HTTP/1.1 מקומי עם keep-alive — כל חיבור חדש משלם השהיה קבועה
+    שמדמה DNS + TCP + TLS handshake מול api.telegram.org"""
+
+    def __init__(self, handshake_seconds: float) -> None:
+        self.handshake_seconds = handshake_seconds
+        self.connections = 0
+        self.requests = 0
+        self._server: asyncio.AbstractServer | None = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    async def __aenter__(self) -> "_KeepAliveServer":
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        await asyncio.sleep(self.handshake_seconds)
+        body = b'{"ok": true, "result": {"message_id": 1}}'
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.decode("latin-1").split("\r\n"):
+                    name, _, value = line.partition(":")
+                    if name.lower() == "content-length":
+                        length = int(value)
+                await reader.readexactly(length)
+                self.requests += 1
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\n"
+                    b"Content-Type: application/json\r\n"
+                    b"Content-Length: " + str(len(body)).encode() + b"\r\n"
+                    b"\r\n" + body
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+class TestSharedHttpClients:
+    """clients משותפים (Bot API, WPPConnect Gateway) — חיבורי keep-alive
+    במקום חיבור לכל הודעה"""
+
+    @pytest.mark.asyncio
+    async def test_pooled_client_lowers_per_message_latency(self) -> None:
+        """20 הודעות דרך _send_telegram_message מול שרת עם השהיית handshake.
+
+        לפני: httpx.AsyncClient חדש לכל הודעה — handshake בכל שליחה
+        (כאן 20 × 20ms לפחות). אחרי: חיבור אחד שנפתח פעם אחת.
+        """
+        import time
+
+        import httpx
+
+        from app.core.config import settings
+        from app.core.http_clients import close_http_clients, telegram_api_url
+        from app.workers.tasks import _send_telegram_message
+
+        message_count = 20
+        handshake = 0.02
+
+        async with _KeepAliveServer(handshake) as server:
+            with patch.object(settings, "TELEGRAM_BOT_TOKEN", "test-token"), \
+                 patch.object(settings, "TELEGRAM_API_BASE_URL", server.base_url):
+                # baseline — התבנית הקודמת: client חדש לכל הודעה
+                started = time.perf_counter()
+                for i in range(message_count):
+                    async with httpx.AsyncClient() as client:
+                        response = await client.post(
+                            telegram_api_url("sendMessage"),
+                            json={"chat_id": "123", "text": f"הודעה {i}"},
+                        )
+                        assert response.status_code == 200
+                per_call_elapsed = time.perf_counter() - started
+                per_call_connections = server.connections
+
+                server.connections = 0
+                started = time.perf_counter()
+                try:
+                    for i in range(message_count):
+                        assert await _send_telegram_message(
+                            "123", {"message_text": f"הודעה {i}"}
+                        )
+                finally:
+                    await close_http_clients()
+                pooled_elapsed = time.perf_counter() - started
+
+        assert per_call_connections == message_count
+        assert server.connections == 1
+        assert server.requests == message_count * 2
+        assert per_call_elapsed >= message_count * handshake
+        assert pooled_elapsed < per_call_elapsed / 2
+
+    @pytest.mark.asyncio
+    async def test_whatsapp_broadcast_reuses_gateway_connections(self) -> None:
+        """broadcast ל-60 שליחים דרך _send_whatsapp_bulk מול גטוויי מקומי.
+
+        לפני: httpx.AsyncClient חדש לכל בקשה — 60 חיבורי TCP קצרים לגטוויי.
+        אחרי: send_text_bulk על ה-client המשותף — לכל היותר
+        WHATSAPP_BULK_SEND_CONCURRENCY חיבורים, שנשארים פתוחים.
+        """
+        from app.core.config import settings
+        from app.core.http_clients import close_http_clients
+        from app.workers.tasks import _send_whatsapp_bulk
+
+        recipients = [f"+97250{i:07d}" for i in range(60)]
+
+        async with _KeepAliveServer(0.02) as server:
+            with patch.object(settings, "WHATSAPP_PROVIDER", "wppconnect"), \
+                 patch.object(settings, "WHATSAPP_HYBRID_MODE", False), \
+                 patch.object(settings, "WHATSAPP_GATEWAY_URL", server.base_url):
+                try:
+                    results = await _send_whatsapp_bulk(
+                        recipients, {"message_text": "משלוח חדש באזורך"}
+                    )
+                finally:
+                    await close_http_clients()
+
+        assert all(r.success for r in results)
+        assert server.requests == len(recipients)
+        assert server.connections <= settings.WHATSAPP_BULK_SEND_CONCURRENCY
+
+
+class _StreamingTransport(httpx.AsyncBaseTransport):
+    """transport מקומי ל-Graph API ולטלגרם שלא מחזיק גופי בקשות/תגובות בזיכרון.
+
+    הורדת המדיה מוחזרת ב-chunks מאותו buffer, וגוף ההעלאה נצרך chunk אחרי
+    chunk ונספר — כך tracemalloc מודד רק את מה שהקוד הנבדק מחזיק.
+    """
+
+    def __init__(self, chunk: bytes, chunk_count: int) -> None:
+        self._chunk = chunk
+        self._chunk_count = chunk_count
+        self.downloads = 0
+        self.uploaded_bytes: list[int] = []
+
+    async def _media_body(self):
+        for _ in range(self._chunk_count):
+            yield self._chunk
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.url.host == "graph.facebook.com":
+            return httpx.Response(200, json={"url": "https://lookaside.fbsbx.com/kyc"})
+        if request.url.host == "lookaside.fbsbx.com":
+            self.downloads += 1
+            return httpx.Response(
+                200, headers={"content-type": "image/jpeg"}, content=self._media_body()
+            )
+        if request.url.path.endswith("/sendPhoto"):
+            size = 0
+            async for part in request.stream:
+                size += len(part)
+            self.uploaded_bytes.append(size)
+            return httpx.Response(200, json={"ok": True, "result": {}})
+        return httpx.Response(404)
+
+
+class TestMediaRelayMemory:
+    """העברת צילומי KYC/הפקדה מוואטסאפ לטלגרם דרך ה-media relay"""
+
+    @pytest.mark.asyncio
+    async def test_forwarding_photo_keeps_peak_memory_below_file_size(self) -> None:
+        """צילום של 4MB ל-3 מנהלים.
+
+        לפני: הורדה לזיכרון לכל מנהל, base64 (+33%) ופענוח חזרה — שיא של
+        פי 3 בערך מגודל הקובץ, ו-3 הורדות. אחרי: הורדה אחת ב-stream ל-cache
+        והעלאה ישירות מהקובץ — שיא הזיכרון בסדר גודל של chunk.
+        """
+        import tracemalloc
+
+        from app.core.config import settings
+        from app.core.http_clients import close_http_clients
+        from app.domain.services.admin_notification_service import AdminNotificationService
+
+        chunk = b"\xff" * 65536
+        file_size = len(chunk) * 64
+        transport = _StreamingTransport(chunk, 64)
+        real_client = httpx.AsyncClient
+
+        def _client(**kwargs):
+            kwargs.pop("transport", None)
+            return real_client(transport=transport, **kwargs)
+
+        admins = ["111", "222", "333"]
+        with patch("httpx.AsyncClient", side_effect=_client), \
+             patch.object(settings, "TELEGRAM_BOT_TOKEN", "test-token"), \
+             patch.object(settings, "WHATSAPP_CLOUD_API_TOKEN", "cloud-token"):
+            tracemalloc.start()
+            try:
+                for admin_id in admins:
+                    assert await AdminNotificationService._forward_whatsapp_photo_to_telegram(
+                        admin_id, "kyc_media_id_123456"
+                    )
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+                await close_http_clients()
+
+        assert transport.downloads == 1
+        assert len(transport.uploaded_bytes) == len(admins)
+        assert all(size > file_size for size in transport.uploaded_bytes)
+        assert peak < file_size / 4
+
+
+class _LoopTicker:
+    """סופר סיבובים של ה-event loop — אם הספירה לא זזה בזמן שבקשה בדרך,
+    ה-loop היה חסום ו-webhook שמגיע באמצע לא היה מתחיל לרוץ"""
+
+    def __init__(self) -> None:
+        self.ticks = 0
+        self._done = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    async def _run(self) -> None:
+        while not self._done.is_set():
+            self.ticks += 1
+            await asyncio.sleep(0)
+
+    async def __aenter__(self) -> "_LoopTicker":
+        self._task = asyncio.create_task(self._run())
+        await asyncio.sleep(0)
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self._done.set()
+        await self._task
+
+
+class TestCloudApiSendLatency:
+    """שליחות Cloud API (pywa_async) לא חוסמות את ה-event loop של ה-webhooks"""
+
+    @pytest.mark.asyncio
+    async def test_webhook_latency_flat_while_cloud_api_sends_in_flight(self) -> None:
+        """broadcast של 40 הודעות דרך PyWaProvider מול Graph API עם 50ms לבקשה.
+
+        baseline: client סינכרוני — כל שליחה חוסמת את ה-loop לכל ה-round trip,
+        ו-webhook שמגיע באמצע מחכה עד שהיא מסתיימת. אחרי: pywa_async על ה-client
+        המשותף — ה-loop ממשיך להסתובב בזמן שהבקשות בדרך, ולא יותר מ-
+        WHATSAPP_CLOUD_API_MAX_CONCURRENCY בקשות במקביל. הבדיקה לא משווה זמנים.
+        """
+        import time
+
+        from app.core.circuit_breaker import CircuitBreaker, CircuitBreakerConfig
+        from app.core.config import settings
+        from app.core.http_clients import close_http_clients
+        from app.domain.services.whatsapp.pywa_provider import PyWaProvider
+
+        latency = 0.05
+        in_flight = 0
+        peak = 0
+        ticker = _LoopTicker()
+        # לכל בקשה: האם ה-loop הסתובב בזמן שהיא הייתה בדרך
+        loop_free: list[bool] = []
+
+        async def _graph_api(request: httpx.Request) -> httpx.Response:
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            before = ticker.ticks
+            await asyncio.sleep(latency)
+            loop_free.append(ticker.ticks > before)
+            in_flight -= 1
+            return httpx.Response(200, json={
+                "messaging_product": "whatsapp",
+                "contacts": [{"input": "972500000000", "wa_id": "972500000000"}],
+                "messages": [{"id": "wamid.test"}],
+            })
+
+        def _build_client() -> httpx.AsyncClient:
+            return httpx.AsyncClient(transport=httpx.MockTransport(_graph_api))
+
+        messages = [(f"+97250{i:07d}", "משלוח חדש באזורך") for i in range(40)]
+
+        def _provider() -> PyWaProvider:
+            return PyWaProvider(
+                circuit_breaker=CircuitBreaker("perf_pywa", CircuitBreakerConfig(failure_threshold=100))
+            )
+
+        # baseline — client שחוסם את ה-loop (קריאה סינכרונית בתוך ה-coroutine)
+        blocking_loop_free: list[bool] = []
+
+        async def _blocking_send(**kwargs):
+            before = ticker.ticks
+            time.sleep(latency)
+            blocking_loop_free.append(ticker.ticks > before)
+
+        blocking = _provider()
+        blocking._client = MagicMock(send_message=AsyncMock(side_effect=_blocking_send))
+        async with ticker:
+            await blocking.send_text_bulk(messages[:4])
+
+        ticker = _LoopTicker()
+        with patch.object(settings, "WHATSAPP_CLOUD_API_PHONE_ID", "123"), \
+             patch.object(settings, "WHATSAPP_CLOUD_API_TOKEN", "cloud-token"), \
+             patch.object(settings, "WHATSAPP_CLOUD_API_MAX_CONCURRENCY", 5), \
+             patch("app.domain.services.whatsapp.pywa_provider._call_slots", {}), \
+             patch("app.core.http_clients._build_whatsapp_cloud_client", _build_client):
+            try:
+                provider = _provider()
+                # ה-import של pywa_async ובניית ה-client — פעם אחת לתהליך, לפני המדידה
+                await provider._get_client()
+                async with ticker:
+                    errors = await provider.send_text_bulk(messages)
+            finally:
+                await close_http_clients()
+
+        assert errors == [None] * len(messages)
+        assert peak == 5
+        assert len(loop_free) == len(messages)
+        assert all(loop_free)
+        assert blocking_loop_free == [False] * 4
+
+
+# ============================================================================
+# unit of work לשיחה — טעינה אחת ו-UPDATE אחד להודעה
+# ============================================================================
+
+
+def _conversation_queries(counter: QueryCounter) -> tuple[int, int]:
+    """(SELECT, UPDATE) על conversation_sessions מתוך השאילתות שנספרו"""
+    statements = [q for q in counter.queries if "conversation_sessions" in q]
+    selects = sum(1 for q in statements if q.lstrip().upper().startswith("SELECT"))
+    updates = sum(1 for q in statements if q.lstrip().upper().startswith("UPDATE"))
+    return selects, updates
+
+
+class TestConversationUnitOfWork:
+    """תור הודעה אחד של שולח / נהג — השיחה נטענת פעם אחת ונכתבת פעם אחת"""
+
+    @pytest.mark.asyncio
+    async def test_sender_turn_single_select_and_update(
+        self, db_session: AsyncSession, async_engine, user_factory
+    ) -> None:
+        """שלב ברחוב איסוף: get_current_state + get_context + transition_to"""
+        from app.db.models.conversation_session import ConversationSession
+        from app.state_machine.handlers import SenderStateHandler
+        from app.state_machine.manager import StateManager, conversation_unit_of_work
+        from app.state_machine.states import SenderState
+
+        user = await user_factory(phone_number="+972503330001", name="שולח", role=UserRole.SENDER)
+        await StateManager(db_session).force_state(
+            user.id, "telegram", SenderState.PICKUP_STREET.value, {"pickup_city": "תל אביב"}
+        )
+
+        async with QueryCounter(async_engine) as counter:
+            async with conversation_unit_of_work(db_session):
+                _, new_state = await SenderStateHandler(db_session).handle_message(
+                    user.id, "telegram", "הרצל"
+                )
+
+        assert new_state == SenderState.PICKUP_NUMBER.value
+        assert _conversation_queries(counter) == (1, 1), counter.queries
+
+        row = (await db_session.execute(
+            select(ConversationSession.current_state, ConversationSession.context_data)
+            .where(ConversationSession.user_id == user.id)
+        )).one()
+        assert row.current_state == SenderState.PICKUP_NUMBER.value
+        assert row.context_data == {"pickup_city": "תל אביב", "pickup_street": "הרצל"}
+
+    @pytest.mark.asyncio
+    async def test_driver_turn_single_select_and_update(
+        self, db_session: AsyncSession, async_engine, user_factory
+    ) -> None:
+        """שלב איסוף שם — שמירת הפרופיל מבצעת commit משלה באמצע התור"""
+        from app.db.models.conversation_session import ConversationSession
+        from app.state_machine.driver_handler import DriverStateHandler
+        from app.state_machine.manager import StateManager, conversation_unit_of_work
+        from app.state_machine.states import DriverState
+
+        user = await user_factory(phone_number="+972503330002", name="נהג", role=UserRole.DRIVER)
+        await StateManager(db_session).force_state(
+            user.id, "telegram", DriverState.REGISTER_COLLECT_NAME.value, context={}
+        )
+
+        async with QueryCounter(async_engine) as counter:
+            async with conversation_unit_of_work(db_session):
+                _, new_state = await DriverStateHandler(db_session, platform="telegram").handle_message(
+                    user, "ישראל ישראלי", None
+                )
+
+        assert new_state == DriverState.REGISTER_COLLECT_BIRTH_DATE.value
+        assert _conversation_queries(counter) == (1, 1), counter.queries
+
+        row = (await db_session.execute(
+            select(ConversationSession.current_state, ConversationSession.context_data)
+            .where(ConversationSession.user_id == user.id)
+        )).one()
+        assert row.current_state == DriverState.REGISTER_COLLECT_BIRTH_DATE.value
+        assert row.context_data == {"reg_name": "ישראל ישראלי"}
+
+    @pytest.mark.asyncio
+    async def test_without_unit_of_work_reloads_per_call(
+        self, db_session: AsyncSession, async_engine, user_factory
+    ) -> None:
+        """baseline — בלי unit of work כל קריאה ל-StateManager טוענת את השיחה מחדש"""
+        from app.state_machine.handlers import SenderStateHandler
+        from app.state_machine.manager import StateManager
+        from app.state_machine.states import SenderState
+
+        user = await user_factory(phone_number="+972503330003", name="שולח", role=UserRole.SENDER)
+        await StateManager(db_session).force_state(
+            user.id, "telegram", SenderState.PICKUP_STREET.value, {"pickup_city": "חיפה"}
+        )
+
+        async with QueryCounter(async_engine) as counter:
+            await SenderStateHandler(db_session).handle_message(user.id, "telegram", "הנביאים")
+
+        selects, updates = _conversation_queries(counter)
+        assert selects == 3
+        assert updates == 1
+
+    @pytest.mark.asyncio
+    async def test_exception_discards_staged_changes(
+        self, db_session: AsyncSession, user_factory
+    ) -> None:
+        """חריגה בתוך הבלוק — שינויים שלא נכתבו לא נשמרים"""
+        from app.state_machine.manager import StateManager, conversation_unit_of_work
+        from app.state_machine.states import SenderState
+
+        user = await user_factory(phone_number="+972503330004", name="שולח", role=UserRole.SENDER)
+        state_manager = StateManager(db_session)
+        await state_manager.force_state(user.id, "telegram", SenderState.MENU.value, {})
+
+        with pytest.raises(RuntimeError):
+            async with conversation_unit_of_work(db_session):
+                await state_manager.update_context(user.id, "telegram", "draft", "x")
+                raise RuntimeError("boom")
+
+        assert await state_manager.get_context(user.id, "telegram") == {}
+
+    @pytest.mark.asyncio
+    async def test_webhook_helpers_commit_and_discard_inside_block(
+        self, db_session: AsyncSession, user_factory
+    ) -> None:
+        """webhook שבולע חריגות — commit לפני סימון completed, discard להודעה שנכשלה"""
+        from app.state_machine.manager import (
+            StateManager,
+            commit_conversation_state,
+            conversation_unit_of_work,
+            discard_conversation_state,
+        )
+        from app.state_machine.states import SenderState
+
+        user = await user_factory(phone_number="+972503330005", name="שולח", role=UserRole.SENDER)
+        user_id = user.id
+        state_manager = StateManager(db_session)
+        await state_manager.force_state(user_id, "telegram", SenderState.MENU.value, {})
+
+        async with conversation_unit_of_work(db_session) as unit_of_work:
+            await state_manager.update_context(user_id, "telegram", "step", 1)
+            await commit_conversation_state(db_session)
+            assert not unit_of_work.has_pending()
+
+            await state_manager.update_context(user_id, "telegram", "draft", "x")
+            discard_conversation_state(db_session)
+            assert not unit_of_work.has_pending()
+
+        db_session.expire_all()
+        assert await state_manager.get_context(user_id, "telegram") == {"step": 1}
+
+
+# ============================================================================
+# context patch — רק המפתחות שהשתנו נשלחים ל-DB
+# ============================================================================
+
+
+def _wizard_context(keys: int) -> dict:
+    """context של זרימת אשף ארוכה — שדות טקסט ורשימה מקוננת"""
+    context: dict = {f"field_{i}": f"ערך בזרימת האשף {i}" for i in range(keys)}
+    context["stops"] = [{"city": "תל אביב", "number": str(i)} for i in range(5)]
+    return context
+
+
+class TestContextPatch:
+    """עדכון context חלקי במקום deepcopy ושכתוב של כל ה-dict"""
+
+    def test_postgres_update_binds_only_changed_keys(self) -> None:
+        from sqlalchemy.dialects import postgresql
+
+        from app.db.models.conversation_session import ConversationSession
+        from app.state_machine.manager import _StagedSession
+
+        conversation = ConversationSession(
+            id=7, user_id=1, platform="telegram",
+            current_state="SENDER.MENU", context_data=_wizard_context(40),
+        )
+        staged = _StagedSession.load(conversation)
+        staged.patch({"field_3": "חדש"}, remove=["field_5"])
+
+        compiled = staged.patch_statement().compile(dialect=postgresql.dialect())
+        sql = str(compiled)
+        params = list(compiled.params.values())
+
+        assert "||" in sql and " - " in sql
+        assert {"field_3": "חדש"} in params
+        assert ["field_5"] in params
+        # ה-context המלא לא נשלח
+        assert not any(isinstance(p, dict) and len(p) > 1 for p in params)
+
+    def test_replace_diffs_against_current_context(self) -> None:
+        """force_state עם context מלא — נכתבים רק מפתחות שנמחקו או השתנו"""
+        from app.db.models.conversation_session import ConversationSession
+        from app.state_machine.manager import _StagedSession
+
+        context = _wizard_context(10)
+        staged = _StagedSession.load(ConversationSession(
+            id=1, user_id=1, platform="telegram", current_state="S", context_data=context,
+        ))
+        new_context = {k: v for k, v in context.items() if k != "field_0"}
+        new_context["field_1"] = "שונה"
+
+        staged.replace(new_context)
+
+        assert staged.removed == {"field_0"}
+        # רשימה מקוננת עלולה להשתנות במקום — נכתבת תמיד
+        assert set(staged.updates) == {"field_1", "stops"}
+        assert staged.context == new_context
+
+    @pytest.mark.asyncio
+    async def test_patch_context_sets_and_removes_keys(self, db_session: AsyncSession, user_factory) -> None:
+        from app.state_machine.manager import StateManager
+
+        user = await user_factory(phone_number="+972503330011", name="שולח", role=UserRole.SENDER)
+        # expire_all מבטל גם את user — גישה ל-user.id אחריו היא lazy load מחוץ ל-greenlet
+        user_id = user.id
+        state_manager = StateManager(db_session)
+        await state_manager.force_state(user_id, "telegram", "SENDER.MENU", {"a": 1, "b": 2})
+
+        await state_manager.patch_context(user_id, "telegram", {"c": 3}, remove=["a"])
+        await state_manager.clear_context(user_id, "telegram")
+        await state_manager.update_context(user_id, "telegram", "d", [1, 2])
+
+        db_session.expire_all()
+        assert await state_manager.get_context(user_id, "telegram") == {"d": [1, 2]}
+
+    @pytest.mark.asyncio
+    async def test_nested_context_values_isolated_from_in_place_changes(
+        self, db_session: AsyncSession, user_factory
+    ) -> None:
+        """שינוי במקום ברשימה / dict מקונן שהוחזר מ-get_context לא נכתב ולא דולף"""
+        from app.state_machine.manager import StateManager, conversation_unit_of_work
+
+        user = await user_factory(phone_number="+972503330012", name="שולח", role=UserRole.SENDER)
+        user_id = user.id
+        state_manager = StateManager(db_session)
+        await state_manager.force_state(
+            user_id, "telegram", "SENDER.MENU",
+            {"stops": [{"city": "חיפה"}], "meta": {"count": 1}},
+        )
+
+        async with conversation_unit_of_work(db_session):
+            context = await state_manager.get_context(user_id, "telegram")
+            context["stops"].append({"city": "אילת"})
+            context["stops"][0]["city"] = "עכו"
+            context["meta"]["count"] = 99
+            # שינוי של מפתח אחר — ה-patch לא כולל את הערכים המקוננים
+            await state_manager.update_context(user_id, "telegram", "step", 2)
+
+            assert await state_manager.get_context(user_id, "telegram") == {
+                "stops": [{"city": "חיפה"}], "meta": {"count": 1}, "step": 2,
+            }
+
+        db_session.expire_all()
+        assert await state_manager.get_context(user_id, "telegram") == {
+            "stops": [{"city": "חיפה"}], "meta": {"count": 1}, "step": 2,
+        }
+
+    def test_patch_turn_cheaper_than_full_rewrite(self) -> None:
+        """CPU לתור באשף ארוך: deepcopy + סריאליזציה של כל ה-context מול patch"""
+        import copy
+        import json
+        import time
+
+        from app.db.models.conversation_session import ConversationSession
+        from app.state_machine.manager import _StagedSession
+
+        turns = 500
+        conversation = ConversationSession(
+            id=1, user_id=1, platform="telegram", current_state="S",
+            context_data=_wizard_context(60),
+        )
+
+        started = time.process_time()
+        for turn in range(turns):
+            context = copy.deepcopy(conversation.context_data)
+            context["step"] = turn
+            conversation.context_data = context
+            json.dumps(context)
+        rewrite_cpu = time.process_time() - started
+
+        started = time.process_time()
+        for turn in range(turns):
+            staged = _StagedSession.load(conversation)
+            staged.patch({"step": turn})
+            json.dumps(staged.updates)
+        patch_cpu = time.process_time() - started
+
+        assert patch_cpu < rewrite_cpu / 2, (rewrite_cpu, patch_cpu)
@@ -5,6 +5,7 @@
 - PyWaProvider — שליחת טקסט, מדיה, retry, circuit breaker
 - format_text — המרת HTML ל-WhatsApp markdown
 - normalize_phone — נרמול לפורמט Cloud API (ללא +)
+- מגבלת קריאות במקביל ו-session משותף לכל loop
 - Provider Factory — מצב hybrid (Cloud API לפרטי, WPPConnect לקבוצות)
 """
 import asyncio
@@ -498,6 +499,97 @@ class TestPyWaNormalizePhone:
         assert provider.normalize_phone("972501234567") == "972501234567"
 
 
+# ============================================================================
+# מקביליות ו-client משותף
+# ============================================================================
+
+
+class TestPyWaConcurrency:
+    """מגבלת קריאות במקביל ל-Cloud API ו-session משותף לכל loop."""
+
+    def _make_provider(self) -> PyWaProvider:
+        provider = PyWaProvider(
+            circuit_breaker=CircuitBreaker("test_pywa", CircuitBreakerConfig(failure_threshold=50))
+        )
+        provider._circuit_breaker.execute = AsyncMock(side_effect=_passthrough_execute)
+        return provider
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_client_uses_shared_session_per_loop(self) -> None:
+        """ה-pywa client נבנה פעם אחת על ה-httpx client המשותף, ומחדש ב-loop אחר."""
+        from app.core.http_clients import get_whatsapp_cloud_client
+
+        provider = self._make_provider()
+        with patch("pywa_async.WhatsApp") as mock_client_class:
+            clients = await asyncio.gather(*(provider._get_client() for _ in range(3)))
+            assert len({id(c) for c in clients}) == 1
+            assert await provider._get_client() is clients[0]
+            assert mock_client_class.call_count == 1
+            assert mock_client_class.call_args[1]["session"] is get_whatsapp_cloud_client()
+
+            await asyncio.to_thread(asyncio.run, provider._get_client())
+            assert mock_client_class.call_count == 2
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_bulk_send_respects_concurrency_limit(self) -> None:
+        """send_text_bulk לא עובר את WHATSAPP_CLOUD_API_MAX_CONCURRENCY."""
+        provider = self._make_provider()
+        in_flight = 0
+        peak = 0
+
+        async def _send_message(**kwargs):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+
+        provider._client = MagicMock(send_message=AsyncMock(side_effect=_send_message))
+        messages = [(f"+9725012345{i:02d}", "שלום") for i in range(8)]
+        with patch.object(settings, "WHATSAPP_CLOUD_API_MAX_CONCURRENCY", 2), \
+             patch("app.domain.services.whatsapp.pywa_provider._call_slots", {}):
+            errors = await provider.send_text_bulk(messages)
+
+        assert errors == [None] * 8
+        assert peak == 2
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_backoff_releases_slot(self) -> None:
+        """בזמן ה-backoff של הודעה שנכשלה — הודעה אחרת כבר נשלחת."""
+        provider = self._make_provider()
+        other_sent = asyncio.Event()
+        failed_once = False
+
+        async def _send_message(to, **kwargs):
+            nonlocal failed_once
+            if to == "972501234500" and not failed_once:
+                failed_once = True
+                raise ConnectionError("timeout")
+            if to == "972501234501":
+                other_sent.set()
+
+        async def _backoff(_seconds):
+            # עם מגבלה של 1, אם ה-backoff מחזיק את המקום — ההודעה השנייה לא תישלח
+            await other_sent.wait()
+
+        provider._client = MagicMock(send_message=AsyncMock(side_effect=_send_message))
+        with patch.object(settings, "WHATSAPP_CLOUD_API_MAX_CONCURRENCY", 1), \
+             patch("app.domain.services.whatsapp.pywa_provider._call_slots", {}), \
+             patch("asyncio.sleep", side_effect=_backoff):
+            errors = await asyncio.wait_for(
+                provider.send_text_bulk(
+                    [("+972501234500", "א"), ("+972501234501", "ב")]
+                ),
+                timeout=1,
+            )
+
+        assert errors == [None, None]
+        assert provider._client.send_message.call_count == 3
+
+
 # ============================================================================
 # Provider Factory — מצב hybrid
 # ============================================================================
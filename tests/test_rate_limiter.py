@@ -0,0 +1,245 @@
+"""
+בדיקות ל-Outbound Rate Limiter — app/core/rate_limiter.py
+
+מכסה:
+- GCRA מקומי (fallback) — burst, המתנה, buckets מרובים אטומיים
+- penalty מ-retry_after והמתנה מקסימלית
+- מסלול Redis (סקריפט Lua) — מפתחות וארגומנטים
+- call_with_rate_limit — כיבוד 429 בלי לפתוח את ה-circuit breaker
+- חילוץ retry_after מתשובות Telegram / Retry-After
+"""
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from app.core.circuit_breaker import CircuitBreaker, CircuitBreakerConfig
+from app.core.config import settings
+from app.core.exceptions import OutboundRateLimitError, TelegramError
+from app.core.rate_limiter import (
+    OutboundRateLimiter,
+    RateLimit,
+    call_with_rate_limit,
+    get_retry_after,
+    parse_retry_after,
+    telegram_rate_limits,
+    whatsapp_rate_limits,
+)
+
+
+@pytest.fixture(autouse=True)
+def _enable_rate_limiter():
+    """conftest מכבה את ה-limiter לכל הבדיקות — כאן מפעילים"""
+    with patch.object(settings, "OUTBOUND_RATE_LIMIT_ENABLED", True):
+        yield
+
+
+@pytest.fixture
+def limiter() -> OutboundRateLimiter:
+    return OutboundRateLimiter()
+
+
+def _response(status_code: int, text: str = "", headers: dict | None = None) -> MagicMock:
+    response = MagicMock()
+    response.status_code = status_code
+    response.text = text
+    response.headers = headers or {}
+    return response
+
+
+class TestLocalGcra:
+    """fallback מקומי — FakeRedis של הבדיקות לא תומך ב-eval"""
+
+    @pytest.mark.unit
+    async def test_burst_then_deny(self, limiter: OutboundRateLimiter) -> None:
+        """burst הודעות עוברות מיד, הבאה ממתינה ~emission interval"""
+        limit = RateLimit("test:chat", rate=10, burst=3)
+
+        for _ in range(3):
+            assert await limiter._try_acquire_local([limit]) == 0
+        wait_ms = await limiter._try_acquire_local([limit])
+        assert 0 < wait_ms <= 100
+
+    @pytest.mark.unit
+    async def test_acquire_waits_for_rate(self, limiter: OutboundRateLimiter) -> None:
+        """acquire ממתין מקומית במקום להיכשל"""
+        limit = RateLimit("test:rate", rate=50)  # 20ms בין הודעות
+
+        start = time.perf_counter()
+        for _ in range(4):
+            await limiter.acquire([limit])
+        elapsed = time.perf_counter() - start
+
+        assert elapsed >= 0.05
+
+    @pytest.mark.unit
+    async def test_denied_request_does_not_consume_other_buckets(
+        self, limiter: OutboundRateLimiter
+    ) -> None:
+        """bucket צ'אט מלא — ה-bucket הגלובלי לא נצרך (בדיקה ועדכון אטומיים)"""
+        global_limit = RateLimit("test:global", rate=1, burst=2)
+        chat_limit = RateLimit("test:chat:1", rate=1, burst=1)
+
+        assert await limiter._try_acquire_local([global_limit, chat_limit]) == 0
+        assert await limiter._try_acquire_local([global_limit, chat_limit]) > 0
+        # צ'אט אחר עדיין מקבל את המכסה הגלובלית שנותרה
+        other_chat = RateLimit("test:chat:2", rate=1, burst=1)
+        assert await limiter._try_acquire_local([global_limit, other_chat]) == 0
+
+    @pytest.mark.unit
+    async def test_disabled_never_waits(self, limiter: OutboundRateLimiter) -> None:
+        limit = RateLimit("test:off", rate=0.001)
+        with patch.object(settings, "OUTBOUND_RATE_LIMIT_ENABLED", False):
+            for _ in range(5):
+                assert await limiter.acquire([limit]) == 0.0
+
+
+class TestPenalty:
+    """retry_after חוסם את ה-bucket"""
+
+    @pytest.mark.unit
+    async def test_penalize_delays_next_acquire(self, limiter: OutboundRateLimiter) -> None:
+        limit = RateLimit("test:penalty", rate=1000, burst=5)
+
+        await limiter.penalize([limit], 0.05)
+        waited = await limiter.acquire([limit])
+
+        assert waited >= 0.04
+
+    @pytest.mark.unit
+    async def test_wait_over_budget_raises(self, limiter: OutboundRateLimiter) -> None:
+        limit = RateLimit("telegram:chat:42", rate=1000)
+
+        await limiter.penalize([limit], 10)
+        with pytest.raises(OutboundRateLimitError) as exc_info:
+            await limiter.acquire([limit], max_wait=0.1)
+
+        assert exc_info.value.details["bucket"] == "telegram:chat:42"
+        assert exc_info.value.details["service"] == "telegram"
+
+
+class TestRedisBackend:
+    """מסלול Redis — סקריפט אטומי אחד לכל ה-buckets"""
+
+    @pytest.mark.unit
+    async def test_acquire_uses_redis_script(self, limiter: OutboundRateLimiter) -> None:
+        redis = MagicMock()
+        redis.eval = AsyncMock(side_effect=[25, 0])
+        limits = [
+            RateLimit("telegram:global", rate=25, burst=25),
+            RateLimit("telegram:chat:1", rate=1, burst=3),
+        ]
+
+        with patch("app.core.redis_client.get_redis", AsyncMock(return_value=redis)):
+            waited = await limiter.acquire(limits)
+
+        assert waited == pytest.approx(0.025)
+        assert redis.eval.await_count == 2
+        args = redis.eval.await_args.args
+        assert args[1] == 2
+        assert args[2:4] == ("ratelimit:telegram:global", "ratelimit:telegram:chat:1")
+        # emission/tolerance לכל bucket: 40ms/960ms, 1000ms/2000ms
+        assert [float(a) for a in args[4:]] == [40.0, 960.0, 1000.0, 2000.0]
+
+    @pytest.mark.unit
+    async def test_falls_back_to_local_when_redis_down(
+        self, limiter: OutboundRateLimiter
+    ) -> None:
+        limit = RateLimit("test:fallback", rate=1)
+
+        with patch(
+            "app.core.redis_client.get_redis",
+            AsyncMock(side_effect=ConnectionError("redis down")),
+        ):
+            assert await limiter._try_acquire([limit]) == 0
+            assert await limiter._try_acquire([limit]) > 0
+
+
+class TestCallWithRateLimit:
+    """429 עם retry_after — המתנה וניסיון חוזר במקום כשלון"""
+
+    @pytest.mark.unit
+    async def test_retries_after_429_without_tripping_breaker(self) -> None:
+        breaker = CircuitBreaker("test-429", CircuitBreakerConfig(failure_threshold=1))
+        error = TelegramError.from_response(
+            "sendMessage",
+            _response(429, '{"ok": false, "parameters": {"retry_after": 0.05}}'),
+        )
+        call = AsyncMock(side_effect=[error, {"ok": True}])
+        limits = telegram_rate_limits("4242")
+
+        async def _send():
+            return await call_with_rate_limit(limits, call)
+
+        with patch("app.core.rate_limiter._limiter", OutboundRateLimiter()):
+            start = time.perf_counter()
+            result = await breaker.execute(_send)
+            elapsed = time.perf_counter() - start
+
+        assert result == {"ok": True}
+        assert call.await_count == 2
+        assert elapsed >= 0.04
+        assert breaker.is_closed
+        assert breaker._state.failure_count == 0
+
+    @pytest.mark.unit
+    async def test_non_rate_limit_errors_propagate(self) -> None:
+        error = TelegramError.from_response("sendMessage", _response(400, "bad"))
+        call = AsyncMock(side_effect=error)
+
+        with patch("app.core.rate_limiter._limiter", OutboundRateLimiter()):
+            with pytest.raises(TelegramError):
+                await call_with_rate_limit(telegram_rate_limits("1"), call)
+
+        assert call.await_count == 1
+
+    @pytest.mark.unit
+    async def test_rate_limit_wait_not_counted_as_failure(self) -> None:
+        """המתנה מקומית שחורגת מהתקציב — ה-circuit breaker לא סופר כשלון"""
+        breaker = CircuitBreaker("test-budget", CircuitBreakerConfig(failure_threshold=1))
+
+        async def _wait_too_long():
+            raise OutboundRateLimitError("telegram", "telegram:chat:1", 60.0)
+
+        with pytest.raises(OutboundRateLimitError):
+            await breaker.execute(_wait_too_long)
+
+        assert breaker.is_closed
+
+
+class TestRetryAfterParsing:
+
+    @pytest.mark.unit
+    def test_telegram_body(self) -> None:
+        response = _response(429, '{"ok": false, "parameters": {"retry_after": 7}}')
+        assert parse_retry_after(response) == 7.0
+
+    @pytest.mark.unit
+    def test_retry_after_header(self) -> None:
+        response = _response(429, "Too Many Requests", {"Retry-After": "3"})
+        assert parse_retry_after(response) == 3.0
+
+    @pytest.mark.unit
+    def test_only_429_carries_retry_after(self) -> None:
+        error = TelegramError.from_response(
+            "sendMessage", _response(503, "", {"Retry-After": "3"})
+        )
+        assert "retry_after" not in error.details
+        assert get_retry_after(error) is None
+
+
+class TestBuckets:
+
+    @pytest.mark.unit
+    def test_telegram_private_and_group(self) -> None:
+        private = telegram_rate_limits(12345)
+        group = telegram_rate_limits("-100987")
+
+        assert [l.key for l in private] == ["telegram:global", "telegram:chat:12345"]
+        assert group[-1].key == "telegram:group:-100987"
+        assert group[-1].period == 60.0
+
+    @pytest.mark.unit
+    def test_whatsapp_group(self) -> None:
+        assert whatsapp_rate_limits("120363@g.us")[-1].key == "whatsapp:group:120363@g.us"
+        assert whatsapp_rate_limits("+972501234567")[-1].key == "whatsapp:chat:+972501234567"
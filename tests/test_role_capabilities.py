@@ -0,0 +1,289 @@
+"""
+בדיקות למטמון יכולות תפקיד (app/domain/services/role_capabilities.py)
+
+מכסה:
+- רשומה עדכנית ב-Redis — בלי שאילתות תחנה
+- ביטול אוטומטי אחרי add_dispatcher / remove_dispatcher / add_owner / remove_owner
+- השבתת תחנה מבטלת את כל הרשומות (generation)
+- Redis לא זמין — חישוב מה-DB
+- touch_session_throttled — עדכון סשן נהג לכל היותר פעם במרווח
+"""
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from app.db.models.user import UserRole
+from app.domain.services import role_capabilities
+from app.domain.services.driver_session_service import DriverSessionService
+from app.domain.services.role_capabilities import get_role_capabilities
+from app.domain.services.station_service import StationService
+
+
+async def _drain_invalidations() -> None:
+    """המתנה ל-tasks שמבטלים רשומות ב-Redis אחרי commit"""
+    await role_capabilities._invalidation.drain()
+
+
+def _count_execute(db_session):
+    """עוטף את db_session.execute ומחזיר רשימה שמתמלאת בכל קריאה"""
+    calls: list[object] = []
+    original = db_session.execute
+
+    async def _execute(statement, *args, **kwargs):
+        calls.append(statement)
+        return await original(statement, *args, **kwargs)
+
+    return calls, patch.object(db_session, "execute", side_effect=_execute)
+
+
+@pytest.fixture
+async def station_owner(user_factory):
+    return await user_factory(
+        phone_number="+972509100001",
+        name="בעל תחנה",
+        role=UserRole.STATION_OWNER,
+        platform="telegram",
+    )
+
+
+@pytest.fixture
+async def station(db_session, station_owner):
+    station = await StationService(db_session).create_station("תחנת מטמון", station_owner.id)
+    await db_session.commit()
+    await _drain_invalidations()
+    return station
+
+
+class TestRoleCapabilities:
+    """get_role_capabilities וביטול אחרי commit"""
+
+    @pytest.mark.asyncio
+    async def test_cached_record_skips_station_queries(
+        self, db_session, user_factory, station, station_owner
+    ) -> None:
+        dispatcher = await user_factory(phone_number="+972509100002", name="סדרן")
+        success, _ = await StationService(db_session).add_dispatcher(
+            station.id, "+972509100002", actor_user_id=station_owner.id
+        )
+        assert success
+        await _drain_invalidations()
+
+        first = await get_role_capabilities(db_session, dispatcher.id)
+        assert first.dispatcher_station_id == station.id
+        assert first.owned_station_ids == ()
+
+        calls, patcher = _count_execute(db_session)
+        with patcher:
+            second = await get_role_capabilities(db_session, dispatcher.id)
+
+        assert second == first
+        assert calls == []
+
+    @pytest.mark.asyncio
+    async def test_owner_record(self, db_session, station, station_owner) -> None:
+        capabilities = await get_role_capabilities(db_session, station_owner.id)
+        assert capabilities.owner_station_id == station.id
+        assert capabilities.dispatcher_station_id is None
+
+    @pytest.mark.asyncio
+    async def test_add_dispatcher_seen_before_redis_invalidation(
+        self, db_session, user_factory, station, station_owner
+    ) -> None:
+        """ה-commit בתהליך הזה לא ממתין למחיקה ב-Redis — רשומה ישנה לא נקראת"""
+        user = await user_factory(phone_number="+972509100003", name="סדרן חדש")
+        assert (await get_role_capabilities(db_session, user.id)).dispatcher_station_id is None
+
+        await StationService(db_session).add_dispatcher(
+            station.id, "+972509100003", actor_user_id=station_owner.id
+        )
+
+        capabilities = await get_role_capabilities(db_session, user.id)
+        assert capabilities.dispatcher_station_id == station.id
+
+    @pytest.mark.asyncio
+    async def test_remove_dispatcher_invalidates(
+        self, db_session, user_factory, station, station_owner, fake_redis
+    ) -> None:
+        service = StationService(db_session)
+        dispatcher = await user_factory(phone_number="+972509100004", name="סדרן")
+        await service.add_dispatcher(station.id, "+972509100004", actor_user_id=station_owner.id)
+        await _drain_invalidations()
+        assert (await get_role_capabilities(db_session, dispatcher.id)).dispatcher_station_id == station.id
+
+        success, _ = await service.remove_dispatcher(
+            station.id, dispatcher.id, actor_user_id=station_owner.id
+        )
+        assert success
+        await _drain_invalidations()
+
+        assert await fake_redis.get(f"user:capabilities:{dispatcher.id}") is None
+        assert (await get_role_capabilities(db_session, dispatcher.id)).dispatcher_station_id is None
+
+    @pytest.mark.asyncio
+    async def test_add_and_remove_owner_invalidate(
+        self, db_session, user_factory, station, station_owner
+    ) -> None:
+        service = StationService(db_session)
+        partner = await user_factory(phone_number="+972509100005", name="שותף")
+        assert (await get_role_capabilities(db_session, partner.id)).owned_station_ids == ()
+
+        success, _ = await service.add_owner(
+            station.id, "+972509100005", actor_user_id=station_owner.id
+        )
+        assert success
+        await _drain_invalidations()
+        assert (await get_role_capabilities(db_session, partner.id)).owned_station_ids == (station.id,)
+
+        success, _ = await service.remove_owner(
+            station.id, partner.id, actor_user_id=station_owner.id
+        )
+        assert success
+        await _drain_invalidations()
+        assert (await get_role_capabilities(db_session, partner.id)).owned_station_ids == ()
+
+    @pytest.mark.asyncio
+    async def test_station_deactivation_invalidates_all_records(
+        self, db_session, user_factory, station, station_owner, fake_redis
+    ) -> None:
+        dispatcher = await user_factory(phone_number="+972509100006", name="סדרן")
+        await StationService(db_session).add_dispatcher(
+            station.id, "+972509100006", actor_user_id=station_owner.id
+        )
+        await _drain_invalidations()
+        assert (await get_role_capabilities(db_session, dispatcher.id)).dispatcher_station_id == station.id
+        assert (await get_role_capabilities(db_session, station_owner.id)).owner_station_id == station.id
+
+        station.is_active = False
+        await db_session.commit()
+        await _drain_invalidations()
+
+        assert await fake_redis.get("user:capabilities:generation") == "1"
+        assert (await get_role_capabilities(db_session, dispatcher.id)).dispatcher_station_id is None
+        assert (await get_role_capabilities(db_session, station_owner.id)).owner_station_id is None
+
+    @pytest.mark.asyncio
+    async def test_redis_unavailable_computes_from_db(
+        self, db_session, station, station_owner, fake_redis
+    ) -> None:
+        with patch.object(fake_redis, "get", AsyncMock(side_effect=ConnectionError("down"))):
+            capabilities = await get_role_capabilities(db_session, station_owner.id)
+
+        assert capabilities.owner_station_id == station.id
+
+
+class TestResolveRoleState:
+    """_resolve_role_state קורא את תחנת הסדרן מהרשומה"""
+
+    @pytest.mark.asyncio
+    async def test_sender_dispatcher_routed_from_cached_record(
+        self, db_session, user_factory, station, station_owner
+    ) -> None:
+        from app.api.webhooks.telegram import _resolve_role_state
+        from app.state_machine.manager import StateManager
+        from app.state_machine.states import DispatcherState
+
+        sender = await user_factory(phone_number="+972509100007", name="שולח-סדרן")
+        await StationService(db_session).add_dispatcher(
+            station.id, "+972509100007", actor_user_id=station_owner.id
+        )
+        await _drain_invalidations()
+        await get_role_capabilities(db_session, sender.id)
+
+        with patch.object(
+            StationService, "get_dispatcher_station", AsyncMock()
+        ) as lookup:
+            target, station_id = await _resolve_role_state(
+                sender, db_session, StateManager(db_session)
+            )
+
+        assert target == DispatcherState.MENU.value
+        assert station_id == station.id
+        lookup.assert_not_awaited()
+
+
+class TestDriverSessionTouchThrottle:
+    """DriverSessionService.touch_session_throttled"""
+
+    @pytest.mark.asyncio
+    async def test_second_touch_within_interval_skipped(self, db_session, user_factory) -> None:
+        driver = await user_factory(phone_number="+972509100008", name="נהג", role=UserRole.DRIVER)
+        service = DriverSessionService(db_session)
+
+        with patch.object(service, "touch_session", wraps=service.touch_session) as touch:
+            await service.touch_session_throttled(driver.id)
+            await service.touch_session_throttled(driver.id)
+
+        assert touch.await_count == 1
+        assert await service.is_session_active(driver.id)
+
+    @pytest.mark.asyncio
+    async def test_disconnect_clears_throttle(self, db_session, user_factory) -> None:
+        driver = await user_factory(phone_number="+972509100009", name="נהג", role=UserRole.DRIVER)
+        service = DriverSessionService(db_session)
+        await service.touch_session_throttled(driver.id)
+
+        await service.disconnect_session(driver.id)
+        assert not await service.is_session_active(driver.id)
+
+        # ההודעה הבאה אחרי ניתוק מחדשת את הסשן מיד
+        await service.touch_session_throttled(driver.id)
+        assert await service.is_session_active(driver.id)
+
+    @pytest.mark.asyncio
+    async def test_zero_interval_touches_every_time(
+        self, db_session, user_factory, monkeypatch
+    ) -> None:
+        from app.core.config import settings
+
+        monkeypatch.setattr(settings, "DRIVER_SESSION_TOUCH_INTERVAL_SECONDS", 0)
+        driver = await user_factory(phone_number="+972509100010", name="נהג", role=UserRole.DRIVER)
+        service = DriverSessionService(db_session)
+
+        with patch.object(service, "touch_session", wraps=service.touch_session) as touch:
+            await service.touch_session_throttled(driver.id)
+            await service.touch_session_throttled(driver.id)
+
+        assert touch.await_count == 2
+
+    @pytest.mark.asyncio
+    async def test_throttle_moves_expiry_up_to_interval_earlier(
+        self, db_session, user_factory, monkeypatch
+    ) -> None:
+        """שינוי התנהגות: הודעה בתוך המרווח לא מזיזה את last_message_at, ולכן
+        ה-timeout של 24 שעות נמדד מה-touch הקודם — עד מרווח אחד לפני 24 שעות
+        מההודעה האחרונה בפועל. עם מרווח 0 — 24 שעות מההודעה האחרונה, כמו קודם."""
+        from datetime import datetime, timedelta
+
+        from app.core.config import settings
+        from app.domain.services import driver_session_service
+
+        start = datetime(2026, 10, 16, 12, 0, 0)
+
+        class _Clock(datetime):
+            current = start
+
+            @classmethod
+            def utcnow(cls):  # type: ignore[override]
+                return cls.current
+
+        monkeypatch.setattr(driver_session_service, "datetime", _Clock)
+        monkeypatch.setattr(settings, "DRIVER_SESSION_TOUCH_INTERVAL_SECONDS", 30)
+
+        async def _touch_twice(driver_id: int) -> None:
+            _Clock.current = start
+            await service.touch_session_throttled(driver_id)
+            _Clock.current = start + timedelta(seconds=20)
+            await service.touch_session_throttled(driver_id)
+
+        service = DriverSessionService(db_session)
+        throttled = await user_factory(phone_number="+972509100011", name="נהג", role=UserRole.DRIVER)
+        await _touch_twice(throttled.id)
+
+        monkeypatch.setattr(settings, "DRIVER_SESSION_TOUCH_INTERVAL_SECONDS", 0)
+        every_message = await user_factory(phone_number="+972509100012", name="נהג", role=UserRole.DRIVER)
+        await _touch_twice(every_message.id)
+
+        # 24 שעות אחרי ה-touch הראשון — 23:59:40 אחרי ההודעה האחרונה
+        _Clock.current = start + timedelta(hours=24)
+        expired = {session.user_id for session in await service.get_expired_sessions()}
+        assert expired == {throttled.id}
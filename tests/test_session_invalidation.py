@@ -0,0 +1,98 @@
+"""
+בדיקות ל-SessionInvalidation (app/domain/services/session_invalidation.py)
+
+מכסה:
+- commit — on_commit מיד, invalidate ברקע, המפתחות pending עד שהוא מסתיים
+- מפתחות מכמה flushes באותה טרנזקציה מצטברים לביטול אחד
+- rollback — המפתחות נזנחים
+"""
+import asyncio
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.db.models.user import User
+from app.domain.services.session_invalidation import SessionInvalidation
+
+
+def _collect_new_users(session: Session) -> set:
+    return {obj.phone_number for obj in session.new if isinstance(obj, User)}
+
+
+class _Recorder:
+    """SessionInvalidation עם invalidate שנחסם עד ש-release משוחרר"""
+
+    def __init__(self) -> None:
+        self.calls: list[frozenset] = []
+        self.local: list[frozenset] = []
+        self.release = asyncio.Event()
+        self.subject = SessionInvalidation(
+            "test_session_invalidation",
+            _collect_new_users,
+            self._invalidate,
+            on_commit=self.local.append,
+        )
+
+    async def _invalidate(self, keys: frozenset) -> None:
+        await self.release.wait()
+        self.calls.append(keys)
+
+
+@pytest.fixture
+def recorder():
+    recorder = _Recorder()
+    subject = recorder.subject
+    subject.register()
+    yield recorder
+    recorder.release.set()
+    event.remove(Session, "after_flush", subject._on_after_flush)
+    event.remove(Session, "after_commit", subject._on_after_commit)
+    event.remove(Session, "after_rollback", subject._on_after_rollback)
+
+
+def _user(user_id: int, phone_number: str) -> User:
+    return User(id=user_id, phone_number=phone_number, name="משתמש", platform="whatsapp")
+
+
+class TestSessionInvalidation:
+    @pytest.mark.asyncio
+    async def test_commit_invalidates_and_marks_pending(
+        self, db_session, user_factory, recorder
+    ) -> None:
+        await user_factory(phone_number="+972509200001")
+
+        assert recorder.local == [frozenset({"+972509200001"})]
+        assert recorder.subject.is_pending("+972509200001")
+        assert recorder.calls == []
+
+        recorder.release.set()
+        await recorder.subject.drain()
+
+        assert recorder.calls == [frozenset({"+972509200001"})]
+        assert not recorder.subject.is_pending("+972509200001")
+
+    @pytest.mark.asyncio
+    async def test_flushes_in_one_transaction_accumulate(
+        self, db_session, recorder
+    ) -> None:
+        recorder.release.set()
+        db_session.add(_user(920002, "+972509200002"))
+        await db_session.flush()
+        db_session.add(_user(920003, "+972509200003"))
+        await db_session.commit()
+        await recorder.subject.drain()
+
+        assert recorder.calls == [frozenset({"+972509200002", "+972509200003"})]
+
+    @pytest.mark.asyncio
+    async def test_rollback_discards_changes(self, db_session, recorder) -> None:
+        recorder.release.set()
+        db_session.add(_user(920004, "+972509200004"))
+        await db_session.flush()
+        await db_session.rollback()
+        await db_session.commit()
+        await recorder.subject.drain()
+
+        assert recorder.calls == []
+        assert recorder.local == []
@@ -0,0 +1,300 @@
+"""
+בדיקות לתור הנכנס של טלגרם (app/domain/services/telegram_inbound_queue.py)
+
+מכסה:
+- webhook במצב תור — הוספה ל-stream והחזרה מיידית, 503 כשה-backlog מלא
+- consumer — סדר לכל צ'אט, מקביליות בין צ'אטים, dead letter ו-replay
+- לקיחת entries שנשארו pending אחרי קריסת consumer
+- process_queued_telegram_update — אותו נתיב עיבוד כמו ה-webhook
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from unittest.mock import AsyncMock, patch
+
+import httpx
+import pytest
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.db.models.user import User
+from app.domain.services.telegram_inbound_queue import (
+    INBOUND_DEAD_STREAM_KEY,
+    INBOUND_GROUP,
+    TelegramInboundConsumer,
+    enqueue_update,
+    list_dead_letters,
+    read_inbound_stats,
+    replay_dead_letters,
+    shard_for,
+    stream_key,
+)
+
+_ADMIN_HEADERS = {"X-Admin-API-Key": "test-admin-key"}
+
+
+def _update(update_id: int, chat_id: int, text: str = "תפריט") -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "chat": {"id": chat_id, "type": "private"},
+            "text": text,
+            "date": 1700000000,
+            "from": {"id": chat_id, "first_name": "Inbound"},
+        },
+    }
+
+
+@pytest.fixture
+def inbound_queue():
+    """תור פעיל עם 2 shards ו-block קצר"""
+    with patch.object(settings, "TELEGRAM_INBOUND_QUEUE_ENABLED", True), \
+         patch.object(settings, "TELEGRAM_INBOUND_SHARDS", 2), \
+         patch.object(settings, "TELEGRAM_INBOUND_CONCURRENCY", 4), \
+         patch.object(settings, "TELEGRAM_INBOUND_MAX_BACKLOG", 100), \
+         patch.object(settings, "TELEGRAM_INBOUND_BLOCK_SECONDS", 0):
+        yield
+
+
+def _age_pending(fake_redis, key: str, seconds: float) -> None:
+    """הזזת זמן המסירה של כל ה-entries ה-pending אחורה (consumer שקרס מזמן)"""
+    for entry in fake_redis._groups[key][INBOUND_GROUP]["pending"].values():
+        entry[2] -= int(seconds * 1000)
+
+
+async def _poll_until_idle(consumer: TelegramInboundConsumer) -> None:
+    while await consumer.poll_once(block_seconds=0):
+        pass
+    await consumer.drain()
+
+
+class TestInboundWebhook:
+    """ה-webhook במצב תור"""
+
+    @pytest.mark.asyncio
+    async def test_webhook_enqueues_and_returns_immediately(
+        self, test_client: httpx.AsyncClient, db_session, fake_redis, inbound_queue
+    ) -> None:
+        resp = await test_client.post("/api/telegram/webhook", json=_update(1, 4242))
+
+        assert resp.status_code == 200
+        assert resp.json() == {"ok": True, "queued": True}
+        entries = await fake_redis.xrange(stream_key(shard_for("4242")))
+        assert len(entries) == 1
+        assert entries[0][1]["chat"] == "4242"
+        # העיבוד לא רץ בתוך ה-webhook
+        result = await db_session.execute(select(User).where(User.telegram_chat_id == "4242"))
+        assert result.scalar_one_or_none() is None
+
+    @pytest.mark.asyncio
+    async def test_webhook_returns_503_when_backlog_full(
+        self, test_client: httpx.AsyncClient, fake_redis, inbound_queue
+    ) -> None:
+        with patch.object(settings, "TELEGRAM_INBOUND_MAX_BACKLOG", 1):
+            first = await test_client.post("/api/telegram/webhook", json=_update(1, 4242))
+            second = await test_client.post("/api/telegram/webhook", json=_update(2, 4242))
+
+        assert first.status_code == 200
+        assert second.status_code == 503
+        stats = await read_inbound_stats()
+        assert stats.backlog == 1
+        assert stats.counters["rejected"] == 1
+
+    @pytest.mark.asyncio
+    async def test_webhook_processes_inline_when_redis_unavailable(
+        self, test_client: httpx.AsyncClient, db_session, fake_redis, inbound_queue
+    ) -> None:
+        with patch.object(fake_redis, "xlen", AsyncMock(side_effect=ConnectionError("redis down"))):
+            resp = await test_client.post("/api/telegram/webhook", json=_update(1, 4343))
+
+        assert resp.status_code == 200
+        assert "queued" not in resp.json()
+        result = await db_session.execute(select(User).where(User.telegram_chat_id == "4343"))
+        assert result.scalar_one_or_none() is not None
+
+
+class TestInboundConsumer:
+    """consumer — סדר, מקביליות, dead letter ו-takeover"""
+
+    @pytest.mark.asyncio
+    async def test_per_chat_order_with_parallel_chats(self, fake_redis, inbound_queue) -> None:
+        processed: list[tuple[str, int]] = []
+        in_flight = 0
+        peak = 0
+
+        async def _handler(payload: dict) -> None:
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            # ה-update הראשון בכל צ'אט הכי איטי — אם הסדר לא נשמר הוא ייעקף
+            await asyncio.sleep(0.03 if payload["update_id"] % 10 == 0 else 0.001)
+            processed.append((str(payload["message"]["chat"]["id"]), payload["update_id"]))
+            in_flight -= 1
+
+        for chat in ("101", "202", "303"):
+            for seq in range(3):
+                await enqueue_update(_update(int(chat) * 10 + seq, int(chat)), chat)
+
+        consumer = TelegramInboundConsumer(_handler, name="c1")
+        await _poll_until_idle(consumer)
+
+        for chat in ("101", "202", "303"):
+            ids = [update_id for c, update_id in processed if c == chat]
+            assert ids == sorted(ids) and len(ids) == 3
+        assert peak > 1
+        stats = await read_inbound_stats()
+        assert stats.backlog == 0
+        assert stats.counters["processed"] == 9
+        assert stats.latency_count == 9
+
+    @pytest.mark.asyncio
+    async def test_failed_update_goes_to_dead_letter_and_replays(
+        self, fake_redis, inbound_queue
+    ) -> None:
+        handler = AsyncMock(side_effect=[RuntimeError("boom"), None, None])
+        await enqueue_update(_update(1, 555), "555")
+        await enqueue_update(_update(2, 555), "555")
+
+        consumer = TelegramInboundConsumer(handler, name="c1")
+        await _poll_until_idle(consumer)
+
+        # כשלון לא עוצר את ה-update הבא באותו צ'אט
+        assert handler.await_count == 2
+        letters = await list_dead_letters()
+        assert [letter.update["update_id"] for letter in letters] == [1]
+        assert letters[0].error == "boom"
+
+        assert await replay_dead_letters() == [letters[0].entry_id]
+        assert await fake_redis.xlen(INBOUND_DEAD_STREAM_KEY) == 0
+        await _poll_until_idle(consumer)
+
+        assert handler.await_args_list[-1].args[0]["update_id"] == 1
+        stats = await read_inbound_stats()
+        assert stats.counters["dead"] == 1
+        assert stats.counters["replayed"] == 1
+        assert stats.backlog == 0
+
+    @pytest.mark.asyncio
+    async def test_takes_over_pending_entries_of_crashed_consumer(
+        self, fake_redis, inbound_queue
+    ) -> None:
+        processed: list[int] = []
+
+        async def _handler(payload: dict) -> None:
+            processed.append(payload["update_id"])
+
+        with patch.object(settings, "TELEGRAM_INBOUND_SHARDS", 1), \
+             patch.object(settings, "TELEGRAM_INBOUND_MAX_DELIVERIES", 2):
+            await enqueue_update(_update(1, 777), "777")
+            await enqueue_update(_update(2, 888), "888")
+            key = stream_key(0)
+            # consumer שקרס קרא את שני ה-updates ולא אישר; את השני כבר ניסו פעמיים
+            await fake_redis.xgroup_create(key, INBOUND_GROUP, id="0")
+            await fake_redis.xreadgroup(INBOUND_GROUP, "crashed", {key: ">"})
+            second_id = (await fake_redis.xrange(key))[1][0]
+            await fake_redis.xclaim(key, INBOUND_GROUP, "crashed", 0, [second_id])
+            await enqueue_update(_update(3, 777), "777")
+            _age_pending(fake_redis, key, settings.TELEGRAM_INBOUND_LEASE_SECONDS)
+
+            consumer = TelegramInboundConsumer(_handler, name="c2")
+            await _poll_until_idle(consumer)
+
+        assert processed == [1, 3]
+        assert [letter.update["update_id"] for letter in await list_dead_letters()] == [2]
+        assert (await fake_redis.xpending(key, INBOUND_GROUP))["pending"] == 0
+
+    @pytest.mark.asyncio
+    async def test_recently_delivered_entries_wait_for_lease_idle_time(
+        self, fake_redis, inbound_queue
+    ) -> None:
+        """entry שנמסר לאחרונה לא נלקח, וה-shard לא נקרא עד שהוא נלקח"""
+        processed: list[int] = []
+
+        async def _handler(payload: dict) -> None:
+            processed.append(payload["update_id"])
+
+        with patch.object(settings, "TELEGRAM_INBOUND_SHARDS", 1):
+            await enqueue_update(_update(1, 777), "777")
+            key = stream_key(0)
+            await fake_redis.xgroup_create(key, INBOUND_GROUP, id="0")
+            await fake_redis.xreadgroup(INBOUND_GROUP, "slow", {key: ">"})
+            await enqueue_update(_update(2, 777), "777")
+
+            consumer = TelegramInboundConsumer(_handler, name="c2")
+            await _poll_until_idle(consumer)
+            assert processed == []
+            assert consumer.owned_shards == {0}
+
+            _age_pending(fake_redis, key, settings.TELEGRAM_INBOUND_LEASE_SECONDS)
+            await _poll_until_idle(consumer)
+
+        assert processed == [1, 2]
+        assert (await fake_redis.xpending(key, INBOUND_GROUP))["pending"] == 0
+
+    def test_default_name_unique_per_start(self) -> None:
+        """restart עם אותו hostname:pid לא יורש את שם ה-consumer הקודם"""
+        first = TelegramInboundConsumer(AsyncMock())
+        second = TelegramInboundConsumer(AsyncMock())
+
+        assert first.name != second.name
+        assert first.name.rsplit(":", 1)[0] == second.name.rsplit(":", 1)[0]
+
+    @pytest.mark.asyncio
+    async def test_shard_owned_by_single_consumer(self, fake_redis, inbound_queue) -> None:
+        first = TelegramInboundConsumer(AsyncMock(), name="c1")
+        second = TelegramInboundConsumer(AsyncMock(), name="c2")
+
+        await first.poll_once(block_seconds=0)
+        await second.poll_once(block_seconds=0)
+
+        assert first.owned_shards == {0, 1}
+        assert second.owned_shards == set()
+
+
+class TestProcessQueuedUpdate:
+    """עיבוד update מהתור באותו נתיב כמו ה-webhook"""
+
+    @pytest.mark.asyncio
+    async def test_processes_update_and_sends_reply(self, db_session) -> None:
+        from app.api.webhooks.telegram import process_queued_telegram_update
+
+        @asynccontextmanager
+        async def _task_session():
+            yield db_session
+
+        with patch("app.api.webhooks.telegram.get_task_session", _task_session), \
+             patch("app.api.webhooks.telegram.send_telegram_message", new_callable=AsyncMock) as send:
+            await process_queued_telegram_update(_update(1, 9191))
+
+        result = await db_session.execute(select(User).where(User.telegram_chat_id == "9191"))
+        assert result.scalar_one_or_none() is not None
+        assert send.await_count >= 1
+        assert send.await_args_list[0].args[0] == "9191"
+
+
+class TestInboundMetricsRoute:
+    """GET /api/admin/debug/telegram/inbound/metrics"""
+
+    @pytest.mark.asyncio
+    async def test_metrics_report_backlog_and_alert(
+        self, test_client: httpx.AsyncClient, fake_redis, inbound_queue
+    ) -> None:
+        await enqueue_update(_update(1, 4242), "4242")
+
+        with patch.object(settings, "ADMIN_API_KEY", "test-admin-key"), \
+             patch.object(settings, "TELEGRAM_INBOUND_BACKLOG_ALERT_SECONDS", -1):
+            resp = await test_client.get(
+                "/api/admin/debug/telegram/inbound/metrics", headers=_ADMIN_HEADERS
+            )
+            prometheus = await test_client.get(
+                "/api/admin/debug/telegram/inbound/metrics/prometheus", headers=_ADMIN_HEADERS
+            )
+
+        assert resp.status_code == 200
+        data = resp.json()
+        assert data["enabled"] is True
+        assert data["backlog"] == 1
+        assert data["backlog_alert"] is True
+        assert data["counters"]["enqueued"] == 1
+        shard = shard_for("4242")
+        assert f'telegram_inbound_backlog{{shard="{shard}"}} 1' in prometheus.text
@@ -5,13 +5,15 @@ from app.api.webhooks.telegram import (
     TelegramUpdate,
     _queue_response_send,
     _SENDER_BUTTON_ROUTES,
-    _get_station_for_owner_or_downgrade,
+    _get_owner_station_id_or_downgrade,
     _handle_sender_join_as_courier,
     _handle_sender_join_as_driver,
     _is_in_multi_step_flow,
     _parse_inbound_event,
-    _store_inline_button_mapping,
+    _store_inline_button_mappings,
     _resolve_inline_button_mapping,
+    _inline_button_callback_data,
+    _INLINE_BUTTON_TTL_SECONDS,
     _compact_callback_data_fallback,
     _INLINE_BUTTON_UNAVAILABLE_CALLBACK,
     send_telegram_message,
@@ -168,35 +170,92 @@ class TestTelegramWebhookHelpers:
         assert out is None
 
     @pytest.mark.asyncio
-    async def test_inline_button_mapping_store_and_resolve(self, monkeypatch):
-        class _FakeRedis:
-            def __init__(self):
-                self._store = {}
+    async def test_inline_button_mapping_store_and_resolve(self, fake_redis):
+        chat_id = "123"
+        cb = "btn:unit"
+        text = "כפתור ארוך מאוד מאוד מאוד כדי לבדוק מיפוי"
+        mapped = await _store_inline_button_mappings(chat_id, {cb: text})
+        assert mapped == {cb}
 
-            async def set(self, key, value, ex=None, nx=False):
-                if nx and key in self._store:
-                    return False
-                self._store[key] = value
-                return True
+        resolved = await _resolve_inline_button_mapping(chat_id, cb)
+        assert resolved == text
 
-            async def get(self, key):
-                return self._store.get(key)
+    @pytest.mark.asyncio
+    async def test_inline_button_mappings_stored_in_one_pipeline(self, fake_redis):
+        """כל המיפויים של מקלדת נשמרים יחד; תפריט זהה ממוחזר בלי כתיבות"""
+        chat_id = "123"
+        labels = [f"כפתור ארוך מאוד מאוד מאוד מספר {i} כדי לעבור 64 בתים" for i in range(6)]
+        buttons = {_inline_button_callback_data(chat_id, t): t for t in labels}
+        assert all(len(cb.encode("utf-8")) <= 64 for cb in buttons)
+        # דטרמיניסטי — אותו צ'אט וטקסט, אותו token; צ'אט אחר, token אחר
+        assert _inline_button_callback_data(chat_id, labels[0]) in buttons
+        assert _inline_button_callback_data("456", labels[0]) not in buttons
 
-        fake = _FakeRedis()
+        pipelines = []
+        real_pipeline = fake_redis.pipeline
 
-        async def _fake_get_redis():
-            return fake
+        def _counting_pipeline(transaction=True):
+            pipe = real_pipeline(transaction)
+            real_execute = pipe.execute
 
-        monkeypatch.setattr("app.core.redis_client.get_redis", _fake_get_redis)
+            async def _execute():
+                pipelines.append([name for name, *_ in pipe._commands])
+                return await real_execute()
+
+            pipe.execute = _execute
+            return pipe
+
+        fake_redis.pipeline = _counting_pipeline
+
+        assert await _store_inline_button_mappings(chat_id, buttons) == set(buttons)
+        # קריאה + כתיבה — שני round trips לכל המקלדת, לא אחד לכל כפתור
+        assert len(pipelines) == 2
+        assert pipelines[1] == ["set"] * len(buttons)
+        for cb, text in buttons.items():
+            assert await _resolve_inline_button_mapping(chat_id, cb) == text
+
+        pipelines.clear()
+        assert await _store_inline_button_mappings(chat_id, buttons) == set(buttons)
+        assert pipelines == [["get", "ttl"] * len(buttons)]
+
+    @pytest.mark.asyncio
+    async def test_long_keyboard_buttons_get_deterministic_callbacks(
+        self, fake_redis, mock_telegram_api, monkeypatch
+    ):
+        """כפתור ארוך נשלח עם token דטרמיניסטי שנפתר בחזרה לטקסט המלא"""
+        from app.core.config import settings
+
+        monkeypatch.setattr(settings, "TELEGRAM_BOT_TOKEN", "unit-token", raising=False)
+        # ה-reply keyboard כבר נוקה — רק sendMessage אחד
+        await fake_redis.set("shipmentbot:tg:reply_kb_cleared:123", "1")
+
+        long_label = "כפתור עם תווית ארוכה מאוד מאוד שעוברת את מגבלת 64 הבתים"
+        await send_telegram_message(chat_id="123", text="תפריט", keyboard=[[long_label, "חזרה"]])
+
+        payload = mock_telegram_api.post.call_args.kwargs["json"]
+        row = payload["reply_markup"]["inline_keyboard"][0]
+        assert row[0]["callback_data"] == _inline_button_callback_data("123", long_label)
+        assert row[1]["callback_data"] == "חזרה"
+        assert await _resolve_inline_button_mapping("123", row[0]["callback_data"]) == long_label
+
+    @pytest.mark.asyncio
+    async def test_inline_button_mappings_refresh_ttl_and_skip_collisions(self, fake_redis):
+        """מיפוי שעבר חצי מחייו מרוענן; מפתח עם טקסט אחר לא נדרס"""
+        from app.api.webhooks.telegram import _inline_button_key
 
         chat_id = "123"
-        cb = "btn:unit"
-        text = "כפתור ארוך מאוד מאוד מאוד כדי לבדוק מיפוי"
-        ok = await _store_inline_button_mapping(chat_id, cb, text)
-        assert ok is True
+        stale_cb = _inline_button_callback_data(chat_id, "ישן")
+        clash_cb = _inline_button_callback_data(chat_id, "חדש")
+        await fake_redis.set(_inline_button_key(chat_id, stale_cb), "ישן", ex=60)
+        await fake_redis.set(_inline_button_key(chat_id, clash_cb), "אחר", ex=60)
 
-        resolved = await _resolve_inline_button_mapping(chat_id, cb)
-        assert resolved == text
+        mapped = await _store_inline_button_mappings(
+            chat_id, {stale_cb: "ישן", clash_cb: "חדש"}
+        )
+
+        assert mapped == {stale_cb}
+        assert await fake_redis.ttl(_inline_button_key(chat_id, stale_cb)) == _INLINE_BUTTON_TTL_SECONDS
+        assert await fake_redis.get(_inline_button_key(chat_id, clash_cb)) == "אחר"
 
     @pytest.mark.asyncio
     async def test_webhook_btn_callback_missing_mapping_sends_expired_message_and_returns(
@@ -334,6 +393,11 @@ class TestTelegramWebhookHelpers:
                 return self._json_data
 
         class _FakeAsyncClient:
+            is_closed = False
+
+            def __init__(self, **kwargs):
+                pass
+
             async def __aenter__(self):
                 return self
 
@@ -376,7 +440,7 @@ class TestTelegramWebhookHelpers:
         assert calls[0][0].endswith("/sendMessage")
 
     @pytest.mark.asyncio
-    async def test_get_station_for_owner_or_downgrade_downgrades_when_missing(
+    async def test_get_owner_station_id_or_downgrade_downgrades_when_missing(
         self, db_session, user_factory
     ):
         owner = await user_factory(
@@ -386,13 +450,13 @@ class TestTelegramWebhookHelpers:
             platform="telegram",
             telegram_chat_id="99001",
         )
-        station = await _get_station_for_owner_or_downgrade(owner, db_session)
-        assert station is None
+        station_id = await _get_owner_station_id_or_downgrade(owner, db_session)
+        assert station_id is None
         await db_session.refresh(owner)
         assert owner.role == UserRole.SENDER
 
     @pytest.mark.asyncio
-    async def test_get_station_for_owner_or_downgrade_returns_station_when_exists(
+    async def test_get_owner_station_id_or_downgrade_returns_station_when_exists(
         self, db_session, user_factory
     ):
         owner = await user_factory(
@@ -406,9 +470,8 @@ class TestTelegramWebhookHelpers:
         db_session.add(station_obj)
         await db_session.commit()
 
-        station = await _get_station_for_owner_or_downgrade(owner, db_session)
-        assert station is not None
-        assert station.owner_id == owner.id
+        station_id = await _get_owner_station_id_or_downgrade(owner, db_session)
+        assert station_id == station_obj.id
         await db_session.refresh(owner)
         assert owner.role == UserRole.STATION_OWNER
 
@@ -0,0 +1,181 @@
+"""
+בדיקות למטמון זיהוי משתמשים (app/domain/services/user_identity_cache.py)
+
+מכסה:
+- משתמש מוכר ב-Telegram / WhatsApp נטען בלי שאילתות חיפוש
+- ביטול אוטומטי אחרי commit ששינה תפקיד / חסימה
+- מיפוי שלא מתאים יותר למזהה נזרק וחוזרים לחיפוש המלא
+- Redis לא זמין — חיפוש רגיל מול ה-DB
+"""
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from sqlalchemy import update
+
+from app.db.models.user import ApprovalStatus, User, UserRole
+from app.domain.services import user_identity_cache
+from app.domain.services.user_identity_cache import get_user_snapshot, reset_identity_cache
+
+
+async def _drain_invalidations() -> None:
+    """המתנה ל-tasks שמוחקים snapshots ב-Redis אחרי commit"""
+    await user_identity_cache._invalidation.drain()
+
+
+def _count_execute(db_session):
+    """עוטף את db_session.execute ומחזיר רשימה שמתמלאת בכל קריאה"""
+    calls: list[object] = []
+    original = db_session.execute
+
+    async def _execute(statement, *args, **kwargs):
+        calls.append(statement)
+        return await original(statement, *args, **kwargs)
+
+    return calls, patch.object(db_session, "execute", side_effect=_execute)
+
+
+class TestTelegramIdentityCache:
+    """get_or_create_user של Telegram"""
+
+    @pytest.mark.asyncio
+    async def test_known_user_resolved_without_lookup_query(self, db_session, fake_redis) -> None:
+        from app.api.webhooks.telegram import get_or_create_user
+
+        first, is_new = await get_or_create_user(db_session, "cache_chat_1", username="a")
+        assert is_new is True
+
+        snapshot = await get_user_snapshot("telegram", "cache_chat_1")
+        assert snapshot.user_id == first.id
+        assert snapshot.role == UserRole.SENDER.value
+
+        calls, patcher = _count_execute(db_session)
+        with patcher:
+            second, is_new = await get_or_create_user(db_session, "cache_chat_1", username="a")
+
+        assert is_new is False
+        assert second.id == first.id
+        assert calls == []
+
+    @pytest.mark.asyncio
+    async def test_snapshot_shared_through_redis(self, db_session, fake_redis) -> None:
+        from app.api.webhooks.telegram import get_or_create_user
+
+        user, _ = await get_or_create_user(db_session, "cache_chat_2")
+        # תהליך אחר — השכבה המקומית ריקה
+        reset_identity_cache()
+
+        snapshot = await get_user_snapshot("telegram", "cache_chat_2")
+        assert snapshot is not None
+        assert snapshot.user_id == user.id
+
+    @pytest.mark.asyncio
+    async def test_role_change_commit_invalidates(self, db_session, fake_redis) -> None:
+        from app.api.webhooks.telegram import get_or_create_user
+
+        user, _ = await get_or_create_user(db_session, "cache_chat_3")
+        assert await get_user_snapshot("telegram", "cache_chat_3") is not None
+
+        user.role = UserRole.COURIER
+        user.approval_status = ApprovalStatus.PENDING
+        await db_session.commit()
+        # מחיקת ה-snapshot ב-Redis רצה כ-task אחרי ה-commit
+        await _drain_invalidations()
+
+        assert await fake_redis.get(f"user:snapshot:{user.id}") is None
+        assert await get_user_snapshot("telegram", "cache_chat_3") is None
+
+        # החיפוש המלא משחזר את המטמון עם התפקיד החדש
+        again, _ = await get_or_create_user(db_session, "cache_chat_3")
+        assert again.id == user.id
+        snapshot = await get_user_snapshot("telegram", "cache_chat_3")
+        assert snapshot.role == UserRole.COURIER.value
+        assert snapshot.approval_status == ApprovalStatus.PENDING.value
+
+    @pytest.mark.asyncio
+    async def test_mismatched_user_falls_back_to_lookup(self, db_session) -> None:
+        """המיפוי מצביע למשתמש שכבר לא מחזיק את ה-chat — חיפוש מלא"""
+        from app.api.webhooks.telegram import get_or_create_user
+
+        user, _ = await get_or_create_user(db_session, "cache_chat_4")
+        # UPDATE ישיר עוקף את ה-listener — ה-snapshot נשאר
+        await db_session.execute(
+            update(User)
+            .where(User.id == user.id)
+            .values(telegram_chat_id="moved_chat", phone_number="tg:moved_chat")
+        )
+        await db_session.commit()
+        assert await get_user_snapshot("telegram", "cache_chat_4") is not None
+
+        other, is_new = await get_or_create_user(db_session, "cache_chat_4")
+
+        assert is_new is True
+        assert other.id != user.id
+
+    @pytest.mark.asyncio
+    async def test_redis_unavailable_uses_db_lookup(self, db_session, fake_redis) -> None:
+        from app.api.webhooks.telegram import get_or_create_user
+
+        user, _ = await get_or_create_user(db_session, "cache_chat_5")
+        reset_identity_cache()
+
+        with patch.object(fake_redis, "get", AsyncMock(side_effect=ConnectionError("down"))):
+            calls, patcher = _count_execute(db_session)
+            with patcher:
+                again, is_new = await get_or_create_user(db_session, "cache_chat_5")
+
+        assert is_new is False
+        assert again.id == user.id
+        assert len(calls) == 1
+
+
+class TestWhatsAppIdentityCache:
+    """get_or_create_user של WhatsApp"""
+
+    @pytest.mark.asyncio
+    async def test_known_sender_resolved_without_lookup_query(self, db_session) -> None:
+        from app.api.webhooks.whatsapp import get_or_create_user
+
+        first, is_new, _ = await get_or_create_user(
+            db_session, "123456@lid", from_number="123456@lid", reply_to="123456@lid"
+        )
+        assert is_new is True
+
+        calls, patcher = _count_execute(db_session)
+        with patcher:
+            second, is_new, _ = await get_or_create_user(
+                db_session, "123456@lid", from_number="123456@lid", reply_to="123456@lid"
+            )
+
+        assert is_new is False
+        assert second.id == first.id
+        assert calls == []
+
+    @pytest.mark.asyncio
+    async def test_blocked_user_invalidated(self, db_session) -> None:
+        from app.api.webhooks.whatsapp import get_or_create_user
+
+        user, _, _ = await get_or_create_user(db_session, "+972501112233")
+        assert await get_user_snapshot("whatsapp", "+972501112233|") is not None
+
+        user.approval_status = ApprovalStatus.BLOCKED
+        await db_session.commit()
+        await _drain_invalidations()
+
+        assert await get_user_snapshot("whatsapp", "+972501112233|") is None
+
+    @pytest.mark.asyncio
+    async def test_placeholder_needing_heal_skips_cache(self, db_session) -> None:
+        """placeholder wa:... עם מספר אמיתי בהודעה — הנתיב המלא מרפא את הטלפון"""
+        from app.api.webhooks.whatsapp import get_or_create_user
+
+        long_lid = "1234567890123456789012345@lid"
+        user, _, _ = await get_or_create_user(db_session, long_lid)
+        assert user.phone_number.startswith("wa:")
+
+        healed, is_new, norm_phone = await get_or_create_user(
+            db_session, long_lid, resolved_phone="0501234567"
+        )
+
+        assert is_new is False
+        assert healed.id == user.id
+        assert healed.phone_number == norm_phone
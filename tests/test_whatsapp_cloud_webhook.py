@@ -13,7 +13,9 @@
 - תפיסת משלוח מקישור wa.me דרך CaptureService
 - אישור/דחיית משלוחים (סדרנים) ב-Cloud webhook
 - כרטיס נהג למנהלים בסיום רישום שליח (PENDING_APPROVAL)
+- batch מכמה שולחים — עיבוד מקבילי לפי שולח
 """
+import base64
 import hashlib
 import hmac
 
@@ -1179,18 +1181,28 @@ class TestCloudApiMediaDownload:
         mock_meta_response.status_code = 200
         mock_meta_response.json.return_value = {"url": "https://lookaside.fbsbx.com/media_download"}
 
+        async def _aiter_bytes():
+            yield fake_content[:50]
+            yield fake_content[50:]
+
         mock_download_response = MagicMock()
         mock_download_response.status_code = 200
-        mock_download_response.content = fake_content
+        mock_download_response.aiter_bytes = _aiter_bytes
         mock_download_response.headers = {"content-type": "image/png"}
 
+        # ההורדה עצמה ב-stream — client.stream() מחזיר async context manager
+        mock_stream = MagicMock()
+        mock_stream.__aenter__ = AsyncMock(return_value=mock_download_response)
+        mock_stream.__aexit__ = AsyncMock(return_value=None)
+
         mock_client = AsyncMock()
-        mock_client.get = AsyncMock(side_effect=[mock_meta_response, mock_download_response])
+        mock_client.get = AsyncMock(return_value=mock_meta_response)
+        mock_client.stream = MagicMock(return_value=mock_stream)
         mock_client.__aenter__ = AsyncMock(return_value=mock_client)
         mock_client.__aexit__ = AsyncMock(return_value=None)
 
-        async def _run_fn(fn):
-            return await fn()
+        async def _run_fn(fn, *args):
+            return await fn(*args)
 
         with patch("app.domain.services.admin_notification_service.httpx.AsyncClient", return_value=mock_client), \
              patch("app.domain.services.admin_notification_service.settings") as mock_settings, \
@@ -1203,6 +1215,7 @@ class TestCloudApiMediaDownload:
 
         assert result is not None
         assert result.startswith("data:image/png;base64,")
+        assert base64.b64decode(result.split(",", 1)[1]) == fake_content
 
     @pytest.mark.unit
     @pytest.mark.asyncio
@@ -1869,3 +1882,83 @@ class TestDispatcherBackButton:
 
         assert new_state == "DISPATCHER.ADD_SHIPMENT.PICKUP_CITY"
         handler_instance.handle_message.assert_called_once()
+
+
+# ============================================================================
+# TestPerSenderBatch — batch מכמה שולחים ב-entry[] → changes[] → messages[]
+# ============================================================================
+
+
+class TestPerSenderBatch:
+    """הודעות של שולחים שונים רצות במקביל, סדר נשמר לכל שולח."""
+
+    @pytest.mark.asyncio
+    async def test_messages_grouped_by_sender(self, test_client, async_engine, monkeypatch) -> None:
+        import asyncio
+        import json
+        from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+        monkeypatch.setattr(settings, "WHATSAPP_CLOUD_API_APP_SECRET", "my_secret")
+        monkeypatch.setattr(settings, "WHATSAPP_WEBHOOK_CONCURRENT_SENDERS", True)
+
+        def _msg(phone: str, seq: int) -> dict:
+            return {
+                "id": f"wamid.{phone}.{seq}",
+                "from": phone,
+                "type": "text",
+                "text": {"body": "שלום"},
+            }
+
+        # שני changes — הודעות של אותו שולח מפוזרות ביניהם
+        payload = {
+            "entry": [{
+                "changes": [
+                    {"value": {
+                        "messaging_product": "whatsapp",
+                        "messages": [_msg("972501", 0), _msg("972502", 0)],
+                    }},
+                    {"value": {
+                        "messaging_product": "whatsapp",
+                        "messages": [_msg("972501", 1), _msg("972502", 1)],
+                    }},
+                ],
+            }],
+        }
+        body = json.dumps(payload).encode()
+        signature = "sha256=" + hmac.new(b"my_secret", body, hashlib.sha256).hexdigest()
+
+        processed: list[str] = []
+        in_flight = 0
+        peak = 0
+
+        async def _fake_process(db, msg, value, background_tasks):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.02 if msg["id"].endswith(".0") else 0.001)
+            processed.append(msg["id"])
+            in_flight -= 1
+            return {"from": msg["from"], "response": msg["id"]}
+
+        test_session_maker = async_sessionmaker(
+            bind=async_engine, class_=AsyncSession, expire_on_commit=False
+        )
+        with patch("app.api.webhooks.whatsapp_cloud._process_cloud_message", _fake_process), \
+             patch("app.api.webhooks.whatsapp.AsyncSessionLocal", test_session_maker):
+            response = await test_client.post(
+                "/api/whatsapp-cloud/webhook",
+                content=body,
+                headers={
+                    "X-Hub-Signature-256": signature,
+                    "Content-Type": "application/json",
+                },
+            )
+
+        assert response.status_code == 200
+        assert [r["response"] for r in response.json()["responses"]] == [
+            "wamid.972501.0", "wamid.972501.1", "wamid.972502.0", "wamid.972502.1",
+        ]
+        for phone in ("972501", "972502"):
+            ids = [m for m in processed if m.startswith(f"wamid.{phone}.")]
+            assert ids == [f"wamid.{phone}.0", f"wamid.{phone}.1"]
+        assert peak == 2
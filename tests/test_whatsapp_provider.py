@@ -206,6 +206,68 @@ class TestWPPConnectSendText:
             assert cb.is_open
 
 
+# ============================================================================
+# WPPConnectProvider — client משותף ו-send_text_bulk
+# ============================================================================
+
+
+class TestWPPConnectPooledClient:
+    """client אחד עם keep-alive לכל השליחות, ושליחה מרובה עם מקביליות חסומה."""
+
+    def _make_provider(self) -> WPPConnectProvider:
+        cb = CircuitBreaker("test_wa_pool", CircuitBreakerConfig(failure_threshold=50))
+        return WPPConnectProvider(circuit_breaker=cb)
+
+    @pytest.mark.asyncio
+    async def test_client_shared_by_text_and_media(self) -> None:
+        """send_text ו-send_media משתמשים באותו client — לא נוצר client לכל בקשה."""
+        provider = self._make_provider()
+
+        mock_response = MagicMock(spec=Response)
+        mock_response.status_code = 200
+
+        with patch("httpx.AsyncClient") as mock_client:
+            mock_instance = AsyncMock()
+            mock_instance.is_closed = False
+            mock_instance.post = AsyncMock(return_value=mock_response)
+            mock_client.return_value = mock_instance
+
+            await provider.send_text(to="+972501234567", text="אחת")
+            await provider.send_text(to="+972501234567", text="שתיים")
+            await provider.send_media(to="+972501234567", media_url="https://x/y.jpg")
+
+            assert mock_client.call_count == 1
+            assert mock_instance.post.await_count == 3
+            mock_instance.aclose.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_send_text_bulk_bounds_concurrency(self) -> None:
+        """לא יותר מ-concurrency בקשות בטיסה; כשלון של נמען לא עוצר את השאר."""
+        import asyncio
+
+        provider = self._make_provider()
+        in_flight = 0
+        peak = 0
+
+        async def _send_text(to, text, **kwargs):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            if to == "+972500000004":
+                raise WhatsAppError(message="gateway /send returned status 400")
+
+        messages = [(f"+97250000000{i}", f"הודעה {i}") for i in range(10)]
+        with patch.object(provider, "send_text", side_effect=_send_text):
+            errors = await provider.send_text_bulk(messages, concurrency=3)
+
+        assert peak == 3
+        assert len(errors) == 10
+        assert isinstance(errors[4], WhatsAppError)
+        assert all(e is None for i, e in enumerate(errors) if i != 4)
+
+
 # ============================================================================
 # WPPConnectProvider — שליחת מדיה
 # ============================================================================
@@ -629,10 +629,13 @@ async def test_whatsapp_duplicate_message_skipped(
 @pytest.mark.asyncio
 async def test_dedup_db_idempotency(
     db_session,
+    monkeypatch,
 ):
     """בדיקת יחידה ל-_try_acquire_message ו-_mark_message_completed (DB idempotency)"""
     from app.api.webhooks.whatsapp import _try_acquire_message, _mark_message_completed
 
+    monkeypatch.setattr(settings, "WEBHOOK_IDEMPOTENCY_BACKEND", "db")
+
     # הודעה ראשונה — אפשר לעבד (commit פנימי ב-_try_acquire_message)
     assert await _try_acquire_message(db_session, "msg-1", "whatsapp") is True
 
@@ -652,8 +655,11 @@ async def test_dedup_db_idempotency(
 @pytest.mark.asyncio
 async def test_dedup_stale_message_allows_retry(
     db_session,
+    monkeypatch,
 ):
     """הודעה תקועה ב-processing מעבר ל-threshold מאפשרת retry"""
+    # stale נקבע לפי created_at בטבלה — ב-Redis זה ה-TTL של המפתח
+    monkeypatch.setattr(settings, "WEBHOOK_IDEMPOTENCY_BACKEND", "db")
     from datetime import datetime, timedelta, timezone
     from app.api.webhooks.whatsapp import (
         _try_acquire_message,
@@ -684,6 +690,238 @@ async def test_dedup_stale_message_allows_retry(
     assert await _try_acquire_message(db_session, "msg-stale-1", "whatsapp") is True
 
 
+@pytest.mark.asyncio
+async def test_dedup_redis_idempotency(
+    db_session,
+    fake_redis,
+):
+    """רכישה וסימון ב-Redis — בלי כתיבה סינכרונית ל-webhook_events"""
+    from app.api.webhooks.whatsapp import (
+        _try_acquire_message,
+        _mark_message_completed,
+        _STALE_PROCESSING_SECONDS,
+    )
+    from app.db.models.webhook_event import WebhookEvent
+    from sqlalchemy import select
+
+    assert await _try_acquire_message(db_session, "msg-r1", "whatsapp") is True
+    assert await _try_acquire_message(db_session, "msg-r1", "whatsapp") is False
+    assert fake_redis._ttls["webhook:idem:msg-r1"] == _STALE_PROCESSING_SECONDS
+
+    await _mark_message_completed(db_session, "msg-r1")
+    assert await _try_acquire_message(db_session, "msg-r1", "whatsapp") is False
+    assert await fake_redis.get("webhook:idem:msg-r1") == "completed"
+    assert (
+        fake_redis._ttls["webhook:idem:msg-r1"]
+        == settings.WEBHOOK_IDEMPOTENCY_COMPLETED_TTL_SECONDS
+    )
+
+    result = await db_session.execute(select(WebhookEvent))
+    assert result.scalars().all() == []
+
+
+@pytest.mark.asyncio
+async def test_dedup_falls_back_to_db_when_redis_down(
+    db_session,
+    fake_redis,
+):
+    """Redis לא זמין — הרכישה והסימון רצים מול הטבלה"""
+    from unittest.mock import AsyncMock, patch
+    from app.api.webhooks.whatsapp import _try_acquire_message, _mark_message_completed
+    from app.db.models.webhook_event import WebhookEvent
+    from sqlalchemy import select
+
+    with patch.object(fake_redis, "set", AsyncMock(side_effect=ConnectionError("redis down"))):
+        assert await _try_acquire_message(db_session, "msg-fb-1", "whatsapp") is True
+        assert await _try_acquire_message(db_session, "msg-fb-1", "whatsapp") is False
+        await _mark_message_completed(db_session, "msg-fb-1")
+
+    result = await db_session.execute(
+        select(WebhookEvent.status).where(WebhookEvent.message_id == "msg-fb-1")
+    )
+    assert result.scalar_one() == "completed"
+
+    # Redis חזר — ה-completed מה-fallback נכתב ל-Redis לפני ה-SET NX
+    assert await _try_acquire_message(db_session, "msg-fb-1", "whatsapp") is False
+    assert await fake_redis.get("webhook:idem:msg-fb-1") == "completed"
+    assert (
+        fake_redis._ttls["webhook:idem:msg-fb-1"]
+        == settings.WEBHOOK_IDEMPOTENCY_COMPLETED_TTL_SECONDS
+    )
+
+
+@pytest.mark.asyncio
+async def test_dedup_db_completion_after_redis_acquire(
+    db_session,
+    fake_redis,
+):
+    """רכישה ב-Redis, Redis נפל לפני הסימון — אין שורה בטבלה, ה-upsert יוצר אותה"""
+    from unittest.mock import AsyncMock, patch
+    from app.api.webhooks.whatsapp import _try_acquire_message, _mark_message_completed
+    from app.db.models.webhook_event import WebhookEvent
+    from sqlalchemy import select
+
+    with patch.object(settings, "WEBHOOK_IDEMPOTENCY_AUDIT_ENABLED", False):
+        assert await _try_acquire_message(db_session, "msg-up-1", "whatsapp") is True
+        with patch.object(fake_redis, "set", AsyncMock(side_effect=ConnectionError("redis down"))):
+            await _mark_message_completed(db_session, "msg-up-1")
+
+    result = await db_session.execute(
+        select(WebhookEvent.status).where(WebhookEvent.message_id == "msg-up-1")
+    )
+    assert result.scalar_one() == "completed"
+
+
+@pytest.mark.asyncio
+async def test_dedup_redis_acquire_skips_db(
+    db_session,
+    fake_redis,
+):
+    """SET NX שמצליח לא פונה ל-webhook_events — אין round trip ל-DB להודעה"""
+    from unittest.mock import AsyncMock, patch
+    from app.api.webhooks.whatsapp import _try_acquire_message
+
+    execute = AsyncMock(side_effect=AssertionError("unexpected DB query"))
+    with patch.object(db_session, "execute", execute):
+        assert await _try_acquire_message(db_session, "msg-nodb-1", "whatsapp") is True
+    execute.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_dedup_audit_written_in_batch(
+    db_session,
+    async_engine,
+    fake_redis,
+):
+    """רכישה + completed באותו חלון נכתבים ל-webhook_events כשורה אחת"""
+    from unittest.mock import patch
+    from sqlalchemy import select
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+    from app.api.webhooks.whatsapp import _try_acquire_message, _mark_message_completed
+    from app.db.models.webhook_event import WebhookEvent
+    from app.domain.services.webhook_idempotency import flush_idempotency_audit
+
+    test_session_maker = async_sessionmaker(
+        bind=async_engine, class_=AsyncSession, expire_on_commit=False
+    )
+    with patch.object(settings, "WEBHOOK_IDEMPOTENCY_AUDIT_ENABLED", True), \
+         patch.object(settings, "WEBHOOK_IDEMPOTENCY_AUDIT_FLUSH_SECONDS", 60), \
+         patch("app.db.database.AsyncSessionLocal", test_session_maker):
+        assert await _try_acquire_message(db_session, "msg-audit-1", "whatsapp") is True
+        assert await _try_acquire_message(db_session, "msg-audit-2", "whatsapp") is True
+        await _mark_message_completed(db_session, "msg-audit-1")
+
+        # לפני ה-flush שום דבר לא נכתב
+        result = await db_session.execute(select(WebhookEvent))
+        assert result.scalars().all() == []
+
+        await flush_idempotency_audit()
+
+    result = await db_session.execute(
+        select(WebhookEvent.message_id, WebhookEvent.status, WebhookEvent.platform)
+        .order_by(WebhookEvent.message_id)
+    )
+    assert [tuple(row) for row in result.all()] == [
+        ("msg-audit-1", "completed", "whatsapp"),
+        ("msg-audit-2", "processing", "whatsapp"),
+    ]
+
+
+# ============================================================================
+# batch מכמה שולחים — עיבוד מקבילי לפי שולח
+# ============================================================================
+
+
+def _batch_payload(senders: int, per_sender: int) -> dict:
+    """הודעות משולבות (שולח 0, 1, 2, 0, 1, 2...) כמו תור שהצטבר בגטוויי"""
+    return {
+        "messages": [
+            {
+                "from_number": f"9725000000{s}@c.us",
+                "sender_id": f"9725000000{s}@c.us",
+                "message_id": f"m-batch-{s}-{i}",
+                "text": "שלום",
+                "timestamp": 1700000000,
+            }
+            for i in range(per_sender)
+            for s in range(senders)
+        ]
+    }
+
+
+@pytest.mark.asyncio
+async def test_batch_processed_concurrently_per_sender(
+    test_client: AsyncClient,
+    async_engine,
+    monkeypatch,
+):
+    """שולחים שונים רצים במקביל, כל אחד עם סשן משלו, והסדר לכל שולח נשמר"""
+    import asyncio
+    from unittest.mock import patch
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+    monkeypatch.setattr(settings, "WHATSAPP_WEBHOOK_CONCURRENT_SENDERS", True)
+    processed: list[str] = []
+    sessions: dict[str, set[int]] = {}
+    in_flight = 0
+    peak = 0
+
+    async def _fake_process(db, message, background_tasks, responses):
+        nonlocal in_flight, peak
+        sessions.setdefault(message.sender_id, set()).add(id(db))
+        in_flight += 1
+        peak = max(peak, in_flight)
+        # ההודעה הראשונה של כל שולח הכי איטית — אם הסדר לא נשמר היא תיעקף
+        await asyncio.sleep(0.03 if message.message_id.endswith("-0") else 0.001)
+        processed.append(message.message_id)
+        in_flight -= 1
+        responses.append({"from": message.sender_id, "response": message.message_id})
+
+    test_session_maker = async_sessionmaker(
+        bind=async_engine, class_=AsyncSession, expire_on_commit=False
+    )
+    with patch("app.api.webhooks.whatsapp._process_whatsapp_message", _fake_process), \
+         patch("app.api.webhooks.whatsapp.AsyncSessionLocal", test_session_maker):
+        resp = await test_client.post("/api/whatsapp/webhook", json=_batch_payload(3, 3))
+
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["processed"] == 9
+    # תגובות לפי סדר ההופעה הראשונה של כל שולח, ובתוכו לפי סדר ההודעות
+    assert [r["response"] for r in data["responses"]] == [
+        f"m-batch-{s}-{i}" for s in range(3) for i in range(3)
+    ]
+    for s in range(3):
+        ids = [m for m in processed if m.startswith(f"m-batch-{s}-")]
+        assert ids == [f"m-batch-{s}-{i}" for i in range(3)]
+    assert peak > 1
+    assert all(len(ids) == 1 for ids in sessions.values())
+    assert len(set().union(*sessions.values())) == 3
+
+
+@pytest.mark.asyncio
+async def test_batch_sequential_when_mode_disabled(
+    test_client: AsyncClient,
+    db_session,
+):
+    """בלי המצב המקבילי — כל ההודעות רצות ברצף על סשן הבקשה"""
+    from unittest.mock import patch
+
+    seen: list[tuple[str, object]] = []
+
+    async def _fake_process(db, message, background_tasks, responses):
+        seen.append((message.message_id, db))
+
+    with patch("app.api.webhooks.whatsapp._process_whatsapp_message", _fake_process):
+        resp = await test_client.post("/api/whatsapp/webhook", json=_batch_payload(2, 2))
+
+    assert resp.status_code == 200
+    assert [message_id for message_id, _ in seen] == [
+        "m-batch-0-0", "m-batch-1-0", "m-batch-0-1", "m-batch-1-1"
+    ]
+    assert all(db is db_session for _, db in seen)
+
+
 # ============================================================================
 # מניעת כרטיס נהג כפול (notification idempotency)
 # ============================================================================